@@ -109,6 +109,32 @@ class AnalysisWorker(QThread):
             except:
                 pass
 
+class SensitivityWorker(QThread):
+    """DCF敏感性计算线程，首次计算需要读取财报"""
+    sensitivity_completed = pyqtSignal(str)
+    sensitivity_failed = pyqtSignal(str)
+    
+    def __init__(self, symbol, market, discount_rate, growth_rate, shares_num):
+        super().__init__()
+        self.symbol = symbol
+        self.market = market
+        self.discount_rate = discount_rate
+        self.growth_rate = growth_rate
+        self.shares_num = shares_num
+        
+    def run(self):
+        try:
+            from wff_agent.utils import fin_reports_utils
+            result = fin_reports_utils.get_dcf_sensitivity(
+                self.symbol, self.market,
+                shares_num=self.shares_num,
+                discount_rate=self.discount_rate,
+                growth_rate=self.growth_rate
+            )
+            self.sensitivity_completed.emit(fin_reports_utils.dcf_sensitivity_markdown(result))
+        except Exception as e:
+            self.sensitivity_failed.emit(str(e))
+
 class StockAnalysisApp(QMainWindow):
     """股票分析桌面应用"""
     
@@ -372,6 +398,27 @@ class StockAnalysisApp(QMainWindow):
         """)
         self.result_tabs.addTab(self.global_result, "🌍 全球市场")
         
+        # DCF敏感性标签页
+        sensitivity_panel = QWidget()
+        sensitivity_layout = QVBoxLayout(sensitivity_panel)
+        self.sensitivity_btn = QPushButton("📐 计算DCF敏感性 (以当前折现率、增长率为中心，无需运行分析)")
+        self.sensitivity_btn.clicked.connect(self.run_dcf_sensitivity)
+        sensitivity_layout.addWidget(self.sensitivity_btn)
+        self.sensitivity_result = QTextEdit()
+        self.sensitivity_result.setReadOnly(True)
+        self.sensitivity_result.setStyleSheet("""
+            QTextEdit {
+                font-family: 'SF Mono', 'Monaco', 'Menlo', 'Ubuntu Mono', monospace;
+                font-size: 16px;
+                line-height: 1.4;
+                border: 1px solid #dee2e6;
+                border-radius: 5px;
+                padding: 10px;
+            }
+        """)
+        sensitivity_layout.addWidget(self.sensitivity_result)
+        self.result_tabs.addTab(sensitivity_panel, "📐 DCF敏感性")
+        
         # 设置标签页
         self.settings_display = QTextEdit()
         self.settings_display.setReadOnly(True)
@@ -620,6 +667,35 @@ class StockAnalysisApp(QMainWindow):
         except Exception as e:
             self.handle_analysis_failed(str(e))
             
+    def run_dcf_sensitivity(self):
+        """计算DCF敏感性表"""
+        if not self.validate_inputs():
+            return
+        shares_num = self.current_settings["total_shares"]*1000000 or None
+        self.sensitivity_btn.setEnabled(False)
+        self.sensitivity_result.setText("⏳ 计算中...")
+        self.sensitivity_worker = SensitivityWorker(
+            self.current_settings["symbol"],
+            self.current_settings["market"],
+            self.current_settings["discount_rate"],
+            self.current_settings["growth_rate"],
+            shares_num
+        )
+        self.sensitivity_worker.sensitivity_completed.connect(self.handle_sensitivity_completed, Qt.ConnectionType.QueuedConnection)
+        self.sensitivity_worker.sensitivity_failed.connect(self.handle_sensitivity_failed, Qt.ConnectionType.QueuedConnection)
+        self.sensitivity_worker.start()
+        
+    def handle_sensitivity_completed(self, markdown):
+        """显示DCF敏感性表"""
+        self.sensitivity_btn.setEnabled(True)
+        self.sensitivity_result.setMarkdown(markdown)
+        
+    def handle_sensitivity_failed(self, error):
+        """DCF敏感性计算失败"""
+        self.sensitivity_btn.setEnabled(True)
+        self.sensitivity_result.setText(f"❌ DCF敏感性计算失败: {error}")
+        log.error(f"❌ DCF敏感性计算失败: {error}")
+        
     def validate_inputs(self):
         """验证输入"""
         if not self.current_settings["symbol"]:
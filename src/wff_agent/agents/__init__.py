@@ -1,5 +1,7 @@
 from wff_agent.agents import base_agent
 from wff_agent.agents import mcp_tools
+from wff_agent.agents import mcp_session
+from wff_agent.agents import llm_cache
 
 
 __version__ = "0.1.0"
@@ -7,4 +9,6 @@ __version__ = "0.1.0"
 __all__ = [
     "base_agent",
     "mcp_tools",
+    "mcp_session",
+    "llm_cache",
 ]
\ No newline at end of file
@@ -8,11 +8,12 @@ from langchain.agents import AgentExecutor, create_tool_calling_agent
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_mcp.toolkit import MCPToolkit
 from langchain_openai import ChatOpenAI
-from mcp import ClientSession, StdioServerParameters
+from mcp import ClientSession
 from mcp.client.stdio import stdio_client
 
+from wff_agent.agents import llm_cache, mcp_session
+
 log = logging.getLogger(__name__)
-import os
 class AnalysisAgent(ABC):
     """基础 Agent 类，提供基本的 Agent 功能"""
     
@@ -31,13 +32,14 @@ class AnalysisAgent(ABC):
         
     def _create_llm(self, base_url:str, api_key:str, model:str, 
                     temperature:float, max_tokens:int) -> ChatOpenAI:
-        """创建语言模型实例"""
+        """创建语言模型实例，相同模型、参数、提示词和工具数据的调用复用缓存的响应"""
         return ChatOpenAI(
             base_url=base_url,
             api_key=api_key,
             model=model,
             temperature=temperature,
-            max_tokens=max_tokens
+            max_tokens=max_tokens,
+            cache=llm_cache.get_cache()
         )
     
     @abstractmethod
@@ -49,6 +51,14 @@ class AnalysisAgent(ABC):
         """
         pass
     
+    def get_dependencies(self) -> List[str]:
+        """获取依赖的 Agent 名称，工作流在这些 Agent 的步骤结束后才执行本 Agent
+        
+        Returns:
+            List[str]: Agent 类名列表
+        """
+        return []
+    
     def create_toolkit(self, session: ClientSession = None) -> MCPToolkit:
         """创建工具包"""
         return MCPToolkit(
@@ -94,6 +104,9 @@ class AnalysisAgent(ABC):
                                    user_message_prompt: str, 
                                    input: Dict[str, Any]={}) -> str:
         """使用会话执行 Agent
+
+        默认从 mcp_session 的会话池借用已初始化的 MCP 服务器会话和工具包，
+        WFF_MCP_PERSISTENT=0 时为本次执行单独启动 MCP 服务器
         
         Args:
             system_prompt (str): 系统提示
@@ -103,38 +116,45 @@ class AnalysisAgent(ABC):
         Returns:
             Dict[str, Any]: 执行结果
         """
-        server_params = StdioServerParameters(
-            command="python",
-            args=["-m", "wff_agent.mcp_server"],
-            env={
-                "NEWS_API_KEY": os.getenv("NEWS_API_KEY"),
-                "ALPHA_VANTAGE_API_KEY": os.getenv("ALPHA_VANTAGE_API_KEY")
-            }
-        )
-        
         try:
-            async with stdio_client(server_params) as (read, write):
-                async with ClientSession(read, write) as session:
-                    log.info("Initializing session...")
-                    await session.initialize()
-                    log.info("Attaching session to toolkit...")
-                    toolkit = self.create_toolkit(session)
-                    log.info(f"Initializing toolkit")
-                    await toolkit.initialize()
-                    log.info(f"System prompt:{system_prompt}")
-                    agent_executor = self.create_agent_executor(toolkit=toolkit, 
-                                                                system_prompt=system_prompt, 
-                                                                user_message_prompt=user_message_prompt)
-                    log.info(f"Created agent executor: {self.__class__.__name__}, invoke executor with input: {input}")
-                    time_start = datetime.now()
-                    content = await agent_executor.ainvoke(input=input)
-                    elapsed = datetime.now() - time_start
-                    log.info(f"Agent executing time: {elapsed} seconds")
-                    return content['output'] + f"\nAgent executing time: {elapsed} seconds"
+            if not mcp_session.persistent_enabled():
+                return await self._execute_with_new_session(system_prompt, user_message_prompt, input)
+            async with mcp_session.session_scope() as pool:
+                async with pool.acquire() as server:
+                    log.info(f"Using MCP session #{server.index}, pool stats: {pool.stats}")
+                    toolkit = await server.toolkit(self)
+                    return await self._invoke(toolkit, system_prompt, user_message_prompt, input)
         except Exception as e:
             log.error(f"运行 agent 失败: {str(e)}", exc_info=True)
             raise e
 
+    async def _execute_with_new_session(self, system_prompt: str, user_message_prompt: str,
+                                        input: Dict[str, Any]) -> str:
+        """启动新的 MCP 服务器执行 Agent，执行完毕后关闭"""
+        async with stdio_client(mcp_session.server_parameters()) as (read, write):
+            async with ClientSession(read, write) as session:
+                log.info("Initializing session...")
+                await session.initialize()
+                log.info("Attaching session to toolkit...")
+                toolkit = self.create_toolkit(session)
+                log.info(f"Initializing toolkit")
+                await toolkit.initialize()
+                return await self._invoke(toolkit, system_prompt, user_message_prompt, input)
+
+    async def _invoke(self, toolkit: MCPToolkit, system_prompt: str, user_message_prompt: str,
+                      input: Dict[str, Any]) -> str:
+        """在已初始化的工具包上创建并执行 Agent"""
+        log.info(f"System prompt:{system_prompt}")
+        agent_executor = self.create_agent_executor(toolkit=toolkit, 
+                                                    system_prompt=system_prompt, 
+                                                    user_message_prompt=user_message_prompt)
+        log.info(f"Created agent executor: {self.__class__.__name__}, invoke executor with input: {input}")
+        time_start = datetime.now()
+        content = await agent_executor.ainvoke(input=input)
+        elapsed = datetime.now() - time_start
+        log.info(f"Agent executing time: {elapsed} seconds")
+        return content['output'] + f"\nAgent executing time: {elapsed} seconds"
+
     @abstractmethod
     def prepare_input(self, input:Dict[str, Any], context:Dict[str, Any]) -> Dict[str, Any]:
         """准备输入"""
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+LLM 响应缓存
+
+同一天反复分析同一只股票时，提示词和工具返回的数据往往完全相同，却每次都重新调用模型。
+LLMResponseCache 作为 ChatOpenAI 的 cache，按 LangChain 传入的 prompt 和 llm_string 生成缓存键:
+
+- prompt 是本次调用的全部消息，包括系统提示、渲染后的用户提示以及此前的工具调用和工具返回结果
+- llm_string 包含模型、温度、max_tokens 以及绑定的工具等调用参数
+
+因此只有模型、参数、提示词和工具数据都相同时才会命中，任何一项变化(如行情更新)都会重新调用模型。
+响应保存在本地文件缓存中，超过 TTL 过期。条目数上限在进程内首次写入时检查，之后每写入
+PRUNE_INTERVAL 条检查一次，删除最旧的条目，因此两次检查之间条目数最多超出上限 PRUNE_INTERVAL 条。
+
+本地文件缓存只在 live 模式下生效，录制/回放模式(WFF_DATASOURCE_MODE=record/replay)下
+get_cache 返回None，模型调用不经过缓存，保证录制和回放的结果只取决于夹具。
+
+环境变量:
+    WFF_LLM_CACHE=0 关闭缓存
+    WFF_LLM_CACHE_TTL 缓存有效期(秒)，默认12小时
+    WFF_LLM_CACHE_MAX_ENTRIES 最多保留的响应数，默认1000
+"""
+import contextvars
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+
+from wff_agent.datasource import file_lru_cache as filecache
+from wff_agent.datasource import replay
+
+log = logging.getLogger(__name__)
+
+CACHE_ENV = "WFF_LLM_CACHE"
+TTL_ENV = "WFF_LLM_CACHE_TTL"
+MAX_ENTRIES_ENV = "WFF_LLM_CACHE_MAX_ENTRIES"
+DEFAULT_TTL = 60*60*12
+DEFAULT_MAX_ENTRIES = 1000
+CACHE_PREFIX = "llm_response"
+# 每写入多少条响应检查一次条目数上限，检查需要列出全部缓存文件
+PRUNE_INTERVAL = 50
+
+# 当前步骤的查询和命中次数，由 track 设置
+_usage: contextvars.ContextVar[Optional[Dict[str, int]]] = contextvars.ContextVar("llm_cache_usage", default=None)
+_cache: Optional["LLMResponseCache"] = None
+_cache_lock = threading.Lock()
+_inactive_logged = False
+
+
+class LLMResponseCache(BaseCache):
+    """基于本地文件缓存的 LLM 响应缓存，带 TTL 和条目数上限"""
+
+    def __init__(self, ttl: int = DEFAULT_TTL, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._updates = 0
+
+    def _key(self, prompt: str, llm_string: str) -> str:
+        return filecache.generate_cache_key(CACHE_PREFIX, llm_string, prompt)
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        value = filecache.get_cached_data(self._key(prompt, llm_string))
+        _record("lookups")
+        if value is None:
+            return None
+        _record("hits")
+        log.info("LLM 响应缓存命中")
+        # LangChain 命中后会改写 generation(如清零用量)，返回副本，避免修改缓存中的对象
+        return [generation.model_copy(deep=True) for generation in value]
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        generations = [generation.model_copy(deep=True) for generation in return_val]
+        filecache.cache_data(generations, self._key(prompt, llm_string), self.ttl)
+        with self._lock:
+            if self._updates % PRUNE_INTERVAL:
+                removed = 0
+            else:
+                removed = filecache.prune_cache(CACHE_PREFIX, self.max_entries)
+            self._updates += 1
+        if removed:
+            log.info(f"LLM 响应缓存超过 {self.max_entries} 条，删除最旧的 {removed} 条")
+
+    def clear(self, **kwargs: Any) -> None:
+        filecache.clear_cache(CACHE_PREFIX)
+
+    # 读写本地文件很快，直接在当前任务中执行，保证 track 设置的计数对本步骤可见
+    async def alookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        return self.lookup(prompt, llm_string)
+
+    async def aupdate(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        self.update(prompt, llm_string, return_val)
+
+    async def aclear(self, **kwargs: Any) -> None:
+        self.clear(**kwargs)
+
+
+def _record(event: str) -> None:
+    usage = _usage.get()
+    if usage is not None:
+        usage[event] += 1
+
+
+def get_cache() -> Optional[LLMResponseCache]:
+    """
+    进程内共享的 LLM 响应缓存，WFF_LLM_CACHE=0 或不是 live 模式时返回None
+    """
+    global _cache, _inactive_logged
+    if os.getenv(CACHE_ENV, "1").lower() in ("0", "false", "no"):
+        return None
+    if not replay.is_live():
+        if not _inactive_logged:
+            log.info(f"数据源模式为 {replay.get_mode()}，LLM 响应缓存不生效")
+            _inactive_logged = True
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMResponseCache(int(os.getenv(TTL_ENV, DEFAULT_TTL)),
+                                      int(os.getenv(MAX_ENTRIES_ENV, DEFAULT_MAX_ENTRIES)))
+        return _cache
+
+
+@contextmanager
+def track() -> Iterator[Dict[str, int]]:
+    """
+    统计代码块内(含其中创建的异步任务)的缓存查询和命中次数
+
+    Returns:
+        {"lookups": 查询次数, "hits": 命中次数}
+    """
+    usage = {"lookups": 0, "hits": 0}
+    token = _usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _usage.reset(token)
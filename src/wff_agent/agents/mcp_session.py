@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+"""
+可复用的 MCP 服务器会话池
+
+原先每个 Agent 步骤都启动一个新的 `python -m wff_agent.mcp_server` 子进程，
+每次都要付出解释器启动、akshare/pandas 导入、session.initialize() 和 toolkit.initialize() 的开销，
+进程内的缓存也随之丢失。会话池在一个工作流(或外层作用域)内只启动一次服务器并复用已初始化的会话和工具包:
+
+- 每个服务器子进程的 stdio_client/ClientSession 在独立的任务中打开和关闭，满足 anyio 上下文
+  必须在同一任务中进入和退出的要求
+- 服务器按需启动，每次只借给一个步骤使用；借出前 ping 检查，子进程崩溃或无响应时关闭并重启
+- 服务器数上限默认与工作流同时执行的步骤数相同，避免步骤等待服务器；设置 WFF_MCP_POOL_SIZE 时以其为准
+- 会话池按事件循环区分，最外层的 session_scope 退出时关闭全部服务器
+
+设置 WFF_MCP_PERSISTENT=0 时恢复每个步骤启动新服务器的行为。
+"""
+import asyncio
+import logging
+import os
+import weakref
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from langchain_mcp.toolkit import MCPToolkit
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+
+from wff_agent.datasource import replay
+
+log = logging.getLogger(__name__)
+
+PERSISTENT_ENV = "WFF_MCP_PERSISTENT"
+POOL_SIZE_ENV = "WFF_MCP_POOL_SIZE"
+DEFAULT_POOL_SIZE = 2
+START_TIMEOUT = 60
+PING_TIMEOUT = 5
+CLOSE_TIMEOUT = 10
+
+_pools: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, McpSessionPool]" = weakref.WeakKeyDictionary()
+
+
+def server_parameters() -> StdioServerParameters:
+    """
+    启动 MCP 服务器子进程的参数
+    """
+    return StdioServerParameters(
+        command="python",
+        args=["-m", "wff_agent.mcp_server"],
+        env={
+            "NEWS_API_KEY": os.getenv("NEWS_API_KEY"),
+            "ALPHA_VANTAGE_API_KEY": os.getenv("ALPHA_VANTAGE_API_KEY"),
+            # 录制/回放模式传递给 MCP 服务器
+            **replay.env()
+        }
+    )
+
+
+def persistent_enabled() -> bool:
+    """
+    是否复用 MCP 服务器会话
+    """
+    return os.getenv(PERSISTENT_ENV, "1").lower() not in ("0", "false", "no")
+
+
+class McpServer:
+    """一个 MCP 服务器子进程及其已初始化的会话和工具包"""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.session: Optional[ClientSession] = None
+        self._toolkits: Dict[Tuple[str, ...], MCPToolkit] = {}
+        self._ready = asyncio.Event()
+        self._stop = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._error: Optional[BaseException] = None
+
+    async def start(self) -> None:
+        """启动子进程并初始化会话"""
+        self._task = asyncio.create_task(self._run(), name=f"mcp-server-{self.index}")
+        try:
+            await asyncio.wait_for(self._ready.wait(), START_TIMEOUT)
+        except asyncio.TimeoutError:
+            await self.close()
+            raise RuntimeError(f"MCP 服务器启动超时: {START_TIMEOUT} 秒")
+        if self.session is None:
+            await self.close()
+            raise RuntimeError(f"MCP 服务器启动失败: {self._error}")
+
+    async def _run(self) -> None:
+        try:
+            async with stdio_client(server_parameters()) as (read, write):
+                async with ClientSession(read, write) as session:
+                    log.info(f"Initializing MCP session #{self.index}...")
+                    await session.initialize()
+                    self.session = session
+                    self._ready.set()
+                    await self._stop.wait()
+        except Exception as e:
+            self._error = e
+            log.error(f"MCP 服务器 #{self.index} 异常退出: {e}", exc_info=True)
+        finally:
+            self.session = None
+            self._toolkits.clear()
+            self._ready.set()
+
+    @property
+    def alive(self) -> bool:
+        return self.session is not None and self._task is not None and not self._task.done()
+
+    async def healthy(self) -> bool:
+        """ping 检查会话是否可用"""
+        if not self.alive:
+            return False
+        try:
+            await asyncio.wait_for(self.session.send_ping(), PING_TIMEOUT)
+            return True
+        except Exception as e:
+            log.warning(f"MCP 服务器 #{self.index} ping 失败: {e!r}")
+            return False
+
+    async def toolkit(self, agent: Any) -> MCPToolkit:
+        """
+        Agent 使用的工具包，注册工具相同的 Agent 共用同一个已初始化的工具包
+
+        Args:
+            agent: AnalysisAgent
+        Returns:
+            MCPToolkit: 已初始化的工具包
+        """
+        key = tuple(sorted(agent.get_registered_tools()))
+        toolkit = self._toolkits.get(key)
+        if toolkit is None:
+            log.info(f"Initializing toolkit on MCP session #{self.index}: {list(key)}")
+            toolkit = agent.create_toolkit(self.session)
+            await toolkit.initialize()
+            self._toolkits[key] = toolkit
+        return toolkit
+
+    async def close(self) -> None:
+        """关闭会话并结束子进程"""
+        self._stop.set()
+        if self._task is None:
+            return
+        done, _ = await asyncio.wait({self._task}, timeout=CLOSE_TIMEOUT)
+        if not done:
+            log.warning(f"MCP 服务器 #{self.index} 关闭超时，取消任务")
+            self._task.cancel()
+            await asyncio.wait({self._task})
+
+
+class McpSessionPool:
+    """同一事件循环内共享的 MCP 服务器池"""
+
+    def __init__(self, size: int = DEFAULT_POOL_SIZE):
+        self.size = max(1, size)
+        self.users = 0
+        self._idle: List[McpServer] = []
+        self._servers: List[McpServer] = []
+        self._available = asyncio.Semaphore(self.size)
+        self._next_index = 0
+        self.stats = {"starts": 0, "restarts": 0, "reuses": 0}
+
+    def grow(self, size: int) -> None:
+        """
+        把服务器数上限提高到 size，不会缩小
+
+        Args:
+            size: 新的上限
+        """
+        for _ in range(size - self.size):
+            self._available.release()
+        self.size = max(self.size, size)
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[McpServer]:
+        """
+        借出一个可用的服务器，没有空闲服务器时按需启动，不可用的服务器关闭后重启
+        """
+        async with self._available:
+            server = self._idle.pop() if self._idle else None
+            if server is not None and not await server.healthy():
+                log.warning(f"MCP 服务器 #{server.index} 不可用，重新启动")
+                await self._discard(server)
+                self.stats["restarts"] += 1
+                server = None
+            if server is None:
+                server = McpServer(self._next_index)
+                self._next_index += 1
+                await server.start()
+                self._servers.append(server)
+                self.stats["starts"] += 1
+            else:
+                self.stats["reuses"] += 1
+            try:
+                yield server
+            finally:
+                self._idle.append(server)
+
+    async def _discard(self, server: McpServer) -> None:
+        if server in self._servers:
+            self._servers.remove(server)
+        await server.close()
+
+    async def close(self) -> None:
+        """关闭全部服务器"""
+        servers, self._servers, self._idle = self._servers, [], []
+        await asyncio.gather(*(server.close() for server in servers), return_exceptions=True)
+        log.info(f"MCP 会话池已关闭: {self.stats}")
+
+
+def pool_size(default: Optional[int] = None) -> int:
+    """
+    会话池的服务器数上限
+
+    Args:
+        default: 未设置 WFF_MCP_POOL_SIZE 时的上限，默认为 DEFAULT_POOL_SIZE
+    Returns:
+        int: 服务器数上限
+    """
+    return int(os.getenv(POOL_SIZE_ENV, default or DEFAULT_POOL_SIZE))
+
+
+@asynccontextmanager
+async def session_scope(size: Optional[int] = None) -> AsyncIterator[McpSessionPool]:
+    """
+    进入当前事件循环的会话池，嵌套或并发的作用域共用同一个池，最后一个作用域退出时关闭全部服务器
+
+    Args:
+        size: 本作用域需要的服务器数，通常是同时执行的步骤数；未设置 WFF_MCP_POOL_SIZE 时，
+              已有的会话池会扩大到这个数
+    Returns:
+        McpSessionPool: 会话池
+    """
+    loop = asyncio.get_running_loop()
+    pool = _pools.get(loop)
+    if pool is None:
+        pool = McpSessionPool(pool_size(size))
+        _pools[loop] = pool
+    else:
+        pool.grow(pool_size(size))
+    pool.users += 1
+    try:
+        yield pool
+    finally:
+        pool.users -= 1
+        if pool.users == 0:
+            if _pools.get(loop) is pool:
+                del _pools[loop]
+            await pool.close()
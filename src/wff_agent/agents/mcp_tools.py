@@ -6,6 +6,8 @@ from autogen_ext.tools.mcp import (
 )
 import os
 
+from wff_agent.datasource import replay
+
 async def get_stdio_tools(mcp_file_path:str) -> list:
     print(f"########################Get stdio tools: {mcp_file_path}")
     
@@ -14,7 +16,9 @@ async def get_stdio_tools(mcp_file_path:str) -> list:
         args=["-m", f"{mcp_file_path}"],
         env={
             "NEWS_API_KEY": os.getenv("NEWS_API_KEY"),
-            "ALPHA_VANTAGE_API_KEY": os.getenv("ALPHA_VANTAGE_API_KEY")
+            "ALPHA_VANTAGE_API_KEY": os.getenv("ALPHA_VANTAGE_API_KEY"),
+            # 录制/回放模式传递给 MCP 服务器
+            **replay.env()
         }
     )   
     return await mcp_server_tools(server_params)
@@ -0,0 +1,3 @@
+"""
+性能基准，运行方式: python -m wff_agent.benchmarks.<模块名>
+"""
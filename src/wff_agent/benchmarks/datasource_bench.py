@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+数据工具基准: 在录制/回放模式下运行 MCP 工具背后的数据获取和计算，统计每一步的耗时
+
+    # 联网录制一次夹具
+    python -m wff_agent.benchmarks.datasource_bench --mode record --symbols 000001.cn 00700.hk AAPL.us
+    # 之后在离线环境中回放，可用 --latency recorded 模拟录制时的上游耗时
+    python -m wff_agent.benchmarks.datasource_bench --mode replay --symbols 000001.cn 00700.hk AAPL.us
+
+模式通过 WFF_DATASOURCE_MODE 传递，夹具目录为 WFF_FIXTURE_DIR(默认项目下的 .fixtures)。
+录制/回放模式下本地文件缓存不生效，每次运行都经过完整的上游调用(或回放)。
+回放时的参数需与录制时相同，否则会因找不到夹具报 ReplayMissError。
+"""
+import argparse
+import os
+import time
+from typing import Callable, Dict, List, Tuple
+
+from wff_agent.datasource import replay
+from wff_agent.utils import fin_reports_utils, macro_utils, stock_utils
+
+
+def steps(symbol: str, market: str) -> List[Tuple[str, Callable]]:
+    """一只股票依次执行的数据步骤"""
+    return [
+        ("price", lambda: stock_utils.get_latest_stock_price(symbol, market)),
+        ("indicators", lambda: stock_utils.get_market_indicators(symbol, market, 50)),
+        ("fundamentals", lambda: fin_reports_utils.get_report_fundamentals(symbol, market)),
+    ]
+
+
+def timed(fn: Callable) -> Tuple[float, str]:
+    start = time.perf_counter()
+    try:
+        fn()
+        status = "ok"
+    except replay.ReplayMissError:
+        status = "miss"
+    except Exception as e:
+        status = f"error: {type(e).__name__}"
+    return time.perf_counter() - start, status
+
+
+def main():
+    parser = argparse.ArgumentParser(description="录制/回放数据工具基准")
+    parser.add_argument("--mode", choices=[replay.MODE_RECORD, replay.MODE_REPLAY], default=replay.MODE_REPLAY,
+                        help="record 访问上游并录制，replay 只读取夹具")
+    parser.add_argument("--symbols", nargs="+", default=["000001.cn"], help="股票代码.市场")
+    parser.add_argument("--fixture-dir", default=None, help="夹具目录，默认使用 WFF_FIXTURE_DIR")
+    parser.add_argument("--latency", default=None, help="回放延迟: 秒数，或 recorded 表示按录制时的耗时")
+    args = parser.parse_args()
+
+    os.environ["WFF_DATASOURCE_MODE"] = args.mode
+    if args.fixture_dir:
+        os.environ["WFF_FIXTURE_DIR"] = args.fixture_dir
+    if args.latency:
+        os.environ["WFF_REPLAY_LATENCY"] = args.latency
+    print(f"mode={args.mode}, fixtures={replay.get_fixture_dir()}, now={replay.now():%Y-%m-%d %H:%M:%S}")
+
+    totals: Dict[str, float] = {}
+    print(f"{'symbol':>12} {'step':>14} {'ms':>10} status")
+    for item in args.symbols:
+        symbol, _, market = item.partition(".")
+        for name, fn in steps(symbol, market or "cn"):
+            elapsed, status = timed(fn)
+            totals[name] = totals.get(name, 0.0) + elapsed
+            print(f"{item:>12} {name:>14} {elapsed * 1000:>10.1f} {status}")
+    markets = sorted({item.partition(".")[2] or "cn" for item in args.symbols} & {"us", "cn"})
+    elapsed, status = timed(lambda: macro_utils.get_macro_data(markets))
+    totals["macro"] = elapsed
+    print(f"{','.join(markets):>12} {'macro':>14} {elapsed * 1000:>10.1f} {status}")
+    print(f"total {sum(totals.values()) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+技术指标计算基准: 原先逐列调用 pandas 的实现 vs indicator_engine
+
+    python -m wff_agent.benchmarks.indicator_bench --rows 250 --repeat 200
+    python -m wff_agent.benchmarks.indicator_bench --panel 5000
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from wff_agent.utils import indicator_engine
+
+
+def make_history(rows: int, seed: int = 0) -> pd.DataFrame:
+    """
+    生成随机游走的日线行情
+    """
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, rows)))
+    high = close * (1 + np.abs(rng.normal(0, 0.01, rows)))
+    low = close * (1 - np.abs(rng.normal(0, 0.01, rows)))
+    open_ = np.clip(close * (1 + rng.normal(0, 0.005, rows)), low, high)
+    volume = rng.integers(100_000, 10_000_000, rows).astype(float)
+    index = pd.bdate_range(end="2025-01-01", periods=rows, name="日期")
+    return pd.DataFrame({"开盘": open_, "收盘": close, "最高": high, "最低": low, "成交量": volume}, index=index)
+
+
+def make_board_history(rows: int, seed: int = 0) -> pd.DataFrame:
+    """
+    生成接近A股实盘的日线: 价格保留两位小数，包含停牌式的一字横盘(开高低收相同)和连续涨停、跌停
+    """
+    rng = np.random.default_rng(seed)
+    change = rng.normal(0, 0.02, rows)
+    flat = rng.integers(0, max(rows - 20, 1))
+    change[flat:flat + 15] = 0
+    for limit in (0.1, -0.1):
+        run = rng.integers(0, max(rows - 6, 1))
+        change[run:run + 5] = limit
+    close = np.round(10 * np.exp(np.cumsum(change)), 2)
+    high = np.round(close * (1 + np.abs(rng.normal(0, 0.01, rows))), 2)
+    low = np.round(close * (1 - np.abs(rng.normal(0, 0.01, rows))), 2)
+    open_ = np.clip(np.round(close * (1 + rng.normal(0, 0.005, rows)), 2), low, high)
+    high[flat:flat + 15] = low[flat:flat + 15] = open_[flat:flat + 15] = close[flat:flat + 15]
+    volume = rng.integers(100_000, 10_000_000, rows).astype(float)
+    index = pd.bdate_range(end="2025-01-01", periods=rows, name="日期")
+    return pd.DataFrame({"开盘": open_, "收盘": close, "最高": high, "最低": low, "成交量": volume}, index=index)
+
+
+def legacy_indicators(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    重构前 get_market_indicators 的计算过程
+    """
+    df = df.copy()
+    df["MA5"] = df["收盘"].rolling(window=5).mean()
+    df["MA20"] = df["收盘"].rolling(window=20).mean()
+    df["MA60"] = df["收盘"].rolling(window=60).mean()
+    df["MA50"] = df["收盘"].rolling(window=120).mean()
+    df["MA200"] = df["收盘"].rolling(window=240).mean()
+    df["EMA9"] = df["收盘"].ewm(span=9, adjust=False).mean()
+    df["EMA12"] = df["收盘"].ewm(span=12, adjust=False).mean()
+    df["EMA21"] = df["收盘"].ewm(span=21, adjust=False).mean()
+    df["EMA26"] = df["收盘"].ewm(span=26, adjust=False).mean()
+    df["EMA50"] = df["收盘"].ewm(span=50, adjust=False).mean()
+    df["DIF"] = df["EMA12"] - df["EMA26"]
+    df["DEA"] = df["DIF"].ewm(span=9, adjust=False).mean()
+    df["MACD"] = 2 * (df["DIF"] - df["DEA"])
+    df["RSV"] = (df["收盘"] - df["最低"].rolling(window=9).min()) / (df["最高"].rolling(window=9).max() - df["最低"].rolling(window=9).min()) * 100
+    df["K"] = df["RSV"].ewm(span=3, adjust=False).mean()
+    df["D"] = df["K"].ewm(span=3, adjust=False).mean()
+    df["J"] = 3 * df["K"] - 2 * df["D"]
+    delta = df["收盘"].diff()
+    gain = (delta.where(delta > 0, 0)).rolling(window=14).mean()
+    loss = (-delta.where(delta < 0, 0)).rolling(window=14).mean()
+    rs = gain / loss
+    df["RSI"] = 100 - (100 / (1 + rs))
+    df["BOLL"] = df["收盘"].rolling(window=20).mean()
+    df["BOLL_UP"] = df["BOLL"] + 2 * df["收盘"].rolling(window=20).std()
+    df["BOLL_DOWN"] = df["BOLL"] - 2 * df["收盘"].rolling(window=20).std()
+    df["OBV"] = (df["成交量"].where(df["收盘"].diff() > 0, 0).rolling(window=20).sum() - df["成交量"].where(df["收盘"].diff() < 0, 0).rolling(window=20).sum()) / df["成交量"].rolling(window=20).sum()
+    return df[indicator_engine.PRICE_COLUMNS + indicator_engine.INDICATOR_COLUMNS]
+
+
+def check_equal(df: pd.DataFrame) -> None:
+    """
+    校验两种实现的输出一致
+    """
+    expected = legacy_indicators(df)
+    actual = indicator_engine.calc_market_indicators(df)
+    for col in expected.columns:
+        if not np.allclose(expected[col].to_numpy(), actual[col].to_numpy(), rtol=1e-9, atol=1e-9, equal_nan=True):
+            raise ValueError(f"指标 {col} 与原实现不一致")
+
+
+def timed(func, df: pd.DataFrame, repeat: int) -> float:
+    func(df)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(df)
+    return (time.perf_counter() - start) / repeat
+
+
+def bench_panel(symbols: int, rows: int = 250) -> None:
+    """
+    面板计算与逐只股票调用原实现的对比，约5%的K线随机缺失模拟停牌
+    """
+    rng = np.random.default_rng(0)
+    histories = {}
+    for i in range(symbols):
+        df = make_history(rows, seed=i)
+        histories[f"{i:06d}"] = df[rng.random(rows) > 0.05]
+    dates, names, panel = indicator_engine.pivot_histories(histories)
+
+    start = time.perf_counter()
+    indicator_engine.compute_panel_indicators(panel["收盘"], panel["最高"], panel["最低"], panel["成交量"])
+    elapsed = time.perf_counter() - start
+
+    sample = names[:min(len(names), 200)]
+    start = time.perf_counter()
+    for name in sample:
+        legacy_indicators(histories[name])
+    legacy = (time.perf_counter() - start) / len(sample) * len(names)
+    print(f"panel {len(dates)} x {len(names)}: engine {elapsed:.2f}s, legacy loop (estimated) {legacy:.2f}s, {legacy / elapsed:.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="技术指标计算基准")
+    parser.add_argument("--rows", type=int, nargs="+", default=[250, 1000, 5000], help="K线数量")
+    parser.add_argument("--repeat", type=int, default=100, help="每组重复次数")
+    parser.add_argument("--panel", type=int, default=0, help="面板基准的股票数量，0表示不运行")
+    args = parser.parse_args()
+
+    if args.panel:
+        bench_panel(args.panel)
+        return
+
+    print(f"{'rows':>8} {'legacy(ms)':>12} {'engine(ms)':>12} {'speedup':>8}")
+    for rows in args.rows:
+        df = make_history(rows)
+        check_equal(df)
+        for seed in range(20):
+            check_equal(make_board_history(rows, seed))
+        legacy = timed(legacy_indicators, df, args.repeat)
+        engine = timed(indicator_engine.calc_market_indicators, df, args.repeat)
+        print(f"{rows:>8} {legacy * 1000:>12.3f} {engine * 1000:>12.3f} {legacy / engine:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
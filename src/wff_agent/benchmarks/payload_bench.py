@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+载荷编码的 token 数对比: 原先的 records 输出 vs columnar / compact
+
+    python -m wff_agent.benchmarks.payload_bench --rows 50
+
+安装了 tiktoken 时用 cl100k_base 计数，否则用 payload_codec.estimate_tokens 粗略估计。
+"""
+import argparse
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from wff_agent.benchmarks.indicator_bench import make_history
+from wff_agent.utils import indicator_engine, payload_codec
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+
+def token_counter() -> Callable[[str], int]:
+    if tiktoken is None:
+        print("未安装 tiktoken，使用粗略估计")
+        return payload_codec.estimate_tokens
+    encoding = tiktoken.get_encoding("cl100k_base")
+    return lambda text: len(encoding.encode(text))
+
+
+def make_indicator_payload(rows: int):
+    """
+    与 get_market_indicators 返回内容相同结构的指标窗口
+    """
+    df = indicator_engine.calc_market_indicators(make_history(rows + 240)).tail(rows).reset_index()
+    df["日期"] = df["日期"].astype(str)
+    return df
+
+
+def make_report_payload(periods: int = 5, seed: int = 0) -> Dict[str, List]:
+    """
+    与 calc_cn_indicators 中年度财务指标相同结构的按列字典
+    """
+    rng = np.random.default_rng(seed)
+    names = ["revenue_growth", "gross_margin", "management_expense_ratio", "sale_expense_ratio",
+             "operating_expense_ratio", "dev_expense_ratio", "financial_cost_ratio", "total_expense_ratio",
+             "fixed_assets_ratio", "current_assets_ratio", "current_liabilities_ratio", "asset_turnover_ratio",
+             "free_cash_flow_growth", "free_cash_flow_ratio", "asset_debt_ratio", "current_ratio", "quick_ratio"]
+    data: Dict[str, List] = {"fiscal_end_date": [f"{2024 - i}-12-31" for i in range(periods)]}
+    for name in names:
+        data[name] = rng.normal(0.2, 0.1, periods).tolist()
+    for name in ["free_cash_flow", "operating_cash_flow", "investing_cash_flow", "financing_cash_flow"]:
+        data[name] = (rng.normal(1, 0.5, periods) * 1e10).tolist()
+    data["pe"] = np.round(rng.normal(15, 3, periods), 2).tolist()
+    return data
+
+
+def main():
+    parser = argparse.ArgumentParser(description="载荷编码 token 数对比")
+    parser.add_argument("--rows", type=int, default=50, help="指标窗口的K线数")
+    args = parser.parse_args()
+    count = token_counter()
+
+    indicators = make_indicator_payload(args.rows)
+    report = make_report_payload()
+    baseline = {
+        "indicators": count(indicators.to_json(force_ascii=False, orient="records")),
+        "report": count(str(report)),
+    }
+    print(f"{'payload':>12} {'mode':>10} {'tokens':>8} {'vs records':>11}")
+    for mode in payload_codec.MODES:
+        results = {
+            "indicators": count(payload_codec.encode_frame(indicators, mode)),
+            "report": count(str(payload_codec.encode_columns(report, mode))),
+        }
+        for name, tokens in results.items():
+            print(f"{name:>12} {mode:>10} {tokens:>8} {tokens / baseline[name]:>10.0%}")
+
+
+if __name__ == "__main__":
+    main()
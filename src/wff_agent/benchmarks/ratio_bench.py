@@ -0,0 +1,391 @@
+# -*- coding: utf-8 -*-
+"""
+财务比率计算基准: 原先 A股、港股、美股各自逐期计算的实现 vs ratio_engine
+
+    python -m wff_agent.benchmarks.ratio_bench --periods 7 --repeat 200
+    python -m wff_agent.benchmarks.ratio_bench --reprice
+
+--reprice 对比每次从报表完整计算与在缓存的基本面数据上只套用股价(fundamentals.reprice)的耗时。
+
+原实现保留在本文件中用于对比。KNOWN_CHANGES 中的键是有意修正了定义的比率(见 ratio_engine)，
+只报告差异，不算作不一致；其余键的值都应与原实现相同。
+
+统一实现的目的是各市场定义一致、报表不变时只需 reprice，不是单次计算更快:
+A股的宽表 DataFrame 约快2倍，港股、美股的报表是只有6~7期的记录列表，
+每次调用约0.1毫秒的 NumPy 固定开销与原先逐期的纯 Python 计算相当，约为原实现的0.6~1.0倍。
+"""
+import argparse
+import copy
+import json
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+import pandas as pd
+
+from wff_agent.utils import ak_fin_utils, fundamentals, ratio_engine
+
+KNOWN_CHANGES = {
+    # 流动比率的分母由负债合计改为流动负债合计，速动比率扣除存货；ROE 保留两位小数的百分比
+    "cn": {"current_ratio", "quick_ratio", "roe"},
+    # 毛利率由 1-毛利/收入 改为 毛利/收入，ROE 改为与其他市场相同的百分比字符串
+    "hk": {"gross_margin", "current_ratio", "quick_ratio", "roe"},
+    # ROE 保留两位小数的百分比，原先先取整到1%
+    "us": {"roe"},
+}
+# 原实现的 ROE 由各自保留4位小数的杜邦三项相乘后再保留2位小数，
+# 与直接 净利润/股东权益 相比可能相差最后一位(A股、美股为1个百分点，港股为0.01)
+ROUNDING_TOLERANCE = {"cn": {"roe": 1.0}, "hk": {"roe": 0.01}, "us": {"roe": 1.0}}
+
+
+# 新浪财务报表每张有一百多列，比率只用到其中少数几列
+CN_EXTRA_COLUMNS = 100
+
+
+def _cn_statement(dates: pd.DatetimeIndex, rng: np.random.Generator, columns: List[str]) -> pd.DataFrame:
+    data = {"报告日": dates.strftime("%Y%m%d")}
+    for col in columns:
+        data[col] = rng.uniform(1e8, 1e10, len(dates))
+    for i in range(CN_EXTRA_COLUMNS):
+        data[f"其他项目{i}"] = np.where(rng.random(len(dates)) < 0.2, np.nan, rng.uniform(1e6, 1e9, len(dates)))
+    return pd.DataFrame(data)
+
+
+def make_statements(market: str, periods: int, seed: int = 0) -> Dict[str, Any]:
+    """
+    生成与各市场数据源结构相同的随机三张报表
+    """
+    rng = np.random.default_rng(seed)
+    fields = ratio_engine.FIELDS[market]
+    columns = {statement: sorted({col for name, (s, cols) in fields.items() if s == statement for col in cols})
+               for statement in (ratio_engine.BALANCE, ratio_engine.INCOME, ratio_engine.CASHFLOW)}
+    if market == "cn":
+        dates = pd.date_range(end="2024-12-31", periods=periods * 4, freq="QE")[::-1]
+        return {statement: _cn_statement(dates, rng, cols) for statement, cols in columns.items()}
+    dates = pd.date_range(end="2024-12-31", periods=periods, freq="YE")[::-1].strftime("%Y-%m-%d")
+    date_column = ratio_engine.DATE_COLUMNS[market]
+    statements = {}
+    for statement, cols in columns.items():
+        records = [{date_column: date, **{col: float(rng.uniform(1e8, 1e10)) for col in cols}} for date in dates]
+        if market == "us":
+            records = [{key: value if key == date_column else str(int(value)) for key, value in record.items()}
+                       for record in records]
+        statements[statement] = records
+    if market == "hk":
+        statements = {statement: json.dumps(records, ensure_ascii=False) for statement, records in statements.items()}
+    return statements
+
+
+# ---------------------------------------------------------------- 原实现
+
+def _legacy_growth(current, previous):
+    if previous == 0:
+        return 0
+    return round((current - previous) / previous, 4)
+
+
+def _legacy_ratio(part, whole):
+    if whole == 0:
+        return None
+    return round(part / whole, 4)
+
+
+def _legacy_cn_filter_annual(report: pd.DataFrame) -> str:
+    report['报告日'] = pd.to_datetime(report['报告日'])
+    report.fillna(0, inplace=True)
+    annual_report = report[report['报告日'].dt.month == 12].head(7)
+    annual_report = annual_report.sort_values(by="报告日", ascending=False)
+    return annual_report.to_json(force_ascii=False, orient="records")
+
+
+def legacy_cn(statements: Dict[str, pd.DataFrame], price: float) -> dict:
+    bs = json.loads(_legacy_cn_filter_annual(statements["balance_sheet"]))
+    inc = json.loads(_legacy_cn_filter_annual(statements["income_statement"]))
+    cf = json.loads(_legacy_cn_filter_annual(statements["cashflow"]))
+    n = len(bs)
+    fcf = [cf[i]['经营活动产生的现金流量净额'] - cf[i]['购建固定资产、无形资产和其他长期资产所支付的现金'] for i in range(n)]
+    net_margin = [_legacy_ratio(inc[i]['净利润'], inc[i]['营业收入']) for i in range(len(inc))]
+    turnover = [_legacy_ratio(inc[i]['营业收入'], bs[i]['资产总计']) for i in range(n)]
+    multiplier = [_legacy_ratio(bs[i]['资产总计'], bs[i]['所有者权益(或股东权益)合计']) for i in range(n)]
+    roe = [str(round(net_margin[i] * turnover[i] * multiplier[i], 2) * 100) + "%" for i in range(n)]
+    return {
+        "fiscal_end_date": [datetime.fromtimestamp(inc[i]['报告日'] / 1000).strftime("%Y-%m-%d") for i in range(len(inc))],
+        "revenue_growth": [_legacy_growth(inc[i]['营业总收入'], inc[i + 1]['营业总收入']) for i in range(len(inc) - 1)],
+        "gross_margin": [1 - _legacy_ratio(inc[i]['营业成本'], inc[i]['营业收入']) for i in range(len(inc))],
+        "management_expense_ratio": [_legacy_ratio(inc[i]['管理费用'], inc[i]['营业收入']) for i in range(len(inc))],
+        "sale_expense_ratio": [_legacy_ratio(inc[i]['销售费用'], inc[i]['营业收入']) for i in range(len(inc))],
+        "operating_expense_ratio": [_legacy_ratio(inc[i]['营业成本'], inc[i]['营业收入']) for i in range(len(inc))],
+        "dev_expense_ratio": [_legacy_ratio(inc[i]['研发费用'], inc[i]['营业收入']) for i in range(len(inc))],
+        "financial_cost_ratio": [_legacy_ratio(inc[i]['财务费用'], inc[i]['营业收入']) for i in range(len(inc))],
+        "total_expense_ratio": [_legacy_ratio(inc[i]['财务费用'] + inc[i]['研发费用'] + inc[i]['销售费用'] + inc[i]['管理费用'],
+                                              inc[i]['营业收入']) for i in range(len(inc))],
+        "fixed_assets_ratio": [_legacy_ratio(bs[i]['固定资产及清理合计'], bs[i]['资产总计']) for i in range(n)],
+        "current_assets_ratio": [_legacy_ratio(bs[i]['流动资产合计'], bs[i]['资产总计']) for i in range(n)],
+        "current_liabilities_ratio": [_legacy_ratio(bs[i]['流动负债合计'], bs[i]['资产总计']) for i in range(n)],
+        "long_liabilities_ratio": [_legacy_ratio(bs[i]['长期借款'] + bs[i]["长期应付款合计"], bs[i]['资产总计']) for i in range(n)],
+        "asset_turnover_ratio": turnover,
+        "inventory_turnover_ratio": [_legacy_ratio(inc[i]['营业收入'], bs[i]['存货']) for i in range(n)],
+        "receivables_turnover_ratio": [_legacy_ratio(inc[i]['营业收入'], bs[i]['应收账款']) for i in range(n)],
+        "payables_turnover_ratio": [_legacy_ratio(inc[i]['营业收入'], bs[i]['应付账款']) for i in range(n)],
+        "interest_coverage_ratio": [_legacy_ratio(inc[i]['营业利润'], inc[i]['利息支出']) for i in range(n)],
+        "free_cash_flow": fcf,
+        "free_cash_flow_growth": [_legacy_growth(fcf[i], fcf[i + 1]) for i in range(len(fcf) - 1)],
+        "free_cash_flow_ratio": [_legacy_ratio(fcf[i], inc[i]['营业收入']) for i in range(len(fcf))],
+        "net_margin_ratio": net_margin,
+        "equity_multiplier": multiplier,
+        "roe": roe,
+        "operating_cash_flow": [cf[i]['经营活动产生的现金流量净额'] for i in range(n)],
+        "investing_cash_flow": [cf[i]['投资活动产生的现金流量净额'] for i in range(n)],
+        "financing_cash_flow": [cf[i]['筹资活动产生的现金流量净额'] for i in range(n)],
+        "asset_debt_ratio": [_legacy_ratio(bs[i]['负债合计'], bs[i]['资产总计']) for i in range(n)],
+        "current_ratio": [_legacy_ratio(bs[i]['流动资产合计'], bs[i]['负债合计']) for i in range(n)],
+        "quick_ratio": [_legacy_ratio(bs[i]['流动资产合计'], bs[i]['流动负债合计']) for i in range(n)],
+        "pe": [round(_legacy_ratio(price, inc[i]['基本每股收益']), 2) for i in range(len(inc))],
+    }
+
+
+def legacy_hk(statements: Dict[str, str], price: float) -> dict:
+    bs = json.loads(statements["balance_sheet"])
+    inc = json.loads(statements["income_statement"])
+    cf = json.loads(statements["cashflow"])
+    for report in (bs, inc, cf):
+        report.sort(key=lambda x: x['report_time'], reverse=True)
+    n = len(bs)
+    fcf = [cf[i]['经营业务现金净额'] - cf[i]['购建固定资产'] if '购建固定资产' in cf[i] else cf[i]['经营业务现金净额']
+           for i in range(len(cf))]
+    net_margin = [_legacy_ratio(inc[i]['持续经营业务税后利润'], inc[i]['营运收入']) for i in range(len(inc))]
+    turnover = [_legacy_ratio(inc[i]['营运收入'], bs[i]['总资产']) for i in range(n)]
+    multiplier = [_legacy_ratio(bs[i]['总资产'], bs[i]['总权益']) for i in range(n)]
+    return {
+        "fiscal_end_date": [inc[i]['report_time'] for i in range(len(inc))],
+        "revenue_growth": [_legacy_growth(inc[i]['营业额'], inc[i + 1]['营业额']) for i in range(len(inc) - 1)],
+        "gross_margin": [1 - _legacy_ratio(inc[i]['毛利'], inc[i]['营运收入']) for i in range(len(inc))],
+        "sale_expense_ratio": [_legacy_ratio(inc[i]['销售及分销费用'], inc[i]['营运收入']) for i in range(len(inc))],
+        "management_expense_ratio": [_legacy_ratio(inc[i]['行政开支'], inc[i]['营运收入']) for i in range(len(inc))],
+        "financial_cost_ratio": [_legacy_ratio(inc[i]['融资成本'], inc[i]['营运收入']) for i in range(len(inc))],
+        "total_expense_ratio": [_legacy_ratio(inc[i]['融资成本'] + inc[i]['销售及分销费用'] + inc[i]['行政开支'],
+                                              inc[i]['营运收入']) for i in range(len(inc))],
+        "fixed_assets_ratio": [_legacy_ratio(bs[i]['物业厂房及设备'] + bs[i]['土地使用权'], bs[i]['总资产']) for i in range(n)],
+        "current_assets_ratio": [_legacy_ratio(bs[i]['流动资产合计'], bs[i]['总资产']) for i in range(n)],
+        "current_liabilities_ratio": [_legacy_ratio(bs[i]['流动负债合计'], bs[i]['总资产']) for i in range(n)],
+        "long_liabilities_ratio": [_legacy_ratio(bs[i]['非流动负债合计'], bs[i]['总资产']) for i in range(n)],
+        "asset_turnover_ratio": turnover,
+        "inventory_turnover_ratio": [_legacy_ratio(inc[i]['营运收入'], bs[i]['存货']) for i in range(n)],
+        "receivables_turnover_ratio": [_legacy_ratio(inc[i]['营运收入'], bs[i]['应收帐款']) for i in range(n)],
+        "payables_turnover_ratio": [_legacy_ratio(inc[i]['营运收入'], bs[i]['应付帐款']) for i in range(n)],
+        "interest_coverage_ratio": [_legacy_ratio(inc[i]['经营溢利'], cf[i]['已付利息(融资)'])
+                                    if '经营溢利' in inc[i] and '已付利息(融资)' in cf[i] else 0 for i in range(n)],
+        "free_cash_flow": fcf,
+        "free_cash_flow_growth": [_legacy_growth(fcf[i], fcf[i + 1]) for i in range(len(fcf) - 1)],
+        "free_cash_flow_ratio": [_legacy_ratio(fcf[i], inc[i]['营运收入']) for i in range(len(fcf))],
+        "operating_cash_flow": [cf[i]['经营业务现金净额'] for i in range(n)],
+        "investing_cash_flow": [cf[i]['投资业务现金净额'] for i in range(n)],
+        "financing_cash_flow": [cf[i]['融资业务现金净额'] for i in range(n)],
+        "net_margin_ratio": net_margin,
+        "equity_multiplier": multiplier,
+        "roe": [round(net_margin[i] * turnover[i] * multiplier[i], 2) for i in range(n)],
+        "asset_debt_ratio": [_legacy_ratio(bs[i]['总负债'], bs[i]['总资产']) for i in range(n)],
+        "current_ratio": [_legacy_ratio(bs[i]['流动资产合计'], bs[i]['总负债']) for i in range(n)],
+        "quick_ratio": [_legacy_ratio(bs[i]['流动资产合计'], bs[i]['流动负债合计']) for i in range(n)],
+        "pe": [round(_legacy_ratio(price, inc[i]['每股基本盈利']), 2) for i in range(len(inc))],
+    }
+
+
+def _us_growth(current, previous):
+    if current == "None" or previous == "None" or int(previous) == 0:
+        return 0.0
+    return round((int(current) - int(previous)) / int(previous), 4)
+
+
+def _us_ratio(share, total):
+    if share == "None" or total == "None" or share is None or total is None or float(total) == 0.0:
+        return 0.0
+    return round(float(share) / float(total), 4)
+
+
+def _us_subtract(a, b):
+    if a == "None" or b == "None":
+        return 0.0
+    return int(a) - int(b)
+
+
+def _us_float(value):
+    try:
+        return 0.0 if value is None or value == "None" else float(value)
+    except (ValueError, TypeError):
+        return 0.0
+
+
+def legacy_us(statements: Dict[str, list], price: float) -> dict:
+    bs, inc, cf = statements["balance_sheet"], statements["income_statement"], statements["cashflow"]
+    n = min(6, len(bs), len(inc), len(cf))
+    for report in (bs, inc, cf):
+        report.sort(key=lambda x: x["fiscalDateEnding"], reverse=True)
+    revenue = [inc[i]["totalRevenue"] for i in range(n)]
+    operating = [_us_ratio(inc[i]["operatingExpenses"], revenue[i]) for i in range(n)]
+    selling = [_us_ratio(inc[i]["sellingGeneralAndAdministrative"], revenue[i]) for i in range(n)]
+    rnd = [_us_ratio(inc[i]["researchAndDevelopment"], revenue[i]) for i in range(n)]
+    interest = [_us_ratio(inc[i]["interestExpense"], revenue[i]) for i in range(n)]
+    fcf = [_us_subtract(cf[i]["operatingCashflow"], cf[i]["capitalExpenditures"]) for i in range(n)]
+    net_margin = [_us_ratio(inc[i]["netIncome"], revenue[i]) for i in range(n)]
+    avg_assets = [(_us_float(bs[i]["totalAssets"]) + _us_float(bs[i + 1]["totalAssets"])) / 2 for i in range(n - 1)]
+    avg_equity = [(_us_float(bs[i]["totalShareholderEquity"]) + _us_float(bs[i + 1]["totalShareholderEquity"])) / 2
+                  for i in range(n - 1)]
+    turnover = [_us_ratio(revenue[i], avg_assets[i]) for i in range(n - 1)]
+    multiplier = [_us_ratio(avg_assets[i], avg_equity[i]) for i in range(n - 1)]
+    eps = [_us_ratio(inc[i]["netIncome"], bs[i]["commonStockSharesOutstanding"]) for i in range(n)]
+    bvps = [_us_ratio(bs[i]["totalShareholderEquity"], bs[i]["commonStockSharesOutstanding"]) for i in range(n)]
+    return {
+        "fiscalDateEnding": [bs[i]["fiscalDateEnding"] for i in range(n)],
+        "revenue_growth": [_us_growth(revenue[i], revenue[i + 1]) for i in range(n - 1)],
+        "gross_margin": [_us_ratio(inc[i]["grossProfit"], revenue[i]) for i in range(n)],
+        "operating_expenses_ratio": operating,
+        "selling_expenses_ratio": selling,
+        "r_and_d_expenses_ratio": rnd,
+        "interest_expenses_ratio": interest,
+        "total_expenses_ratio": [operating[i] + selling[i] + rnd[i] + interest[i] for i in range(n)],
+        "fixed_assets_ratio": [_us_ratio(bs[i]["propertyPlantEquipment"], bs[i]["totalAssets"]) for i in range(n)],
+        "current_assets_ratio": [_us_ratio(bs[i]["totalCurrentAssets"], bs[i]["totalAssets"]) for i in range(n)],
+        "current_liabilities_ratio": [_us_ratio(bs[i]["totalCurrentLiabilities"], bs[i]["totalLiabilities"]) for i in range(n)],
+        "long_term_liabilities_ratio": [_us_ratio(bs[i]["totalNonCurrentLiabilities"], bs[i]["totalLiabilities"]) for i in range(n)],
+        "asset_turnover_ratio": [_us_ratio(revenue[i], bs[i]["totalAssets"]) for i in range(n)],
+        "inventory_turnover_ratio": [_us_ratio(inc[i]["costOfRevenue"], bs[i]["inventory"]) for i in range(n)],
+        "receivables_turnover_ratio": [_us_ratio(revenue[i], bs[i]["currentNetReceivables"]) for i in range(n)],
+        "payables_turnover_ratio": [_us_ratio(inc[i]["costOfRevenue"], bs[i]["currentAccountsPayable"]) for i in range(n)],
+        "interest_coverage_ratio": [_us_ratio(inc[i]["ebit"], inc[i]["interestExpense"]) for i in range(n)],
+        "free_cash_flow": fcf,
+        "free_cash_flow_change_rate": [_us_growth(fcf[i], fcf[i + 1]) for i in range(n - 1)],
+        "free_cash_flow_ratio": [_us_ratio(fcf[i], revenue[i]) for i in range(n)],
+        "net_income_margin": net_margin,
+        "total_asset_turnover": turnover,
+        "equity_multiplier": multiplier,
+        "roe": [str(round(net_margin[i] * turnover[i] * multiplier[i], 2) * 100) + "%" for i in range(n - 1)],
+        "debt_ratio": [_us_ratio(bs[i]["totalLiabilities"], bs[i]["totalAssets"]) for i in range(n)],
+        "current_ratio": _us_ratio(bs[0]["totalCurrentAssets"], bs[0]["totalCurrentLiabilities"]),
+        "quick_ratio": _us_ratio(_us_subtract(bs[0]["totalCurrentAssets"], bs[0]["inventory"]),
+                                 bs[0]["totalCurrentLiabilities"]),
+        "operating_cash_flow": [cf[i]["operatingCashflow"] for i in range(n)],
+        "investing_cash_flow": [cf[i]["cashflowFromInvestment"] for i in range(n)],
+        "financing_cash_flow": [cf[i]["cashflowFromFinancing"] for i in range(n)],
+        "pe_ttm": _us_ratio(price, eps[0]),
+        "pb_ttm": _us_ratio(price, bvps[0]),
+    }
+
+
+LEGACY: Dict[str, Callable[[Dict[str, Any], float], dict]] = {"cn": legacy_cn, "hk": legacy_hk, "us": legacy_us}
+
+
+def engine(market: str, statements: Dict[str, Any], price: float) -> dict:
+    if market == "cn":
+        annual = {name: ak_fin_utils._filter_annual_report(df) for name, df in statements.items()}
+        return ratio_engine.calc_ratios("cn", annual["balance_sheet"], annual["income_statement"], annual["cashflow"], price)
+    limit = 6 if market == "us" else None
+    return ratio_engine.calc_ratios(market, statements["balance_sheet"], statements["income_statement"],
+                                    statements["cashflow"], price, limit=limit)
+
+
+# ---------------------------------------------------------------- 对比
+
+def _as_number(value: Any) -> Any:
+    if isinstance(value, str):
+        try:
+            return float(value.rstrip("%"))
+        except ValueError:
+            return value
+    return value
+
+
+def _is_percent(value: Any) -> bool:
+    return isinstance(value, str) and value.endswith("%")
+
+
+def _close(expected: Any, actual: Any, tolerance: float = 0.0) -> bool:
+    if isinstance(expected, list) or isinstance(actual, list):
+        if not isinstance(expected, list) or not isinstance(actual, list) or len(expected) != len(actual):
+            return False
+        return all(_close(e, a, tolerance) for e, a in zip(expected, actual))
+    if _is_percent(expected) != _is_percent(actual):
+        # 百分比字符串与数值不是同一种输出；美股原实现的现金流是上游的数字字符串，与数值等同
+        return False
+    expected, actual = _as_number(expected), _as_number(actual)
+    if isinstance(expected, (int, float)) and isinstance(actual, (int, float)):
+        # 原实现对中间结果逐步取整，允许取整带来的误差
+        return abs(expected - actual) <= max(1e-3, 1e-3 * abs(expected), tolerance * (1 + 1e-6))
+    return expected == actual
+
+
+def compare(market: str, periods: int, price: float = 20.0) -> List[str]:
+    """
+    返回与原实现不一致的键，KNOWN_CHANGES 中的键除外
+    """
+    statements = make_statements(market, periods)
+    expected = LEGACY[market](copy.deepcopy(statements), price)
+    actual = engine(market, statements, price)
+    missing = set(expected) - set(actual)
+    if missing:
+        raise ValueError(f"{market} 缺少原有的键: {sorted(missing)}")
+    tolerance = ROUNDING_TOLERANCE[market]
+    changed = [key for key in expected if not _close(expected[key], actual[key], tolerance.get(key, 0.0))]
+    unexpected = [key for key in changed if key not in KNOWN_CHANGES[market]]
+    print(f"{market}: {len(expected)} 个键，定义修正 {sorted(set(changed) - set(unexpected))}")
+    return unexpected
+
+
+def timed(func: Callable[[Any], Any], inputs: List[Any]) -> float:
+    func(copy.deepcopy(inputs[0]))
+    start = time.perf_counter()
+    for item in inputs:
+        func(item)
+    return (time.perf_counter() - start) / len(inputs)
+
+
+def bench_reprice(periods: int, repeat: int) -> None:
+    """
+    完整计算 vs 只套用股价，报表使用同一份 A 股数据
+    """
+    statements = make_statements("cn", periods)
+    # 让自由现金流为正、每股收益在合理范围，使 DCF 估值和市盈率都参与计算
+    statements["cashflow"]["购建固定资产、无形资产和其他长期资产所支付的现金"] *= 0.01
+    statements["income_statement"]["基本每股收益"] = 1.5
+    start = time.perf_counter()
+    for _ in range(repeat):
+        ak_fin_utils.calc_cn_indicators(statements, 20.0, shares_num=1e9)
+    full = (time.perf_counter() - start) / repeat
+    base = ak_fin_utils.calc_cn_fundamentals(statements)
+    start = time.perf_counter()
+    for i in range(repeat):
+        fundamentals.reprice(base, 20.0 + i * 0.01, shares_num=1e9)
+    repriced = (time.perf_counter() - start) / repeat
+    print(f"full {full * 1000:.3f} ms, reprice {repriced * 1e6:.1f} us, {full / repriced:.0f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="财务比率计算基准")
+    parser.add_argument("--periods", type=int, default=7, help="年报期数")
+    parser.add_argument("--repeat", type=int, default=200, help="每个市场重复次数")
+    parser.add_argument("--reprice", action="store_true", help="对比完整计算与只套用股价")
+    args = parser.parse_args()
+
+    if args.reprice:
+        bench_reprice(args.periods, args.repeat)
+        return
+
+    for market in ratio_engine.FIELDS:
+        unexpected = compare(market, args.periods)
+        if unexpected:
+            raise ValueError(f"{market} 的比率与原实现不一致: {unexpected}")
+
+    # legacy / engine，小于1表示统一实现更慢
+    print(f"{'market':>8} {'legacy(ms)':>12} {'engine(ms)':>12} {'ratio':>8}")
+    for market, legacy in LEGACY.items():
+        statements = make_statements(market, args.periods)
+        # 原实现会原地排序、填充报表，每次调用使用独立的副本
+        inputs = [copy.deepcopy(statements) for _ in range(args.repeat)]
+        legacy_time = timed(lambda s: legacy(s, 20.0), inputs)
+        engine_time = timed(lambda s: engine(market, s, 20.0), inputs)
+        print(f"{market:>8} {legacy_time * 1000:>12.3f} {engine_time * 1000:>12.3f} {legacy_time / engine_time:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
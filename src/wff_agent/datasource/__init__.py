@@ -2,10 +2,18 @@ from wff_agent.datasource import file_lru_cache
 from wff_agent.datasource import news_request
 from wff_agent.datasource import alpha_v_request
 from wff_agent.datasource import akshare_request
+from wff_agent.datasource import macro_store
+from wff_agent.datasource import price_store
+from wff_agent.datasource import replay
+from wff_agent.datasource import scheduler
 
 __all__ = [
     "file_lru_cache",
     "news_request",
     "alpha_v_request",
     "akshare_request",
+    "macro_store",
+    "price_store",
+    "replay",
+    "scheduler",
 ]
\ No newline at end of file
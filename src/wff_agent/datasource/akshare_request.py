@@ -1,15 +1,19 @@
-from concurrent.futures import ThreadPoolExecutor
-from concurrent.futures import as_completed
+from concurrent.futures import Future, as_completed
 import json
-import akshare as ak
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 import pandas as pd
 import datetime
 import logging
 from wff_agent.datasource import file_lru_cache as filecache
+from wff_agent.datasource import macro_store
+from wff_agent.datasource import price_store
+from wff_agent.datasource import replay
+from wff_agent.datasource import scheduler
 
 log = logging.getLogger(__name__)
 
+ak = replay.upstream("akshare")
+
 def get_cn_stock_info(symbol: str) -> Dict[str, Any]:
     """
     获取股票价格
@@ -53,8 +57,8 @@ def get_hk_stock_info(symbol: str) -> Dict[str, Any]:
         - 振幅
        
     """
-    start_date = (datetime.datetime.now() - datetime.timedelta(days=10)).strftime("%Y%m%d")
-    end_date = datetime.datetime.now().strftime("%Y%m%d")
+    start_date = (replay.now() - datetime.timedelta(days=10)).strftime("%Y%m%d")
+    end_date = replay.now().strftime("%Y%m%d")
     stock_info_df = ak.stock_hk_hist(symbol,period="daily", start_date=start_date,end_date=end_date, adjust="qfq")
     stock_info_df = stock_info_df.tail(1)
     stock_info_df["日期"] = stock_info_df["日期"].astype(str)
@@ -81,7 +85,6 @@ def convert2chinese_column(df)-> pd.DataFrame:
     }
     df = df.rename(columns=column_mapping)
     return df
-@filecache.cached("stock_history", expire_seconds=60*60*8)
 def get_stock_history(symbol: str, market: str, period: str = "daily", 
                      start_date: str = None, end_date: str = None,
                      adjust: str = "qfq") -> pd.DataFrame:
@@ -91,7 +94,7 @@ def get_stock_history(symbol: str, market: str, period: str = "daily",
     Args:
         symbol: 股票代码（如：000001，不带市场前缀）
         market: 市场，可选 us, hk, cn
-        period: 时间周期，可选 daily, weekly, monthly
+        period: 时间周期，可选 daily, weekly, monthly, quarterly 或 N日线(如 5d)
         start_date: 开始日期，格式 YYYYMMDD，默认为近一年
         end_date: 结束日期，格式 YYYYMMDD，默认为今天
         adjust: 复权类型，qfq: 前复权, hfq: 后复权, 空: 不复权
@@ -99,60 +102,75 @@ def get_stock_history(symbol: str, market: str, period: str = "daily",
     Returns:
         股票历史数据DataFrame
     """
+    market = market.lower()
+    symbol = symbol.upper()
+    if not end_date:
+        end_date = replay.now().strftime("%Y%m%d")
+    if not start_date:
+        start_date = (replay.now() - datetime.timedelta(days=365)).strftime("%Y%m%d")
+    # 日线来自本地行情存储，复权价格由不复权K线和复权因子现算，其他周期由日线聚合
+    start_date = price_store.period_start_date(start_date, period)
+    log.info(f"获取股票历史数据: {symbol}, {period}, {start_date}, {end_date}, {adjust}")
     try:
-        # 设置默认日期
-        log.info(f"start_date: {start_date}, end_date: {end_date}")
-        market = market.lower()
-        symbol = symbol.upper()
-        if not end_date:
-            end_date = datetime.datetime.now().strftime("%Y%m%d")
-        if not start_date:
-            start_date = (datetime.datetime.now() - datetime.timedelta(days=365)).strftime("%Y%m%d")
-        log.info(f"获取股票历史数据: {symbol}, {period}, {start_date}, {end_date}, {adjust}")
-        df = None
-        with ThreadPoolExecutor() as executor:
-            if market == 'us':
-                log.info(f"获取美股历史数据: {symbol}")
-                future = executor.submit(ak.stock_us_daily, symbol=symbol, adjust=adjust)
-                df = future.result()
-                df = convert2chinese_column(df)
-            elif market == 'hk':
-                log.info(f"获取HK股历史数据: {symbol}")
-                future = executor.submit(ak.stock_hk_hist, symbol=symbol, period=period, start_date=start_date,end_date=end_date, adjust=adjust)
-                df = future.result()
-            elif market == 'cn':
-                log.info(f"获取A股历史数据: {symbol}")
-                future = executor.submit(ak.stock_zh_a_hist, symbol=symbol, period=period, start_date=start_date,end_date=end_date, adjust=adjust)
-                df = future.result()
-                
-        if df is None or df.empty:
-            log.error(f"获取股票历史数据为空: {symbol}")
-            raise ValueError(f"获取股票历史数据为空: {symbol}")
-            
-        # 重命名列，确保列名为小写
-        df.columns = [col.lower() for col in df.columns]
-        
-        # 处理日期列并转换为索引
-        date_columns = ['日期', 'date']
-        date_col = next((col for col in date_columns if col in df.columns), None)
-        
-        if date_col:
-            # 确保日期格式一致
-            if isinstance(df[date_col].iloc[0], str):
-                df[date_col] = pd.to_datetime(df[date_col])
-            df = df.set_index(date_col)
-        
-        # 确保数值列是浮点数
-        numeric_cols = ['开盘', '收盘', '最高', '最低', '成交量', '涨跌幅', '涨跌额', '振幅', '换手率']
-        for col in [c.lower() for c in numeric_cols]:
-            if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors='coerce')       
-        return df
+        df = price_store.get_daily_bars(symbol, market, start_date, end_date, adjust)
     except Exception as e:
         print(f"获取股票历史数据时出错: {e}")
         raise ValueError(f"获取股票历史数据时出错: {e}")
+    if df.empty:
+        log.error(f"获取股票历史数据为空: {symbol}")
+        raise ValueError(f"获取股票历史数据为空: {symbol}")
+    return price_store.resample_bars(df, period)
     
-@filecache.cached("cn_stock_financial_report", expire_seconds=60*60*24*30)
+def _normalize_report_date(value) -> Optional[str]:
+    """
+    将报告期统一为 YYYY-MM-DD 字符串，便于比较版本
+    """
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return None
+    return pd.to_datetime(str(value)).strftime("%Y-%m-%d")
+
+@filecache.cached("cn_latest_report_date", expire_seconds=60*60*24)
+def get_latest_report_date_cn(symbol: str) -> Optional[str]:
+    """
+    探测A股最新的报告期，只请求一次财务摘要，比拉取三张报表便宜得多
+
+    Args:
+        symbol: 股票代码（如：000001，不带市场前缀）
+    Returns:
+        最新报告期，格式 YYYY-MM-DD
+    """
+    abstract_df = ak.stock_financial_abstract(symbol=symbol)
+    report_dates = [col for col in abstract_df.columns if str(col).isdigit()]
+    if not report_dates:
+        return None
+    return _normalize_report_date(max(report_dates))
+
+def report_version_cn(reports: dict) -> Optional[str]:
+    """
+    A股报表的版本: 三张报表各自最新报告期中最早的一个
+    """
+    dates = [pd.to_datetime(reports[key]["报告日"].astype(str)).max()
+             for key in ("balance_sheet", "income_statement", "cashflow")]
+    return min(dates).strftime("%Y-%m-%d")
+
+def _merge_cn_reports(old: dict, new: dict) -> dict:
+    """
+    把新拉取的报表合并进已缓存的历史，相同报告期以新数据为准
+    """
+    merged = {}
+    for key, new_df in new.items():
+        old_df = old.get(key)
+        if old_df is None:
+            merged[key] = new_df
+            continue
+        df = pd.concat([new_df, old_df], ignore_index=True)
+        report_date = pd.to_datetime(df["报告日"].astype(str))
+        df = df[~report_date.duplicated(keep="first")]
+        merged[key] = df.iloc[pd.to_datetime(df["报告日"].astype(str)).argsort()[::-1]].reset_index(drop=True)
+    return merged
+
+@filecache.versioned("cn_stock_financial_report", probe=get_latest_report_date_cn,
+                     version_of=report_version_cn, merge=_merge_cn_reports)
 def get_stock_financial_report_cn(symbol: str) -> dict:
     """
     获取股票财务指标
@@ -178,26 +196,26 @@ def get_stock_financial_report_cn(symbol: str) -> dict:
         def get_cash_flow_statement():
             log.info(f"get_cash_flow_statement: {symbol}")
             return ak.stock_financial_report_sina(stock=symbol, symbol="现金流量表")
-        with ThreadPoolExecutor() as executor:
-            log.info("ThreadPoolExecutor")
-            future_to_symbol = {executor.submit(get_balance_sheet): "资产负债表",
-                                executor.submit(get_income_statement): "利润表",
-                                executor.submit(get_cash_flow_statement): "现金流量表"}
-            for future in as_completed(future_to_symbol):
-                current_report_type = future_to_symbol[future]
-                try:
-                    data = future.result()
-                except Exception as exc:
-                    log.error('%r generated an exception: %s' % (current_report_type, exc))
-                    raise ValueError(f"获取股票财务指标时出错: {exc}")
-                else:
-                    log.info('%r page is %d bytes' % (current_report_type, len(data)))
-                    if current_report_type == "资产负债表":
-                        balance_sheet = data
-                    elif current_report_type == "利润表":
-                        income_statement = data
-                    elif current_report_type == "现金流量表":
-                        cash_flow_statement = data
+        future_to_symbol = {scheduler.submit("akshare", get_balance_sheet): "资产负债表",
+                            scheduler.submit("akshare", get_income_statement): "利润表",
+                            scheduler.submit("akshare", get_cash_flow_statement): "现金流量表"}
+        for future in as_completed(future_to_symbol):
+            current_report_type = future_to_symbol[future]
+            try:
+                data = future.result()
+            except Exception as exc:
+                log.error('%r generated an exception: %s' % (current_report_type, exc))
+                for other in future_to_symbol:
+                    other.cancel()
+                raise ValueError(f"获取股票财务指标时出错: {exc}")
+            else:
+                log.info('%r page is %d bytes' % (current_report_type, len(data)))
+                if current_report_type == "资产负债表":
+                    balance_sheet = data
+                elif current_report_type == "利润表":
+                    income_statement = data
+                elif current_report_type == "现金流量表":
+                    cash_flow_statement = data
         # 合并财务指标
         if balance_sheet is None:
             raise ValueError(f"获取股票财务balance_sheet时出错: {symbol}")
@@ -216,18 +234,68 @@ def get_stock_financial_report_cn(symbol: str) -> dict:
         print(f"获取股票财务指标时出错: {e}")
         raise ValueError(f"获取股票财务指标时出错: {e}")
     
-@filecache.cached("stock_financial_report_hk", expire_seconds=60*60*24*30)
+def get_cached_financial_report_cn(symbol: str) -> Optional[dict]:
+    """
+    读取本地已缓存的A股财报，不回源，未缓存时返回None
+    """
+    return filecache.peek_versioned("cn_stock_financial_report", symbol)
+
+@filecache.cached("hk_latest_report_date", expire_seconds=60*60*24)
+def get_latest_report_date_hk(symbol: str) -> Optional[str]:
+    """
+    探测港股最新的报告期，只请求一次主要指标，而不是六张报表
+
+    Args:
+        symbol: 股票代码（如：00700）
+    Returns:
+        最新报告期，格式 YYYY-MM-DD
+    """
+    indicator_df = ak.stock_financial_hk_analysis_indicator_em(symbol=symbol, indicator="报告期")
+    if indicator_df is None or indicator_df.empty:
+        return None
+    return _normalize_report_date(pd.to_datetime(indicator_df["REPORT_DATE"]).max())
+
+# 合并后每张港股报表保留的报告期数量
+HK_REPORT_KEEP_PERIODS = 8
+
+def report_version_hk(reports: dict) -> Optional[str]:
+    """
+    港股报表的版本: 所有报表中最新的报告期
+    """
+    report_times = [report["report_time"] for value in reports.values() for report in json.loads(value)]
+    if not report_times:
+        return None
+    return _normalize_report_date(max(report_times))
+
+def _merge_hk_reports(old: dict, new: dict) -> dict:
+    """
+    按 report_time 合并港股报表，相同报告期以新数据为准
+    """
+    merged = {}
+    for key, new_value in new.items():
+        reports = {report["report_time"]: report for report in json.loads(old.get(key, "[]"))}
+        reports.update({report["report_time"]: report for report in json.loads(new_value)})
+        recent = sorted(reports.values(), key=lambda x: x["report_time"], reverse=True)[:HK_REPORT_KEEP_PERIODS]
+        merged[key] = json.dumps(sorted(recent, key=lambda x: x["report_time"]), ensure_ascii=False)
+    return merged
+
+def _submit_hk_report(symbol: str, statement: str, indicator: str) -> Future:
+    """提交一张港股报表的拉取任务"""
+    return scheduler.submit("akshare", ak.stock_financial_hk_report_em,
+                            kwargs={"stock": symbol, "symbol": statement, "indicator": indicator})
+
+@filecache.versioned("stock_financial_report_hk", probe=get_latest_report_date_hk,
+                     version_of=report_version_hk, merge=_merge_hk_reports)
 def get_stock_financial_report_hk(symbol: str) -> dict:
     balance_sheet = None
     income_statement = None
     cash_flow_statement = None
-    with ThreadPoolExecutor() as executor:
-        balance_sheet = executor.submit(ak.stock_financial_hk_report_em, stock=symbol, symbol="资产负债表", indicator="年度")
-        income_statement = executor.submit(ak.stock_financial_hk_report_em, stock=symbol, symbol="利润表", indicator="年度")
-        cash_flow_statement = executor.submit(ak.stock_financial_hk_report_em, stock=symbol, symbol="现金流量表", indicator="年度")
-        quarter_balance_sheet = executor.submit(ak.stock_financial_hk_report_em, stock=symbol, symbol="资产负债表", indicator="季度")
-        quarter_income_statement = executor.submit(ak.stock_financial_hk_report_em, stock=symbol, symbol="利润表", indicator="季度")
-        quarter_cash_flow_statement = executor.submit(ak.stock_financial_hk_report_em, stock=symbol, symbol="现金流量表", indicator="季度")
+    balance_sheet = _submit_hk_report(symbol, "资产负债表", "年度")
+    income_statement = _submit_hk_report(symbol, "利润表", "年度")
+    cash_flow_statement = _submit_hk_report(symbol, "现金流量表", "年度")
+    quarter_balance_sheet = _submit_hk_report(symbol, "资产负债表", "季度")
+    quarter_income_statement = _submit_hk_report(symbol, "利润表", "季度")
+    quarter_cash_flow_statement = _submit_hk_report(symbol, "现金流量表", "季度")
     
     balance_sheet_result = transform_hk_financial_report(balance_sheet.result())
     income_statement_result = transform_hk_financial_report(income_statement.result())
@@ -245,24 +313,46 @@ def get_stock_financial_report_hk(symbol: str) -> dict:
         "quarter_cashflow": quarter_cash_flow_statement_result
     }
 
+def get_cached_financial_report_hk(symbol: str) -> Optional[dict]:
+    """
+    读取本地已缓存的港股财报，不回源，未缓存时返回None
+    """
+    return filecache.peek_versioned("stock_financial_report_hk", symbol)
+
+@filecache.cached("industry_constituents", expire_seconds=60*60*24)
+def get_industry_constituents(industry: str) -> pd.DataFrame:
+    """
+    获取东方财富行业板块的成分股
+
+    Args:
+        industry: 行业板块名称，与 get_cn_stock_info 返回的 行业 相同，如 家电行业
+    Returns:
+        成分股行情DataFrame，包含 代码、名称、最新价、成交额、市盈率-动态、市净率 等列
+    """
+    df = scheduler.run("akshare", ak.stock_board_industry_cons_em, kwargs={"symbol": industry})
+    if df is None or df.empty:
+        raise ValueError(f"行业板块没有成分股: {industry}")
+    df = df.copy()
+    df["代码"] = df["代码"].astype(str)
+    return df.drop(columns=["序号"], errors="ignore")
+
 def get_macro_data() -> dict:
     """
-    获取宏观数据
+    获取宏观数据，数据来自本地宏观存储，按发布日历刷新
     """
-    macro_china_ppi_yearly_df = ak.macro_china_ppi_yearly()
-    macro_china_cpi_yearly_df = ak.macro_china_cpi_yearly()
-    macro_china_cx_services_pmi_yearly_df = ak.macro_china_cx_services_pmi_yearly()
-    macro_usa_cpi_monthly_df = ak.macro_usa_cpi_monthly()
-    macro_usa_labor_df = ak.macro_usa_lmci()
-    macro_bank_usa_interest_rate_df = ak.macro_bank_usa_interest_rate()
-    return {
-        "macro_china_ppi_yearly": json.dumps(macro_china_ppi_yearly_df, ensure_ascii=False, orient="records"),
-        "macro_china_cpi_yearly": json.dumps(macro_china_cpi_yearly_df, ensure_ascii=False, orient="records"),
-        "macro_china_cx_services_pmi_yearly": json.dumps(macro_china_cx_services_pmi_yearly_df, ensure_ascii=False, orient="records"),
-        "macro_usa_cpi_monthly": json.dumps(macro_usa_cpi_monthly_df, ensure_ascii=False, orient="records"),
-        "macro_usa_labor": json.dumps(macro_usa_labor_df, ensure_ascii=False, orient="records"),
-        "macro_bank_usa_interest_rate": json.dumps(macro_bank_usa_interest_rate_df, ensure_ascii=False, orient="records"),
+    names = {
+        "macro_china_ppi_yearly": "cn_ppi",
+        "macro_china_cpi_yearly": "cn_cpi",
+        "macro_china_cx_services_pmi_yearly": "cn_cx_pmi",
+        "macro_usa_cpi_monthly": "us_cpi",
+        "macro_usa_labor": "us_lmci",
+        "macro_bank_usa_interest_rate": "us_interest_rate",
     }
+    result = {}
+    for key, name in names.items():
+        df, _ = macro_store.get_series(name, last_n=12)
+        result[key] = df.to_json(force_ascii=False, orient="records")
+    return result
 
       
 def transform_hk_financial_report(df: pd.DataFrame) -> List[Dict[str, Any]]:
@@ -275,11 +365,11 @@ def transform_hk_financial_report(df: pd.DataFrame) -> List[Dict[str, Any]]:
     Returns:
         dict: 转换后的财务报告数据 
     """
-    # 确保REPORT_DATE列是日期时间格式
-    df['REPORT_DATE'] = pd.to_datetime(df['REPORT_DATE'])
-    df.fillna(0, inplace=True)
-    df.sort_values(by="REPORT_DATE", inplace=True, ascending=False)
-    df = df.head(5)
+    # 确保REPORT_DATE列是日期时间格式，不修改传入的报表
+    df = (df.assign(REPORT_DATE=pd.to_datetime(df['REPORT_DATE']))
+            .fillna(0)
+            .sort_values(by="REPORT_DATE", ascending=False)
+            .head(5))
     # 按REPORT_DATE分组
     grouped = df.groupby('REPORT_DATE')
     
@@ -392,21 +482,15 @@ def get_global_financial_news() -> pd.DataFrame:
 
 
 def get_cn_ppi() -> pd.DataFrame:
-    macro_china_ppi_yearly_df = ak.macro_china_ppi_yearly()
-    macro_china_ppi_yearly_df.sort_values(by="日期", inplace=True, ascending=False)
-    macro_china_ppi_yearly_df = macro_china_ppi_yearly_df.head(12)
+    macro_china_ppi_yearly_df, _ = macro_store.get_series("cn_ppi", last_n=12)
     return macro_china_ppi_yearly_df
 
 def get_cn_cpi() -> pd.DataFrame:
-    macro_china_cpi_yearly_df = ak.macro_china_cpi_yearly()
-    macro_china_cpi_yearly_df.sort_values(by="日期", inplace=True, ascending=False)
-    macro_china_cpi_yearly_df = macro_china_cpi_yearly_df.head(12)
+    macro_china_cpi_yearly_df, _ = macro_store.get_series("cn_cpi", last_n=12)
     return macro_china_cpi_yearly_df
 
 def get_cn_cx_pmi() -> pd.DataFrame:
-    macro_china_cx_services_pmi_yearly_df = ak.macro_china_cx_services_pmi_yearly()
-    macro_china_cx_services_pmi_yearly_df.sort_values(by="日期", inplace=True, ascending=False)
-    macro_china_cx_services_pmi_yearly_df = macro_china_cx_services_pmi_yearly_df.head(12)
+    macro_china_cx_services_pmi_yearly_df, _ = macro_store.get_series("cn_cx_pmi", last_n=12)
     return macro_china_cx_services_pmi_yearly_df
 
 
@@ -420,9 +504,7 @@ def get_us_cpi() -> pd.DataFrame:
 3    美国CPI月率  1970-04-01  0.5  NaN  0.5
 4    美国CPI月率  1970-05-01  0.5  NaN  0.5
     """
-    macro_usa_cpi_monthly_df = ak.macro_usa_cpi_monthly()
-    macro_usa_cpi_monthly_df.sort_values(by="日期", inplace=True, ascending=False)
-    macro_usa_cpi_monthly_df = macro_usa_cpi_monthly_df.head(5)
+    macro_usa_cpi_monthly_df, _ = macro_store.get_series("us_cpi", last_n=5)
     return macro_usa_cpi_monthly_df
 
 def get_labor_index() -> pd.DataFrame:
@@ -434,9 +516,7 @@ def get_labor_index() -> pd.DataFrame:
 2   美联储劳动力市场状况指数  2014-12-08  2.9  NaN  3.9
 3   美联储劳动力市场状况指数  2015-01-12  6.1  NaN  5.5
     """
-    macro_usa_labor_df = ak.macro_usa_lmci()
-    macro_usa_labor_df.sort_values(by="日期", inplace=True, ascending=False)
-    macro_usa_labor_df = macro_usa_labor_df.head(5)
+    macro_usa_labor_df, _ = macro_store.get_series("us_lmci", last_n=5)
     return macro_usa_labor_df
 
 def get_usa_interest_rate() -> pd.DataFrame:
@@ -449,9 +529,7 @@ def get_usa_interest_rate() -> pd.DataFrame:
 3    美联储利率决议报告  1982-11-20   9.00   NaN   9.50
 4    美联储利率决议报告  1982-12-15   8.50   NaN   9.00
     """
-    macro_bank_usa_interest_rate_df = ak.macro_bank_usa_interest_rate()
-    macro_bank_usa_interest_rate_df.sort_values(by="日期", inplace=True, ascending=False)
-    macro_bank_usa_interest_rate_df = macro_bank_usa_interest_rate_df.head(5)
+    macro_bank_usa_interest_rate_df, _ = macro_store.get_series("us_interest_rate", last_n=5)
     return macro_bank_usa_interest_rate_df
 
 def get_global_index()-> pd.DataFrame:
@@ -474,6 +552,31 @@ def get_cn_index_spot()-> pd.DataFrame:
     stock_zh_index_spot_sina_df = ak.stock_zh_index_spot_sina()
     return stock_zh_index_spot_sina_df[stock_zh_index_spot_sina_df["名称"].isin(["上证指数", "深圳成指", "创业板指", "沪深300", "中证500"])]
 
+@filecache.cached("market_spot", expire_seconds=60*5)
+def get_market_spot(market: str) -> pd.DataFrame:
+    """
+    获取全市场实时行情快照
+
+    Args:
+        market: 市场，可选 us, hk, cn
+    Returns:
+        每只股票一行的DataFrame，代码列为不带市场前缀的股票代码
+    """
+    if market == "cn":
+        df = scheduler.run("akshare", ak.stock_zh_a_spot_em)
+    elif market == "hk":
+        df = scheduler.run("akshare", ak.stock_hk_spot_em)
+    elif market == "us":
+        df = scheduler.run("akshare", ak.stock_us_spot_em)
+    else:
+        raise ValueError(f"不支持的市场: {market}")
+    if df is None or df.empty:
+        raise ValueError(f"获取{market}市场行情快照为空")
+    df = df.copy()
+    # 东方财富美股代码带交易所编号前缀，如 105.AAPL
+    df["代码"] = df["代码"].astype(str).str.split(".").str[-1]
+    return df.drop(columns=["序号"], errors="ignore")
+
 def get_us_stock_spot()-> pd.DataFrame:
     """
     获取美国股票
@@ -1,16 +1,18 @@
 # -*- coding: utf-8 -*-
-from concurrent.futures import ThreadPoolExecutor
 import logging
 import os
 import requests
+from typing import Optional
 from wff_agent.datasource import file_lru_cache as filecache
+from wff_agent.datasource import replay
+from wff_agent.datasource import scheduler
 
 log = logging.getLogger(__name__)
 
 
 ALPHA_VANTAGE_API_KEY = os.getenv("ALPHA_VANTAGE_API_KEY")
 
-
+@replay.recordable("alphavantage")
 def _get_fin_report(symbol: str, report_type: str = "BALANCE_SHEET") -> dict:
     
     url = f'https://www.alphavantage.co/query?function={report_type}&symbol={symbol}&apikey={ALPHA_VANTAGE_API_KEY}'
@@ -18,13 +20,17 @@ def _get_fin_report(symbol: str, report_type: str = "BALANCE_SHEET") -> dict:
     data = r.json()
     return data
 
+@replay.recordable("alphavantage")
+def _get_global_quote(symbol: str) -> dict:
+    url = f'https://www.alphavantage.co/query?function=GLOBAL_QUOTE&symbol={symbol}&apikey={ALPHA_VANTAGE_API_KEY}'
+    r = requests.get(url)
+    return r.json()
+
 @filecache.cached("us_stock_info", expire_seconds=60*60*4)
 def get_us_stock_info(symbol: str) -> float:
     """获取美股股票价格
     """
-    url = f'https://www.alphavantage.co/query?function=GLOBAL_QUOTE&symbol={symbol}&apikey={ALPHA_VANTAGE_API_KEY}'
-    r = requests.get(url)
-    data = r.json()
+    data = _get_global_quote(symbol)
     print(data)
     try:
         return {
@@ -37,7 +43,46 @@ def get_us_stock_info(symbol: str) -> float:
         raise Exception(f"请求失败：请检查API密钥或股票代码{symbol}")
     
 
-@filecache.cached("us_stock_financial_report", expire_seconds=60*60*24*30)
+@filecache.cached("us_latest_report_date", expire_seconds=60*60*24)
+def get_latest_report_date_us(symbol: str) -> Optional[str]:
+    """探测美股最新的报告期，只请求一次 EARNINGS，而不是三张报表
+
+    Args:
+        symbol (str): 股票代码
+
+    Returns:
+        str: 最新报告期，格式 YYYY-MM-DD
+    """
+    earnings = _get_fin_report(symbol, "EARNINGS")
+    dates = [item["fiscalDateEnding"] for item in earnings.get("quarterlyEarnings", [])]
+    return max(dates) if dates else None
+
+def report_version_us(reports: dict) -> Optional[str]:
+    """美股报表的版本: 三张报表各自最新季报报告期中最早的一个
+    """
+    dates = []
+    for report in reports.values():
+        quarterly = [item["fiscalDateEnding"] for item in report.get("quarterlyReports", [])]
+        if quarterly:
+            dates.append(max(quarterly))
+    return min(dates) if dates else None
+
+def _merge_us_reports(old: dict, new: dict) -> dict:
+    """按 fiscalDateEnding 合并年报和季报，相同报告期以新数据为准
+    """
+    merged = {}
+    for key, new_report in new.items():
+        report = dict(new_report)
+        old_report = old.get(key, {})
+        for field in ("annualReports", "quarterlyReports"):
+            items = {item["fiscalDateEnding"]: item for item in old_report.get(field, [])}
+            items.update({item["fiscalDateEnding"]: item for item in new_report.get(field, [])})
+            report[field] = sorted(items.values(), key=lambda x: x["fiscalDateEnding"], reverse=True)
+        merged[key] = report
+    return merged
+
+@filecache.versioned("us_stock_financial_report", probe=get_latest_report_date_us,
+                     version_of=report_version_us, merge=_merge_us_reports)
 def get_stock_financial_report_us(symbol: str) -> dict:
     """获取财务报表
 
@@ -51,23 +96,22 @@ def get_stock_financial_report_us(symbol: str) -> dict:
         balance_sheet = None
         income_statement = None
         cash_flow = None
-        with ThreadPoolExecutor(max_workers=10) as executor:
-            balance_sheet_future = executor.submit(_get_fin_report, symbol, "BALANCE_SHEET")
-            income_statement_future = executor.submit(_get_fin_report, symbol, "INCOME_STATEMENT")
-            cash_flow_future = executor.submit(_get_fin_report, symbol, "CASH_FLOW")
-
-            balance_sheet = balance_sheet_future.result()
-            income_statement = income_statement_future.result()
-            cash_flow = cash_flow_future.result() 
-            if balance_sheet is None or len(balance_sheet) == 0:
-                log.error(f"获取 {symbol} 资产负债表失败")
-                raise Exception(f"获取 {symbol} 资产负债表失败")
-            if income_statement is None or len(income_statement) == 0:
-                log.error(f"获取 {symbol} 利润表失败")
-                raise Exception(f"获取 {symbol} 利润表失败")
-            if cash_flow is None or len(cash_flow) == 0:
-                log.error(f"获取 {symbol} 现金流量表失败")
-                raise Exception(f"获取 {symbol} 现金流量表失败")
+        balance_sheet_future = scheduler.submit("alphavantage", _get_fin_report, (symbol, "BALANCE_SHEET"))
+        income_statement_future = scheduler.submit("alphavantage", _get_fin_report, (symbol, "INCOME_STATEMENT"))
+        cash_flow_future = scheduler.submit("alphavantage", _get_fin_report, (symbol, "CASH_FLOW"))
+
+        balance_sheet = balance_sheet_future.result()
+        income_statement = income_statement_future.result()
+        cash_flow = cash_flow_future.result() 
+        if balance_sheet is None or len(balance_sheet) == 0:
+            log.error(f"获取 {symbol} 资产负债表失败")
+            raise Exception(f"获取 {symbol} 资产负债表失败")
+        if income_statement is None or len(income_statement) == 0:
+            log.error(f"获取 {symbol} 利润表失败")
+            raise Exception(f"获取 {symbol} 利润表失败")
+        if cash_flow is None or len(cash_flow) == 0:
+            log.error(f"获取 {symbol} 现金流量表失败")
+            raise Exception(f"获取 {symbol} 现金流量表失败")
     except Exception as e:
         log.error(f"获取 {symbol} 财务报表失败: {e}")
         raise Exception(f"获取 {symbol} 财务报表失败: {e}")
@@ -78,6 +122,11 @@ def get_stock_financial_report_us(symbol: str) -> dict:
         "cashflow": cash_flow
     }
 
+def get_cached_financial_report_us(symbol: str) -> Optional[dict]:
+    """读取本地已缓存的美股财报，不回源，未缓存时返回None
+    """
+    return filecache.peek_versioned("us_stock_financial_report", symbol)
+
 
 if __name__ == "__main__":
     data = get_us_stock_info("AAPL")
@@ -1,10 +1,96 @@
+"""
+本地文件缓存，带进程内的内存层
+
+内存层保存最近读写过的对象，命中时不再反序列化 pickle 文件。返回给调用方的是副本，
+调用方对返回值的任何修改都只作用在自己的副本上，不会污染缓存:
+
+- dict/list/tuple 逐层复制容器，str、数字、日期等不可变标量直接共享
+- DataFrame/Series 在写时复制生效时(pandas 3，或 pandas 2 中调用方开启了 mode.copy_on_write)
+  用 copy(deep=False) 共享底层数据，否则深拷贝。本模块不修改 pandas 的全局选项，
+  因此 pandas 2 默认配置下每次命中都会复制 DataFrame，省掉的只是反序列化
+- numpy 数组复制一份，其他对象(如自定义类的实例)深拷贝
+
+返回值总是副本，缓存对象不会被调用方原地修改，不需要额外的校验。
+"""
+import copy
 import datetime
+import threading
 import time
 import hashlib
 import os
+from collections import OrderedDict
 from pathlib import Path
 import pickle
-from typing import Any, Callable, Optional
+from typing import Any, Callable, Optional, Tuple
+import numpy as np
+import pandas as pd
+from wff_agent.datasource import replay
+
+# 内存层保留的对象数
+MEMORY_MAX_ENTRIES = 256
+# versioned 缓存的数据落后于探测到的版本时，重新拉取的最短间隔
+LAG_RETRY_SECONDS = 60*60
+
+# pandas 3 起写时复制是默认且唯一的行为
+_PANDAS_COW = int(pd.__version__.split(".")[0]) >= 3
+# 可以直接共享的不可变标量
+_IMMUTABLE = (str, bytes, int, float, complex, bool, type(None), datetime.date, datetime.timedelta, np.generic)
+
+# 缓存键 -> (过期时间戳, 缓存文件修改时间, 数据)
+_memory: "OrderedDict[str, Tuple[float, int, Any]]" = OrderedDict()
+_memory_lock = threading.Lock()
+
+def _copy_on_write() -> bool:
+    # pandas 2 的 mode.copy_on_write 可以是 True/False/"warn"，只有 True 时浅拷贝才不会被原地修改穿透
+    return _PANDAS_COW or pd.get_option("mode.copy_on_write") is True
+
+def _share(data: Any) -> Any:
+    """
+    返回调用方可以随意修改的副本: 容器逐层复制，不可变标量直接共享，
+    DataFrame/Series 在写时复制生效时浅拷贝、否则深拷贝，numpy 数组和其他对象复制
+    """
+    if isinstance(data, (pd.DataFrame, pd.Series)):
+        return data.copy(deep=not _copy_on_write())
+    if type(data) is dict:
+        return {key: _share(value) for key, value in data.items()}
+    if type(data) is list:
+        return [_share(value) for value in data]
+    if type(data) is tuple:
+        return tuple(_share(value) for value in data)
+    if isinstance(data, _IMMUTABLE):
+        return data
+    if isinstance(data, np.ndarray):
+        return data.copy()
+    return copy.deepcopy(data)
+
+def _remember(cache_key: str, data: Any, expire_time: float, mtime: int) -> None:
+    with _memory_lock:
+        _memory[cache_key] = (expire_time, mtime, data)
+        _memory.move_to_end(cache_key)
+        while len(_memory) > MEMORY_MAX_ENTRIES:
+            _memory.popitem(last=False)
+
+def _recall(cache_key: str, cache_file: Path) -> Optional[Any]:
+    """
+    从内存层读取，缓存文件被删除或被其他进程改写(修改时间变化)时视为未命中
+    """
+    with _memory_lock:
+        entry = _memory.get(cache_key)
+        if entry is not None:
+            _memory.move_to_end(cache_key)
+    if entry is None:
+        return None
+    expire_time, mtime, data = entry
+    try:
+        current_mtime = cache_file.stat().st_mtime_ns
+    except OSError:
+        current_mtime = None
+    if current_mtime != mtime or time.time() > expire_time:
+        with _memory_lock:
+            if _memory.get(cache_key) is entry:
+                del _memory[cache_key]
+        return None
+    return _share(data)
 
 def get_cache_dir() -> Path:
     """
@@ -45,6 +131,9 @@ def cache_data(data: Any, cache_key: str, expire_seconds: int = 3600) -> None:
         cache_key: 缓存键
         expire_seconds: 过期时间（秒）
     """
+    if not replay.is_live():
+        # 录制/回放模式下不读写本地缓存，保证每次都经过录制层
+        return
     cache_dir = get_cache_dir()
     cache_file = cache_dir / f"{cache_key}.pkl"
     
@@ -58,6 +147,8 @@ def cache_data(data: Any, cache_key: str, expire_seconds: int = 3600) -> None:
     try:
         with open(cache_file, "wb") as f:
             pickle.dump(cache_data, f)
+        # 保存副本，调用方此后修改自己持有的对象不会影响内存层
+        _remember(cache_key, _share(data), cache_data["expire_time"].timestamp(), cache_file.stat().st_mtime_ns)
     except Exception as e:
         print(f"缓存数据时出错: {str(e)}")
         
@@ -69,15 +160,21 @@ def get_cached_data(cache_key: str) -> Optional[Any]:
         cache_key: 缓存键
         
     Returns:
-        缓存的数据，如果不存在或已过期则返回None
+        缓存数据的副本(仅在写时复制生效时与缓存共享 DataFrame 的底层数据)，如果不存在或已过期则返回None
     """
+    if not replay.is_live():
+        return None
     cache_dir = get_cache_dir()
     cache_file = cache_dir / f"{cache_key}.pkl"
-    
+
+    data = _recall(cache_key, cache_file)
+    if data is not None:
+        return data
     if not cache_file.exists():
         return None
     
     try:
+        mtime = cache_file.stat().st_mtime_ns
         with open(cache_file, "rb") as f:
             cache_data = pickle.load(f)
         
@@ -88,8 +185,9 @@ def get_cached_data(cache_key: str) -> Optional[Any]:
             # 删除过期缓存
             os.remove(cache_file)
             return None
-        
-        return cache_data["data"]
+
+        _remember(cache_key, cache_data["data"], expired_time, mtime)
+        return _share(cache_data["data"])
     except Exception as e:
         print(f"读取缓存数据时出错: {str(e)}")
         return None
@@ -128,6 +226,101 @@ def cached(prefix: str, expire_seconds: int = 3600):
         return wrapper
     return decorator
 
+def _lagging(entry: dict) -> bool:
+    """
+    缓存的数据版本是否落后于拉取时探测到的版本(探测接口已出现新一期，报表接口尚未更新)
+    """
+    version, checked = entry.get("version"), entry.get("checked_version")
+    return version is not None and checked is not None and version < checked
+
+def versioned(prefix: str, probe: Callable[..., Optional[str]],
+              version_of: Callable[[Any], Optional[str]],
+              merge: Optional[Callable[[Any, Any], Any]] = None,
+              max_age_seconds: int = 60*60*24*180,
+              lag_retry_seconds: int = LAG_RETRY_SECONDS):
+    """
+    按数据版本失效的缓存装饰器，适用于财报这类只在新一期发布时才变化的数据
+
+    每次调用先用 probe 廉价地探测上游最新版本(如最新报告期)，只有出现比已缓存数据更新的版本时
+    才重新拉取，并用 merge 把新数据合并进已缓存的历史，而不是整体替换。
+    
+    Args:
+        prefix: 缓存键前缀
+        probe: 与被装饰函数参数相同，返回上游最新版本，版本需可按字符串比较(如 YYYY-MM-DD)
+        version_of: 从数据中计算其所含的最新版本
+        merge: merge(old, new) 返回合并后的数据，为None时直接替换
+        max_age_seconds: 缓存最长保留时间，超过后无论版本都重新拉取
+        lag_retry_seconds: 数据版本落后于探测到的版本时，重新拉取的最短间隔
+    Returns:
+        装饰器函数
+    """
+    def decorator(func: Callable):
+        def wrapper(*args, **kwargs):
+            cache_key = generate_cache_key(prefix, *args, **kwargs)
+            entry = get_cached_data(cache_key)
+            if not isinstance(entry, dict) or "version" not in entry:
+                entry = None
+
+            latest_version = None
+            try:
+                latest_version = probe(*args, **kwargs)
+            except Exception as e:
+                print(f"探测 {func.__name__} 最新版本出错: {str(e)}")
+                if entry is not None:
+                    return entry["data"]
+
+            if entry is not None:
+                # checked_version 记录拉取时探测到的版本；报表接口滞后于探测结果时缓存的数据仍是旧版本，
+                # 此时每隔 lag_retry_seconds 重新拉取一次，直到数据追上探测到的版本
+                known = [v for v in (entry["version"], entry.get("checked_version")) if v]
+                known_version = max(known) if known else None
+                if latest_version is None or (known_version is not None and latest_version <= known_version):
+                    if not _lagging(entry):
+                        return entry["data"]
+                    if time.time() - entry.get("fetched_at", 0) < lag_retry_seconds:
+                        return entry["data"]
+                    print(f"{func.__name__} 缓存报告期 {entry['version']} 仍落后于探测到的 {entry['checked_version']}, 重新拉取")
+                else:
+                    print(f"{func.__name__} 出现新报告期 {latest_version}, 已缓存 {entry['version']}")
+
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                print(f"call func {func.__name__} 出错: {str(e)}")
+                raise ValueError(f"缓存装饰器时出错: {str(e)}")
+
+            if entry is not None and merge is not None:
+                try:
+                    result = merge(entry["data"], result)
+                except Exception as e:
+                    print(f"合并 {func.__name__} 缓存数据出错, 使用新数据: {str(e)}")
+            checked = [v for v in (latest_version, entry and entry.get("checked_version")) if v]
+            cache_data({
+                "data": result,
+                "version": version_of(result),
+                "checked_version": max(checked) if checked else None,
+                "fetched_at": time.time(),
+            }, cache_key, max_age_seconds)
+            return result
+        return wrapper
+    return decorator
+
+def peek_versioned(prefix: str, *args, **kwargs) -> Optional[Any]:
+    """
+    只读取 versioned 缓存中已有的数据，不探测版本也不回源
+
+    Args:
+        prefix: 缓存键前缀，与 versioned 装饰器一致
+        *args: 与被装饰函数调用时相同的位置参数
+        **kwargs: 与被装饰函数调用时相同的关键字参数
+    Returns:
+        缓存的数据，未缓存时返回None
+    """
+    entry = get_cached_data(generate_cache_key(prefix, *args, **kwargs))
+    if not isinstance(entry, dict) or "version" not in entry:
+        return None
+    return entry["data"]
+
 def clear_cache(prefix: Optional[str] = None) -> int:
     """
     清除缓存
@@ -138,6 +331,9 @@ def clear_cache(prefix: Optional[str] = None) -> int:
     Returns:
         清除的缓存文件数量
     """
+    with _memory_lock:
+        for cache_key in [key for key in _memory if prefix is None or key.startswith(f"{prefix}_")]:
+            del _memory[cache_key]
     cache_dir = get_cache_dir()
     count = 0
     
@@ -149,4 +345,30 @@ def clear_cache(prefix: Optional[str] = None) -> int:
             except Exception as e:
                 print(f"删除缓存文件 {cache_file} 时出错: {str(e)}")
     
-    return count 
\ No newline at end of file
+    return count 
+
+def prune_cache(prefix: str, max_entries: int) -> int:
+    """
+    按修改时间删除最旧的缓存文件，使某个前缀的缓存不超过 max_entries 个
+    
+    Args:
+        prefix: 缓存键前缀
+        max_entries: 保留的缓存文件数量
+        
+    Returns:
+        删除的缓存文件数量
+    """
+    files = []
+    for cache_file in get_cache_dir().glob(f"{prefix}_*.pkl"):
+        try:
+            files.append((cache_file.stat().st_mtime_ns, cache_file))
+        except OSError:
+            continue
+    count = 0
+    for _, cache_file in sorted(files)[:max(0, len(files) - max_entries)]:
+        try:
+            os.remove(cache_file)
+            count += 1
+        except Exception as e:
+            print(f"删除缓存文件 {cache_file} 时出错: {str(e)}")
+    return count
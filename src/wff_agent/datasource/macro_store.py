@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+import datetime
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from wff_agent.datasource import file_lru_cache as filecache
+from wff_agent.datasource import replay
+from wff_agent.datasource import scheduler
+
+log = logging.getLogger(__name__)
+
+ak = replay.upstream("akshare")
+
+# 本地存储的保留时间，真正的刷新由发布日历决定
+STORE_EXPIRE_SECONDS = 60*60*24*365
+# 发布日已过但数据未更新时，最短重新检查间隔
+MIN_RECHECK_SECONDS = 60*60*6
+
+
+class MacroSeries:
+    """宏观时间序列定义"""
+    def __init__(self, name: str, title: str, key: str, market: str,
+                 fetch: Callable[[], pd.DataFrame], cadence_days: int):
+        """
+        Args:
+            name: 序列名称，用作存储键
+            title: 中文名称
+            key: 宏观数据快照中使用的键，沿用 macro_utils.get_macro_data 原有的名称
+            market: 所属市场，us 或 cn
+            fetch: 从上游拉取完整序列的函数
+            cadence_days: 发布周期（天），日历中没有下一次发布日期时使用
+        """
+        self.name = name
+        self.title = title
+        self.key = key
+        self.market = market
+        self.fetch = fetch
+        self.cadence_days = cadence_days
+
+
+SERIES: Dict[str, MacroSeries] = {
+    s.name: s for s in [
+        MacroSeries("cn_ppi", "中国PPI", "中国PPI", "cn", lambda: ak.macro_china_ppi_yearly(), 31),
+        MacroSeries("cn_cpi", "中国CPI", "中国CPI", "cn", lambda: ak.macro_china_cpi_yearly(), 31),
+        # 键沿用原来的"中国利率"(实际是财新服务业PMI)，避免下游按键取值时出错
+        MacroSeries("cn_cx_pmi", "中国财新服务业PMI", "中国利率", "cn", lambda: ak.macro_china_cx_services_pmi_yearly(), 31),
+        MacroSeries("us_cpi", "美国CPI", "美国CPI", "us", lambda: ak.macro_usa_cpi_monthly(), 31),
+        MacroSeries("us_lmci", "美国劳动力市场状况指数", "美国劳动力指数", "us", lambda: ak.macro_usa_lmci(), 31),
+        # 美联储议息会议约每6周一次
+        MacroSeries("us_interest_rate", "美联储利率决议", "美国利率", "us", lambda: ak.macro_bank_usa_interest_rate(), 45),
+    ]
+}
+
+_entries: Dict[str, Dict[str, Any]] = {}
+_locks: Dict[str, threading.Lock] = {name: threading.Lock() for name in SERIES}
+
+
+def _store_key(name: str) -> str:
+    return f"macro_store_{name}"
+
+
+def _next_refresh_time(df: pd.DataFrame, cadence_days: int,
+                       fetched_at: datetime.datetime) -> datetime.datetime:
+    """
+    根据发布日历计算下一次需要刷新的时间
+
+    金十数据的宏观序列中包含尚未公布（今值为空）的未来发布日期，
+    优先使用该日期；否则按最近一次发布日期加发布周期推算。
+    """
+    dates = pd.to_datetime(df["日期"], errors="coerce")
+    released = df["今值"].notna() if "今值" in df.columns else pd.Series(True, index=df.index)
+    upcoming = dates[(~released) & (dates > fetched_at)]
+    if len(upcoming) > 0:
+        next_release = upcoming.min().to_pydatetime()
+    elif released.any():
+        next_release = dates[released].max().to_pydatetime() + datetime.timedelta(days=cadence_days)
+    else:
+        next_release = fetched_at + datetime.timedelta(days=cadence_days)
+    # 发布日已过而上游未更新时，避免每次调用都回源
+    return max(next_release, fetched_at + datetime.timedelta(seconds=MIN_RECHECK_SECONDS))
+
+
+def _load_entry(name: str) -> Optional[Dict[str, Any]]:
+    entry = _entries.get(name)
+    if entry is None:
+        entry = filecache.get_cached_data(_store_key(name))
+        if entry is not None:
+            _entries[name] = entry
+    return entry
+
+
+def refresh(name: str, force: bool = False) -> Dict[str, Any]:
+    """
+    按发布日历刷新宏观序列
+
+    Args:
+        name: 序列名称
+        force: 是否忽略发布日历强制刷新
+    Returns:
+        存储条目，包含 data, fetched_at, next_refresh
+    """
+    if name not in SERIES:
+        raise ValueError(f"未知的宏观序列: {name}")
+    series = SERIES[name]
+    with _locks[name]:
+        entry = _load_entry(name)
+        now = datetime.datetime.now()
+        if entry is not None and not force and now < entry["next_refresh"]:
+            return entry
+        log.info(f"刷新宏观序列: {name}")
+        try:
+            df = series.fetch()
+        except Exception as e:
+            if entry is not None:
+                log.error(f"刷新宏观序列 {name} 失败，继续使用 {entry['fetched_at']} 的数据: {e}")
+                return entry
+            raise ValueError(f"获取宏观序列 {name} 失败: {e}")
+        df = df.sort_values(by="日期", ascending=False).reset_index(drop=True)
+        entry = {
+            "data": df,
+            "fetched_at": now,
+            "next_refresh": _next_refresh_time(df, series.cadence_days, now),
+        }
+        _entries[name] = entry
+        filecache.cache_data(entry, _store_key(name), STORE_EXPIRE_SECONDS)
+        log.info(f"宏观序列 {name} 下一次刷新时间: {entry['next_refresh']}")
+        return entry
+
+
+def get_series(name: str, last_n: int = 12) -> Tuple[pd.DataFrame, datetime.datetime]:
+    """
+    获取宏观序列最近N条已公布的数据
+
+    Args:
+        name: 序列名称，见 SERIES
+        last_n: 返回的条数
+    Returns:
+        (按日期倒序的DataFrame, 数据获取时间)
+    """
+    entry = refresh(name)
+    df = entry["data"]
+    if "今值" in df.columns:
+        df = df[df["今值"].notna()]
+    # head 可能是存储条目的视图，只有几行，复制一份，调用方修改返回值不会影响存储条目
+    return df.head(last_n).copy(), entry["fetched_at"]
+
+
+def get_macro_snapshot(markets: List[str], last_n: int = 12) -> Dict[str, Any]:
+    """
+    获取指定市场的宏观数据快照
+
+    Args:
+        markets: 市场列表，支持 "us" 和 "cn"
+        last_n: 每个序列返回的条数
+    Returns:
+        Dict[str, Any]: 以 MacroSeries.key 为键(与原有键名相同)，值包含 as_of 和 data
+    """
+    futures = {
+        series.key: scheduler.submit("akshare", get_series, (series.name, last_n))
+        for series in SERIES.values() if series.market in markets
+    }
+    result = {}
+    for key, future in futures.items():
+        try:
+            df, as_of = future.result()
+            df["日期"] = df["日期"].astype(str)
+            df = df.astype(object).where(df.notna(), None)
+            result[key] = {
+                "as_of": as_of.strftime("%Y-%m-%d %H:%M:%S"),
+                "data": df.to_dict(orient="records"),
+            }
+        except Exception as e:
+            log.error(f"获取{key}数据时发生错误: {str(e)}")
+            result[key] = None
+    return result
@@ -1,13 +1,15 @@
-from datetime import datetime, timedelta
-import akshare as ak
+from datetime import timedelta
 import pandas as pd
 import requests
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
 import logging
 import os
+from wff_agent.datasource import replay
 
 log = logging.getLogger(__name__)
 
+ak = replay.upstream("akshare")
+
 NEWS_API_KEY = os.getenv("NEWS_API_KEY")
 def get_financial_new_cn(limit: int = 20) -> pd.DataFrame:
     """
@@ -28,22 +30,15 @@ def get_news_from_newapi(keywords: List[str], limit: int = 20, days: int = 30) -
     :return:
     """
     log.info(f"开始获取新闻: {keywords}, {limit}")
-    date_str = (datetime.now()-timedelta(days=days)).strftime("%Y-%m-%d")
+    date_str = (replay.now()-timedelta(days=days)).strftime("%Y-%m-%d")
     if len(keywords) > 1:
         keywords_str = ' OR '.join(keywords)
     else:
         keywords_str = keywords[0]
-    news_api_key = NEWS_API_KEY
     log.info(f"开始获取新闻: {keywords_str}, {date_str}")
-    url = ('https://newsapi.org/v2/everything?'
-       f'q={keywords_str}&'
-       f'from={date_str}&'
-       f'sortBy=popularity&'
-       f'apiKey={news_api_key}')
-    response = requests.get(url)
-    log.info(f"获取到的响应: {response.json()}")
-    if response.status_code == 200:
-        json_data = response.json()
+    status_code, json_data = _fetch_everything(keywords_str, date_str)
+    log.info(f"获取到的响应: {json_data}")
+    if status_code == 200:
         status = json_data["status"]
         if status == "ok":
             if len(json_data["articles"]) > limit:
@@ -55,6 +50,20 @@ def get_news_from_newapi(keywords: List[str], limit: int = 20, days: int = 30) -
     else:
         return None
 
+@replay.recordable("newsapi")
+def _fetch_everything(keywords_str: str, date_str: str) -> Tuple[int, Optional[Dict[str, Any]]]:
+    """
+    调用 NewsAPI everything 接口
+    :return: (状态码, 响应JSON)
+    """
+    news_api_key = NEWS_API_KEY
+    url = ('https://newsapi.org/v2/everything?'
+       f'q={keywords_str}&'
+       f'from={date_str}&'
+       f'sortBy=popularity&'
+       f'apiKey={news_api_key}')
+    response = requests.get(url)
+    return response.status_code, response.json()
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
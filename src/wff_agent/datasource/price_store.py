@@ -0,0 +1,398 @@
+# -*- coding: utf-8 -*-
+"""
+日线行情本地存储
+
+每个股票只保存一份不复权日线和一列后复权因子(后复权收盘价 / 不复权收盘价)，
+前复权和后复权价格在读取时按因子向量化计算:
+
+    后复权 = 不复权 * 因子
+    前复权 = 不复权 * 因子 / 最新因子
+
+后复权因子只会在除权除息日之后变化，已有的历史因子保持不变，
+因此分红送股只需要追加新的因子行，不需要重新拉取全部历史。
+
+周线、月线和N日线由复权后的日线在本地聚合(resample_bars)，不再单独回源。
+"""
+import datetime
+import logging
+import re
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from wff_agent.datasource import file_lru_cache as filecache
+from wff_agent.datasource import replay
+from wff_agent.datasource import scheduler
+
+log = logging.getLogger(__name__)
+
+ak = replay.upstream("akshare")
+
+# 本地存储的保留时间，增量更新由 RECHECK_SECONDS 控制
+STORE_EXPIRE_SECONDS = 60*60*24*365
+# 距离上次检查超过该时间才回源拉取新K线
+RECHECK_SECONDS = 60*60*8
+# 请求的开始日期与第一根K线相差超过该天数才认为第一根K线是上市首日，较短的间隔可能只是周末或节假日
+LISTING_GAP_DAYS = 30
+
+FACTOR_COLUMN = "复权因子"
+# 需要按复权因子换算的价格列，涨跌幅、振幅、换手率等比例列保持不变
+PRICE_COLUMNS = ["开盘", "收盘", "最高", "最低", "涨跌额"]
+NUMERIC_COLUMNS = ["开盘", "收盘", "最高", "最低", "成交量", "成交额", "涨跌幅", "涨跌额", "振幅", "换手率"]
+
+# 日历周期对应的 pandas 周期，周线按自然周(周一至周日)对齐
+PERIOD_FREQS = {"weekly": "W", "monthly": "M", "quarterly": "Q"}
+# 每根K线约含的交易日数，用于把K线数换算为日线的拉取范围
+PERIOD_TRADING_DAYS = {"daily": 1, "weekly": 5, "monthly": 21, "quarterly": 63}
+# 聚合规则，涨跌额、涨跌幅、振幅由聚合后的K线重新计算，其余列取最后一根日线
+AGG_RULES = {
+    "开盘": "first",
+    "最高": "max",
+    "最低": "min",
+    "收盘": "last",
+    "成交量": "sum",
+    "成交额": "sum",
+    "换手率": "sum",
+    FACTOR_COLUMN: "last",
+}
+
+US_COLUMNS = {
+    "date": "日期",
+    "open": "开盘",
+    "high": "最高",
+    "low": "最低",
+    "close": "收盘",
+    "volume": "成交量",
+}
+
+_entries: Dict[str, Dict[str, Any]] = {}
+_locks: Dict[str, threading.Lock] = {}
+_locks_guard = threading.Lock()
+
+
+def _store_key(symbol: str, market: str) -> str:
+    return f"price_store_{market}_{symbol}"
+
+
+def _get_lock(key: str) -> threading.Lock:
+    with _locks_guard:
+        if key not in _locks:
+            _locks[key] = threading.Lock()
+        return _locks[key]
+
+
+def _fetch_bars(symbol: str, market: str, start_date: str, end_date: str, adjust: str) -> pd.DataFrame:
+    """
+    从上游拉取日线，返回以日期为索引、数值列为浮点数的DataFrame
+    """
+    if market == "us":
+        # 新浪美股接口不支持日期范围，返回全部历史
+        df = ak.stock_us_daily(symbol=symbol, adjust=adjust).rename(columns=US_COLUMNS)
+    elif market == "hk":
+        df = ak.stock_hk_hist(symbol=symbol, period="daily", start_date=start_date, end_date=end_date, adjust=adjust)
+    elif market == "cn":
+        df = ak.stock_zh_a_hist(symbol=symbol, period="daily", start_date=start_date, end_date=end_date, adjust=adjust)
+    else:
+        raise ValueError(f"不支持的市场: {market}")
+    if df is None or df.empty:
+        return pd.DataFrame()
+    df = df.copy()
+    df["日期"] = pd.to_datetime(df["日期"])
+    df = df.set_index("日期").sort_index()
+    df = df[~df.index.duplicated(keep="last")]
+    for col in NUMERIC_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors="coerce")
+    return df
+
+
+def _fetch_segment(symbol: str, market: str, start_date: str, end_date: str) -> pd.DataFrame:
+    """
+    拉取一段不复权日线并计算该段的复权因子。
+    美股只有前复权价格，因子尺度与后复权不同，由 _align 统一换算到存储的尺度。
+    """
+    factor_adjust = "qfq" if market == "us" else "hfq"
+    raw_future = scheduler.submit("akshare", _fetch_bars, (symbol, market, start_date, end_date, ""))
+    adjusted_future = scheduler.submit("akshare", _fetch_bars, (symbol, market, start_date, end_date, factor_adjust))
+    raw = raw_future.result()
+    adjusted = adjusted_future.result()
+    if raw.empty:
+        return raw
+    factor = adjusted["收盘"].reindex(raw.index) / raw["收盘"]
+    raw[FACTOR_COLUMN] = factor.replace([float("inf"), -float("inf")], float("nan")).ffill().bfill()
+    return raw
+
+
+def _align(segment: pd.DataFrame, anchor: pd.Timestamp, anchor_factor: float) -> Optional[pd.DataFrame]:
+    """
+    按重叠日期的因子把新拉取的一段换算到已存储的尺度，重叠日期不在新数据中时返回None
+    """
+    if anchor not in segment.index:
+        return None
+    segment_factor = segment.at[anchor, FACTOR_COLUMN]
+    if pd.isna(segment_factor) or segment_factor == 0:
+        return None
+    segment = segment.copy()
+    segment[FACTOR_COLUMN] = segment[FACTOR_COLUMN] * (anchor_factor / segment_factor)
+    return segment
+
+
+def _raw_close_changed(bars: pd.DataFrame, segment: pd.DataFrame, date: pd.Timestamp) -> bool:
+    # 不复权价格不应改变，改变说明上游数据被修订，需要全量重建
+    old_close = bars.at[date, "收盘"]
+    new_close = segment.at[date, "收盘"]
+    return abs(old_close - new_close) > 1e-6 * max(abs(old_close), 1.0)
+
+
+def _rebuild(symbol: str, market: str, start_date: str, end_date: str) -> pd.DataFrame:
+    log.info(f"全量拉取日线: {market} {symbol} {start_date} - {end_date}")
+    return _fetch_segment(symbol, market, start_date, end_date)
+
+
+def _extend(bars: pd.DataFrame, symbol: str, market: str, start_date: str, end_date: str) -> pd.DataFrame:
+    """
+    向后追加新K线，必要时向前补齐更早的历史
+    """
+    first_date, last_date = bars.index[0], bars.index[-1]
+    parts = []
+
+    requested_start = pd.to_datetime(start_date)
+    if requested_start < first_date:
+        head = _fetch_segment(symbol, market, start_date, first_date.strftime("%Y%m%d"))
+        if not head.empty:
+            head = _align(head, first_date, bars.at[first_date, FACTOR_COLUMN])
+            if head is None or _raw_close_changed(bars, head, first_date):
+                return _rebuild(symbol, market, start_date, end_date)
+            parts.append(head[head.index < first_date])
+
+    parts.append(bars)
+
+    if pd.to_datetime(end_date) > last_date:
+        # 从最后一根K线开始拉取，用重叠的一天对齐因子尺度
+        tail = _fetch_segment(symbol, market, last_date.strftime("%Y%m%d"), end_date)
+        if not tail.empty:
+            tail = _align(tail, last_date, bars.at[last_date, FACTOR_COLUMN])
+            if tail is None or _raw_close_changed(bars, tail, last_date):
+                return _rebuild(symbol, market, min(start_date, first_date.strftime("%Y%m%d")), end_date)
+            new_bars = tail[tail.index > last_date]
+            if not new_bars.empty:
+                log.info(f"追加日线: {market} {symbol} {len(new_bars)} 根")
+            parts.append(new_bars)
+
+    return pd.concat(parts) if len(parts) > 1 else bars
+
+
+def _load_entry(key: str) -> Optional[Dict[str, Any]]:
+    entry = _entries.get(key)
+    if entry is None:
+        entry = filecache.get_cached_data(key)
+        if entry is not None:
+            _entries[key] = entry
+    return entry
+
+
+def refresh(symbol: str, market: str, start_date: str, end_date: str, force: bool = False) -> Dict[str, Any]:
+    """
+    确保存储覆盖 [start_date, end_date]，并按 RECHECK_SECONDS 增量追加新K线
+
+    Args:
+        symbol: 股票代码
+        market: 市场，可选 us, hk, cn
+        start_date: 开始日期，格式 YYYYMMDD
+        end_date: 结束日期，格式 YYYYMMDD
+        force: 是否忽略检查间隔立即增量更新
+    Returns:
+        存储条目，包含 bars(不复权日线及复权因子) 和 checked_at
+    """
+    key = _store_key(symbol, market)
+    with _get_lock(key):
+        entry = _load_entry(key)
+        now = replay.now()
+        if entry is not None and not entry["bars"].empty:
+            bars = entry["bars"]
+            # fetched_from 之后已向上游请求过，没有K线的日期说明当时休市
+            fetched_from = min(bars.index[0], entry.get("fetched_from", bars.index[0]))
+            covers_start = pd.to_datetime(start_date) >= fetched_from or entry.get("listing_date") is not None
+            fresh = (now - entry["checked_at"]).total_seconds() < RECHECK_SECONDS
+            covers_end = pd.to_datetime(end_date) <= bars.index[-1]
+            if covers_start and (covers_end or (fresh and not force)):
+                return entry
+            new_bars = _extend(bars, symbol, market, start_date, end_date)
+        else:
+            new_bars = _rebuild(symbol, market, start_date, end_date)
+
+        if new_bars.empty:
+            raise ValueError(f"获取股票历史数据为空: {symbol}")
+        fetched_from = pd.to_datetime(start_date)
+        listing_date = None
+        if entry is not None and not entry["bars"].empty:
+            fetched_from = min(fetched_from, entry["bars"].index[0], entry.get("fetched_from", fetched_from))
+            listing_date = entry.get("listing_date")
+        # 第一根K线比请求的开始日期晚得多，说明已拉取到上市首日，之后不再向前补齐
+        if listing_date is None and (new_bars.index[0] - fetched_from).days > LISTING_GAP_DAYS:
+            listing_date = new_bars.index[0]
+        entry = {
+            "bars": new_bars,
+            "checked_at": now,
+            "fetched_from": fetched_from,
+            "listing_date": listing_date,
+        }
+        _entries[key] = entry
+        filecache.cache_data(entry, key, STORE_EXPIRE_SECONDS)
+        return entry
+
+
+def apply_adjust(bars: pd.DataFrame, adjust: str) -> pd.DataFrame:
+    """
+    由不复权日线和复权因子计算复权价格
+
+    Args:
+        bars: 含复权因子列的不复权日线
+        adjust: 复权类型，qfq: 前复权, hfq: 后复权, 空: 不复权
+    Returns:
+        复权后的日线，不含复权因子列
+    """
+    df = bars.drop(columns=[FACTOR_COLUMN])
+    if not adjust:
+        return df
+    factor = bars[FACTOR_COLUMN]
+    if adjust == "qfq":
+        factor = factor / factor.iloc[-1]
+    elif adjust != "hfq":
+        raise ValueError(f"不支持的复权类型: {adjust}")
+    cols = [col for col in PRICE_COLUMNS if col in df.columns]
+    df[cols] = df[cols].mul(factor, axis=0)
+    return df
+
+
+def get_daily_bars(symbol: str, market: str, start_date: str, end_date: str, adjust: str = "qfq") -> pd.DataFrame:
+    """
+    获取日线行情
+
+    Args:
+        symbol: 股票代码
+        market: 市场，可选 us, hk, cn
+        start_date: 开始日期，格式 YYYYMMDD
+        end_date: 结束日期，格式 YYYYMMDD
+        adjust: 复权类型，qfq: 前复权, hfq: 后复权, 空: 不复权
+    Returns:
+        以日期为索引的日线DataFrame。前复权以存储中的最新K线为基准
+    """
+    bars = refresh(symbol, market, start_date, end_date)["bars"]
+    df = apply_adjust(bars, adjust)
+    return df.loc[pd.to_datetime(start_date):pd.to_datetime(end_date)]
+
+
+def last_bar_date(symbol: str, market: str) -> Optional[datetime.datetime]:
+    """
+    获取存储中最新一根K线的日期，未存储时返回None
+    """
+    entry = _load_entry(_store_key(symbol, market))
+    if entry is None or entry["bars"].empty:
+        return None
+    return entry["bars"].index[-1].to_pydatetime()
+
+
+def peek_last_bar(symbol: str, market: str) -> Optional[Tuple[datetime.datetime, float, float]]:
+    """
+    不回源地查看最新K线，用于判断依赖行情的计算结果是否仍然有效
+
+    Args:
+        symbol: 股票代码
+        market: 市场
+    Returns:
+        (日期, 不复权收盘价, 成交量)；未存储或已到增量检查时间时返回None
+    """
+    entry = _load_entry(_store_key(symbol, market))
+    if entry is None or entry["bars"].empty:
+        return None
+    if (replay.now() - entry["checked_at"]).total_seconds() >= RECHECK_SECONDS:
+        return None
+    bars = entry["bars"]
+    return bars.index[-1].to_pydatetime(), float(bars["收盘"].iloc[-1]), float(bars["成交量"].iloc[-1])
+
+
+def _parse_period(period: str) -> Tuple[Optional[str], int]:
+    """
+    解析K线周期
+
+    Args:
+        period: daily, weekly, monthly, quarterly 或 N日线(如 5d)
+    Returns:
+        (pandas 周期，N日线时为None, 每根K线约含的交易日数)
+    """
+    period = period.lower()
+    if period in PERIOD_TRADING_DAYS:
+        return PERIOD_FREQS.get(period), PERIOD_TRADING_DAYS[period]
+    match = re.fullmatch(r"(\d+)d", period)
+    if match and int(match.group(1)) > 0:
+        return None, int(match.group(1))
+    raise ValueError(f"不支持的K线周期: {period}，可选 daily, weekly, monthly, quarterly 或 N日线(如 5d)")
+
+
+def trading_days_per_bar(period: str) -> int:
+    """
+    每根K线约含的交易日数
+    """
+    return _parse_period(period)[1]
+
+
+def period_start_date(start_date: str, period: str) -> str:
+    """
+    把开始日期前移到所在周期的第一天，避免第一根周线、月线只聚合了部分日线
+
+    Args:
+        start_date: 开始日期，格式 YYYYMMDD
+        period: K线周期
+    Returns:
+        对齐后的开始日期，格式 YYYYMMDD
+    """
+    freq, _ = _parse_period(period)
+    if freq is None:
+        return start_date
+    return pd.Period(pd.to_datetime(start_date), freq=freq).start_time.strftime("%Y%m%d")
+
+
+def resample_bars(df: pd.DataFrame, period: str) -> pd.DataFrame:
+    """
+    把日线聚合为更长周期的K线
+
+    开盘取第一根，最高取最大，最低取最小，收盘取最后一根，成交量、成交额、换手率求和，
+    每根K线以其中最后一个交易日为日期，因此当前未走完的周期显示截至最新交易日的数据。
+    周线、月线、季线按自然周期对齐；N日线从最新一根日线向前每N个交易日一组，
+    最早不足N根的一组丢弃。
+
+    Args:
+        df: 以日期为索引、按日期升序的日线，价格应已复权
+        period: daily, weekly, monthly, quarterly 或 N日线(如 5d)
+    Returns:
+        聚合后的K线，列与输入一致
+    """
+    freq, days = _parse_period(period)
+    if df.empty or (freq is None and days == 1):
+        return df
+    if freq is not None:
+        keys = df.index.to_period(freq)
+    else:
+        keys = -((len(df) - 1 - np.arange(len(df))) // days)
+        if len(df) % days:
+            keep = keys > keys[0]
+            df, keys = df[keep], keys[keep]
+    grouped = df.groupby(keys, sort=True)
+    out = grouped.agg({col: AGG_RULES.get(col, "last") for col in df.columns})
+    out.index = pd.DatetimeIndex(pd.Series(df.index, index=df.index).groupby(keys, sort=True).last().to_numpy(),
+                                 name=df.index.name)
+
+    previous_close = out["收盘"].shift(1)
+    if "涨跌额" in df.columns and len(out):
+        # 第一根K线的前收盘价由第一根日线的涨跌额倒推
+        previous_close.iloc[0] = df["收盘"].iloc[0] - df["涨跌额"].iloc[0]
+    if "涨跌额" in out.columns:
+        out["涨跌额"] = out["收盘"] - previous_close
+    if "涨跌幅" in out.columns:
+        out["涨跌幅"] = (out["收盘"] / previous_close - 1) * 100
+    if "振幅" in out.columns:
+        out["振幅"] = (out["最高"] - out["最低"]) / previous_close * 100
+    return out
@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""
+数据源录制/回放
+
+所有对 akshare、AlphaVantage、NewsAPI 的上游调用都经过这里，通过环境变量切换模式:
+
+    WFF_DATASOURCE_MODE   live(默认): 直接访问上游
+                          record: 访问上游并把每次调用及返回值(含DataFrame)写入夹具目录
+                          replay: 只从夹具目录读取，不访问网络
+    WFF_FIXTURE_DIR       夹具目录，默认为项目下的 .fixtures
+    WFF_REPLAY_LATENCY    回放时模拟的延迟: 秒数，或 recorded 表示按录制时的耗时
+"""
+import datetime
+import functools
+import importlib
+import json
+import logging
+import os
+import pickle
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+log = logging.getLogger(__name__)
+
+MODE_LIVE = "live"
+MODE_RECORD = "record"
+MODE_REPLAY = "replay"
+
+ENV_VARS = ["WFF_DATASOURCE_MODE", "WFF_FIXTURE_DIR", "WFF_REPLAY_LATENCY"]
+
+_MANIFEST = "manifest.json"
+
+# 夹具目录 -> 清单内容，每个目录只读取一次
+_manifests: Dict[Path, Dict[str, Any]] = {}
+_manifest_lock = threading.Lock()
+
+
+class ReplayMissError(ValueError):
+    """回放模式下找不到对应的录制夹具"""
+    pass
+
+
+def get_mode() -> str:
+    """
+    获取当前数据源模式，每次调用时读取环境变量，便于基准测试在运行时切换
+    """
+    mode = os.getenv("WFF_DATASOURCE_MODE", MODE_LIVE).lower()
+    if mode not in (MODE_LIVE, MODE_RECORD, MODE_REPLAY):
+        log.error(f"未知的数据源模式 {mode}, 使用 live")
+        return MODE_LIVE
+    return mode
+
+
+def is_live() -> bool:
+    return get_mode() == MODE_LIVE
+
+
+def get_fixture_dir() -> Path:
+    """
+    获取夹具目录，目录在录制时才创建
+    """
+    fixture_dir = os.getenv("WFF_FIXTURE_DIR")
+    if fixture_dir:
+        return Path(fixture_dir)
+    return Path(os.path.dirname(os.path.dirname(__file__))) / ".fixtures"
+
+
+def env() -> Dict[str, str]:
+    """
+    返回需要传递给子进程(如 MCP 服务器)的录制/回放环境变量
+    """
+    return {name: os.environ[name] for name in ENV_VARS if os.getenv(name)}
+
+
+def _read_manifest() -> Dict[str, Any]:
+    fixture_dir = get_fixture_dir()
+    with _manifest_lock:
+        manifest = _manifests.get(fixture_dir)
+        if manifest is None:
+            manifest_file = fixture_dir / _MANIFEST
+            manifest = {}
+            if manifest_file.exists():
+                with open(manifest_file, "r", encoding="utf-8") as f:
+                    manifest = json.load(f)
+            _manifests[fixture_dir] = manifest
+        return manifest
+
+
+def _ensure_manifest() -> None:
+    fixture_dir = get_fixture_dir()
+    manifest_file = fixture_dir / _MANIFEST
+    with _manifest_lock:
+        if manifest_file.exists():
+            return
+        manifest = {"recorded_at": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+        with open(manifest_file, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        _manifests[fixture_dir] = manifest
+
+
+def now() -> datetime.datetime:
+    """
+    当前时间。回放模式下返回录制时的时间，使依赖"今天"的默认参数(如历史行情的起止日期)与录制时一致
+    """
+    if get_mode() == MODE_REPLAY:
+        recorded_at = _read_manifest().get("recorded_at")
+        if recorded_at:
+            return datetime.datetime.strptime(recorded_at, "%Y-%m-%d %H:%M:%S")
+    return datetime.datetime.now()
+
+
+def _fixture_file(provider: str, name: str, args: tuple, kwargs: dict) -> Path:
+    # 与文件缓存使用相同的键生成规则
+    from wff_agent.datasource.file_lru_cache import generate_cache_key
+    return get_fixture_dir() / provider / f"{generate_cache_key(name, *args, **kwargs)}.pkl"
+
+
+def _replay_latency(recorded_elapsed: float) -> float:
+    latency = os.getenv("WFF_REPLAY_LATENCY", "0")
+    if latency == "recorded":
+        return recorded_elapsed
+    try:
+        return float(latency)
+    except ValueError:
+        log.error(f"WFF_REPLAY_LATENCY 格式错误: {latency}")
+        return 0.0
+
+
+def _record(fixture_file: Path, record: Dict[str, Any]) -> None:
+    fixture_file.parent.mkdir(parents=True, exist_ok=True)
+    _ensure_manifest()
+    tmp_file = fixture_file.with_suffix(f".{os.getpid()}.tmp")
+    try:
+        with open(tmp_file, "wb") as f:
+            pickle.dump(record, f)
+        os.replace(tmp_file, fixture_file)
+    except Exception as e:
+        log.error(f"写入夹具 {fixture_file} 时出错: {str(e)}")
+
+
+def _replay(fixture_file: Path, provider: str, name: str, args: tuple, kwargs: dict) -> Any:
+    if not fixture_file.exists():
+        raise ReplayMissError(f"没有找到录制数据: {provider}.{name} args={args} kwargs={kwargs}")
+    with open(fixture_file, "rb") as f:
+        record = pickle.load(f)
+    latency = _replay_latency(record.get("elapsed", 0.0))
+    if latency > 0:
+        time.sleep(latency)
+    if record.get("error") is not None:
+        raise record["error"]
+    return record["result"]
+
+
+def recordable(provider: str, name: Optional[str] = None):
+    """
+    上游调用装饰器，按当前模式直接调用、录制或回放
+
+    Args:
+        provider: 数据提供方，如 akshare, alphavantage, newsapi
+        name: 调用名称，默认为函数名
+    Returns:
+        装饰器函数
+    """
+    def decorator(func: Callable):
+        call_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            mode = get_mode()
+            if mode == MODE_LIVE:
+                return func(*args, **kwargs)
+            fixture_file = _fixture_file(provider, call_name, args, kwargs)
+            if mode == MODE_REPLAY:
+                return _replay(fixture_file, provider, call_name, args, kwargs)
+            # 录制模式，异常同样录制，回放时原样抛出
+            start = time.perf_counter()
+            record = {"provider": provider, "name": call_name,
+                      "args": args, "kwargs": kwargs, "result": None, "error": None}
+            try:
+                record["result"] = func(*args, **kwargs)
+                return record["result"]
+            except Exception as e:
+                record["error"] = e
+                raise
+            finally:
+                record["elapsed"] = time.perf_counter() - start
+                _record(fixture_file, record)
+        return wrapper
+    return decorator
+
+
+class UpstreamModule:
+    """
+    上游模块代理，模块中的每个函数调用都经过 recordable。
+    模块在首次访问属性时才导入，回放模式下不需要真正访问网络。
+    """
+    def __init__(self, module_name: str, provider: Optional[str] = None):
+        self._module_name = module_name
+        self._provider = provider or module_name
+        self._module = None
+        self._wrapped: Dict[str, Callable] = {}
+
+    def __getattr__(self, attr: str) -> Any:
+        if attr.startswith("_"):
+            raise AttributeError(attr)
+        if attr not in self._wrapped:
+            def call(*args, **kwargs):
+                return getattr(self._load(), attr)(*args, **kwargs)
+            call.__name__ = attr
+            self._wrapped[attr] = recordable(self._provider, attr)(call)
+        return self._wrapped[attr]
+
+    def _load(self):
+        if self._module is None:
+            self._module = importlib.import_module(self._module_name)
+        return self._module
+
+
+def upstream(module_name: str, provider: Optional[str] = None) -> UpstreamModule:
+    """
+    获取经过录制/回放代理的上游模块，例如 ak = replay.upstream("akshare")
+    """
+    return UpstreamModule(module_name, provider)
@@ -0,0 +1,343 @@
+# -*- coding: utf-8 -*-
+"""
+进程级数据源调度器
+
+所有数据源的并发拉取都提交到同一个长期存在的线程池:
+    - 优先级队列: 交互请求(PRIORITY_INTERACTIVE)优先于预取(PRIORITY_PREFETCH)
+    - 按数据提供方限制并发，如 akshare、alphavantage
+    - 支持取消尚未开始的任务，并提供队列深度等指标
+
+任务函数的参数通过 args/kwargs 传入，与调度选项(priority)分开，例如
+    scheduler.submit("akshare", ak.stock_financial_hk_report_em, kwargs={"stock": symbol, "symbol": "利润表"})
+
+在任务内部再次提交的任务同样进入队列，遵守优先级和提供方并发上限，并继承外层任务的优先级。
+工作线程在 future.result()/exception() 上等待尚未完成的任务时，暂时让出自己占用的并发名额，
+必要时启动额外的线程，避免外层任务占满名额后与内层任务互相等待；等待结束后重新按上限取得名额。
+工作线程内不要用 concurrent.futures.wait/as_completed 等待本调度器的任务，它们不会让出名额。
+
+    WFF_SCHEDULER_WORKERS   工作线程数，默认 8
+    WFF_PROVIDER_LIMITS     各提供方并发上限，如 "akshare=6,alphavantage=2"
+"""
+import contextlib
+import contextvars
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional
+
+log = logging.getLogger(__name__)
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_PREFETCH = 10
+
+DEFAULT_WORKERS = 8
+DEFAULT_PROVIDER_LIMITS = {
+    "akshare": 6,
+    # Alpha Vantage 免费额度每分钟只有5次请求
+    "alphavantage": 2,
+    "newsapi": 2,
+}
+
+_current_priority: contextvars.ContextVar = contextvars.ContextVar("datasource_priority", default=PRIORITY_INTERACTIVE)
+
+
+class _TaskFuture(Future):
+    """工作线程等待时让出并发名额的 Future"""
+
+    def __init__(self, scheduler: "DatasourceScheduler"):
+        super().__init__()
+        self._scheduler = scheduler
+
+    def result(self, timeout: Optional[float] = None) -> Any:
+        with self._scheduler._blocking(self):
+            return super().result(timeout)
+
+    def exception(self, timeout: Optional[float] = None) -> Optional[BaseException]:
+        with self._scheduler._blocking(self):
+            return super().exception(timeout)
+
+
+class _Task:
+    def __init__(self, scheduler: "DatasourceScheduler", provider: str, priority: int,
+                 fn: Callable, args: tuple, kwargs: dict):
+        self.provider = provider
+        self.priority = priority
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        # 在提交时的上下文中执行，内层提交的任务继承外层的优先级
+        self.context = contextvars.copy_context()
+        self.future: Future = _TaskFuture(scheduler)
+        self.submitted_at = time.perf_counter()
+
+
+def _parse_provider_limits(value: Optional[str]) -> Dict[str, int]:
+    limits = dict(DEFAULT_PROVIDER_LIMITS)
+    if not value:
+        return limits
+    for item in value.split(","):
+        try:
+            provider, limit = item.split("=")
+            limits[provider.strip()] = int(limit)
+        except ValueError:
+            log.error(f"WFF_PROVIDER_LIMITS 格式错误: {item}")
+    return limits
+
+
+class DatasourceScheduler:
+    """数据源调度器"""
+
+    def __init__(self, max_workers: int = DEFAULT_WORKERS, provider_limits: Optional[Dict[str, int]] = None):
+        """
+        Args:
+            max_workers: 工作线程数，即全局上游并发上限
+            provider_limits: 各提供方的并发上限，未列出的提供方只受全局上限约束
+        """
+        self.max_workers = max_workers
+        self.provider_limits = provider_limits if provider_limits is not None else dict(DEFAULT_PROVIDER_LIMITS)
+        self._cond = threading.Condition()
+        self._pending: List[tuple] = []
+        self._seq = itertools.count()
+        self._in_flight: Dict[str, int] = {}
+        self._workers: List[threading.Thread] = []
+        # 在 future 上等待、暂时让出名额的工作线程数
+        self._blocked = 0
+        self._local = threading.local()
+        self._shutdown = False
+        self._stats = {"submitted": 0, "completed": 0, "failed": 0, "cancelled": 0, "wait_seconds": 0.0}
+
+    def submit(self, provider: str, fn: Callable, args: tuple = (), kwargs: Optional[Dict[str, Any]] = None,
+               priority: Optional[int] = None) -> Future:
+        """
+        提交一个数据源任务
+
+        Args:
+            provider: 数据提供方
+            fn: 要执行的函数
+            args: fn 的位置参数
+            kwargs: fn 的关键字参数
+            priority: 优先级，数值越小越优先，默认取当前上下文的优先级
+        Returns:
+            Future: 任务结果
+        """
+        if priority is None:
+            priority = _current_priority.get()
+        task = _Task(self, provider, priority, fn, tuple(args), dict(kwargs or {}))
+        with self._cond:
+            if self._shutdown:
+                raise RuntimeError("数据源调度器已关闭")
+            heapq.heappush(self._pending, (priority, next(self._seq), task))
+            self._stats["submitted"] += 1
+            self._ensure_workers()
+            self._cond.notify()
+        return task.future
+
+    def run(self, provider: str, fn: Callable, args: tuple = (), kwargs: Optional[Dict[str, Any]] = None,
+            priority: Optional[int] = None) -> Any:
+        """
+        提交任务并等待结果
+        """
+        return self.submit(provider, fn, args, kwargs, priority).result()
+
+    def cancel_pending(self, provider: Optional[str] = None, priority: Optional[int] = None) -> int:
+        """
+        取消尚未开始执行的任务
+
+        Args:
+            provider: 只取消指定提供方的任务，None 表示全部
+            priority: 只取消指定优先级的任务，None 表示全部
+        Returns:
+            int: 取消的任务数量
+        """
+        count = 0
+        with self._cond:
+            for _, _, task in self._pending:
+                if provider is not None and task.provider != provider:
+                    continue
+                if priority is not None and task.priority != priority:
+                    continue
+                if task.future.cancel():
+                    count += 1
+        return count
+
+    def metrics(self) -> Dict[str, Any]:
+        """
+        调度器指标: 队列深度(总数/按优先级/按提供方)、执行中的任务数和累计统计
+        """
+        with self._cond:
+            live = [task for _, _, task in self._pending if not task.future.cancelled()]
+            by_priority: Dict[int, int] = {}
+            by_provider: Dict[str, int] = {}
+            for task in live:
+                by_priority[task.priority] = by_priority.get(task.priority, 0) + 1
+                by_provider[task.provider] = by_provider.get(task.provider, 0) + 1
+            started = self._stats["completed"] + self._stats["failed"]
+            return {
+                "queue_depth": len(live),
+                "queue_depth_by_priority": by_priority,
+                "queue_depth_by_provider": by_provider,
+                "in_flight": {k: v for k, v in self._in_flight.items() if v > 0},
+                "workers": len(self._workers),
+                "blocked_workers": self._blocked,
+                "submitted": self._stats["submitted"],
+                "completed": self._stats["completed"],
+                "failed": self._stats["failed"],
+                "cancelled": self._stats["cancelled"],
+                "avg_wait_seconds": self._stats["wait_seconds"] / started if started else 0.0,
+            }
+
+    def shutdown(self, cancel_pending: bool = True) -> None:
+        """
+        关闭调度器
+
+        Args:
+            cancel_pending: 是否取消队列中尚未执行的任务
+        """
+        if cancel_pending:
+            self.cancel_pending()
+        with self._cond:
+            self._shutdown = True
+            self._cond.notify_all()
+        for worker in self._workers:
+            worker.join()
+
+    def _ensure_workers(self) -> None:
+        # 调用方需持有锁。等待中的工作线程不占用全局上限
+        if len(self._workers) - self._blocked >= self.max_workers:
+            return
+        busy = sum(self._in_flight.values()) + self._blocked
+        if busy + len(self._pending) <= len(self._workers):
+            return
+        worker = threading.Thread(target=self._worker_loop, name=f"datasource-{len(self._workers)}", daemon=True)
+        self._workers.append(worker)
+        worker.start()
+
+    def _pop_runnable(self) -> Optional[_Task]:
+        # 调用方需持有锁。按优先级顺序取出第一个所属提供方还有并发余量的任务
+        skipped = []
+        task = None
+        while self._pending:
+            item = heapq.heappop(self._pending)
+            candidate = item[2]
+            if candidate.future.cancelled():
+                self._stats["cancelled"] += 1
+                continue
+            limit = self.provider_limits.get(candidate.provider)
+            if limit is not None and self._in_flight.get(candidate.provider, 0) >= limit:
+                skipped.append(item)
+                continue
+            task = candidate
+            break
+        for item in skipped:
+            heapq.heappush(self._pending, item)
+        return task
+
+    @contextlib.contextmanager
+    def _blocking(self, future: Future):
+        """
+        工作线程等待本调度器中尚未完成的任务时，让出当前任务的提供方名额，等待结束后按上限重新取得
+        """
+        task = getattr(self._local, "task", None)
+        if task is None or future.done():
+            yield
+            return
+        with self._cond:
+            self._in_flight[task.provider] -= 1
+            self._blocked += 1
+            self._ensure_workers()
+            self._cond.notify_all()
+        try:
+            yield
+        finally:
+            with self._cond:
+                limit = self.provider_limits.get(task.provider)
+                while limit is not None and self._in_flight.get(task.provider, 0) >= limit:
+                    self._cond.wait()
+                self._in_flight[task.provider] += 1
+                self._blocked -= 1
+
+    def _worker_loop(self) -> None:
+        while True:
+            with self._cond:
+                task = self._pop_runnable()
+                while task is None:
+                    if self._shutdown:
+                        return
+                    self._cond.wait()
+                    task = self._pop_runnable()
+                self._in_flight[task.provider] = self._in_flight.get(task.provider, 0) + 1
+                self._stats["wait_seconds"] += time.perf_counter() - task.submitted_at
+            self._local.task = task
+            try:
+                self._run(task)
+            finally:
+                self._local.task = None
+                with self._cond:
+                    self._in_flight[task.provider] -= 1
+                    # 提供方的并发名额释放后，等待中的同提供方任务可能可以执行
+                    self._cond.notify_all()
+
+    def _run(self, task: _Task) -> None:
+        if not task.future.set_running_or_notify_cancel():
+            return
+        try:
+            result = task.context.run(task.fn, *task.args, **task.kwargs)
+        except BaseException as e:
+            with self._cond:
+                self._stats["failed"] += 1
+            task.future.set_exception(e)
+        else:
+            with self._cond:
+                self._stats["completed"] += 1
+            task.future.set_result(result)
+
+
+_scheduler: Optional[DatasourceScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> DatasourceScheduler:
+    """
+    获取进程级数据源调度器
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            max_workers = int(os.getenv("WFF_SCHEDULER_WORKERS", DEFAULT_WORKERS))
+            _scheduler = DatasourceScheduler(max_workers, _parse_provider_limits(os.getenv("WFF_PROVIDER_LIMITS")))
+        return _scheduler
+
+
+def submit(provider: str, fn: Callable, args: tuple = (), kwargs: Optional[Dict[str, Any]] = None,
+           priority: Optional[int] = None) -> Future:
+    """
+    提交任务到进程级调度器
+    """
+    return get_scheduler().submit(provider, fn, args, kwargs, priority)
+
+
+def run(provider: str, fn: Callable, args: tuple = (), kwargs: Optional[Dict[str, Any]] = None,
+        priority: Optional[int] = None) -> Any:
+    """
+    提交任务到进程级调度器并等待结果
+    """
+    return get_scheduler().run(provider, fn, args, kwargs, priority)
+
+
+@contextlib.contextmanager
+def prefetch():
+    """
+    上下文内提交的任务使用预取优先级，排在交互请求之后
+
+        with scheduler.prefetch():
+            akshare_request.get_stock_history(symbol, "cn")
+    """
+    token = _current_priority.set(PRIORITY_PREFETCH)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
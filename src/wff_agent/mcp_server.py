@@ -1,10 +1,12 @@
 # -*- coding: utf-8 -*-
 import asyncio
+import json
 from mcp.server.fastmcp import FastMCP
 
 from wff_agent.utils import macro_utils
 from wff_agent.utils import fin_reports_utils, stock_utils
-from typing import Dict, Any, List
+from wff_agent.utils import backtest, payload_codec, screener
+from typing import Dict, Any, List, Optional
 import logging
 import os
 from wff_agent.datasource import akshare_request as ak_request 
@@ -22,25 +24,156 @@ mcp = FastMCP("FinancialAnalyst")
 
 
 @mcp.tool(name="GetMarketIndicators")
-async def GetMarketIndicators(symbol: str, market:str, windows:int=50) -> Dict[str, Any]:
+async def GetMarketIndicators(symbol: str, market:str, windows:int=50, indicators: Optional[List[str]] = None,
+                              period: str = "daily", encoding: Optional[str] = None,
+                              max_points: Optional[int] = None) -> Dict[str, Any]:
     """Get stock market indicators
 
     Args:
         symbol (str): stock symbol
         market (str): market, us, cn, hk
-        windows (int): data windows, default 50
+        windows (int): number of latest bars to return, default 50
+        indicators (List[str]): optional subset of indicators or groups, e.g. ["MACD", "RSI"].
+            groups: MA, EMA, MACD, KDJ, BOLL; single: MA5, MA20, MA60, MA50, MA200, EMA9, EMA12, EMA50,
+            K, D, J, RSI, DIF, DEA, MACD, BOLL, BOLL_UP, BOLL_DOWN, OBV. Default all
+        period (str): bar period, daily, weekly, monthly, quarterly or N-day like "5d", default daily
+        encoding (str): payload encoding, records (one object per bar), columnar (arrays per column) or
+            compact (columnar, 4 significant digits, older bars sampled, plus window summary). Default from config
+        max_points (int): optional, downsample the window to this many bars keeping the close price shape
+            (LTTB, first and last bar always kept), e.g. windows=500, max_points=60 for a long lookback
     Returns:
         Dict[str, Any]: stock market indicators
     """
     try:
-        log.info(f"开始获取股票技术指标: {symbol}, {market}")
-        result = stock_utils.get_market_indicators(symbol, market)
+        log.info(f"开始获取股票技术指标: {symbol}, {market}, {windows}, {indicators}, {period}")
+        result = stock_utils.get_market_indicators(symbol, market, windows, indicators=indicators, period=period,
+                                                   encoding=encoding, max_points=max_points)
         log.debug(f"获取到的技术指标数据: {result}")
         return result
     except Exception as e:
         log.error(f"获取技术指标失败: {str(e)}", exc_info=True)
         raise
 
+@mcp.tool(name="BacktestSignals")
+async def BacktestSignals(symbols: List[str], market: str, rules: Optional[List[str]] = None, years: int = 3,
+                          horizon: int = 5, encoding: Optional[str] = None) -> str:
+    """Backtest technical signals on daily history before trusting them
+
+    Args:
+        symbols (List[str]): stock symbols of the same market
+        market (str): market, us, cn, hk
+        rules (List[str]): optional, ma_cross (MA golden/death cross), macd_flip (MACD histogram sign flip),
+            kdj_extreme (J below low / above high), boll_breakout (breakout above upper band, or reversion
+            from lower band). Default all, each over its default parameter grid
+        years (int): years of history, default 3
+        horizon (int): bars after a buy signal used for signal hit rate, default 5
+        encoding (str): payload encoding, records, columnar or compact. Default from config
+    Returns:
+        str: per rule and parameters: signals, signal_hit_rate, signal_return (mean return over horizon),
+            trades, win_rate, avg_trade_return, total_return (mean per symbol), buy_hold_return, exposure
+    """
+    try:
+        log.info(f"开始回测技术信号: {symbols}, {market}, {rules}, {years}")
+        # 回测在进程池中运行数秒，放到线程中等待，不阻塞同一服务器上其他步骤的工具调用
+        summary, _ = await asyncio.to_thread(backtest.run_backtest, symbols, market, rules=rules, years=years,
+                                             horizon=horizon)
+        result = payload_codec.encode_frame(summary, payload_codec.tool_encoding("BacktestSignals", encoding))
+        log.debug(f"回测结果: {result}")
+        return result
+    except Exception as e:
+        log.error(f"回测技术信号失败: {str(e)}", exc_info=True)
+        raise
+
+@mcp.tool(name="ScreenMarket")
+async def ScreenMarket(expression: str, market: str, top_n: int = 20, sort_by: Optional[str] = None,
+                       ascending: bool = False, encoding: Optional[str] = None,
+                       max_bar_symbols: int = screener.MAX_BAR_SYMBOLS) -> str:
+    """Screen the market with a filter expression and return the top symbols
+
+    Spot conditions cover the whole market. Indicator conditions (MA, RSI, MACD, ...) need daily bars and are
+    only evaluated for the max_bar_symbols (default 300) most traded symbols that pass the spot conditions;
+    the rest are dropped and reported under "truncated". Add spot conditions to narrow the candidates, or
+    raise max_bar_symbols, when the whole market must be checked.
+
+    Args:
+        expression (str): filter, e.g. "RSI < 30 and close > MA200 and PE < 15". Supports and/or/not,
+            < <= > >= == !=, + - * /, numbers and fields (case-insensitive):
+            spot: CLOSE, CHANGE_PCT, VOLUME, AMOUNT, AMPLITUDE, TURNOVER, VOLUME_RATIO, PE, PB, MARKET_CAP,
+                FLOAT_MARKET_CAP, CHANGE_60D, CHANGE_YTD (availability depends on market);
+            indicators (latest daily bar): MA5, MA20, MA60, MA50, MA200, EMA9, EMA12, EMA50, K, D, J, RSI,
+                DIF, DEA, MACD, BOLL, BOLL_UP, BOLL_DOWN, OBV;
+            fundamentals (cn only, from locally cached reports): ROE, GROSS_MARGIN, DEBT_RATIO, REVENUE_GROWTH.
+            Spot conditions are applied first, then indicators, then fundamentals
+        market (str): market, us, cn, hk
+        top_n (int): number of symbols to return, default 20
+        sort_by (str): field to rank by, default AMOUNT (turnover value)
+        ascending (bool): rank ascending, default False
+        encoding (str): payload encoding, records, columnar or compact. Default from config
+        max_bar_symbols (int): most symbols to load daily bars for when the expression uses indicators,
+            default 300. Narrow the expression with spot conditions or raise this to cover more symbols
+    Returns:
+        str: matching symbols with their names and referenced fields. When indicator conditions were only
+            evaluated for part of the candidates, {"symbols": ..., "truncated": {"candidates", "evaluated", "note"}}
+    """
+    try:
+        log.info(f"开始选股: {expression}, {market}, {top_n}, {sort_by}")
+        frame, info = await asyncio.to_thread(screener.screen, expression, market, top_n=top_n, sort_by=sort_by,
+                                              ascending=ascending, max_bar_symbols=max_bar_symbols)
+        result = payload_codec.encode_frame(frame, payload_codec.tool_encoding("ScreenMarket", encoding))
+        candidates, evaluated = info["indicator_candidates"], info["indicator_evaluated"]
+        if candidates is not None and evaluated < candidates:
+            result = json.dumps({
+                "symbols": json.loads(result),
+                "truncated": {
+                    "candidates": candidates,
+                    "evaluated": evaluated,
+                    "note": f"only the {evaluated} most traded of {candidates} candidates were checked against "
+                            f"indicator conditions; other symbols may also match",
+                },
+            }, ensure_ascii=False)
+        log.debug(f"选股结果: {result}")
+        return result
+    except Exception as e:
+        log.error(f"选股失败: {str(e)}", exc_info=True)
+        raise
+
+@mcp.tool(name="GetDCFSensitivity")
+async def GetDCFSensitivity(symbol: str, market: str, total_shares: Optional[float] = None,
+                            stock_price: Optional[float] = None, discount_rate: float = 0.09,
+                            growth_rate: float = 0.01, discount_rates: Optional[List[float]] = None,
+                            growth_rates: Optional[List[float]] = None,
+                            fcf_growths: Optional[List[float]] = None) -> Dict[str, Any]:
+    """DCF valuation sensitivity grid, computed in one vectorized pass from cached report fundamentals
+
+    Args:
+        symbol (str): stock symbol
+        market (str): market, us, cn, hk
+        total_shares (float): optional, total shares. cn defaults to the quote's total shares, us to the
+            latest shares outstanding in the balance sheet; for hk without it the share count is unknown:
+            intrinsic_value is the whole-company value, per_share is false and upside is omitted
+        stock_price (float): optional, current price for upside, default latest quote
+        discount_rate (float): center of the default discount rate axis (7 values, 1% apart), default 0.09
+        growth_rate (float): center of the default terminal growth axis (7 values, 0.5% apart), default 0.01
+        discount_rates (List[float]): optional, explicit discount rates
+        growth_rates (List[float]): optional, explicit terminal growth rates
+        fcf_growths (List[float]): optional, forecast FCF growth rates, default 0.5x..1.5x of fcf_growth_used,
+            the growth implied by the reports, or discount_rate when that growth is not positive
+    Returns:
+        Dict[str, Any]: latest_fcf, fcf_growth, fcf_growth_used, per_share, axes, and intrinsic_value / upside
+            nested as [fcf_growth][discount_rate][growth_rate] (None where discount rate <= terminal growth)
+    """
+    try:
+        log.info(f"开始计算DCF敏感性: {symbol}, {market}, {discount_rate}, {growth_rate}")
+        result = await asyncio.to_thread(
+            fin_reports_utils.get_dcf_sensitivity, symbol, market, shares_num=total_shares, stock_price=stock_price, discount_rate=discount_rate,
+            growth_rate=growth_rate, discount_rates=discount_rates, growth_rates=growth_rates,
+            fcf_growths=fcf_growths)
+        log.debug(f"DCF敏感性: {result}")
+        return result
+    except Exception as e:
+        log.error(f"计算DCF敏感性失败: {str(e)}", exc_info=True)
+        raise
+
 @mcp.tool(name="GetLatestStockPrice")
 async def GetLatestStockPrice(symbol:str, market:str) -> List[Dict[str,Any]]:
     """获取最新股票价格
@@ -99,20 +232,25 @@ async def GetGlobalMarketIndicators() -> Dict[str, Any]:
     except Exception as e:
         log.error(f"获取全球市场指标失败: {str(e)}", exc_info=True)
         raise e
-#@mcp.tool(name="GetMacroData")
-# async def GetMacroData(symbol:str, market:str) -> Dict[str, Any]:
-#     """获取宏观数据
-#     Returns:
-#         Dict[str, Any]: 宏观数据
-#     """
-#     try:
-#         log.info(f"开始获取宏观数据: {symbol}, {market}")
-#         result = macro_utils.get_macro_data()
-#         log.debug(f"获取到的宏观数据: {result}")
-#         return result
-#     except Exception as e:
-#         log.error(f"获取宏观数据失败: {str(e)}", exc_info=True)
-#         raise e
+@mcp.tool(name="GetMacroData")
+async def GetMacroData(market:str, last_n:int=12) -> Dict[str, Any]:
+    """获取宏观数据
+    Args:
+        market (str): 市场, us, cn, hk
+        last_n (int): 每个宏观指标返回最近的条数, 默认12
+    Returns:
+        Dict[str, Any]: 宏观数据, 每个指标包含 as_of(数据获取时间) 和 data
+    """
+    try:
+        log.info(f"开始获取宏观数据: {market}")
+        # 港股同时受中美两地宏观环境影响
+        markets = ["us", "cn"] if market in ("cn", "hk") else ["us"]
+        result = macro_utils.get_macro_data(markets, last_n)
+        log.debug(f"获取到的宏观数据: {result}")
+        return result
+    except Exception as e:
+        log.error(f"获取宏观数据失败: {str(e)}", exc_info=True)
+        raise e
     
 #@mcp.tool(name="AnalyzeFinancialReport")
 # async def AnalyzeFinancialReport(symbol:str, market:str, stock_price:float, 
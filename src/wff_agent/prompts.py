@@ -94,6 +94,7 @@ FundamentalAnalysisPrompt_v2 = """
 1. 财务数据如下:
   
    - 根据 {annual_financial_report_indicators}:年度财务指标，{quarter_financial_report_indicators}:季度财务指标给出财务指标分析
+   - {ttm_indicators}:滚动12个月(TTM)的营收、净利润、自由现金流、每股收益及 pe_ttm、pb_ttm，估值以此为准(季报的市盈率同样按TTM计算)
    - 根据 {dcf_valuation}给出DCF估值区间，判断当前股价是否合理
    
 2. 分析财务指标:
@@ -120,7 +121,7 @@ FundamentalAnalysisPrompt_v2 = """
    - 分析估值
       1. 相对估值法：
          - PEG比率 = 市盈率（pe_ttm） / 营收增长率(annual_revenue_growth_rate[0])
-         - 市净率分位数 = 行业排名百分比
+         - 市净率分位数 = 行业排名百分比，以 {peer_context} 中的同行分位数为准(不要杜撰)
       2. 绝对估值法：
          - 根据给出的DCF数据，判断当前价格是否合理
    - 使用杜邦分析法，分析净资产收益率的变动原因，给出杜邦分析图
@@ -147,6 +148,7 @@ FundamentalAnalysisPrompt = """
 【基本面分析流程】
 1. 财务数据如下:
    - 根据 {annual_financial_report_indicators}:年度财务指标，{quarter_financial_report_indicators}:季度财务指标给出财务指标分析
+   - {ttm_indicators}:滚动12个月(TTM)的营收、净利润、自由现金流、每股收益及 pe_ttm、pb_ttm，估值以此为准(季报的市盈率同样按TTM计算)
    - 根据 {dcf_valuation}给出DCF估值区间，判断当前股价是否合理
 
 2. 分析财务指标:
@@ -166,7 +168,7 @@ FundamentalAnalysisPrompt = """
 3. 估值分析框架:
    ▶ 相对估值法：
       PEG比率 = 市盈率 / 营收增长率
-      市净率分位数 = 行业排名百分比
+      市净率分位数 = 行业排名百分比，以 {peer_context} 中的同行分位数为准(不要杜撰)
    ▶ 绝对估值法：
      根据 {fin_ratios}中的dcf_valuation给出DCF估值区间，判断当前股价是否合理
 
@@ -197,8 +199,9 @@ GlobalMarketAnalysisPrompt = """
 【全球市场分析流程】
 1. 调用工具序列:
    - GetGlobalMarketIndicators() 请将获取的JSON数据转换为易读的格式，然后进行分析
+   - GetMacroData(market='{market}') 获取宏观经济指标(注意每个指标的as_of数据时间)
 2. 分析数据并生成报告:
-   根据全球市场指标，给出全球市场对股票的影响，包括正面影响和负面影响
+   根据全球市场指标和宏观经济指标，给出全球市场对股票的影响，包括正面影响和负面影响
 """
 
 MacroAnalysisPrompt = """
@@ -224,6 +227,7 @@ ComprehensiveAnalysisPrompt = """
 基本面分析：{fundamental_analysis}
 新闻分析：{news_analysis}
 全球市场分析：{global_market_analysis}
+蒙特卡洛DCF估值：{monte_carlo_valuation}
 
 【综合决策】
 报告中注明：
@@ -235,7 +239,7 @@ ComprehensiveAnalysisPrompt = """
    市场情绪 20%
 
 2. 蒙特卡洛模拟：
-   基于10,000次随机游走模拟，计算：
+   引用上面的蒙特卡洛DCF估值结果(内在价值分位数及高于当前股价的概率，不要杜撰)，并据此和技术面给出：
    - 上涨概率
    - 下跌概率
    - 震荡概率
@@ -6,7 +6,7 @@ from typing import Any, Dict, List
 
 from wff_agent import prompts
 
-from wff_agent.utils import fin_reports_utils, stock_utils
+from wff_agent.utils import fin_reports_utils, monte_carlo, payload_codec, peers, stock_utils
 from wff_agent.utils.stock_utils import is_valid_symbol
 from wff_agent.agents.base_agent import AnalysisAgent
 log = logging.getLogger(__name__)
@@ -22,12 +22,27 @@ class StockAnalysisAgent(AnalysisAgent):
         """
         return [
             "GetMarketIndicators",
+            "BacktestSignals",
+            "GetDCFSensitivity",
             "GetStockSentiment",
             "GetGlobalMarketIndicators",
+            "GetMacroData",
         ]
     def prepare_input(self, input: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
         log.info(f"StockAnalysisAgent 的输入: {input}")
         return input
+
+    def fill_stock_price(self, input: Dict[str, Any]) -> None:
+        """读取最新行情，设置 stock_price，A股同时设置 total_shares"""
+        stock_info = stock_utils.get_latest_stock_price(input["symbol"], input["market"])
+        if input["market"] == "cn":
+            input["stock_price"] = stock_info["最新"]
+            input["total_shares"] = stock_info["总股本"]
+        elif input["market"] == "us":
+            input["stock_price"] = stock_info["price"]
+        elif input["market"] == "hk":
+            log.debug(f"港股股票价格: {stock_info}")
+            input["stock_price"] = stock_info["收盘"]
     
     def get_output_file_name(self, input:Dict[str, Any]) -> str:
         return f"{input['symbol']}_{input['market']}_{self.__class__.__name__}.md"
@@ -48,28 +63,35 @@ class FundamentalAnalysisAgent(StockAnalysisAgent):
     def prepare_input(self, input:Dict[str, Any], context:Dict[str, Any]) -> Dict[str, Any]:
         """准备输入"""
         symbol = input["symbol"]
-        stock_info = stock_utils.get_latest_stock_price(symbol, input["market"])
-        if input["market"] == "cn":
-            input["stock_price"] = stock_info["最新"]
-            input["total_shares"] = stock_info["总股本"]
-        elif input["market"] == "us":
-            input["stock_price"] = stock_info["price"]
-        elif input["market"] == "hk":
-            if input["total_shares"] is None:
-                log.error("total_shares is None, hk market need total_shares")
-                raise ValueError("total_shares is None, hk market need total_shares")
-            log.debug(f"港股股票价格: {stock_info}")
-            input["stock_price"] = stock_info["收盘"]
+        if input["market"] == "hk" and input["total_shares"] is None:
+            log.error("total_shares is None, hk market need total_shares")
+            raise ValueError("total_shares is None, hk market need total_shares")
+        self.fill_stock_price(input)
         
         fin_ratios = self.get_fin_ratios(symbol, input["market"], input["stock_price"], input["discount_rate"], input["growth_rate"], input["total_shares"])
-        input["annual_financial_report_indicators"] = fin_ratios["annual_financial_report_indicators"]
-        input["quarter_financial_report_indicators"] = fin_ratios["quarter_financial_report_indicators"]
+        encoding = payload_codec.tool_encoding("FinancialReportIndicators")
+        input["annual_financial_report_indicators"] = payload_codec.encode_columns(fin_ratios["annual_financial_report_indicators"], encoding)
+        input["quarter_financial_report_indicators"] = payload_codec.encode_columns(fin_ratios["quarter_financial_report_indicators"], encoding)
+        if "ttm_indicators" in fin_ratios:
+            input["ttm_indicators"] = payload_codec.encode_columns(fin_ratios["ttm_indicators"], encoding)
+        else:
+            input["ttm_indicators"] = "未计算TTM指标"
         if "dcf_valuation" in fin_ratios:
             input["dcf_valuation"] = fin_ratios["dcf_valuation"]
         else:
             input["dcf_valuation"] = "未计算DCF估值"
+        input["peer_context"] = self.get_peer_context(input)
         log.info("获取基本面数据完毕，准备执行基本面分析")
         return super().prepare_input(input, context)
+
+    def get_peer_context(self, input: Dict[str, Any]) -> str:
+        """同行分位数摘要，只使用本地缓存，失败时返回说明文字"""
+        try:
+            result = peers.peer_ranking(input["symbol"], input["market"], peers=input.get("peers"))
+            return peers.summary_text(result)
+        except Exception as e:
+            log.warning(f"同行分位数计算失败: {e}")
+            return f"未计算同行分位数: {e}"
     
     def get_fin_ratios(self, symbol:str, market:str, stock_price:float, discount_rate:float, growth_rate:float, total_shares:int) -> str:
         fin_ratios = fin_reports_utils.get_report_indicators(symbol, market, stock_price, discount_rate, growth_rate, total_shares)
@@ -127,9 +149,15 @@ class ComprehensiveAnalysisAgent(StockAnalysisAgent):
     
     def get_system_prompt(self) -> str:
         return prompts.SystemStockAnalysisPrompt
+
+    def get_dependencies(self) -> List[str]:
+        return ["NewsAnalysisAgent", "TechAnalysisAgent", "FundamentalAnalysisAgent", "GlobalMarketAnalysisAgent"]
     
     def prepare_input(self, input: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
         """准备输入"""
+        # 各步骤的输入相互独立，股价不再由基本面分析步骤传入
+        if input.get("stock_price") is None:
+            self.fill_stock_price(input)
         if context["TechAnalysisAgent"]["output"] is None or len(context["TechAnalysisAgent"]["output"]) == 0:
             log.info(f"TechAnalysisAgent 的输出为空，读取文件: {input['symbol']}_{input['market']}_TechAnalysisAgent.md")
             input["technical_analysis"] = self.read_report_files(input, "TechAnalysisAgent")
@@ -152,8 +180,23 @@ class ComprehensiveAnalysisAgent(StockAnalysisAgent):
             input["global_market_analysis"] = self.read_report_files(input, "GlobalMarketAnalysisAgent")
         else:
             input["global_market_analysis"] = context["GlobalMarketAnalysisAgent"]["output"]
+        input["monte_carlo_valuation"] = self.get_monte_carlo_valuation(input)
         return super().prepare_input(input, context)
 
+    def get_monte_carlo_valuation(self, input: Dict[str, Any]) -> str:
+        """蒙特卡洛DCF估值摘要，失败时返回说明文字"""
+        try:
+            result = fin_reports_utils.get_monte_carlo_valuation(
+                input["symbol"], input["market"],
+                shares_num=input.get("total_shares") or None,
+                stock_price=input.get("stock_price"),
+                discount_rate=input["discount_rate"],
+                growth_rate=input["growth_rate"])
+            return monte_carlo.summary_text(result)
+        except Exception as e:
+            log.error(f"蒙特卡洛估值失败: {e}", exc_info=True)
+            return f"未计算蒙特卡洛估值: {e}"
+
     def read_report_files(self, input: Dict[str, Any], agent_name: str) -> str:
         file_path = f"./reports/{input['symbol']}_{input['market']}_{agent_name}.md"
         with open(file_path, "r") as f:
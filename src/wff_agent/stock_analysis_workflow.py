@@ -11,19 +11,22 @@ log = logging.getLogger(__name__)
 class StockAnalysisWorkflow(Workflow):
     """股票分析工作流"""
     
-    def __init__(self, agents: List[AnalysisAgent], progress_callback: Optional[Callable] = None):
-        super().__init__(progress_callback=progress_callback)
+    def __init__(self, agents: List[AnalysisAgent], progress_callback: Optional[Callable] = None,
+                 max_concurrency: Optional[int] = None):
+        super().__init__(progress_callback=progress_callback, max_concurrency=max_concurrency)
         self.agents = agents
      
         
     def setup_steps(self):
         """设置工作流步骤"""
-         # 基本面分析步骤
+         # 每个 Agent 一个步骤，只保留本次工作流中存在的依赖
+        names = {agent.__class__.__name__ for agent in self.agents}
         for agent in self.agents:
             self.steps.append(WorkflowStep(
                 name=agent.__class__.__name__,
                 agent=agent,
-                system_prompt=agent.get_system_prompt()
+                system_prompt=agent.get_system_prompt(),
+                depends_on=[name for name in agent.get_dependencies() if name in names]
             ))
        
         
@@ -3,12 +3,32 @@ from wff_agent.utils import ak_fin_utils
 from wff_agent.utils import av_fin_utils
 from wff_agent.utils import agent_utils
 from wff_agent.utils import stock_utils
+from wff_agent.utils import indicator_engine
+from wff_agent.utils import indicator_stream
+from wff_agent.utils import indicator_memo
+from wff_agent.utils import payload_codec
+from wff_agent.utils import backtest
+from wff_agent.utils import screener
+from wff_agent.utils import ratio_engine
+from wff_agent.utils import fundamentals
+from wff_agent.utils import monte_carlo
+from wff_agent.utils import peers
 __all__ = [
         "fin_reports_utils", 
         "ak_fin_utils", 
         "av_fin_utils", 
         "agent_utils", 
-        "stock_utils"
+        "stock_utils",
+        "indicator_engine",
+        "indicator_stream",
+        "indicator_memo",
+        "payload_codec",
+        "backtest",
+        "screener",
+        "ratio_engine",
+        "fundamentals",
+        "monte_carlo",
+        "peers"
         ]
 
 
@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+"""
+技术信号回测
+
+用本地行情存储中的日线和 indicator_engine 计算的指标，检验技术分析中常用信号的历史表现:
+均线交叉、MACD 柱翻转、KDJ 的 J 值极值、布林带突破/回归。
+
+每条规则由指标数组向量化地生成买入、卖出信号，持仓状态、交易区间和收益也都用数组运算得到，
+不逐根K线循环。多只股票在进程池中并行，每个进程计算一只股票的全部规则和参数组合。
+
+收益按信号K线的收盘价成交，只做多，不计滑点，可以用 fee 指定每笔交易的往返费用。
+"""
+import datetime
+import itertools
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from wff_agent.datasource import akshare_request as ak_request
+from wff_agent.datasource import replay
+from wff_agent.utils import indicator_engine
+
+log = logging.getLogger(__name__)
+
+# 默认回测年数
+DEFAULT_YEARS = 3
+# 信号后的观察K线数，用于计算信号命中率
+DEFAULT_HORIZON = 5
+# 并行的进程数上限
+DEFAULT_WORKERS = 4
+
+Signals = Tuple[np.ndarray, np.ndarray]
+
+
+def _cross_above(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    # 比较中含NaN时结果为 False，指标预热期内不会产生信号；
+    # 第一根K线之前的状态未知，不算作交叉
+    above = a > b
+    previous = np.concatenate([[False], a[:-1] <= b[:-1]])
+    return above & previous
+
+
+def _cross_below(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    below = a < b
+    previous = np.concatenate([[False], a[:-1] >= b[:-1]])
+    return below & previous
+
+
+def ma_cross(data: Dict[str, np.ndarray], fast: str = "MA5", slow: str = "MA20") -> Signals:
+    """快线上穿慢线买入，下穿卖出"""
+    return _cross_above(data[fast], data[slow]), _cross_below(data[fast], data[slow])
+
+
+def macd_flip(data: Dict[str, np.ndarray]) -> Signals:
+    """MACD 柱由负转正买入，由正转负卖出"""
+    zero = np.zeros_like(data["MACD"])
+    return _cross_above(data["MACD"], zero), _cross_below(data["MACD"], zero)
+
+
+def kdj_extreme(data: Dict[str, np.ndarray], low: float = 0.0, high: float = 100.0) -> Signals:
+    """J 值跌破 low 买入，升破 high 卖出"""
+    j = data["J"]
+    return _cross_below(j, np.full_like(j, low)), _cross_above(j, np.full_like(j, high))
+
+
+def boll_breakout(data: Dict[str, np.ndarray], mode: str = "breakout") -> Signals:
+    """
+    breakout: 收盘价上穿上轨买入，跌破中轨卖出
+    reversion: 收盘价跌破下轨买入，回到中轨卖出
+    """
+    close = data["收盘"]
+    if mode == "breakout":
+        return _cross_above(close, data["BOLL_UP"]), _cross_below(close, data["BOLL"])
+    if mode == "reversion":
+        return _cross_below(close, data["BOLL_DOWN"]), _cross_above(close, data["BOLL"])
+    raise ValueError(f"不支持的布林带模式: {mode}")
+
+
+RULES: Dict[str, Callable[..., Signals]] = {
+    "ma_cross": ma_cross,
+    "macd_flip": macd_flip,
+    "kdj_extreme": kdj_extreme,
+    "boll_breakout": boll_breakout,
+}
+
+# 每条规则的默认参数网格，值为候选列表，回测时取笛卡尔积
+DEFAULT_GRIDS: Dict[str, Dict[str, List[Any]]] = {
+    "ma_cross": {"fast": ["MA5", "MA20"], "slow": ["MA20", "MA60"]},
+    "macd_flip": {},
+    "kdj_extreme": {"low": [-10, 0, 10], "high": [90, 100, 110]},
+    "boll_breakout": {"mode": ["breakout", "reversion"]},
+}
+
+
+def expand_grid(grid: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+    """
+    展开参数网格
+
+    Args:
+        grid: {参数名: 候选值列表}
+    Returns:
+        List[Dict[str, Any]]: 全部参数组合
+    """
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def _valid_params(rule: str, params: Dict[str, Any]) -> bool:
+    if rule == "ma_cross":
+        fast, slow = params.get("fast", "MA5"), params.get("slow", "MA20")
+        return indicator_engine.MA_WINDOWS[fast] < indicator_engine.MA_WINDOWS[slow]
+    if rule == "kdj_extreme":
+        return params.get("low", 0.0) < params.get("high", 100.0)
+    return True
+
+
+def build_plan(rules: Optional[Iterable[str]] = None,
+               grids: Optional[Dict[str, Dict[str, List[Any]]]] = None) -> List[Tuple[str, Dict[str, Any]]]:
+    """
+    生成 (规则, 参数) 列表
+
+    Args:
+        rules: 规则名称，None 表示全部
+        grids: 覆盖默认参数网格，如 {"kdj_extreme": {"low": [0], "high": [100]}}
+    Returns:
+        List[Tuple[str, Dict[str, Any]]]
+    """
+    rules = list(RULES) if rules is None else list(rules)
+    unknown = [rule for rule in rules if rule not in RULES]
+    if unknown:
+        raise ValueError(f"未知的回测规则: {', '.join(unknown)}，可选: {', '.join(RULES)}")
+    grids = dict(DEFAULT_GRIDS, **(grids or {}))
+    return [(rule, params) for rule in rules for params in expand_grid(grids.get(rule, {}))
+            if _valid_params(rule, params)]
+
+
+def positions(buy: np.ndarray, sell: np.ndarray) -> np.ndarray:
+    """
+    由买入、卖出信号得到每根K线收盘后的持仓(1 持有, 0 空仓)，同一根K线同时出现时忽略
+
+    Args:
+        buy: 买入信号
+        sell: 卖出信号
+    Returns:
+        np.ndarray: 持仓，布尔数组
+    """
+    state = np.full(len(buy), np.nan)
+    state[buy & ~sell] = 1.0
+    state[sell & ~buy] = 0.0
+    state = pd.Series(state).ffill().fillna(0.0).to_numpy()
+    return state > 0
+
+
+def evaluate(close: np.ndarray, buy: np.ndarray, sell: np.ndarray,
+             horizon: int = DEFAULT_HORIZON, fee: float = 0.0) -> Dict[str, float]:
+    """
+    回测一组信号
+
+    Args:
+        close: 收盘价
+        buy: 买入信号
+        sell: 卖出信号
+        horizon: 信号命中率的观察K线数
+        fee: 每笔交易的往返费用比例
+    Returns:
+        Dict[str, float]: signals 信号数, signal_hit_rate 信号后 horizon 根K线上涨的比例,
+            signal_return 信号后 horizon 根K线的平均收益, trades 交易数, win_rate 盈利交易比例,
+            avg_trade_return 平均每笔收益, total_return 复利总收益, exposure 持仓时间占比
+    """
+    n = len(close)
+    held = positions(buy, sell)
+
+    # 信号命中率: 买入信号之后 horizon 根K线的收益
+    signal_idx = np.flatnonzero(buy[:n - horizon]) if n > horizon else np.array([], dtype=int)
+    forward = close[signal_idx + horizon] / close[signal_idx] - 1 if len(signal_idx) else np.array([])
+
+    # 交易区间: 持仓由0变1的K线买入，由1变0的K线卖出，期末未平仓按最后收盘价计
+    change = np.diff(np.concatenate([[False], held, [False]]).astype(np.int8))
+    starts = np.flatnonzero(change == 1)
+    ends = np.minimum(np.flatnonzero(change == -1), n - 1)
+    trade_returns = close[ends] / close[starts] - 1 - fee
+
+    return {
+        "signals": int(len(signal_idx)),
+        "signal_hit_rate": float(np.mean(forward > 0)) if len(forward) else np.nan,
+        "signal_return": float(np.mean(forward)) if len(forward) else np.nan,
+        "trades": int(len(trade_returns)),
+        "win_rate": float(np.mean(trade_returns > 0)) if len(trade_returns) else np.nan,
+        "avg_trade_return": float(np.mean(trade_returns)) if len(trade_returns) else np.nan,
+        "total_return": float(np.prod(1 + trade_returns) - 1) if len(trade_returns) else 0.0,
+        "exposure": float(held.mean()) if n else np.nan,
+    }
+
+
+def _backtest_symbol(symbol: str, data: Dict[str, np.ndarray], plan: List[Tuple[str, Dict[str, Any]]],
+                     horizon: int, fee: float) -> List[Dict[str, Any]]:
+    # 进程池中执行，参数和返回值只含可序列化的基本类型和数组
+    close = data["收盘"]
+    buy_hold = float(close[-1] / close[0] - 1) if len(close) else np.nan
+    rows = []
+    for rule, params in plan:
+        buy, sell = RULES[rule](data, **params)
+        row = {"symbol": symbol, "rule": rule, "params": params, "buy_hold_return": buy_hold}
+        row.update(evaluate(close, buy, sell, horizon, fee))
+        rows.append(row)
+    return rows
+
+
+def load_history(symbol: str, market: str, years: int = DEFAULT_YEARS) -> Dict[str, np.ndarray]:
+    """
+    从本地行情存储读取前复权日线并计算全部指标
+
+    Args:
+        symbol: 股票代码
+        market: 市场
+        years: 回测年数，另多取一年用于指标预热
+    Returns:
+        Dict[str, np.ndarray]: 收盘价和各指标列，已去掉预热期
+    """
+    start = replay.now() - datetime.timedelta(days=365 * (years + 1))
+    df = ak_request.get_stock_history(symbol, market, start_date=start.strftime("%Y%m%d"))
+    frame = indicator_engine.calc_market_indicators(df.sort_index())
+    frame = frame[frame.index >= replay.now() - datetime.timedelta(days=365 * years)]
+    return {col: frame[col].to_numpy(dtype=float) for col in ["收盘"] + indicator_engine.INDICATOR_COLUMNS}
+
+
+def run_backtest(symbols: List[str], market: str, rules: Optional[List[str]] = None,
+                 grids: Optional[Dict[str, Dict[str, List[Any]]]] = None, years: int = DEFAULT_YEARS,
+                 horizon: int = DEFAULT_HORIZON, fee: float = 0.0,
+                 max_workers: int = DEFAULT_WORKERS) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    回测多只股票的技术信号
+
+    Args:
+        symbols: 股票代码列表
+        market: 市场, us, cn, hk
+        rules: 规则名称，可选 ma_cross, macd_flip, kdj_extreme, boll_breakout，None 表示全部
+        grids: 覆盖默认参数网格
+        years: 回测年数
+        horizon: 信号命中率的观察K线数
+        fee: 每笔交易的往返费用比例
+        max_workers: 并行进程数，1 表示在当前进程内计算
+    Returns:
+        (每个规则和参数在全部股票上的汇总, 每只股票的明细)
+    """
+    plan = build_plan(rules, grids)
+    # 行情在主进程读取，复用本进程的行情存储和调度器
+    histories: Dict[str, Dict[str, np.ndarray]] = {}
+    for symbol in symbols:
+        try:
+            histories[symbol] = load_history(symbol.upper(), market.lower(), years)
+        except Exception as e:
+            log.error(f"回测读取行情失败: {symbol}, {e}")
+    if not histories:
+        raise ValueError(f"没有可回测的行情: {symbols}")
+
+    rows: List[Dict[str, Any]] = []
+    if max_workers <= 1 or len(histories) == 1:
+        for symbol, data in histories.items():
+            rows.extend(_backtest_symbol(symbol, data, plan, horizon, fee))
+    else:
+        with ProcessPoolExecutor(max_workers=min(max_workers, len(histories))) as executor:
+            futures = [executor.submit(_backtest_symbol, symbol, data, plan, horizon, fee)
+                       for symbol, data in histories.items()]
+            for future in futures:
+                rows.extend(future.result())
+
+    detail = pd.DataFrame(rows)
+    detail["params"] = detail["params"].map(lambda params: ", ".join(f"{k}={v}" for k, v in params.items()))
+    return summarize(detail), detail
+
+
+def summarize(detail: pd.DataFrame) -> pd.DataFrame:
+    """
+    按规则和参数汇总各股票的回测结果，命中率和胜率按信号数、交易数加权
+
+    Args:
+        detail: run_backtest 返回的明细
+    Returns:
+        pd.DataFrame: 每个规则和参数一行
+    """
+    detail = detail.assign(
+        signal_hits=detail["signal_hit_rate"].fillna(0) * detail["signals"],
+        signal_return_sum=detail["signal_return"].fillna(0) * detail["signals"],
+        wins=detail["win_rate"].fillna(0) * detail["trades"],
+        trade_return_sum=detail["avg_trade_return"].fillna(0) * detail["trades"],
+    )
+    grouped = detail.groupby(["rule", "params"], sort=False)
+    summary = grouped.agg(symbols=("symbol", "count"), signals=("signals", "sum"), signal_hits=("signal_hits", "sum"),
+                          signal_return_sum=("signal_return_sum", "sum"), trades=("trades", "sum"),
+                          wins=("wins", "sum"), trade_return_sum=("trade_return_sum", "sum"),
+                          total_return=("total_return", "mean"), buy_hold_return=("buy_hold_return", "mean"),
+                          exposure=("exposure", "mean"))
+    signals = summary["signals"].where(summary["signals"] > 0)
+    trades = summary["trades"].where(summary["trades"] > 0)
+    summary["signal_hit_rate"] = summary.pop("signal_hits") / signals
+    summary["signal_return"] = summary.pop("signal_return_sum") / signals
+    summary["win_rate"] = summary.pop("wins") / trades
+    summary["avg_trade_return"] = summary.pop("trade_return_sum") / trades
+    columns = ["symbols", "signals", "signal_hit_rate", "signal_return", "trades", "win_rate",
+               "avg_trade_return", "total_return", "buy_hold_return", "exposure"]
+    return summary[columns].reset_index()
@@ -1,7 +1,13 @@
 import logging
+from typing import Sequence
+
+import numpy as np
 
 log = logging.getLogger(__name__)
 
+# 显式预测期年数，与 free_cash_flow_valuation 相同
+FORECAST_YEARS = 5
+
 def free_cash_flow_valuation(latest_fcf:int, recent_3_yr_fcf_avg_growth:float, 
                       discount_rate:float=0.09, growth_rate:float=0.01, shares_num:int=1)->dict:
     """
@@ -47,4 +53,59 @@ def free_cash_flow_valuation(latest_fcf:int, recent_3_yr_fcf_avg_growth:float,
         "present_value": present_value,
         "future_5_yr_fcf": future_5_yr_fcf,
         "intrinsic_value": present_value/int(shares_num)
-    }
\ No newline at end of file
+    }
+
+
+def dcf_grid(latest_fcf: float, fcf_growths: Sequence[float], discount_rates: Sequence[float],
+             growth_rates: Sequence[float], shares_num: float = 1) -> np.ndarray:
+    """
+    一次计算整张 DCF 敏感性表，与 free_cash_flow_valuation 的估值公式逐点一致
+
+    三组参数按广播展开，不做 Python 循环；自由现金流增长率不大于0时同样改用折现率，
+    折现率不大于永续增长率的组合没有意义，结果为 NaN。
+
+    Args:
+        latest_fcf: 最新自由现金流
+        fcf_growths: 预测期内自由现金流增长率
+        discount_rates: 折现率
+        growth_rates: 永续增长率
+        shares_num: 总股本
+    Returns:
+        np.ndarray: 每股内在价值，形状为 (len(fcf_growths), len(discount_rates), len(growth_rates))
+    """
+    if not shares_num or shares_num == "None":
+        raise ValueError("股票数量为0，无法计算DCF估值")
+    if latest_fcf is None or latest_fcf <= 0:
+        raise ValueError("最新自由现金流不大于0，无法计算DCF估值")
+    g = np.asarray(fcf_growths, dtype=float).reshape(-1, 1, 1)
+    r = np.asarray(discount_rates, dtype=float).reshape(1, -1, 1)
+    tg = np.asarray(growth_rates, dtype=float).reshape(1, 1, -1)
+    g = np.where(g > 0, g, r)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        values = present_value(latest_fcf, g, r, tg)
+    return np.where(r > tg, values, np.nan) / float(shares_num)
+
+
+def present_value(latest_fcf: float, fcf_growth: np.ndarray, discount_rate: np.ndarray,
+                  growth_rate: np.ndarray) -> np.ndarray:
+    """
+    DCF 现值的逐元素计算，参数按 NumPy 规则广播，不做参数修正，调用方保证折现率大于永续增长率
+
+    Args:
+        latest_fcf: 最新自由现金流
+        fcf_growth: 预测期内自由现金流增长率
+        discount_rate: 折现率
+        growth_rate: 永续增长率
+    Returns:
+        np.ndarray: 企业现值
+    """
+    # 预测期各年折现后的现金流之和: fcf * sum(q^t), q = (1+g)/(1+r), t = 1..5
+    q = (1 + fcf_growth) / (1 + discount_rate)
+    discounted_sum = np.zeros(np.shape(q))
+    term = np.ones(np.shape(q))
+    for _ in range(FORECAST_YEARS):
+        term = term * q
+        discounted_sum = discounted_sum + term
+    last_fcf = latest_fcf * (1 + fcf_growth) ** FORECAST_YEARS
+    terminal_discounted = last_fcf * (1 + growth_rate) / (discount_rate - growth_rate) / (1 + discount_rate) ** FORECAST_YEARS
+    return latest_fcf * discounted_sum + terminal_discounted
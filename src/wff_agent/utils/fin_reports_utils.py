@@ -1,18 +1,160 @@
 # -*- coding: utf-8 -*-
 
-from typing import Any, Dict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import numpy as np
 from wff_agent.datasource import alpha_v_request as av_request
 from wff_agent.datasource import akshare_request as ak_request 
+from wff_agent.datasource import scheduler
 import logging
 
-from wff_agent.utils import ak_fin_utils, av_fin_utils
+from wff_agent.utils import ak_fin_utils, av_fin_utils, fcf_valuation, fundamentals, monte_carlo, stock_utils
 
 log = logging.getLogger(__name__)
 
+# 批量读取报表的线程数，上游并发仍由数据源调度器限制
+BATCH_FETCH_WORKERS = 4
+# 批量计算基本面数据的进程数
+BATCH_BUILD_WORKERS = 4
+
+# 市场 -> (拉取报表, 报表版本, 计算与股价无关的基本面数据)
+_MARKETS = {
+    "us": (av_request.get_stock_financial_report_us, av_request.report_version_us, av_fin_utils.calc_us_fundamentals),
+    "cn": (ak_request.get_stock_financial_report_cn, ak_request.report_version_cn, ak_fin_utils.calc_cn_fundamentals),
+    "hk": (ak_request.get_stock_financial_report_hk, ak_request.report_version_hk, ak_fin_utils.calc_hk_fundamentals),
+}
+# 市场 -> 只读取本地已缓存的报表
+_CACHED_REPORTS = {
+    "us": av_request.get_cached_financial_report_us,
+    "cn": ak_request.get_cached_financial_report_cn,
+    "hk": ak_request.get_cached_financial_report_hk,
+}
+
+def _reuse_same_version(symbol: str, market: str, entry: Optional[Dict[str, Any]],
+                        version: Optional[str]) -> Optional[Dict[str, Any]]:
+    """
+    报表版本与缓存一致时刷新核对时间并返回缓存的基本面数据，否则返回None
+    """
+    if entry is not None and version is not None and entry["version"] == version:
+        fundamentals.record("version_hits")
+        return fundamentals.put(market, symbol, version, entry["data"])["data"]
+    return None
+
+def _store(symbol: str, market: str, version: Optional[str], data: Dict[str, Any]) -> Dict[str, Any]:
+    fundamentals.record("builds")
+    if version is not None:
+        fundamentals.put(market, symbol, version, data)
+    return data
+
+def get_report_fundamentals(symbol: str, market: str) -> Dict[str, Any]:
+    """
+    获取与股价无关的基本面数据，按报表版本缓存
+
+    距上次核对版本不超过 fundamentals.RECHECK_SECONDS 时直接使用缓存；否则读取报表(报表本身按版本缓存)，
+    版本未变时沿用缓存，出现新报告期时重新计算。
+
+    Args:
+        symbol: 股票代码
+        market: 市场, us, cn, hk
+    Returns:
+        dict: 基本面数据，用 fundamentals.reprice 套用股价
+    """
+    entry = fundamentals.lookup(market, symbol)
+    if entry is not None and fundamentals.is_fresh(entry):
+        fundamentals.record("hits")
+        return entry["data"]
+    fetch, version_of, build = _MARKETS[market]
+    reports = fetch(symbol)
+    version = version_of(reports)
+    reused = _reuse_same_version(symbol, market, entry, version)
+    if reused is not None:
+        return reused
+    log.info(f"计算{symbol}的基本面数据, 报表版本: {version}")
+    return _store(symbol, market, version, build(reports))
+
+def get_batch_fundamentals(symbols: List[str], market: str, cached_only: bool = True,
+                           fetch_workers: int = BATCH_FETCH_WORKERS,
+                           max_workers: int = BATCH_BUILD_WORKERS) -> Dict[str, Dict[str, Any]]:
+    """
+    批量获取一组股票(如同行业可比公司)与股价无关的基本面数据
+
+    已缓存的基本面数据直接使用；其余股票的报表用 fetch_workers 个线程读取，上游请求使用调度器的预取优先级，
+    不挤占交互请求；需要重新计算的股票在进程池中并行计算，结果写回按版本的缓存。
+
+    Args:
+        symbols: 股票代码
+        market: 市场, us, cn, hk
+        cached_only: 只使用本地已缓存的基本面数据和报表，不回源，用于分析时几乎零代价地取得同行数据
+        fetch_workers: 读取报表的线程数
+        max_workers: 计算的进程数，1 表示在当前进程内计算
+    Returns:
+        {股票代码: 基本面数据}，取不到报表或计算失败的股票不在结果中
+    """
+    if market not in _MARKETS:
+        raise ValueError(f"不支持的市场: {market}")
+    fetch, version_of, build = _MARKETS[market]
+    result: Dict[str, Dict[str, Any]] = {}
+    entries: Dict[str, Optional[Dict[str, Any]]] = {}
+    for symbol in dict.fromkeys(symbols):
+        entry = fundamentals.lookup(market, symbol)
+        if entry is not None and (cached_only or fundamentals.is_fresh(entry)):
+            fundamentals.record("hits")
+            result[symbol] = entry["data"]
+        else:
+            entries[symbol] = entry
+
+    def load(symbol: str) -> Optional[Any]:
+        try:
+            if cached_only:
+                return _CACHED_REPORTS[market](symbol)
+            with scheduler.prefetch():
+                return fetch(symbol)
+        except Exception as e:
+            log.warning(f"批量读取报表失败: {symbol}, {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=max(1, fetch_workers)) as executor:
+        loaded = dict(zip(entries, executor.map(load, entries)))
+    pending: Dict[str, Tuple[Any, Optional[str]]] = {}
+    for symbol, reports in loaded.items():
+        if reports is None:
+            continue
+        version = version_of(reports)
+        reused = _reuse_same_version(symbol, market, entries[symbol], version)
+        if reused is not None:
+            result[symbol] = reused
+        else:
+            pending[symbol] = (reports, version)
+
+    if pending:
+        log.info(f"批量计算基本面数据: {market}, {len(pending)} 只股票")
+        if max_workers <= 1 or len(pending) == 1:
+            futures = {symbol: _completed(build, reports) for symbol, (reports, _) in pending.items()}
+        else:
+            with ProcessPoolExecutor(max_workers=min(max_workers, len(pending))) as executor:
+                futures = {symbol: executor.submit(build, reports) for symbol, (reports, _) in pending.items()}
+                for future in futures.values():
+                    future.exception()
+        for symbol, future in futures.items():
+            if future.exception() is not None:
+                log.warning(f"批量计算基本面数据失败: {symbol}, {future.exception()}")
+                continue
+            result[symbol] = _store(symbol, market, pending[symbol][1], future.result())
+    return {symbol: result[symbol] for symbol in symbols if symbol in result}
+
+def _completed(fn: Callable, *args) -> Future:
+    """在当前进程内执行，返回已完成的 Future，与进程池的结果统一处理"""
+    future: Future = Future()
+    try:
+        future.set_result(fn(*args))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
 def get_report_indicators(symbol: str, market: str, stock_price: float, 
                          discount_rate: float = 0.06, growth_rate: float = 0.02, shares_num: int = 1) -> Dict[str, Any]:
     """
-    获取财务报表指标
+    获取财务报表指标，报表部分按版本缓存，每次调用只套用当前股价、折现率和增长率
     """
     if symbol is None:
         log.error(f"param symbol is None")
@@ -30,19 +172,10 @@ def get_report_indicators(symbol: str, market: str, stock_price: float,
         log.error(f"param growth_rate is None")
         return {"error": """param growth_rate is None"""}
     
-    reports = None
-    """财务关键指标计算"""
     log.info(f"股票价格：{stock_price}, 开始计算{symbol}的财务指标")
     try:
-        if market == 'us':
-            reports = av_request.get_stock_financial_report_us(symbol)
-            indictors = av_fin_utils.calc_us_indicators(reports, stock_price, discount_rate=discount_rate, growth_rate=growth_rate, shares_num=shares_num)     
-        elif market == 'cn':
-            reports = ak_request.get_stock_financial_report_cn(symbol)
-            indictors = ak_fin_utils.calc_cn_indicators(reports, stock_price, discount_rate=discount_rate, growth_rate=growth_rate, shares_num=shares_num)  
-        elif market == 'hk':
-            reports = ak_request.get_stock_financial_report_hk(symbol)
-            indictors = ak_fin_utils.calc_hk_indicators(reports, stock_price, discount_rate=discount_rate, growth_rate=growth_rate, shares_num=shares_num)  
+        base = get_report_fundamentals(symbol, market)
+        indictors = fundamentals.reprice(base, stock_price, discount_rate=discount_rate, growth_rate=growth_rate, shares_num=shares_num)
     except Exception as e:
         log.error(f"获取财务报表失败: {e}")
         return {"error": str(e)}
@@ -50,6 +183,148 @@ def get_report_indicators(symbol: str, market: str, stock_price: float,
     log.info(f"计算财务指标完成: {symbol}, market:{market}")
     return indictors
 
+def _around(center: float, step: float, count: int = 3) -> List[float]:
+    """以 center 为中心、左右各 count 档的取值"""
+    return [round(center + step * i, 4) for i in range(-count, count + 1)]
+
+def _price_and_shares(symbol: str, market: str, stock_price: Optional[float],
+                      shares_num: Optional[float], base: Dict[str, Any]) -> tuple:
+    """
+    补全股价和总股本: 缺省时读取最新行情，A股总股本取行情中的总股本，
+    美股取报表中最新的总股本(base["shares_num"])，都没有时总股本为 None(未知)
+    """
+    if stock_price is None or (shares_num is None and market == "cn"):
+        stock_info = stock_utils.get_latest_stock_price(symbol, market)
+        if market == "cn":
+            price, shares = stock_info["最新"], stock_info["总股本"]
+        elif market == "us":
+            price, shares = stock_info["price"], None
+        else:
+            price, shares = stock_info["收盘"], None
+        stock_price = stock_price if stock_price is not None else price
+        shares_num = shares_num if shares_num is not None else shares
+    return stock_price, shares_num or base.get("shares_num") or None
+
+def get_dcf_sensitivity(symbol: str, market: str, shares_num: Optional[float] = None,
+                        stock_price: Optional[float] = None, discount_rate: float = 0.09, growth_rate: float = 0.01,
+                        discount_rates: Optional[List[float]] = None, growth_rates: Optional[List[float]] = None,
+                        fcf_growths: Optional[List[float]] = None) -> Dict[str, Any]:
+    """
+    DCF 估值敏感性表，基本面数据按报表版本缓存，整张表一次向量化计算，不经过大模型
+
+    Args:
+        symbol: 股票代码
+        market: 市场, us, cn, hk
+        shares_num: 总股本，A股缺省时取行情中的总股本，美股取报表中的总股本；
+            港股缺省时股本未知，intrinsic_value 为企业总价值，不计算上涨空间
+        stock_price: 当前股价，缺省时读取最新行情，用于计算上涨空间
+        discount_rate: 未给出 discount_rates 时，以它为中心每 1% 取一档，左右各3档
+        growth_rate: 未给出 growth_rates 时，以它为中心每 0.5% 取一档，左右各3档
+        discount_rates: 折现率
+        growth_rates: 永续增长率
+        fcf_growths: 预测期自由现金流增长率，缺省为 fcf_growth_used 的 0.5, 0.75, 1, 1.25, 1.5 倍
+    Returns:
+        dict: latest_fcf, fcf_growth(报表推算的增长率), fcf_growth_used(估值实际使用的增长率，
+            报表推算的增长率不大于0时与 free_cash_flow_valuation 一样改用 discount_rate), 各轴取值,
+            per_share(intrinsic_value 是否为每股价值), intrinsic_value 与 upside
+            (按 fcf_growths x discount_rates x growth_rates 嵌套的列表，无效组合为 None；股本未知时没有 upside)
+    """
+    if market not in _MARKETS:
+        raise ValueError(f"不支持的市场: {market}")
+    base = get_report_fundamentals(symbol, market)
+    if base["latest_fcf"] is None:
+        raise ValueError(f"{symbol}缺少最新一期的自由现金流，无法计算DCF估值")
+    stock_price, shares_num = _price_and_shares(symbol, market, stock_price, shares_num, base)
+    per_share = shares_num is not None
+    discount_rates = discount_rates or [r for r in _around(discount_rate, 0.01) if r > 0]
+    growth_rates = growth_rates or _around(growth_rate, 0.005)
+    # 增长率不大于0时估值改用折现率，默认的轴以实际使用的值为中心，否则各档都被替换成折现率，每张表都相同
+    fcf_growth_used = base["fcf_growth"] if base["fcf_growth"] > 0 else discount_rate
+    fcf_growths = fcf_growths or [round(fcf_growth_used * k, 4) for k in (0.5, 0.75, 1, 1.25, 1.5)]
+    values = fcf_valuation.dcf_grid(base["latest_fcf"], fcf_growths, discount_rates, growth_rates,
+                                    shares_num if per_share else 1)
+
+    def to_list(grid: np.ndarray, digits: int) -> list:
+        return np.where(np.isnan(grid), None, np.round(grid, digits)).tolist()
+
+    result = {
+        "latest_fcf": base["latest_fcf"],
+        "fcf_growth": base["fcf_growth"],
+        "fcf_growth_used": fcf_growth_used,
+        "shares_num": shares_num,
+        "per_share": per_share,
+        "stock_price": stock_price,
+        "fcf_growths": list(fcf_growths),
+        "discount_rates": list(discount_rates),
+        "growth_rates": list(growth_rates),
+        "intrinsic_value": to_list(values, 2),
+    }
+    # 股本未知时是企业总价值，与股价不可比
+    if stock_price and per_share:
+        result["upside"] = to_list(values / float(stock_price) - 1, 4)
+    return result
+
+def get_monte_carlo_valuation(symbol: str, market: str, shares_num: Optional[float] = None,
+                              stock_price: Optional[float] = None, discount_rate: float = 0.09,
+                              growth_rate: float = 0.01, paths: int = monte_carlo.DEFAULT_PATHS,
+                              seed: int = monte_carlo.DEFAULT_SEED) -> Dict[str, Any]:
+    """
+    蒙特卡洛 DCF 估值，增长率分布由缓存的基本面数据中的历年自由现金流增长率拟合
+
+    Args:
+        symbol: 股票代码
+        market: 市场, us, cn, hk
+        shares_num: 总股本，缺省规则同 get_dcf_sensitivity，股本未知时不计算
+        stock_price: 当前股价，缺省时读取最新行情
+        discount_rate: 折现率均值
+        growth_rate: 永续增长率均值
+        paths: 路径数
+        seed: 随机种子
+    Returns:
+        dict: monte_carlo.simulate 的结果
+    Raises:
+        ValueError: 总股本未知，按1股计算的企业总价值与股价不可比，不计算
+    """
+    if market not in _MARKETS:
+        raise ValueError(f"不支持的市场: {market}")
+    base = get_report_fundamentals(symbol, market)
+    stock_price, shares_num = _price_and_shares(symbol, market, stock_price, shares_num, base)
+    if shares_num is None:
+        raise ValueError(f"{symbol}的总股本未知，无法计算每股内在价值，请提供总股本")
+    return monte_carlo.simulate(base["latest_fcf"], fundamentals.fcf_growth_history(base), base["fcf_growth"],
+                                discount_rate=discount_rate, growth_rate=growth_rate, shares_num=shares_num,
+                                stock_price=stock_price, paths=paths, seed=seed)
+
+def dcf_sensitivity_markdown(result: Dict[str, Any]) -> str:
+    """
+    把 get_dcf_sensitivity 的结果转换为 Markdown 表格，每个自由现金流增长率一张表，
+    行为折现率，列为永续增长率，单元格为每股内在价值(相对当前股价的上涨空间)；股本未知时为企业总价值
+    """
+    per_share = result.get("per_share", True)
+    growth = f"报表推算增长率: {result['fcf_growth']:.2%}"
+    if result.get("fcf_growth_used", result["fcf_growth"]) != result["fcf_growth"]:
+        growth += f"(不大于0，估值使用 {result['fcf_growth_used']:.2%})"
+    shares = f"总股本: {result['shares_num']:,.0f}" if per_share else "总股本: 未知，单元格为企业总价值，不计算上涨空间"
+    lines = [f"最新自由现金流: {result['latest_fcf']:,.0f}, {growth}, 当前股价: {result['stock_price']}, {shares}"]
+    upside = result.get("upside")
+    unit = "每股内在价值" if per_share else "企业总价值"
+    header = "| 折现率/永续增长率 | " + " | ".join(f"{g:.1%}" for g in result["growth_rates"]) + " |"
+    divider = "|---" * (len(result["growth_rates"]) + 1) + "|"
+    for i, fcf_growth in enumerate(result["fcf_growths"]):
+        lines += ["", f"#### 自由现金流增长率 {fcf_growth:.2%}, {unit}", "", header, divider]
+        for j, rate in enumerate(result["discount_rates"]):
+            cells = []
+            for k in range(len(result["growth_rates"])):
+                value = result["intrinsic_value"][i][j][k]
+                if value is None:
+                    cells.append("-")
+                elif upside is not None:
+                    cells.append(f"{value:,.2f} ({upside[i][j][k]:+.1%})")
+                else:
+                    cells.append(f"{value:,.2f}")
+            lines.append(f"| {rate:.1%} | " + " | ".join(cells) + " |")
+    return "\n".join(lines)
+
 if __name__ == "__main__":
     logging.basicConfig(level=logging.DEBUG)
     try:
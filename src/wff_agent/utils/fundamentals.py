@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+基本面指标的报表部分与股价部分分离
+
+财务比率、自由现金流及其增长率只取决于报表，按报表版本(最新报告期)计算一次后缓存；
+市盈率、市净率和 DCF 估值的上涨空间取决于当前股价、折现率等参数，每次调用时由 reprice 套用。
+同一份报表在盘中反复分析时只需重新做几次除法，不再读取报表。
+
+缓存使用本地文件缓存(含其内存层)，lookup 返回的是副本，reprice 返回新的字典和列表，
+调用方修改返回值不会影响缓存。
+
+缓存的内容:
+    {"market": 市场, "annual_ratios": ..., "annual_per_share": ..., "quarter_ratios": ...,
+     "quarter_per_share": ..., "quarter_ttm": 季报每股指标是否为 TTM, "ttm": 滚动12个月数据,
+     "latest_fcf": 最新一期自由现金流, "fcf_growth": DCF 使用的自由现金流增长率,
+     "shares_num": 报表中最新的总股本(美股资产负债表提供，其他市场为 None)}
+"""
+import logging
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from wff_agent.datasource import file_lru_cache as filecache
+from wff_agent.datasource import replay
+from wff_agent.utils import fcf_valuation, ratio_engine
+
+log = logging.getLogger(__name__)
+
+# 距上次核对报表版本不超过该时间时直接使用缓存，不再读取报表
+RECHECK_SECONDS = 60*60*6
+# 磁盘副本的保留时间，仅用于清理不再访问的结果
+MEMO_EXPIRE_SECONDS = 60*60*24*180
+# 基本面数据的结构版本，结构变化时递增，使旧的缓存失效
+MEMO_SCHEMA = 3
+
+# 年报比率中历年自由现金流增长率的键
+FCF_GROWTH_KEYS = {"cn": "free_cash_flow_growth", "hk": "free_cash_flow_growth", "us": "free_cash_flow_change_rate"}
+
+_lock = threading.Lock()
+_stats = {"hits": 0, "version_hits": 0, "builds": 0}
+
+
+def make_base(market: str, annual: tuple, quarter: tuple, latest_fcf: Optional[float],
+              fcf_growth: float, ttm: Optional[Dict[str, Any]] = None,
+              shares_num: Optional[float] = None) -> Dict[str, Any]:
+    """
+    组装与股价无关的基本面数据
+
+    Args:
+        market: cn, hk 或 us
+        annual: 年报的 ratio_engine.calc_base_ratios 结果
+        quarter: 季报的 ratio_engine.calc_base_ratios 结果
+        latest_fcf: 最新一期自由现金流
+        fcf_growth: DCF 使用的自由现金流增长率
+        ttm: ratio_engine.calc_ttm 的结果，给出时季报的市盈率、市净率改用 TTM 每股指标计算
+        shares_num: 报表中最新的总股本，行情中没有总股本的市场用于计算每股估值
+    Returns:
+        dict: 基本面数据
+    """
+    quarter_per_share = quarter[1]
+    if ttm is not None:
+        quarter_per_share = ratio_engine.ttm_per_share(ttm, quarter[0][ratio_engine.DATE_KEYS[market]])
+    return {
+        "market": market,
+        "annual_ratios": annual[0],
+        "annual_per_share": annual[1],
+        "quarter_ratios": quarter[0],
+        "quarter_per_share": quarter_per_share,
+        "quarter_ttm": ttm is not None,
+        "ttm": ttm,
+        "latest_fcf": latest_fcf,
+        "fcf_growth": fcf_growth,
+        "shares_num": shares_num,
+    }
+
+
+def reprice(base: Dict[str, Any], stock_price: float, discount_rate: float = 0.09,
+            growth_rate: float = 0.01, shares_num: int = 1) -> Dict[str, Any]:
+    """
+    在与股价无关的基本面数据上套用当前股价、折现率和增长率
+
+    Args:
+        base: make_base 返回的基本面数据
+        stock_price: 当前股价
+        discount_rate: 折现率
+        growth_rate: 永续增长率
+        shares_num: 总股本
+    Returns:
+        dict: 与原先 calc_*_indicators 相同结构的财务指标，DCF 估值另含相对当前股价的上涨空间 upside，
+            有 TTM 数据时另含 ttm_indicators。不与 base 共享可变对象
+    """
+    market = base["market"]
+    result = {
+        "annual_financial_report_indicators": ratio_engine.reprice(
+            market, base["annual_ratios"], base["annual_per_share"], stock_price),
+        "quarter_financial_report_indicators": ratio_engine.reprice(
+            market, base["quarter_ratios"], base["quarter_per_share"], stock_price, annual=False,
+            ttm=base.get("quarter_ttm", False)),
+    }
+    if base.get("ttm"):
+        result["ttm_indicators"] = ratio_engine.reprice_ttm(base["ttm"], stock_price)
+    if base["latest_fcf"] is None:
+        log.error("缺少最新一期的自由现金流，跳过DCF估值")
+        return result
+    dcf = fcf_valuation.free_cash_flow_valuation(base["latest_fcf"], base["fcf_growth"],
+                                                 discount_rate, growth_rate, shares_num)
+    if dcf is not None:
+        if stock_price:
+            dcf["upside"] = round(dcf["intrinsic_value"] / stock_price - 1, 4)
+        result["dcf_valuation"] = dcf
+    return result
+
+
+def fcf_growth_history(base: Dict[str, Any]) -> list:
+    """
+    历年自由现金流增长率(年报，最新在前)，缺失的期为 None
+    """
+    return list(base["annual_ratios"].get(FCF_GROWTH_KEYS[base["market"]]) or [])
+
+
+def _key(market: str, symbol: str) -> str:
+    return filecache.generate_cache_key("report_fundamentals", MEMO_SCHEMA, market, symbol)
+
+
+def lookup(market: str, symbol: str) -> Optional[Dict[str, Any]]:
+    """
+    读取缓存的基本面数据，先查文件缓存的内存层再查磁盘
+
+    Returns:
+        {"version": 报表版本, "checked_at": 上次核对版本的时间戳, "data": 基本面数据}，未缓存时返回None。
+        返回的是副本，调用方可以修改
+    """
+    entry = filecache.get_cached_data(_key(market, symbol))
+    if not isinstance(entry, dict) or "version" not in entry:
+        return None
+    return entry
+
+
+def is_fresh(entry: Dict[str, Any], max_age: int = RECHECK_SECONDS) -> bool:
+    """
+    是否可以不核对报表版本直接使用，录制/回放模式下总是核对，保证报表请求经过录制层
+    """
+    return replay.is_live() and time.time() - entry["checked_at"] < max_age
+
+
+def put(market: str, symbol: str, version: Optional[str], data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    保存某个版本报表的基本面数据，同一版本重复保存时只更新核对时间
+
+    Args:
+        market: 市场
+        symbol: 股票代码
+        version: 报表版本(最新报告期)
+        data: 基本面数据
+    Returns:
+        条目，data 即传入的对象，缓存中保存的是副本
+    """
+    entry = {"version": version, "checked_at": time.time(), "data": data}
+    filecache.cache_data(entry, _key(market, symbol), MEMO_EXPIRE_SECONDS)
+    return entry
+
+
+def record(event: str) -> None:
+    """
+    记录命中情况: hits 未核对版本直接使用，version_hits 核对后版本未变，builds 重新计算
+    """
+    with _lock:
+        _stats[event] += 1
+
+
+def stats() -> dict:
+    """
+    命中统计
+    """
+    with _lock:
+        return dict(_stats)
@@ -0,0 +1,517 @@
+# -*- coding: utf-8 -*-
+"""
+技术指标计算引擎
+
+在连续的 NumPy 数组上一次性计算 MA/EMA/MACD/KDJ/RSI/BOLL/OBV，
+收盘价的滚动窗口和、价格变化、9日最高最低等中间结果在各指标间共享。
+每个指标在 REGISTRY 中声明依赖和所需K线数，只计算所请求指标的依赖闭包。
+所有函数沿 axis 0 (时间)计算，既支持单只股票的一维数组，也支持 日期 x 股票 的二维数组。
+结果与原先逐列调用 pandas rolling/ewm 的结果一致。
+"""
+import logging
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+log = logging.getLogger(__name__)
+
+# 输出列，顺序与 get_market_indicators 的返回一致
+PRICE_COLUMNS = ['开盘', '收盘', '最高', '最低', '成交量']
+INDICATOR_COLUMNS = ['MA5', 'MA20', 'MA60', 'MA50', 'MA200',
+                     'EMA9', 'EMA12', 'EMA50', 'K', 'D', 'J',
+                     'RSI', 'DIF', 'DEA', 'MACD', 'BOLL', 'BOLL_UP', 'BOLL_DOWN', 'OBV']
+
+# 均线名称与实际窗口，MA50/MA200 沿用原有的 120/240 日窗口
+MA_WINDOWS = {"MA5": 5, "MA20": 20, "MA60": 60, "MA50": 120, "MA200": 240}
+EMA_SPANS = {"EMA9": 9, "EMA12": 12, "EMA50": 50}
+MACD_FAST, MACD_SLOW, MACD_SIGNAL = 12, 26, 9
+KDJ_WINDOW, KDJ_SPAN = 9, 3
+RSI_WINDOW = 14
+BOLL_WINDOW, BOLL_WIDTH = 20, 2
+OBV_WINDOW = 20
+
+# 分块闭式 EMA 中权重 (1-alpha)^-k 的上限，防止溢出。
+# 块内第 j 项的误差约为 eps * j * |x|，与权重的量级无关，因此上限可以取得很大
+_EMA_MAX_SCALE = 1e200
+# pandas 3 起 ewm(adjust=False) 在缺失值之后按 (1-a)^k 和 1-(1-a)^k 加权，此前为 (1-a)^k 和 a 再归一化
+_PANDAS_GAP_WEIGHTS = int(pd.__version__.split(".")[0]) >= 3
+
+
+class RollingWindow:
+    """
+    滚动窗口的和、均值与标准差，同一序列的同一窗口长度只求和一次。
+    窗口和按窗口长度分块、块内重新累加得到(见 _window_sum)，误差只与窗口内的数值有关，
+    全零窗口的和精确为0，不会像整条序列的前缀和相减那样留下 1e-13 量级的残差。
+    窗口内有缺失值时结果为NaN，与 pandas rolling 默认的 min_periods 一致。
+    """
+
+    def __init__(self, values: np.ndarray):
+        """
+        Args:
+            values: 按时间排列的数组，一维或二维(日期 x 股票)
+        """
+        self.values = np.asarray(values, dtype=np.float64)
+        self.length = self.values.shape[0]
+        self._sums: Dict[int, np.ndarray] = {}
+
+    def sum(self, window: int) -> np.ndarray:
+        if window not in self._sums:
+            self._sums[window] = _window_sum(self.values, window)
+        return self._sums[window]
+
+    def mean(self, window: int) -> np.ndarray:
+        return self.sum(window) / window
+
+    def std(self, window: int) -> np.ndarray:
+        """样本标准差(ddof=1)，以窗口内第一个值为基准求偏差的平方和，常数窗口精确为0"""
+        out = np.full(self.values.shape, np.nan)
+        if 1 < window <= self.length:
+            view = sliding_window_view(self.values, window, axis=0)
+            deviation = view - view[..., :1]
+            s1 = deviation.sum(axis=-1)
+            s2 = np.sum(deviation * deviation, axis=-1)
+            out[window - 1:] = np.sqrt(np.maximum(s2 - s1 * s1 / window, 0.0) / (window - 1))
+        return out
+
+
+def _window_sum(values: np.ndarray, window: int) -> np.ndarray:
+    """
+    滚动窗口和。序列按窗口长度分块，每个窗口恰好由前一块的后缀和与后一块的前缀和组成，
+    两者都在块内从0开始累加，计算量与窗口长度无关
+    """
+    n = values.shape[0]
+    out = np.full(values.shape, np.nan)
+    if window > n:
+        return out
+    blocks = -(-n // window)
+    padded = np.zeros((blocks * window,) + values.shape[1:])
+    padded[:n] = values
+    shaped = padded.reshape((blocks, window) + values.shape[1:])
+    prefix = np.cumsum(shaped, axis=1).reshape(padded.shape)
+    suffix = np.cumsum(shaped[:, ::-1], axis=1)[:, ::-1].reshape(padded.shape)
+    starts = np.arange(n - window + 1)
+    # 从块首开始的窗口就是整块，后缀和已包含全部
+    head = np.where((starts % window == 0).reshape((-1,) + (1,) * (values.ndim - 1)),
+                    0.0, prefix[starts + window - 1])
+    out[window - 1:] = suffix[starts] + head
+    return out
+
+
+def rolling_min(values: np.ndarray, window: int) -> np.ndarray:
+    """滚动最小值，窗口内有缺失值时为NaN"""
+    return _rolling_reduce(values, window, np.min)
+
+
+def rolling_max(values: np.ndarray, window: int) -> np.ndarray:
+    """滚动最大值，窗口内有缺失值时为NaN"""
+    return _rolling_reduce(values, window, np.max)
+
+
+def _rolling_reduce(values: np.ndarray, window: int, reduce) -> np.ndarray:
+    out = np.full(values.shape, np.nan)
+    if window <= values.shape[0]:
+        view = sliding_window_view(values, window, axis=0)
+        out[window - 1:] = reduce(view, axis=-1)
+    return out
+
+
+def diff(values: np.ndarray) -> np.ndarray:
+    """一阶差分，第一行为NaN"""
+    out = np.empty(values.shape)
+    out[0] = np.nan
+    np.subtract(values[1:], values[:-1], out=out[1:])
+    return out
+
+
+def ema(values: np.ndarray, span: int) -> np.ndarray:
+    """
+    指数移动平均，等价于 pandas ewm(span=span, adjust=False).mean()
+
+    无缺失值时 y_t = (1-a) y_{t-1} + a x_t 展开为闭式的加权前缀和，
+    按块计算以避免 (1-a)^-k 溢出；序列开头的缺失值保持为NaN，
+    序列中间的缺失值按 pandas 的权重衰减规则逐行计算。
+
+    Args:
+        values: 按时间排列的数组，一维或二维
+        span: 跨度
+    Returns:
+        与输入形状相同的数组
+    """
+    alpha = 2.0 / (span + 1.0)
+    values = np.asarray(values, dtype=np.float64)
+    if values.shape[0] == 0:
+        return values.copy()
+    x2d = values.reshape(values.shape[0], -1)
+
+    valid = ~np.isnan(x2d)
+    has_valid = valid.any(axis=0)
+    first = np.where(has_valid, valid.argmax(axis=0), x2d.shape[0])
+    rows = np.arange(x2d.shape[0])[:, None]
+    leading = rows < first
+    # 开头的缺失值用第一个有效值填充，递推结果在第一个有效值之前保持不变
+    first_value = x2d[np.minimum(first, x2d.shape[0] - 1), np.arange(x2d.shape[1])]
+    filled = np.where(leading, first_value, x2d)
+
+    interior = (~valid & ~leading).any(axis=0)
+    out = np.empty_like(filled)
+    if (~interior).any():
+        out[:, ~interior] = _ema_closed_form(filled[:, ~interior], alpha)
+    if interior.any():
+        out[:, interior] = _ema_loop(filled[:, interior], alpha)
+    out[leading] = np.nan
+    return out.reshape(values.shape)
+
+
+def _ema_closed_form(x: np.ndarray, alpha: float) -> np.ndarray:
+    decay = 1.0 - alpha
+    n = x.shape[0]
+    chunk = max(1, int(np.log(_EMA_MAX_SCALE) / -np.log(decay))) if decay > 0 else 1
+    steps = np.arange(min(chunk, n), dtype=np.float64)
+    growth = decay ** -steps
+    shrink = decay ** steps
+    out = np.empty_like(x)
+    prev = x[0]
+    out[0] = prev
+    start = 1
+    while start < n:
+        stop = min(start + chunk, n)
+        k = stop - start
+        # y_{s+j} = (1-a)^j [(1-a) y_{s-1} + a * sum_{i<=j} (1-a)^{-i} x_{s+i}]
+        acc = np.cumsum(x[start:stop] * growth[:k, None], axis=0)
+        block = shrink[:k, None] * (decay * prev + alpha * acc)
+        out[start:stop] = block
+        prev = block[-1]
+        start = stop
+    return out
+
+
+def _ema_loop(x: np.ndarray, alpha: float) -> np.ndarray:
+    # pandas ewm(adjust=False, ignore_na=False) 的逐行实现，缺失期间旧权重继续衰减
+    decay = 1.0 - alpha
+    out = np.empty_like(x)
+    weighted = x[0].copy()
+    old_wt = np.ones(x.shape[1])
+    out[0] = weighted
+    for i in range(1, x.shape[0]):
+        cur = x[i]
+        observed = ~np.isnan(cur)
+        has_weighted = ~np.isnan(weighted)
+        old_wt = np.where(has_weighted, old_wt * decay, old_wt)
+        update = has_weighted & observed & (weighted != cur)
+        with np.errstate(invalid="ignore"):
+            if _PANDAS_GAP_WEIGHTS:
+                blended = old_wt * weighted + (1.0 - old_wt) * cur
+            else:
+                blended = (old_wt * weighted + alpha * cur) / (old_wt + alpha)
+        weighted = np.where(update, blended, weighted)
+        old_wt = np.where(has_weighted & observed, 1.0, old_wt)
+        weighted = np.where(~has_weighted & observed, cur, weighted)
+        out[i] = weighted
+    return out
+
+
+class Indicator:
+    """
+    指标定义: 依赖的输入(行情列或其他指标)、计算函数和自身需要的额外K线数
+    """
+
+    def __init__(self, name: str, inputs: List[str], compute: Callable[..., Any],
+                 lookback: int, public: bool = True):
+        """
+        Args:
+            name: 指标名称，public 指标即输出列名
+            inputs: 依赖的行情列(收盘 最高 最低 成交量)、有效K线掩码(_valid)或其他指标
+            compute: 按 inputs 顺序接收依赖的计算结果
+            lookback: 在依赖之外还需要的K线数，如N日均线为 N-1，EMA 取 4 倍跨度使初值影响衰减到可忽略
+            public: 是否为可请求的输出列，否则只是共享的中间结果
+        """
+        self.name = name
+        self.inputs = inputs
+        self.compute = compute
+        self.lookback = lookback
+        self.public = public
+
+
+def _masked_zero(valid: Optional[np.ndarray]):
+    # 无效K线不计入滚动窗口；未给出掩码时与 pandas 一致按0计入
+    return 0.0 if valid is None else np.where(valid, 0.0, np.nan)
+
+
+def _rsv(close: np.ndarray, high: np.ndarray, low: np.ndarray) -> np.ndarray:
+    lowest = rolling_min(low, KDJ_WINDOW)
+    highest = rolling_max(high, KDJ_WINDOW)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (close - lowest) / (highest - lowest) * 100
+
+
+def _compare(delta: np.ndarray, sign: int) -> np.ndarray:
+    with np.errstate(invalid="ignore"):
+        return delta > 0 if sign > 0 else delta < 0
+
+
+def _safe(func: Callable[..., np.ndarray]) -> Callable[..., np.ndarray]:
+    def wrapper(*args):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return func(*args)
+    return wrapper
+
+
+_INDICATORS = [
+    # 均线与布林线共享收盘价的滚动窗口和
+    Indicator("_close_window", ["收盘"], RollingWindow, 0, public=False),
+    *[Indicator(name, ["_close_window"], lambda w, n=window: w.mean(n), window - 1)
+      for name, window in MA_WINDOWS.items()],
+    *[Indicator(name, ["收盘"], lambda close, s=span: ema(close, s), 4 * span)
+      for name, span in EMA_SPANS.items()],
+    Indicator("_macd_fast", ["收盘"], lambda close: ema(close, MACD_FAST), 4 * MACD_FAST, public=False),
+    Indicator("_macd_slow", ["收盘"], lambda close: ema(close, MACD_SLOW), 4 * MACD_SLOW, public=False),
+    Indicator("DIF", ["_macd_fast", "_macd_slow"], lambda fast, slow: fast - slow, 0),
+    Indicator("DEA", ["DIF"], lambda dif: ema(dif, MACD_SIGNAL), 4 * MACD_SIGNAL),
+    Indicator("MACD", ["DIF", "DEA"], lambda dif, dea: 2 * (dif - dea), 0),
+    Indicator("_rsv", ["收盘", "最高", "最低"], _rsv, KDJ_WINDOW - 1, public=False),
+    Indicator("K", ["_rsv"], lambda rsv: ema(rsv, KDJ_SPAN), 4 * KDJ_SPAN),
+    Indicator("D", ["K"], lambda k: ema(k, KDJ_SPAN), 4 * KDJ_SPAN),
+    Indicator("J", ["K", "D"], _safe(lambda k, d: 3 * k - 2 * d), 0),
+    # 价格变化在 RSI 和 OBV 间共享
+    Indicator("_delta", ["收盘"], diff, 1, public=False),
+    Indicator("_rising", ["_delta"], lambda delta: _compare(delta, 1), 0, public=False),
+    Indicator("_falling", ["_delta"], lambda delta: _compare(delta, -1), 0, public=False),
+    Indicator("_missing", ["_valid"], _masked_zero, 0, public=False),
+    Indicator("_gain", ["_delta", "_rising", "_missing"],
+              lambda delta, rising, missing: RollingWindow(np.where(rising, delta, missing)).mean(RSI_WINDOW),
+              RSI_WINDOW - 1, public=False),
+    Indicator("_loss", ["_delta", "_falling", "_missing"],
+              lambda delta, falling, missing: RollingWindow(np.where(falling, -delta, missing)).mean(RSI_WINDOW),
+              RSI_WINDOW - 1, public=False),
+    Indicator("RSI", ["_gain", "_loss"], _safe(lambda gain, loss: 100 - (100 / (1 + gain / loss))), 0),
+    Indicator("BOLL", ["_close_window"], lambda w: w.mean(BOLL_WINDOW), BOLL_WINDOW - 1),
+    Indicator("_boll_width", ["_close_window"], lambda w: BOLL_WIDTH * w.std(BOLL_WINDOW), BOLL_WINDOW - 1, public=False),
+    Indicator("BOLL_UP", ["BOLL", "_boll_width"], lambda boll, width: boll + width, 0),
+    Indicator("BOLL_DOWN", ["BOLL", "_boll_width"], lambda boll, width: boll - width, 0),
+    Indicator("OBV", ["成交量", "_rising", "_falling", "_missing"],
+              _safe(lambda volume, rising, falling, missing:
+                    (RollingWindow(np.where(rising, volume, missing)).sum(OBV_WINDOW)
+                     - RollingWindow(np.where(falling, volume, missing)).sum(OBV_WINDOW))
+                    / RollingWindow(volume).sum(OBV_WINDOW)),
+              OBV_WINDOW),
+]
+
+REGISTRY: Dict[str, Indicator] = {indicator.name: indicator for indicator in _INDICATORS}
+# 计算所需的原始输入
+BASE_INPUTS = ["收盘", "最高", "最低", "成交量", "_valid"]
+
+# 指标组别名，MACD/BOLL 作为组名时包含整组指标
+GROUPS: Dict[str, List[str]] = {
+    "MA": list(MA_WINDOWS.keys()),
+    "EMA": list(EMA_SPANS.keys()),
+    "MACD": ["DIF", "DEA", "MACD"],
+    "KDJ": ["K", "D", "J"],
+    "BOLL": ["BOLL", "BOLL_UP", "BOLL_DOWN"],
+    "ALL": list(INDICATOR_COLUMNS),
+}
+
+
+def resolve(indicators: Optional[Iterable[str]] = None) -> List[str]:
+    """
+    展开指标组别名并校验指标名称
+
+    Args:
+        indicators: 指标或指标组名称，不区分大小写，None 表示全部
+    Returns:
+        List[str]: 按 INDICATOR_COLUMNS 顺序排列的输出列
+    """
+    if indicators is None:
+        return list(INDICATOR_COLUMNS)
+    if isinstance(indicators, str):
+        indicators = indicators.split(",")
+    requested = set()
+    for item in indicators:
+        name = item.strip().upper()
+        if not name:
+            continue
+        if name in GROUPS:
+            requested.update(GROUPS[name])
+        elif name in REGISTRY and REGISTRY[name].public:
+            requested.add(name)
+        else:
+            raise ValueError(f"未知的技术指标: {item}, 可选: {', '.join(dict.fromkeys(list(GROUPS) + INDICATOR_COLUMNS))}")
+    if not requested:
+        return list(INDICATOR_COLUMNS)
+    return [name for name in INDICATOR_COLUMNS if name in requested]
+
+
+def dependency_closure(names: Iterable[str]) -> List[str]:
+    """
+    计算指标及其全部依赖，按拓扑顺序返回
+
+    Args:
+        names: 指标名称
+    Returns:
+        List[str]: 依赖在前的指标名称，不含原始输入
+    """
+    ordered: List[str] = []
+    seen = set()
+
+    def visit(name: str) -> None:
+        if name in seen or name in BASE_INPUTS:
+            return
+        seen.add(name)
+        for dep in REGISTRY[name].inputs:
+            visit(dep)
+        ordered.append(name)
+
+    for name in names:
+        visit(name)
+    return ordered
+
+
+def required_bars(names: Iterable[str]) -> int:
+    """
+    计算指标最后一个值所需的K线数量
+
+    Args:
+        names: 指标名称
+    Returns:
+        int: K线数量，EMA 类指标按 4 倍跨度预热
+    """
+    bars: Dict[str, int] = {}
+    for name in dependency_closure(names):
+        indicator = REGISTRY[name]
+        bars[name] = indicator.lookback + max(bars.get(dep, 1) for dep in indicator.inputs)
+    return max((bars[name] for name in names), default=1)
+
+
+def compute_indicators(close: np.ndarray, high: np.ndarray, low: np.ndarray,
+                       volume: np.ndarray, valid: Optional[np.ndarray] = None,
+                       indicators: Optional[Iterable[str]] = None) -> Dict[str, np.ndarray]:
+    """
+    一次性计算技术指标，只计算所请求指标的依赖闭包
+
+    Args:
+        close: 收盘价，按日期升序，一维或二维(日期 x 股票)
+        high: 最高价
+        low: 最低价
+        volume: 成交量
+        valid: 有效K线掩码，无效位置不计入 RSI/OBV 的滚动窗口；为None时与 pandas 一致按0计入
+        indicators: 指标或指标组名称，None 表示全部
+    Returns:
+        Dict[str, np.ndarray]: 以所请求的输出列为键的指标数组
+    """
+    columns = resolve(indicators)
+    values: Dict[str, Any] = {
+        "收盘": np.ascontiguousarray(close, dtype=np.float64),
+        "最高": np.ascontiguousarray(high, dtype=np.float64),
+        "最低": np.ascontiguousarray(low, dtype=np.float64),
+        "成交量": np.ascontiguousarray(volume, dtype=np.float64),
+        "_valid": valid,
+    }
+    for name in dependency_closure(columns):
+        indicator = REGISTRY[name]
+        values[name] = indicator.compute(*(values[dep] for dep in indicator.inputs))
+    return {name: values[name] for name in columns}
+
+
+def calc_market_indicators(df: pd.DataFrame, indicators: Optional[Iterable[str]] = None) -> pd.DataFrame:
+    """
+    计算单只股票的技术指标
+
+    Args:
+        df: 以日期为索引、按日期升序的行情，包含 开盘 收盘 最高 最低 成交量
+        indicators: 指标或指标组名称，None 表示全部
+    Returns:
+        pd.DataFrame: 行情列加所请求的指标列
+    """
+    columns = resolve(indicators)
+    indicators = compute_indicators(df["收盘"].to_numpy(dtype=np.float64),
+                                    df["最高"].to_numpy(dtype=np.float64),
+                                    df["最低"].to_numpy(dtype=np.float64),
+                                    df["成交量"].to_numpy(dtype=np.float64),
+                                    indicators=columns)
+    # 一次性拼接，避免逐列插入 DataFrame 的开销；行情列保留原有的类型
+    block = pd.DataFrame(np.column_stack([indicators[name] for name in columns]),
+                         index=df.index, columns=columns)
+    return pd.concat([df[PRICE_COLUMNS], block], axis=1)
+
+
+def pivot_histories(histories: Dict[str, pd.DataFrame]) -> Tuple[pd.DatetimeIndex, List[str], Dict[str, np.ndarray]]:
+    """
+    把多只股票的日线对齐为 日期 x 股票 的二维数组，缺失的K线为NaN
+
+    Args:
+        histories: 股票代码到日线DataFrame的映射，DataFrame以日期为索引
+    Returns:
+        (日期索引, 股票代码列表, 以 PRICE_COLUMNS 为键的二维数组)
+    """
+    symbols = list(histories.keys())
+    if not symbols:
+        return pd.DatetimeIndex([]), [], {col: np.empty((0, 0)) for col in PRICE_COLUMNS}
+    dates = pd.DatetimeIndex(sorted(set().union(*(df.index for df in histories.values()))))
+    panel = {col: np.full((len(dates), len(symbols)), np.nan) for col in PRICE_COLUMNS}
+    for j, symbol in enumerate(symbols):
+        df = histories[symbol]
+        df = df[~df.index.duplicated(keep="last")]
+        rows = dates.get_indexer(df.index)
+        for col in PRICE_COLUMNS:
+            panel[col][rows, j] = df[col].to_numpy(dtype=np.float64)
+    return dates, symbols, panel
+
+
+def compute_panel_indicators(close: np.ndarray, high: np.ndarray, low: np.ndarray,
+                             volume: np.ndarray, indicators: Optional[Iterable[str]] = None) -> Dict[str, np.ndarray]:
+    """
+    计算 日期 x 股票 面板的全部技术指标
+
+    停牌、未上市等缺失的K线不参与计算: 每只股票的有效K线先按原顺序稳定地压缩到数组底部，
+    计算后再放回原来的日期位置，结果与逐只股票单独计算一致，缺失位置为NaN。
+
+    Args:
+        close: 收盘价，形状为 (日期, 股票)
+        high: 最高价
+        low: 最低价
+        volume: 成交量
+        indicators: 指标或指标组名称，None 表示全部
+    Returns:
+        Dict[str, np.ndarray]: 以所请求的输出列为键、与输入同形状的指标数组
+    """
+    arrays = [np.asarray(x, dtype=np.float64) for x in (close, high, low, volume)]
+    if arrays[0].ndim != 2:
+        raise ValueError("面板数据必须是 (日期, 股票) 的二维数组")
+    valid = ~np.logical_or.reduce([np.isnan(x) for x in arrays])
+    # 缺失的K线排在前面，有效K线保持原有顺序排在后面，开头的NaN由各指标按序列起点处理
+    order = np.argsort(valid, axis=0, kind="stable")
+    compact = [np.take_along_axis(x, order, axis=0) for x in arrays]
+    compact_valid = np.take_along_axis(valid, order, axis=0)
+    compact = [np.where(compact_valid, x, np.nan) for x in compact]
+    computed = compute_indicators(*compact, valid=compact_valid, indicators=indicators)
+
+    result = {}
+    for name, values in computed.items():
+        out = np.empty_like(values)
+        np.put_along_axis(out, order, values, axis=0)
+        out[~valid] = np.nan
+        result[name] = out
+    return result
+
+
+def latest_snapshot(dates: pd.DatetimeIndex, symbols: List[str],
+                    values: Dict[str, np.ndarray]) -> pd.DataFrame:
+    """
+    取每只股票最后一根有效K线上的数值，用于选股
+
+    Args:
+        dates: 面板的日期索引
+        symbols: 面板的股票代码
+        values: 二维数组，需包含 收盘 列以判断有效K线
+    Returns:
+        pd.DataFrame: 以股票代码为索引，包含 日期 和各数值列
+    """
+    valid = ~np.isnan(values["收盘"])
+    has_bar = valid.any(axis=0)
+    last = valid.shape[0] - 1 - np.argmax(valid[::-1], axis=0)
+    columns = np.arange(len(symbols))
+    snapshot = pd.DataFrame({name: array[last, columns] for name, array in values.items()},
+                            index=pd.Index(symbols, name="代码"))
+    snapshot.insert(0, "日期", dates[last] if len(dates) else [])
+    return snapshot[has_bar]
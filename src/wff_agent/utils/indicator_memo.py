@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+技术指标结果缓存
+
+以 (股票, 市场, 最新K线, 指标集合, 窗口, K线周期) 为键保存计算好的指标结果(编码前的 DataFrame)。
+最新K线变化(新的交易日或盘中刷新)时键随之变化，旧结果自然失效，不需要过期时间。
+结果保存在本地文件缓存中: 其内存层保留最近使用的结果，返回给调用方的是副本，
+磁盘上的副本用于进程重启(如每次启动的 MCP 服务器)后复用。
+"""
+import logging
+import threading
+from typing import Any, Iterable, Optional, Tuple
+
+from wff_agent.datasource import file_lru_cache as filecache
+
+log = logging.getLogger(__name__)
+
+# 磁盘副本的保留时间，仅用于清理不再访问的结果
+MEMO_EXPIRE_SECONDS = 60*60*24*7
+
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0}
+
+
+def make_key(symbol: str, market: str, last_bar: Tuple, indicators: Iterable[str], window: int,
+             period: str = "daily") -> str:
+    """
+    生成缓存键
+
+    Args:
+        symbol: 股票代码
+        market: 市场
+        last_bar: 最新K线的标识，如 (日期, 收盘价, 成交量)
+        indicators: 指标集合
+        window: 返回的行数
+        period: K线周期
+    Returns:
+        缓存键
+    """
+    return filecache.generate_cache_key("indicator_memo", symbol, market, tuple(last_bar),
+                                        tuple(sorted(indicators)), window, period)
+
+
+def get(key: str) -> Optional[Any]:
+    """
+    读取缓存的指标结果，未命中时返回None。返回的是副本，调用方可以修改
+    """
+    value = filecache.get_cached_data(key)
+    with _lock:
+        _stats["misses" if value is None else "hits"] += 1
+    return value
+
+
+def put(key: str, value: Any) -> None:
+    """
+    保存指标结果
+    """
+    filecache.cache_data(value, key, MEMO_EXPIRE_SECONDS)
+
+
+def stats() -> dict:
+    """
+    命中统计
+    """
+    with _lock:
+        return dict(_stats)
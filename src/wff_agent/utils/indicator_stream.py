@@ -0,0 +1,341 @@
+# -*- coding: utf-8 -*-
+"""
+增量技术指标
+
+IndicatorState 保存 EMA/MACD/KDJ/RSI 的递推状态和各滚动窗口的缓冲区，
+每追加一根K线只做常数次运算。状态与指标结果一起按股票写入本地缓存，
+新的日线或盘中刷新只推进状态，不再对整年历史重新计算。
+"""
+import copy
+import logging
+import math
+import threading
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+from wff_agent.datasource import file_lru_cache as filecache
+from wff_agent.utils import indicator_engine as engine
+
+log = logging.getLogger(__name__)
+
+# 检查点的保留时间，复权变化时会重建
+CHECKPOINT_EXPIRE_SECONDS = 60*60*24*365
+# 检查点中至少保留的指标行数，请求的历史更长时按请求的行数保留
+FRAME_KEEP_ROWS = 500
+
+
+def _divide(a: float, b: float) -> float:
+    # 与 NumPy 浮点除法一致: 除以0得到 inf，0/0 得到NaN
+    if b == 0:
+        if a == 0 or math.isnan(a):
+            return math.nan
+        return math.copysign(math.inf, a) * math.copysign(1.0, b)
+    return a / b
+
+
+class _Ema:
+    """pandas ewm(span, adjust=False) 的逐值递推"""
+
+    def __init__(self, span: int):
+        self.alpha = 2.0 / (span + 1.0)
+        self.value = math.nan
+        self.old_wt = 1.0
+
+    def push(self, x: float) -> float:
+        if not math.isnan(self.value):
+            self.old_wt *= 1.0 - self.alpha
+            if not math.isnan(x):
+                if self.value != x and engine._PANDAS_GAP_WEIGHTS:
+                    self.value = self.old_wt * self.value + (1.0 - self.old_wt) * x
+                elif self.value != x:
+                    self.value = (self.old_wt * self.value + self.alpha * x) / (self.old_wt + self.alpha)
+                self.old_wt = 1.0
+        elif not math.isnan(x):
+            self.value = x
+        return self.value
+
+
+class _RollingSum:
+    """定长窗口的滚动和，用 Kahan 补偿累计加减误差，窗口内全为0时精确返回0"""
+
+    def __init__(self, window: int):
+        self.window = window
+        self.values: deque = deque()
+        self.total = 0.0
+        self.compensation = 0.0
+        self.nonzero = 0
+
+    def _add(self, x: float) -> None:
+        y = x - self.compensation
+        t = self.total + y
+        self.compensation = (t - self.total) - y
+        self.total = t
+
+    def push(self, x: float) -> None:
+        self.values.append(x)
+        self._add(x)
+        self.nonzero += x != 0
+        if len(self.values) > self.window:
+            removed = self.values.popleft()
+            self._add(-removed)
+            self.nonzero -= removed != 0
+        if self.nonzero == 0:
+            # 加减抵消后的残差会让 0/0 变成有限值，如横盘时的 RSI
+            self.total = 0.0
+            self.compensation = 0.0
+        if math.isnan(self.total):
+            # 缺失值移出窗口后重新求和
+            self.total = math.fsum(self.values)
+            self.compensation = 0.0
+
+    @property
+    def full(self) -> bool:
+        return len(self.values) == self.window
+
+    def sum(self) -> float:
+        # 窗口内有缺失值时与 pandas 一致返回NaN
+        return self.total if self.full and not math.isnan(self.total) else math.nan
+
+    def mean(self) -> float:
+        return self.sum() / self.window
+
+
+class IndicatorState:
+    """单只股票的增量指标状态"""
+
+    def __init__(self):
+        self.ma_sums = {name: _RollingSum(window) for name, window in engine.MA_WINDOWS.items()}
+        self.emas = {name: _Ema(span) for name, span in engine.EMA_SPANS.items()}
+        self.ema_fast = _Ema(engine.MACD_FAST)
+        self.ema_slow = _Ema(engine.MACD_SLOW)
+        self.dea = _Ema(engine.MACD_SIGNAL)
+        self.boll = _RollingSum(engine.BOLL_WINDOW)
+        self.highs: deque = deque(maxlen=engine.KDJ_WINDOW)
+        self.lows: deque = deque(maxlen=engine.KDJ_WINDOW)
+        self.k = _Ema(engine.KDJ_SPAN)
+        self.d = _Ema(engine.KDJ_SPAN)
+        self.gains = _RollingSum(engine.RSI_WINDOW)
+        self.losses = _RollingSum(engine.RSI_WINDOW)
+        self.up_volume = _RollingSum(engine.OBV_WINDOW)
+        self.down_volume = _RollingSum(engine.OBV_WINDOW)
+        self.total_volume = _RollingSum(engine.OBV_WINDOW)
+        self.last_close = math.nan
+        self.last_date: Optional[pd.Timestamp] = None
+        self.count = 0
+        # 追加最后一根K线之前的状态，用于盘中替换最后一根K线
+        self._previous: Optional["IndicatorState"] = None
+
+    def _snapshot(self) -> "IndicatorState":
+        previous, self._previous = self._previous, None
+        snapshot = copy.deepcopy(self)
+        self._previous = previous
+        return snapshot
+
+    def append(self, date, high: float, low: float, close: float, volume: float) -> Dict[str, float]:
+        """
+        追加一根新K线
+
+        Args:
+            date: K线日期
+            high: 最高价
+            low: 最低价
+            close: 收盘价
+            volume: 成交量
+        Returns:
+            Dict[str, float]: 该K线的指标值，键为 INDICATOR_COLUMNS
+        """
+        self._previous = self._snapshot()
+        return self._advance(pd.Timestamp(date), high, low, close, volume)
+
+    def replace_last(self, high: float, low: float, close: float, volume: float) -> Dict[str, float]:
+        """
+        用盘中刷新后的数据替换最后一根K线
+
+        Returns:
+            Dict[str, float]: 替换后该K线的指标值
+        """
+        if self._previous is None:
+            raise ValueError("没有可替换的K线")
+        date = self.last_date
+        previous = self._previous
+        self.__dict__.update(copy.deepcopy(previous).__dict__)
+        self._previous = previous
+        return self._advance(date, high, low, close, volume)
+
+    def _advance(self, date: pd.Timestamp, high: float, low: float, close: float, volume: float) -> Dict[str, float]:
+        result: Dict[str, float] = {}
+        for name, rolling in self.ma_sums.items():
+            rolling.push(close)
+            result[name] = rolling.mean()
+        for name, ema in self.emas.items():
+            result[name] = ema.push(close)
+
+        dif = self.ema_fast.push(close) - self.ema_slow.push(close)
+        dea = self.dea.push(dif)
+        result["DIF"] = dif
+        result["DEA"] = dea
+        result["MACD"] = 2 * (dif - dea)
+
+        self.highs.append(high)
+        self.lows.append(low)
+        rsv = math.nan
+        if len(self.highs) == engine.KDJ_WINDOW:
+            highest, lowest = max(self.highs), min(self.lows)
+            rsv = _divide(close - lowest, highest - lowest) * 100
+        k = self.k.push(rsv)
+        d = self.d.push(k)
+        result["K"] = k
+        result["D"] = d
+        result["J"] = 3 * k - 2 * d
+
+        delta = close - self.last_close
+        rising = delta > 0
+        falling = delta < 0
+        self.gains.push(delta if rising else 0.0)
+        self.losses.push(-delta if falling else 0.0)
+        result["RSI"] = 100 - _divide(100, 1 + _divide(self.gains.mean(), self.losses.mean()))
+
+        self.boll.push(close)
+        boll = self.boll.mean()
+        std = math.nan
+        if self.boll.full:
+            std = math.sqrt(math.fsum((x - boll) ** 2 for x in self.boll.values) / (engine.BOLL_WINDOW - 1))
+        result["BOLL"] = boll
+        result["BOLL_UP"] = boll + engine.BOLL_WIDTH * std
+        result["BOLL_DOWN"] = boll - engine.BOLL_WIDTH * std
+
+        self.up_volume.push(volume if rising else 0.0)
+        self.down_volume.push(volume if falling else 0.0)
+        self.total_volume.push(volume)
+        result["OBV"] = _divide(self.up_volume.sum() - self.down_volume.sum(), self.total_volume.sum())
+
+        self.last_close = close
+        self.last_date = date
+        self.count += 1
+        return {name: result[name] for name in engine.INDICATOR_COLUMNS}
+
+    def extend(self, df: pd.DataFrame) -> List[Dict[str, float]]:
+        """
+        依次追加多根K线
+
+        Args:
+            df: 以日期为索引、按日期升序的行情
+        Returns:
+            List[Dict[str, float]]: 每根K线的指标值
+        """
+        bars = list(zip(df.index, *(df[col].astype(float).tolist() for col in ["最高", "最低", "收盘", "成交量"])))
+        results = [self._advance(pd.Timestamp(date), high, low, close, volume)
+                   for date, high, low, close, volume in bars[:-1]]
+        if bars:
+            # 只为最后一根K线保留推进前的状态
+            results.append(self.append(*bars[-1]))
+        return results
+
+    @classmethod
+    def from_history(cls, df: pd.DataFrame) -> "IndicatorState":
+        """
+        由完整历史逐根推进建立状态
+
+        Args:
+            df: 以日期为索引、按日期升序的行情
+        Returns:
+            IndicatorState
+        """
+        state = cls()
+        state.extend(df)
+        return state
+
+
+_checkpoints: Dict[str, Dict[str, Any]] = {}
+_locks: Dict[str, threading.Lock] = {}
+_locks_guard = threading.Lock()
+
+
+def _checkpoint_key(symbol: str, market: str) -> str:
+    return f"indicator_state_{market}_{symbol}"
+
+
+def _get_lock(key: str) -> threading.Lock:
+    with _locks_guard:
+        if key not in _locks:
+            _locks[key] = threading.Lock()
+        return _locks[key]
+
+
+def _same_price(a: float, b: float) -> bool:
+    return abs(a - b) <= 1e-9 * max(abs(a), abs(b), 1.0)
+
+
+def _rebuild(df: pd.DataFrame, keep_rows: int) -> Dict[str, Any]:
+    frame = engine.calc_market_indicators(df)
+    return {"state": IndicatorState.from_history(df), "frame": frame.tail(keep_rows), "keep_rows": keep_rows}
+
+
+def _advance(checkpoint: Dict[str, Any], df: pd.DataFrame, keep_rows: int) -> Optional[Dict[str, Any]]:
+    """
+    用新的行情推进检查点，行情与检查点不连续(如除权导致前复权价格变化)、
+    或检查点的指标行没有覆盖到行情的第一根K线(之前按更短的历史建立)时返回None
+    """
+    state: IndicatorState = checkpoint["state"]
+    frame: pd.DataFrame = checkpoint["frame"]
+    last_date = state.last_date
+    if last_date is None or last_date not in df.index or df.index[-1] < last_date:
+        return None
+    if frame.empty or frame.index[0] > df.index[0]:
+        return None
+    keep_rows = max(keep_rows, checkpoint.get("keep_rows", FRAME_KEEP_ROWS))
+    position = df.index.get_loc(last_date)
+    previous = state._previous
+    if previous is not None and previous.last_date is not None:
+        # 倒数第二根K线的收盘价变化说明历史价格被复权调整
+        if previous.last_date not in df.index or not _same_price(df.at[previous.last_date, "收盘"], previous.last_close):
+            return None
+    if position == len(df) - 1 and _same_price(df.at[last_date, "收盘"], state.last_close) \
+            and df.at[last_date, "成交量"] == frame["成交量"].iloc[-1] and keep_rows == checkpoint.get("keep_rows"):
+        return checkpoint
+
+    state = copy.deepcopy(state)
+    rows = []
+    bar = df.iloc[position]
+    if not (_same_price(bar["收盘"], state.last_close) and bar["成交量"] == frame["成交量"].iloc[-1]):
+        # 盘中刷新，替换最后一根K线
+        values = state.replace_last(*(float(bar[col]) for col in ["最高", "最低", "收盘", "成交量"]))
+        rows.append((last_date, values))
+        frame = frame.iloc[:-1]
+    new_bars = df.iloc[position + 1:]
+    rows.extend(zip(new_bars.index, state.extend(new_bars)))
+    if rows:
+        dates = [date for date, _ in rows]
+        block = pd.DataFrame([values for _, values in rows], index=pd.Index(dates, name=df.index.name))
+        new_rows = pd.concat([df.loc[dates, engine.PRICE_COLUMNS], block[engine.INDICATOR_COLUMNS]], axis=1)
+        frame = pd.concat([frame, new_rows]).tail(keep_rows)
+        log.info(f"增量更新指标 {len(rows)} 根K线")
+    return {"state": state, "frame": frame, "keep_rows": keep_rows}
+
+
+def get_indicator_frame(symbol: str, market: str, df: pd.DataFrame) -> pd.DataFrame:
+    """
+    获取技术指标，优先用检查点增量推进
+
+    Args:
+        symbol: 股票代码
+        market: 市场
+        df: 以日期为索引、按日期升序的前复权日线
+    Returns:
+        pd.DataFrame: 行情列加指标列，至少覆盖 df 的全部K线，
+            检查点保留 FRAME_KEEP_ROWS 与曾请求过的最长 df 中较大的行数
+    """
+    key = _checkpoint_key(symbol, market)
+    keep_rows = max(FRAME_KEEP_ROWS, len(df))
+    with _get_lock(key):
+        checkpoint = _checkpoints.get(key) or filecache.get_cached_data(key)
+        advanced = _advance(checkpoint, df, keep_rows) if checkpoint is not None else None
+        if advanced is None:
+            log.info(f"重建指标状态: {market} {symbol}")
+            advanced = _rebuild(df, keep_rows)
+        if advanced is not checkpoint:
+            _checkpoints[key] = advanced
+            filecache.cache_data(advanced, key, CHECKPOINT_EXPIRE_SECONDS)
+        return advanced["frame"]
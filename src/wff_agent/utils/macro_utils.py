@@ -1,53 +1,24 @@
-from concurrent import futures
 from typing import Any, Dict, List
-from wff_agent.datasource import akshare_request as ak_request
+from wff_agent.datasource import macro_store
 import logging
 
 log = logging.getLogger(__name__)           
 
-def get_macro_data(markets: List[str]) -> Dict[str, Any]:
+def get_macro_data(markets: List[str], last_n: int = 12) -> Dict[str, Any]:
     """获取宏观数据
+    数据来自本地宏观存储，各序列按自身的发布日历刷新，其余时间直接从内存/本地返回。
     Args:
         markets: 市场列表，支持 "us" 和 "cn"
+        last_n: 每个序列返回最近的条数
     Returns:
-        Dict[str, Any]: 宏观数据，包含指定市场的各项指标数据
+        Dict[str, Any]: 宏观数据，键与原来相同("美国CPI"、"中国PPI"等)；
+            值由原来的记录列表改为 {"as_of": 数据获取时间, "data": 最近 last_n 条已公布的记录(按日期倒序)}，
+            获取失败时为None
     """
     if not markets:
         return {}
-
-    # 定义所有可用的任务
-    all_tasks = {
-        "美国劳动力指数": ak_request.get_labor_index,
-        "美国CPI": ak_request.get_us_cpi,
-        "美国利率": ak_request.get_usa_interest_rate,
-        "中国PPI": ak_request.get_cn_ppi,
-        "中国CPI": ak_request.get_cn_cpi,
-        "中国利率": ak_request.get_cn_cx_pmi,
-    }
-    
-    # 根据市场参数筛选任务
-    tasks = {}
-    for task_name, task_func in all_tasks.items():
-        if ("美国" in task_name and "us" in markets) or ("中国" in task_name and "cn" in markets):
-            tasks[task_name] = task_func
-    
-    results = {}
-    with futures.ThreadPoolExecutor(max_workers=len(tasks)) as executor:
-        future_to_task = {
-            executor.submit(task): name 
-            for name, task in tasks.items()
-        }
-        
-        for future in futures.as_completed(future_to_task):
-            task_name = future_to_task[future]
-            try:
-                df = future.result()
-                results[task_name] = df.to_dict(orient="records") if df is not None else None
-            except Exception as e:
-                log.error(f"获取{task_name}数据时发生错误: {str(e)}")
-                results[task_name] = None
-    
-    return results
+    markets = [market.lower() for market in markets]
+    return macro_store.get_macro_snapshot(markets, last_n)
 
 if __name__ == "__main__":
     # 测试获取美国和中国数据
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+蒙特卡洛 DCF 估值
+
+预测期自由现金流增长率、折现率、永续增长率按分布抽样，每条路径用 fcf_valuation.present_value
+向量化地计算内在价值，汇总为分位数和高于当前股价的概率。
+
+- 增长率的分布由历年自由现金流增长率拟合(正态分布，先截尾到 GROWTH_CLIP 以压制个别年份的极端值)，
+  历史不足两期时以报表推算的增长率为均值、DEFAULT_GROWTH_STD 为标准差
+- 折现率、永续增长率以给定值为均值，标准差分别为 DISCOUNT_STD、TERMINAL_STD，
+  永续增长率至少比折现率低 MIN_SPREAD，避免终值发散
+- 路径按 CHUNK_SIZE 分块，每块用 SeedSequence.spawn 派生的独立种子，结果与进程数无关、可复现；
+  每块只返回固定分箱的直方图和若干累加量，内存占用与路径总数无关
+"""
+import logging
+import math
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from wff_agent.utils import fcf_valuation
+
+log = logging.getLogger(__name__)
+
+DEFAULT_PATHS = 1_000_000
+DEFAULT_SEED = 20240601
+CHUNK_SIZE = 250_000
+# 并行的进程数上限
+DEFAULT_WORKERS = 4
+# 用于确定分箱范围的试算路径数
+PILOT_PATHS = 20_000
+HISTOGRAM_BINS = 4000
+PERCENTILES = (5, 25, 50, 75, 95)
+
+GROWTH_CLIP = (-0.5, 0.5)
+DEFAULT_GROWTH_STD = 0.05
+MIN_GROWTH_STD = 0.02
+DISCOUNT_STD = 0.01
+MIN_DISCOUNT_RATE = 0.01
+TERMINAL_STD = 0.005
+MIN_SPREAD = 0.01
+
+
+def fit_params(growth_history: Sequence[Optional[float]], fcf_growth: float, discount_rate: float,
+               growth_rate: float) -> Dict[str, Dict[str, float]]:
+    """
+    拟合抽样分布的参数
+
+    Args:
+        growth_history: 历年自由现金流增长率，None 表示缺失
+        fcf_growth: 报表推算的增长率，历史不足时作为均值
+        discount_rate: 折现率均值
+        growth_rate: 永续增长率均值
+    Returns:
+        dict: {"fcf_growth": {"mean", "std", "samples"}, "discount_rate": {...}, "growth_rate": {...}}
+    """
+    history = np.clip([value for value in growth_history if value is not None and math.isfinite(value)],
+                      *GROWTH_CLIP)
+    if len(history) >= 2:
+        growth = {"mean": float(history.mean()), "std": max(float(history.std(ddof=1)), MIN_GROWTH_STD)}
+    else:
+        growth = {"mean": float(np.clip(fcf_growth or 0.0, *GROWTH_CLIP)), "std": DEFAULT_GROWTH_STD}
+    growth["samples"] = int(len(history))
+    return {
+        "fcf_growth": growth,
+        "discount_rate": {"mean": discount_rate, "std": DISCOUNT_STD},
+        "growth_rate": {"mean": growth_rate, "std": TERMINAL_STD},
+    }
+
+
+def _sample_values(seed: np.random.SeedSequence, paths: int, latest_fcf: float,
+                   params: Dict[str, Dict[str, float]]) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    g = np.clip(rng.normal(params["fcf_growth"]["mean"], params["fcf_growth"]["std"], paths), *GROWTH_CLIP)
+    r = np.maximum(rng.normal(params["discount_rate"]["mean"], params["discount_rate"]["std"], paths),
+                   MIN_DISCOUNT_RATE)
+    tg = np.minimum(rng.normal(params["growth_rate"]["mean"], params["growth_rate"]["std"], paths),
+                    r - MIN_SPREAD)
+    return fcf_valuation.present_value(latest_fcf, g, r, tg)
+
+
+def _simulate_chunk(seed: np.random.SeedSequence, paths: int, latest_fcf: float,
+                    params: Dict[str, Dict[str, float]], edges: np.ndarray,
+                    threshold: Optional[float]) -> Dict[str, Any]:
+    """
+    模拟一块路径，只返回直方图和累加量(企业现值口径)
+    """
+    values = _sample_values(seed, paths, latest_fcf, params)
+    counts, _ = np.histogram(values, bins=edges)
+    return {
+        "counts": counts,
+        "below": int((values < edges[0]).sum()),
+        "above": int((values > edges[-1]).sum()),
+        "sum": float(values.sum()),
+        "sum_sq": float(np.square(values).sum()),
+        "over_threshold": int((values > threshold).sum()) if threshold is not None else 0,
+    }
+
+
+def _percentile(edges: np.ndarray, counts: np.ndarray, below: int, total: int, q: float) -> float:
+    """
+    由直方图线性插值得到分位数，落在分箱范围外时返回范围端点
+    """
+    rank = q / 100 * total
+    if rank <= below:
+        return float(edges[0])
+    cumulative = below + np.cumsum(counts)
+    index = int(np.searchsorted(cumulative, rank))
+    if index >= len(counts):
+        return float(edges[-1])
+    previous = cumulative[index - 1] if index > 0 else below
+    fraction = (rank - previous) / counts[index] if counts[index] else 0.0
+    return float(edges[index] + fraction * (edges[index + 1] - edges[index]))
+
+
+def simulate(latest_fcf: float, growth_history: Sequence[Optional[float]], fcf_growth: float,
+             discount_rate: float = 0.09, growth_rate: float = 0.01, shares_num: float = 1,
+             stock_price: Optional[float] = None, paths: int = DEFAULT_PATHS, seed: int = DEFAULT_SEED,
+             chunk_size: int = CHUNK_SIZE, max_workers: int = DEFAULT_WORKERS) -> Dict[str, Any]:
+    """
+    蒙特卡洛 DCF 估值
+
+    Args:
+        latest_fcf: 最新自由现金流
+        growth_history: 历年自由现金流增长率
+        fcf_growth: 报表推算的增长率
+        discount_rate: 折现率均值
+        growth_rate: 永续增长率均值
+        shares_num: 总股本
+        stock_price: 当前股价，给出时计算每股内在价值高于股价的概率
+        paths: 路径数
+        seed: 随机种子，相同参数和种子的结果相同
+        chunk_size: 每块路径数
+        max_workers: 并行进程数，1 表示在当前进程内计算
+    Returns:
+        dict: 路径数、种子、分布参数、每股内在价值的分位数和均值、高于当前股价的概率
+    """
+    if not shares_num:
+        raise ValueError("股票数量为0，无法计算蒙特卡洛估值")
+    if latest_fcf is None or latest_fcf <= 0:
+        raise ValueError("最新自由现金流不大于0，无法计算蒙特卡洛估值")
+    if paths <= 0:
+        raise ValueError(f"路径数必须大于0: {paths}")
+    params = fit_params(growth_history, fcf_growth, discount_rate, growth_rate)
+    pilot_seed, *chunk_seeds = np.random.SeedSequence(seed).spawn(1 + math.ceil(paths / chunk_size))
+    # 分箱范围取试算路径 0.1%~99.9% 分位数并向两侧各扩展一半，范围外的路径单独计数
+    low, high = np.percentile(_sample_values(pilot_seed, PILOT_PATHS, latest_fcf, params), [0.1, 99.9])
+    span = max(high - low, abs(high) * 1e-6, 1e-9)
+    edges = np.linspace(low - span / 2, high + span / 2, HISTOGRAM_BINS + 1)
+    threshold = stock_price * float(shares_num) if stock_price else None
+    sizes = [min(chunk_size, paths - i * chunk_size) for i in range(len(chunk_seeds))]
+
+    if max_workers <= 1 or len(sizes) == 1:
+        parts = [_simulate_chunk(s, n, latest_fcf, params, edges, threshold) for s, n in zip(chunk_seeds, sizes)]
+    else:
+        with ProcessPoolExecutor(max_workers=min(max_workers, len(sizes))) as executor:
+            futures = [executor.submit(_simulate_chunk, s, n, latest_fcf, params, edges, threshold)
+                       for s, n in zip(chunk_seeds, sizes)]
+            parts = [future.result() for future in futures]
+
+    counts = np.sum([part["counts"] for part in parts], axis=0)
+    below = sum(part["below"] for part in parts)
+    mean = sum(part["sum"] for part in parts) / paths
+    variance = max(sum(part["sum_sq"] for part in parts) / paths - mean ** 2, 0.0)
+    per_share = float(shares_num)
+    intrinsic_value: Dict[str, float] = {
+        f"p{q}": round(_percentile(edges, counts, below, paths, q) / per_share, 2) for q in PERCENTILES
+    }
+    intrinsic_value["mean"] = round(mean / per_share, 2)
+    intrinsic_value["std"] = round(math.sqrt(variance) / per_share, 2)
+    result = {
+        "paths": paths,
+        "seed": seed,
+        "params": params,
+        "intrinsic_value": intrinsic_value,
+    }
+    if threshold is not None:
+        result["stock_price"] = stock_price
+        result["prob_above_price"] = round(sum(part["over_threshold"] for part in parts) / paths, 4)
+    log.info(f"蒙特卡洛估值完成: {paths} 条路径, {intrinsic_value}")
+    return result
+
+
+def summary_text(result: Dict[str, Any]) -> str:
+    """
+    把 simulate 的结果整理为提示词中使用的简短文字
+    """
+    value = result["intrinsic_value"]
+    growth = result["params"]["fcf_growth"]
+    lines: List[str] = [
+        f"{result['paths']:,} 条路径 (种子 {result['seed']})，自由现金流增长率 ~ N({growth['mean']:.2%}, {growth['std']:.2%})"
+        f"(由 {growth['samples']} 期历史拟合)，折现率 ~ N({result['params']['discount_rate']['mean']:.2%}, {DISCOUNT_STD:.2%})，"
+        f"永续增长率 ~ N({result['params']['growth_rate']['mean']:.2%}, {TERMINAL_STD:.2%})",
+        "每股内在价值: " + ", ".join(f"P{q}={value[f'p{q}']}" for q in PERCENTILES) + f", 均值={value['mean']}",
+    ]
+    if "prob_above_price" in result:
+        lines.append(f"内在价值高于当前股价 {result['stock_price']} 的概率: {result['prob_above_price']:.1%}")
+    return "\n".join(lines)
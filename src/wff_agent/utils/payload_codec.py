@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+"""
+发送给大模型的数据载荷编码
+
+records 与原先的 to_json(orient="records") 一致，每行重复所有列名并输出完整精度。
+columnar 按列输出，列名只出现一次；compact 在此基础上按有效数字取整，
+较早的行按步长抽样，并附带整个窗口的统计摘要。
+
+每个工具的编码方式可以在调用时通过 encoding 参数指定，
+也可以用环境变量统一配置，如 WFF_TOOL_ENCODINGS="GetMarketIndicators=compact,FinancialReportIndicators=columnar"，
+未配置时保持 records。
+"""
+import json
+import logging
+import math
+import os
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+log = logging.getLogger(__name__)
+
+MODE_RECORDS = "records"
+MODE_COLUMNAR = "columnar"
+MODE_COMPACT = "compact"
+MODES = (MODE_RECORDS, MODE_COLUMNAR, MODE_COMPACT)
+DEFAULT_MODE = MODE_RECORDS
+
+# compact 模式的默认参数
+COMPACT_DIGITS = 4
+# 最近的行完整保留，更早的行每隔 COMPACT_STRIDE 行保留一行
+COMPACT_RECENT_ROWS = 20
+COMPACT_STRIDE = 5
+
+
+def _parse_tool_encodings(value: Optional[str]) -> Dict[str, str]:
+    encodings: Dict[str, str] = {}
+    if not value:
+        return encodings
+    for item in value.split(","):
+        try:
+            tool, mode = item.split("=")
+        except ValueError:
+            log.error(f"WFF_TOOL_ENCODINGS 格式错误: {item}")
+            continue
+        mode = mode.strip().lower()
+        if mode not in MODES:
+            log.error(f"WFF_TOOL_ENCODINGS 中不支持的编码: {item}")
+            continue
+        encodings[tool.strip()] = mode
+    return encodings
+
+
+def tool_encoding(tool: str, encoding: Optional[str] = None) -> str:
+    """
+    确定工具使用的编码方式，调用时指定的优先，其次是环境变量 WFF_TOOL_ENCODINGS
+
+    Args:
+        tool: 工具名称，如 GetMarketIndicators
+        encoding: 调用时指定的编码，None 表示使用配置
+    Returns:
+        records, columnar 或 compact
+    """
+    if encoding:
+        encoding = encoding.lower()
+        if encoding not in MODES:
+            raise ValueError(f"不支持的编码方式: {encoding}，可选: {', '.join(MODES)}")
+        return encoding
+    return _parse_tool_encodings(os.getenv("WFF_TOOL_ENCODINGS")).get(tool, DEFAULT_MODE)
+
+
+def round_significant(values: np.ndarray, digits: int) -> np.ndarray:
+    """
+    按有效数字取整，NaN 和 inf 保持不变
+
+    Args:
+        values: 浮点数组
+        digits: 有效数字位数
+    Returns:
+        取整后的数组
+    """
+    values = np.asarray(values, dtype=float)
+    out = values.copy()
+    finite = np.isfinite(values) & (values != 0)
+    if not finite.any():
+        return out
+    x = values[finite]
+    exponent = digits - 1 - np.floor(np.log10(np.abs(x))).astype(int)
+    # 用精确的10的整数次幂相乘或相除，避免 0.1 这类不精确的比例引入多余的尾数
+    positive = exponent >= 0
+    scale = np.power(10.0, np.abs(exponent))
+    x = np.where(positive, np.round(x * scale) / scale, np.round(x / scale) * scale)
+    out[finite] = x
+    return out
+
+
+def _to_json_value(value: Any) -> Any:
+    if isinstance(value, (float, np.floating)):
+        value = float(value)
+        if not math.isfinite(value):
+            return None
+        # 整数值去掉 .0，成交量等大数也更短
+        if value.is_integer() and abs(value) < 1e15:
+            return int(value)
+        return value
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, np.bool_):
+        return bool(value)
+    return value
+
+
+def _column_values(series: pd.Series, digits: Optional[int]) -> List[Any]:
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        values = series.to_numpy(dtype=float, na_value=np.nan)
+        if digits is not None:
+            values = round_significant(values, digits)
+        return [_to_json_value(value) for value in values]
+    return [None if pd.isna(value) else _to_json_value(value) for value in series.astype(object)]
+
+
+def downsample_rows(df: pd.DataFrame, recent_rows: int, stride: int) -> pd.DataFrame:
+    """
+    最近的 recent_rows 行完整保留，更早的行从分界处向前每隔 stride 行保留一行
+
+    Args:
+        df: 按时间升序的数据
+        recent_rows: 完整保留的行数
+        stride: 较早部分的抽样步长
+    Returns:
+        抽样后的数据
+    """
+    if stride <= 1 or len(df) <= recent_rows:
+        return df
+    older = len(df) - recent_rows
+    positions = np.arange(older - stride, -1, -stride)[::-1]
+    return df.iloc[np.concatenate([positions, np.arange(older, len(df))])]
+
+
+def lttb_indices(y: np.ndarray, max_points: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets 降采样，保留曲线的形状(高点、低点和拐点)
+
+    首尾两点固定保留，中间的点均分为 max_points-2 个桶，每个桶选出与
+    上一个选中点、下一个桶均值构成的三角形面积最大的点。
+
+    Args:
+        y: 按时间升序的序列，横坐标取行号
+        max_points: 保留的点数，至少为3
+    Returns:
+        np.ndarray: 保留的行号，升序
+    """
+    n = len(y)
+    if max_points < 3:
+        raise ValueError(f"降采样点数至少为3: {max_points}")
+    if n <= max_points:
+        return np.arange(n)
+    y = np.asarray(y, dtype=float)
+    # 缺失值按前后值填充，避免面积为NaN
+    y = pd.Series(y).ffill().bfill().fillna(0.0).to_numpy()
+    edges = np.linspace(1, n - 1, max_points - 1).astype(int)
+    selected = np.empty(max_points, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for i in range(max_points - 2):
+        start, end = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_start, next_end = edges[i + 1], edges[i + 2]
+        else:
+            next_start, next_end = n - 1, n
+        next_x = (next_start + next_end - 1) / 2.0
+        next_y = y[next_start:next_end].mean()
+        xs = np.arange(start, end)
+        area = np.abs((previous - next_x) * (y[start:end] - y[previous])
+                      - (previous - xs) * (next_y - y[previous]))
+        previous = start + int(np.argmax(area))
+        selected[i + 1] = previous
+    return selected
+
+
+def downsample_lttb(df: pd.DataFrame, max_points: int, column: str = "收盘") -> pd.DataFrame:
+    """
+    按 column 的形状用 LTTB 选出 max_points 行，其他列取同一行的值
+
+    Args:
+        df: 按时间升序的数据
+        max_points: 保留的行数
+        column: 用于选点的列
+    Returns:
+        降采样后的数据
+    """
+    return df.iloc[lttb_indices(df[column].to_numpy(dtype=float, na_value=np.nan), max_points)]
+
+
+def summarize(df: pd.DataFrame, digits: Optional[int] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    数值列在整个窗口上的统计摘要: 最小、最大、均值、最新值和区间变化率
+
+    Args:
+        df: 按时间升序的数据
+        digits: 有效数字位数，None 表示不取整
+    Returns:
+        Dict[str, Dict[str, Any]]: 键为列名
+    """
+    summary: Dict[str, Dict[str, Any]] = {}
+    for col in df.columns:
+        series = df[col]
+        if not pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series):
+            continue
+        values = series.dropna().to_numpy(dtype=float)
+        if len(values) == 0:
+            continue
+        first, last = values[0], values[-1]
+        stats = np.array([values.min(), values.max(), values.mean(), last,
+                          (last / first - 1) * 100 if first != 0 else np.nan])
+        if digits is not None:
+            stats = round_significant(stats, digits)
+        summary[str(col)] = dict(zip(["min", "max", "mean", "last", "change_pct"],
+                                     (_to_json_value(value) for value in stats)))
+    return summary
+
+
+def encode_frame(df: pd.DataFrame, mode: str = DEFAULT_MODE, digits: Optional[int] = None,
+                 recent_rows: Optional[int] = None, stride: Optional[int] = None) -> str:
+    """
+    把按时间升序的 DataFrame 编码为 JSON 字符串
+
+    Args:
+        df: 数据，索引不输出，需要的列(如日期)应先 reset_index
+        mode: records, columnar 或 compact
+        digits: 有效数字位数，compact 默认 COMPACT_DIGITS，其他模式默认不取整
+        recent_rows: 完整保留的最近行数，compact 默认 COMPACT_RECENT_ROWS，其他模式默认全部保留
+        stride: 较早行的抽样步长，compact 默认 COMPACT_STRIDE
+    Returns:
+        JSON 字符串
+    """
+    if mode not in MODES:
+        raise ValueError(f"不支持的编码方式: {mode}，可选: {', '.join(MODES)}")
+    if mode == MODE_RECORDS and digits is None and recent_rows is None:
+        return df.to_json(force_ascii=False, orient="records")
+    if mode == MODE_COMPACT:
+        digits = COMPACT_DIGITS if digits is None else digits
+        recent_rows = COMPACT_RECENT_ROWS if recent_rows is None else recent_rows
+        stride = COMPACT_STRIDE if stride is None else stride
+    sampled = df if recent_rows is None else downsample_rows(df, recent_rows, stride or 1)
+
+    columns = {str(col): _column_values(sampled[col], digits) for col in sampled.columns}
+    if mode == MODE_RECORDS:
+        payload: Any = [dict(zip(columns, row)) for row in zip(*columns.values())]
+    else:
+        payload = {"columns": columns}
+        if len(sampled) < len(df):
+            payload["rows"] = f"共{len(df)}行，最近{recent_rows}行完整保留，更早的行每{stride}行取1行"
+        if mode == MODE_COMPACT:
+            payload["summary"] = summarize(df, digits)
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+
+
+def encode_columns(data: Dict[str, Any], mode: str = DEFAULT_MODE, digits: Optional[int] = None) -> Any:
+    """
+    编码按列组织的字典(如财务指标 {指标: [各期数值]})
+
+    Args:
+        data: 按列组织的字典，值为列表或标量
+        mode: records 原样返回，columnar 输出紧凑的 JSON，compact 另按有效数字取整
+        digits: 有效数字位数，compact 默认 COMPACT_DIGITS
+    Returns:
+        records 模式返回原对象，其他模式返回 JSON 字符串
+    """
+    if mode not in MODES:
+        raise ValueError(f"不支持的编码方式: {mode}，可选: {', '.join(MODES)}")
+    if mode == MODE_RECORDS:
+        return data
+    if mode == MODE_COMPACT and digits is None:
+        digits = COMPACT_DIGITS
+
+    def encode_value(value: Any) -> Any:
+        if isinstance(value, dict):
+            return {key: encode_value(item) for key, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [encode_value(item) for item in value]
+        if isinstance(value, (float, np.floating)) and digits is not None:
+            value = round_significant(np.array([value]), digits)[0]
+        return _to_json_value(value)
+
+    return json.dumps(encode_value(data), ensure_ascii=False, separators=(",", ":"))
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    粗略估计 token 数: 中文约每字1个，其他字符约每4个1个
+    """
+    cjk = sum(1 for ch in text if "一" <= ch <= "鿿")
+    return cjk + math.ceil((len(text) - cjk) / 4)
@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+"""
+同行业可比公司的财务比率分位数
+
+同行来自东方财富行业板块的成分股(仅A股，按成交额取前 MAX_PEERS 只)或调用方给出的股票列表。
+各公司的年报比率按财年对齐排成 股票 × 报告期 × 比率 的三维数组，每个报告期、每个比率在股票维度上一次求百分位排名。
+分位数只表示在同行中的位置(数值越大分位数越高)，比率本身的好坏方向由使用者判断。
+
+分析时只使用本地已缓存的基本面数据和报表，代价可以忽略；缺少缓存的同行在后台以预取优先级拉取，
+下次分析即可使用。
+"""
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from wff_agent.datasource import akshare_request as ak_request
+from wff_agent.utils import fin_reports_utils, ratio_engine
+
+log = logging.getLogger(__name__)
+
+MAX_PEERS = 30
+# 参与排名的年报期数，0 为最新一期
+PEER_PERIODS = 3
+# 至少有这么多家公司有数据时才输出分位数
+MIN_PEERS = 3
+# 行业成分股行情中的估值列 -> 比率名，只有最新一期
+SPOT_RATIOS = {"市盈率-动态": "pe_dynamic", "市净率": "pb"}
+
+_prefetching: set = set()
+_prefetch_lock = threading.Lock()
+
+
+def industry_peers(symbol: str, market: str, limit: int = MAX_PEERS) -> Tuple[str, pd.DataFrame]:
+    """
+    股票所在行业板块中成交额最大的 limit 只成分股，始终包含该股票本身
+
+    Args:
+        symbol: 股票代码
+        market: 市场，目前只支持 cn
+        limit: 最多返回的股票数
+    Returns:
+        (行业名称, 成分股行情DataFrame)
+    """
+    if market != "cn":
+        raise ValueError(f"{market} 市场没有行业成分股数据，请直接给出可比公司列表")
+    industry = ak_request.get_cn_stock_info(symbol).get("行业")
+    if not industry:
+        raise ValueError(f"无法确定{symbol}所属行业")
+    members = ak_request.get_industry_constituents(industry)
+    if "成交额" in members.columns:
+        members = members.sort_values("成交额", ascending=False, na_position="last")
+    members = members.head(limit)
+    if symbol not in set(members["代码"]):
+        members = pd.concat([members, pd.DataFrame({"代码": [symbol]})], ignore_index=True)
+    return industry, members.reset_index(drop=True)
+
+
+def _to_number(value: Any) -> float:
+    if isinstance(value, str) and value.endswith("%"):
+        value = float(value[:-1]) / 100
+    return np.nan if value is None else float(value)
+
+
+def _fiscal_years(base: Dict[str, Any]) -> List[Optional[int]]:
+    """
+    年报比率各期(按期倒序)所属的财年，即报告期的年份
+    """
+    dates = base["annual_ratios"].get(ratio_engine.DATE_KEYS[base["market"]]) or []
+    years: List[Optional[int]] = []
+    for date in dates:
+        try:
+            years.append(pd.Timestamp(str(date)).year)
+        except (TypeError, ValueError):
+            years.append(None)
+    return years
+
+
+def ratio_cube(bases: Dict[str, Dict[str, Any]], periods: int = PEER_PERIODS, anchor: Optional[str] = None
+               ) -> Tuple[List[str], List[str], np.ndarray]:
+    """
+    把各公司的年报比率按财年对齐排成三维数组
+
+    各公司最新年报的财年可能不同(有的已发布新年报，有的只有更早的报表)，
+    因此报告期维度按财年而不是列表位置对齐: 第 p 期为基准财年之前 p 年的年报。
+
+    Args:
+        bases: {股票代码: 基本面数据}
+        periods: 报告期数
+        anchor: 以该股票最新年报的财年为第0期，缺省或没有年报时取所有公司中最新的财年
+    Returns:
+        (股票代码, 比率名, 股票 × 报告期 × 比率 的数组)，缺失为 NaN；只输出最新一期的标量比率放在其最新财年
+    """
+    symbols = list(bases)
+    keys: List[str] = []
+    for base in bases.values():
+        date_key = ratio_engine.DATE_KEYS[base["market"]]
+        keys.extend(key for key in base["annual_ratios"] if key != date_key and key not in keys)
+    cube = np.full((len(symbols), periods, len(keys)), np.nan)
+    years = {symbol: _fiscal_years(base) for symbol, base in bases.items()}
+    known = [year for year in (years.get(anchor) or []) if year is not None] \
+        or [year for values in years.values() for year in values if year is not None]
+    if not known:
+        return symbols, keys, cube
+    latest = max(known)
+    for i, symbol in enumerate(symbols):
+        ratios = bases[symbol]["annual_ratios"]
+        # 每期在数组中的位置，同一财年有多份年报时取最新的一份
+        slots: List[Optional[int]] = []
+        for year in years[symbol]:
+            slot = None if year is None else latest - year
+            slots.append(slot if slot is not None and 0 <= slot < periods and slot not in slots else None)
+        for k, key in enumerate(keys):
+            values = ratios.get(key)
+            if values is None:
+                continue
+            values = values if isinstance(values, list) else [values]
+            for slot, value in zip(slots, values):
+                if slot is not None:
+                    cube[i, slot, k] = _to_number(value)
+    return symbols, keys, cube
+
+
+def percentile_ranks(cube: np.ndarray) -> np.ndarray:
+    """
+    每个报告期、每个比率在股票维度上的百分位排名(0~1，相同值取平均名次)，缺失值不参与排名
+    """
+    symbols = cube.shape[0]
+    flat = pd.DataFrame(cube.reshape(symbols, -1))
+    return flat.rank(pct=True).to_numpy().reshape(cube.shape)
+
+
+def peer_ranking(symbol: str, market: str, peers: Optional[List[str]] = None, cached_only: bool = True,
+                 periods: int = PEER_PERIODS) -> Dict[str, Any]:
+    """
+    计算股票的财务比率在同行中的分位数
+
+    Args:
+        symbol: 股票代码
+        market: 市场, us, cn, hk
+        peers: 可比公司代码，缺省时取同行业板块的成分股(仅A股)
+        cached_only: 只使用本地缓存，缺少缓存的同行在后台预取
+        periods: 参与排名的年报期数
+    Returns:
+        dict: {"industry", "peers": 有数据的同行数, "missing": 缺少数据的同行数,
+            "ratios": {比率: {"value", "percentile", "median", "count"}}}，分位数为最新一期
+    """
+    industry = None
+    spot = None
+    if peers is None:
+        industry, members = industry_peers(symbol, market)
+        symbols = members["代码"].tolist()
+        spot = members.set_index("代码")
+    else:
+        symbols = list(dict.fromkeys([symbol] + list(peers)))
+    bases = fin_reports_utils.get_batch_fundamentals(symbols, market, cached_only=cached_only)
+    missing = [s for s in symbols if s not in bases]
+    if cached_only and missing:
+        prefetch_peers(missing, market)
+    if symbol not in bases:
+        bases = dict(bases, **{symbol: fin_reports_utils.get_report_fundamentals(symbol, market)})
+
+    names, keys, cube = ratio_cube(bases, periods, anchor=symbol)
+    if spot is not None:
+        columns = [column for column in SPOT_RATIOS if column in spot.columns]
+        extra = np.full((len(names), periods, len(columns)), np.nan)
+        values = spot.reindex(names)[columns].apply(pd.to_numeric, errors="coerce").to_numpy()
+        extra[:, 0, :] = values
+        cube = np.concatenate([cube, extra], axis=2)
+        keys = keys + [SPOT_RATIOS[column] for column in columns]
+    ranks = percentile_ranks(cube)
+    row = names.index(symbol)
+    counts = np.sum(~np.isnan(cube[:, 0, :]), axis=0)
+    with np.errstate(all="ignore"):
+        medians = np.nanmedian(cube[:, 0, :], axis=0) if len(names) else np.array([])
+    ratios: Dict[str, Any] = {}
+    for k, key in enumerate(keys):
+        value = cube[row, 0, k]
+        if np.isnan(value) or counts[k] < MIN_PEERS:
+            continue
+        ratios[key] = {
+            "value": round(float(value), 4),
+            "percentile": round(float(ranks[row, 0, k]), 2),
+            "median": round(float(medians[k]), 4),
+            "count": int(counts[k]),
+        }
+    return {"industry": industry, "peers": len(names) - 1, "missing": len(missing), "ratios": ratios}
+
+
+def prefetch_peers(symbols: List[str], market: str) -> None:
+    """
+    在后台以预取优先级拉取同行的报表并计算基本面数据，同一批股票同时只拉取一次
+    """
+    with _prefetch_lock:
+        symbols = [symbol for symbol in symbols if (market, symbol) not in _prefetching]
+        _prefetching.update((market, symbol) for symbol in symbols)
+    if not symbols:
+        return
+
+    def run():
+        try:
+            fin_reports_utils.get_batch_fundamentals(symbols, market, cached_only=False)
+        except Exception as e:
+            log.warning(f"预取同行基本面数据失败: {e}")
+        finally:
+            with _prefetch_lock:
+                _prefetching.difference_update((market, symbol) for symbol in symbols)
+
+    log.info(f"后台预取{len(symbols)}只同行的基本面数据: {market}")
+    threading.Thread(target=run, name="peer-prefetch", daemon=True).start()
+
+
+def summary_text(result: Dict[str, Any]) -> str:
+    """
+    把 peer_ranking 的结果整理为提示词中使用的简短文字
+    """
+    head = f"同行业({result['industry']})" if result.get("industry") else "可比公司"
+    lines = [f"{head}共 {result['peers']} 家有数据，分位数为最新年报在同行中的位置(0~1，越大数值越高):"]
+    for key, item in result["ratios"].items():
+        lines.append(f"{key}: {item['value']}, 分位数 {item['percentile']}, 同行中位数 {item['median']}")
+    return "\n".join(lines)
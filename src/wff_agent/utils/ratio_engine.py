@@ -0,0 +1,656 @@
+# -*- coding: utf-8 -*-
+"""
+A股、港股、美股统一的财务比率计算
+
+各市场的报表字段不同，但比率的定义相同。FIELDS 把统一的字段名映射到各市场报表中的列，
+RATIOS 按统一字段把每个比率定义为 分子/分母。计算时三张报表按报告期对齐为按期排列的数组
+(最新一期在前)，所有比率的分子、分母各组成一个矩阵，一次相除。
+
+与原先各市场的实现相比修正了以下定义(输出的键不变):
+    - A股、港股的流动比率 = 流动资产/流动负债(原为除以负债合计)，速动比率扣除存货
+    - 港股毛利率 = 毛利/营运收入(原为 1-毛利/营运收入)
+    - ROE 在所有市场都是保留2位小数的百分比字符串，如 "15.34%"
+      (原先A股、美股先取整到1%，港股输出数值)
+
+缺失值与除零的处理在所有市场一致:
+    - 报表中缺失或无法转换为数字的值(如 Alpha Vantage 的 "None")视为缺失
+    - 多列相加的字段(如总费用)中缺失的列按0计，所有列都缺失时该字段缺失
+    - 比率的分子或分母缺失、分母为0时结果为 None，增长率的基期为0时同样为 None
+    - 比率保留4位小数，市盈率、市净率保留2位，ROE 输出为保留2位小数的百分比字符串
+
+港股、美股的报表只有几期，单次计算并不比原先逐期的纯 Python 实现快(见 benchmarks/ratio_bench.py)，
+性能上的收益来自报表不变时只需 reprice。
+"""
+import functools
+import json
+import logging
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+log = logging.getLogger(__name__)
+
+BALANCE = "balance_sheet"
+INCOME = "income_statement"
+CASHFLOW = "cashflow"
+
+# 各市场报表中的报告期列
+DATE_COLUMNS = {"cn": "报告日", "hk": "report_time", "us": "fiscalDateEnding"}
+
+# 统一字段 -> (报表, 列)，多列时相加
+FIELDS: Dict[str, Dict[str, Tuple[str, Tuple[str, ...]]]] = {
+    "cn": {
+        "total_revenue": (INCOME, ("营业总收入",)),
+        "revenue": (INCOME, ("营业收入",)),
+        "cost_of_revenue": (INCOME, ("营业成本",)),
+        "management_expense": (INCOME, ("管理费用",)),
+        "selling_expense": (INCOME, ("销售费用",)),
+        "rd_expense": (INCOME, ("研发费用",)),
+        "financial_expense": (INCOME, ("财务费用",)),
+        "total_expense": (INCOME, ("财务费用", "研发费用", "销售费用", "管理费用")),
+        "operating_profit": (INCOME, ("营业利润",)),
+        "interest_expense": (INCOME, ("利息支出",)),
+        "net_income": (INCOME, ("净利润",)),
+        "eps": (INCOME, ("基本每股收益",)),
+        "total_assets": (BALANCE, ("资产总计",)),
+        "fixed_assets": (BALANCE, ("固定资产及清理合计",)),
+        "current_assets": (BALANCE, ("流动资产合计",)),
+        "current_liabilities": (BALANCE, ("流动负债合计",)),
+        "long_term_liabilities": (BALANCE, ("长期借款", "长期应付款合计")),
+        "total_liabilities": (BALANCE, ("负债合计",)),
+        "equity": (BALANCE, ("所有者权益(或股东权益)合计",)),
+        "inventory": (BALANCE, ("存货",)),
+        "receivables": (BALANCE, ("应收账款",)),
+        "payables": (BALANCE, ("应付账款",)),
+        "operating_cash_flow": (CASHFLOW, ("经营活动产生的现金流量净额",)),
+        "investing_cash_flow": (CASHFLOW, ("投资活动产生的现金流量净额",)),
+        "financing_cash_flow": (CASHFLOW, ("筹资活动产生的现金流量净额",)),
+        "capex": (CASHFLOW, ("购建固定资产、无形资产和其他长期资产所支付的现金",)),
+        # 面值1元，股本金额即股数
+        "shares": (BALANCE, ("实收资本(或股本)",)),
+    },
+    "hk": {
+        "total_revenue": (INCOME, ("营业额",)),
+        "revenue": (INCOME, ("营运收入",)),
+        "gross_profit": (INCOME, ("毛利",)),
+        "management_expense": (INCOME, ("行政开支",)),
+        "selling_expense": (INCOME, ("销售及分销费用",)),
+        "financial_expense": (INCOME, ("融资成本",)),
+        "total_expense": (INCOME, ("融资成本", "销售及分销费用", "行政开支")),
+        "operating_profit": (INCOME, ("经营溢利",)),
+        "net_income": (INCOME, ("持续经营业务税后利润",)),
+        "eps": (INCOME, ("每股基本盈利",)),
+        "total_assets": (BALANCE, ("总资产",)),
+        "fixed_assets": (BALANCE, ("物业厂房及设备", "土地使用权")),
+        "current_assets": (BALANCE, ("流动资产合计",)),
+        "current_liabilities": (BALANCE, ("流动负债合计",)),
+        "long_term_liabilities": (BALANCE, ("非流动负债合计",)),
+        "total_liabilities": (BALANCE, ("总负债",)),
+        "equity": (BALANCE, ("总权益",)),
+        "inventory": (BALANCE, ("存货",)),
+        "receivables": (BALANCE, ("应收帐款",)),
+        "payables": (BALANCE, ("应付帐款",)),
+        "interest_expense": (CASHFLOW, ("已付利息(融资)",)),
+        "operating_cash_flow": (CASHFLOW, ("经营业务现金净额",)),
+        "investing_cash_flow": (CASHFLOW, ("投资业务现金净额",)),
+        "financing_cash_flow": (CASHFLOW, ("融资业务现金净额",)),
+        "capex": (CASHFLOW, ("购建固定资产",)),
+    },
+    "us": {
+        "total_revenue": (INCOME, ("totalRevenue",)),
+        "revenue": (INCOME, ("totalRevenue",)),
+        "gross_profit": (INCOME, ("grossProfit",)),
+        "cost_of_revenue": (INCOME, ("costOfRevenue",)),
+        "operating_expense": (INCOME, ("operatingExpenses",)),
+        "selling_expense": (INCOME, ("sellingGeneralAndAdministrative",)),
+        "rd_expense": (INCOME, ("researchAndDevelopment",)),
+        "interest_expense": (INCOME, ("interestExpense",)),
+        "total_expense": (INCOME, ("operatingExpenses", "sellingGeneralAndAdministrative",
+                                   "researchAndDevelopment", "interestExpense")),
+        "ebit": (INCOME, ("ebit",)),
+        "net_income": (INCOME, ("netIncome",)),
+        "total_assets": (BALANCE, ("totalAssets",)),
+        "fixed_assets": (BALANCE, ("propertyPlantEquipment",)),
+        "current_assets": (BALANCE, ("totalCurrentAssets",)),
+        "current_liabilities": (BALANCE, ("totalCurrentLiabilities",)),
+        "long_term_liabilities": (BALANCE, ("totalNonCurrentLiabilities",)),
+        "total_liabilities": (BALANCE, ("totalLiabilities",)),
+        "equity": (BALANCE, ("totalShareholderEquity",)),
+        "shares": (BALANCE, ("commonStockSharesOutstanding",)),
+        "inventory": (BALANCE, ("inventory",)),
+        "receivables": (BALANCE, ("currentNetReceivables",)),
+        "payables": (BALANCE, ("currentAccountsPayable",)),
+        "operating_cash_flow": (CASHFLOW, ("operatingCashflow",)),
+        "investing_cash_flow": (CASHFLOW, ("cashflowFromInvestment",)),
+        "financing_cash_flow": (CASHFLOW, ("cashflowFromFinancing",)),
+        "capex": (CASHFLOW, ("capitalExpenditures",)),
+    },
+}
+
+Arrays = Dict[str, np.ndarray]
+
+
+def _previous(values: np.ndarray) -> np.ndarray:
+    """
+    上一期的值，按期倒序排列时即后移一位，最早一期为 NaN
+    """
+    return np.concatenate((values[1:], [np.nan])) if len(values) else values
+
+
+def _zero_if_missing(values: np.ndarray) -> np.ndarray:
+    # 与 np.nan_to_num 相同，但对只有几期的数组没有其额外开销
+    return np.where(np.isnan(values), 0.0, values)
+
+
+def derive_fields(fields: Arrays) -> Arrays:
+    """
+    由报表字段派生出比率用到的其他字段，所有字段长度相同
+
+    跨期的字段(上期值、两期均值)最早一期为 NaN，对应的比率输出时去掉最早一期。
+    """
+    derived = dict(fields)
+    if "gross_profit" not in derived:
+        derived["gross_profit"] = fields["revenue"] - fields["cost_of_revenue"]
+    # 自由现金流 = 经营活动现金流 - 资本开支，资本开支缺失时按0计
+    derived["free_cash_flow"] = fields["operating_cash_flow"] - _zero_if_missing(fields["capex"])
+    derived["quick_assets"] = fields["current_assets"] - _zero_if_missing(fields["inventory"])
+    for name in ("total_revenue", "free_cash_flow"):
+        previous = _previous(derived[name])
+        derived[f"{name}_previous"] = previous
+        derived[f"{name}_change"] = derived[name] - previous
+    derived["average_total_assets"] = (fields["total_assets"] + _previous(fields["total_assets"])) / 2
+    derived["average_equity"] = (fields["equity"] + _previous(fields["equity"])) / 2
+    return derived
+
+
+# (输出键, 分子字段, 分母字段)，分母为 None 时输出分子字段的值
+RatioSpec = List[Tuple[str, str, Optional[str]]]
+
+_CN_HK_RATIOS: RatioSpec = [
+    ("revenue_growth", "total_revenue_change", "total_revenue_previous"),
+    ("gross_margin", "gross_profit", "revenue"),
+    ("management_expense_ratio", "management_expense", "revenue"),
+    ("sale_expense_ratio", "selling_expense", "revenue"),
+    ("financial_cost_ratio", "financial_expense", "revenue"),
+    ("total_expense_ratio", "total_expense", "revenue"),
+    ("fixed_assets_ratio", "fixed_assets", "total_assets"),
+    ("current_assets_ratio", "current_assets", "total_assets"),
+    ("current_liabilities_ratio", "current_liabilities", "total_assets"),
+    ("long_liabilities_ratio", "long_term_liabilities", "total_assets"),
+    ("asset_turnover_ratio", "revenue", "total_assets"),
+    ("inventory_turnover_ratio", "revenue", "inventory"),
+    ("receivables_turnover_ratio", "revenue", "receivables"),
+    ("payables_turnover_ratio", "revenue", "payables"),
+    ("interest_coverage_ratio", "operating_profit", "interest_expense"),
+    ("free_cash_flow", "free_cash_flow", None),
+    ("free_cash_flow_growth", "free_cash_flow_change", "free_cash_flow_previous"),
+    ("free_cash_flow_ratio", "free_cash_flow", "revenue"),
+    ("net_margin_ratio", "net_income", "revenue"),
+    ("equity_multiplier", "total_assets", "equity"),
+    # 杜邦分解 净利润率 × 总资产周转率 × 权益乘数 化简后即 净利润 / 股东权益
+    ("roe", "net_income", "equity"),
+    ("operating_cash_flow", "operating_cash_flow", None),
+    ("investing_cash_flow", "investing_cash_flow", None),
+    ("financing_cash_flow", "financing_cash_flow", None),
+    ("asset_debt_ratio", "total_liabilities", "total_assets"),
+    # 原实现除以负债合计且不扣除存货，与美股和通常的定义不一致
+    ("current_ratio", "current_assets", "current_liabilities"),
+    ("quick_ratio", "quick_assets", "current_liabilities"),
+]
+
+RATIOS: Dict[str, RatioSpec] = {
+    "cn": _CN_HK_RATIOS + [
+        ("operating_expense_ratio", "cost_of_revenue", "revenue"),
+        ("dev_expense_ratio", "rd_expense", "revenue"),
+    ],
+    "hk": _CN_HK_RATIOS,
+    "us": [
+        ("revenue_growth", "total_revenue_change", "total_revenue_previous"),
+        ("gross_margin", "gross_profit", "revenue"),
+        ("operating_expenses_ratio", "operating_expense", "revenue"),
+        ("selling_expenses_ratio", "selling_expense", "revenue"),
+        ("r_and_d_expenses_ratio", "rd_expense", "revenue"),
+        ("interest_expenses_ratio", "interest_expense", "revenue"),
+        ("total_expenses_ratio", "total_expense", "revenue"),
+        ("fixed_assets_ratio", "fixed_assets", "total_assets"),
+        ("current_assets_ratio", "current_assets", "total_assets"),
+        ("current_liabilities_ratio", "current_liabilities", "total_liabilities"),
+        ("long_term_liabilities_ratio", "long_term_liabilities", "total_liabilities"),
+        ("asset_turnover_ratio", "revenue", "total_assets"),
+        ("inventory_turnover_ratio", "cost_of_revenue", "inventory"),
+        ("receivables_turnover_ratio", "revenue", "receivables"),
+        ("payables_turnover_ratio", "cost_of_revenue", "payables"),
+        ("interest_coverage_ratio", "ebit", "interest_expense"),
+        ("free_cash_flow", "free_cash_flow", None),
+        ("free_cash_flow_change_rate", "free_cash_flow_change", "free_cash_flow_previous"),
+        ("free_cash_flow_ratio", "free_cash_flow", "revenue"),
+        ("net_income_margin", "net_income", "revenue"),
+        # 总资产周转率、权益乘数和 ROE 按相邻两期的平均资产、平均权益计算
+        ("total_asset_turnover", "revenue", "average_total_assets"),
+        ("equity_multiplier", "average_total_assets", "average_equity"),
+        ("roe", "net_income", "average_equity"),
+        ("debt_ratio", "total_liabilities", "total_assets"),
+        ("current_ratio", "current_assets", "current_liabilities"),
+        ("quick_ratio", "quick_assets", "current_liabilities"),
+        ("operating_cash_flow", "operating_cash_flow", None),
+        ("investing_cash_flow", "investing_cash_flow", None),
+        ("financing_cash_flow", "financing_cash_flow", None),
+    ],
+}
+
+# 与股价相关的比率只依赖每股指标，报表不变时每股指标不变，股价变化时只需重新相除
+# (每股指标, 分子字段, 分母字段)
+PER_SHARE: Dict[str, RatioSpec] = {
+    "cn": [("eps", "eps", None)],
+    "hk": [("eps", "eps", None)],
+    "us": [("eps", "net_income", "shares"), ("book_value_per_share", "equity", "shares")],
+}
+# (输出键, 每股指标)，输出 股价 / 每股指标
+PRICE_RATIOS: Dict[str, List[Tuple[str, str]]] = {
+    "cn": [("pe", "eps")],
+    "hk": [("pe", "eps")],
+    "us": [("pe_ttm", "eps"), ("pb_ttm", "book_value_per_share")],
+}
+
+VALUE_KEYS = {"free_cash_flow", "operating_cash_flow", "investing_cash_flow", "financing_cash_flow"}
+PERCENT_KEYS = {"roe"}
+# 跨期计算的键，比期数少一项
+CROSS_PERIOD_KEYS = {
+    "cn": {"revenue_growth", "free_cash_flow_growth"},
+    "hk": {"revenue_growth", "free_cash_flow_growth"},
+    "us": {"revenue_growth", "free_cash_flow_change_rate", "total_asset_turnover", "equity_multiplier", "roe"},
+}
+# 只输出最新一期的标量
+LATEST_KEYS = {"us": {"current_ratio", "quick_ratio", "pe_ttm", "pb_ttm"}}
+# 只对年报计算的键，季报的每股指标不是 TTM 时输出 None
+ANNUAL_ONLY_KEYS = {"us": {"pe_ttm", "pb_ttm"}}
+# 报告期在输出中的键
+DATE_KEYS = {"cn": "fiscal_end_date", "hk": "fiscal_end_date", "us": "fiscalDateEnding"}
+
+# 滚动12个月(TTM)汇总的流量字段，A股、港股的每股收益同样是累计值
+TTM_FLOWS: Dict[str, List[str]] = {
+    "cn": ["total_revenue", "net_income", "free_cash_flow", "eps"],
+    "hk": ["total_revenue", "net_income", "free_cash_flow", "eps"],
+    "us": ["total_revenue", "net_income", "free_cash_flow"],
+}
+# 报表中的流量是本财年累计值(一季报、中报、三季报、年报)的市场，其余市场为单季值
+CUMULATIVE_MARKETS = {"cn", "hk"}
+# TTM 输出的期数，与季报比率相同
+TTM_PERIODS = 6
+
+Statement = Union[pd.DataFrame, List[Dict[str, Any]], str]
+
+
+def _parse_statement(statement: Statement, date_column: str) -> Tuple[List[str], Any]:
+    """
+    解析报表，返回报告期字符串列表和按行访问的数据(DataFrame 或记录列表)
+    """
+    if isinstance(statement, str):
+        statement = json.loads(statement)
+    if isinstance(statement, pd.DataFrame):
+        if statement.empty or date_column not in statement.columns:
+            return [], []
+        dates = statement[date_column]
+        if pd.api.types.is_datetime64_any_dtype(dates):
+            dates = dates.dt.strftime("%Y-%m-%d")
+        return [str(date) for date in dates], statement
+    records = [record for record in (statement or []) if date_column in record]
+    return [str(record[date_column]) for record in records], records
+
+
+def _to_float(value: Any) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _statement_matrix(data: Any, rows: np.ndarray, columns: List[str]) -> np.ndarray:
+    """
+    取出指定行、列的数值，行号为 -1 或列不存在时为 NaN
+
+    Args:
+        data: _parse_statement 返回的 DataFrame 或记录列表
+        rows: 每个报告期所在的行
+        columns: 用到的列
+    Returns:
+        np.ndarray: 期数 × 列数
+    """
+    if isinstance(data, pd.DataFrame):
+        frame = data.reindex(columns=columns)
+        try:
+            values = frame.to_numpy(dtype=float, na_value=np.nan)
+        except (TypeError, ValueError):
+            values = frame.apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+        # 末尾补一行 NaN，行号 -1 正好取到这一行
+        return np.vstack([values, np.full((1, len(columns)), np.nan)])[rows]
+    empty = {}
+    table = [[(data[row] if row >= 0 else empty).get(col) for col in columns] for row in rows]
+    try:
+        return np.array(table, dtype=float).reshape(len(rows), len(columns))
+    except (TypeError, ValueError):
+        # Alpha Vantage 用字符串 "None" 表示缺失
+        return np.array([[_to_float(value) for value in row] for row in table], dtype=float).reshape(len(rows), len(columns))
+
+
+@functools.lru_cache(maxsize=None)
+def _layout(market: str) -> Tuple[Dict[str, List[str]], List[Tuple[str, str, Any]]]:
+    """
+    每张报表用到的列，以及每个字段在报表矩阵中的列号(多列时为列号列表)
+    """
+    columns: Dict[str, List[str]] = {BALANCE: [], INCOME: [], CASHFLOW: []}
+    for statement, cols in FIELDS[market].values():
+        columns[statement].extend(col for col in cols if col not in columns[statement])
+    field_columns = []
+    for name, (statement, cols) in FIELDS[market].items():
+        index = [columns[statement].index(col) for col in cols]
+        field_columns.append((name, statement, index[0] if len(index) == 1 else index))
+    return columns, field_columns
+
+
+def load_fields(market: str, balance_sheet: Statement, income_statement: Statement,
+                cash_flow_statement: Statement, limit: Optional[int] = None) -> Tuple[List[str], Arrays]:
+    """
+    按利润表的报告期对齐三张报表，取出该市场用到的字段
+
+    Args:
+        market: cn, hk 或 us
+        balance_sheet: 资产负债表
+        income_statement: 利润表
+        cash_flow_statement: 现金流量表
+        limit: 最多保留的期数，None 表示全部
+    Returns:
+        (按倒序排列的报告期, {统一字段: 按期倒序的数组})
+    """
+    if market not in FIELDS:
+        raise ValueError(f"不支持的市场: {market}")
+    date_column = DATE_COLUMNS[market]
+    parsed = {
+        BALANCE: _parse_statement(balance_sheet, date_column),
+        INCOME: _parse_statement(income_statement, date_column),
+        CASHFLOW: _parse_statement(cash_flow_statement, date_column),
+    }
+    columns, field_columns = _layout(market)
+
+    # 报告期以利润表为准，倒序，重复的报告期保留第一条
+    dates = sorted(set(parsed[INCOME][0]), reverse=True)
+    if limit is not None:
+        dates = dates[:limit]
+    matrices: Dict[str, np.ndarray] = {}
+    for name, (statement_dates, data) in parsed.items():
+        row_of = {date: i for i, date in reversed(list(enumerate(statement_dates)))}
+        rows = np.array([row_of.get(date, -1) for date in dates], dtype=int)
+        matrices[name] = _statement_matrix(data, rows, columns[name])
+
+    fields: Arrays = {}
+    for name, statement, index in field_columns:
+        if isinstance(index, int):
+            fields[name] = matrices[statement][:, index]
+        else:
+            # 多列相加时缺失的列按0计，全部缺失时为 NaN
+            values = matrices[statement][:, index]
+            fields[name] = np.where(np.isnan(values).all(axis=1), np.nan, np.nansum(values, axis=1))
+    return dates, fields
+
+
+def latest_value(market: str, field: str, balance_sheet: Statement, income_statement: Statement,
+                 cash_flow_statement: Statement) -> Optional[float]:
+    """
+    最新一期报表中某个统一字段的值，如美股的总股本(shares)
+
+    Args:
+        market: cn, hk 或 us
+        field: FIELDS 中的统一字段
+        balance_sheet: 资产负债表
+        income_statement: 利润表
+        cash_flow_statement: 现金流量表
+    Returns:
+        按报告期从新到旧第一个不缺失的值，该市场没有这个字段或各期都缺失时返回 None
+    """
+    if field not in FIELDS.get(market, {}):
+        return None
+    _, fields = load_fields(market, balance_sheet, income_statement, cash_flow_statement)
+    values = fields[field][~np.isnan(fields[field])]
+    return float(values[0]) if len(values) else None
+
+
+@functools.lru_cache(maxsize=None)
+def _ratio_layout(market: str) -> Tuple[List[str], List[Optional[str]], np.ndarray]:
+    """
+    比率和每股指标的分子字段、分母字段(None 表示1)，以及比率是否保留4位小数
+    """
+    specs = RATIOS[market] + PER_SHARE[market]
+    rounded = np.array([[key not in VALUE_KEYS and key not in PERCENT_KEYS] for key, _, _ in RATIOS[market]])
+    return [num for _, num, _ in specs], [den for _, _, den in specs], rounded
+
+
+def calc_base_ratios(market: str, balance_sheet: Statement, income_statement: Statement,
+                     cash_flow_statement: Statement, limit: Optional[int] = None
+                     ) -> Tuple[Dict[str, Any], Dict[str, List[Optional[float]]]]:
+    """
+    计算与股价无关的财务比率和每股指标，所有比率的分子、分母各组成一个矩阵，一次相除
+
+    结果只取决于报表，同一版本的报表只需计算一次，再用 reprice 套用当前股价。
+
+    Args:
+        market: cn, hk 或 us
+        balance_sheet: 资产负债表，DataFrame、记录列表或其 JSON 字符串
+        income_statement: 利润表
+        cash_flow_statement: 现金流量表
+        limit: 最多保留的期数，None 表示全部
+    Returns:
+        (比率, 每股指标): 比率为 {比率: 按期倒序的列表}，CROSS_PERIOD_KEYS 中的比率比期数少一项；
+        每股指标为 {每股指标: 按期倒序的列表}
+    """
+    dates, fields = load_fields(market, balance_sheet, income_statement, cash_flow_statement, limit)
+    fields = derive_fields(fields)
+    numerators, denominators, rounded = _ratio_layout(market)
+    periods = len(dates)
+    fields[None] = np.ones(periods)
+    # 报表只有几期，np.array 一次堆叠比 vstack 逐个检查维度快得多
+    numerator = np.array([fields[num] for num in numerators]).reshape(len(numerators), periods)
+    denominator = np.array([fields[den] for den in denominators]).reshape(len(denominators), periods)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        values = np.where(denominator == 0, np.nan, numerator / denominator)
+    rows = values.tolist()
+    values = np.where(rounded, np.round(values[:len(rounded)], 4), values[:len(rounded)])
+
+    ratios: Dict[str, Any] = {DATE_KEYS[market]: dates}
+    cross_period = CROSS_PERIOD_KEYS.get(market, set())
+    latest_keys = LATEST_KEYS.get(market, set())
+    for (key, _, _), row in zip(RATIOS[market], values.tolist()):
+        if key in cross_period:
+            row = row[:-1]
+        if key in PERCENT_KEYS:
+            output: Any = [None if value != value else f"{round(value * 100, 2)}%" for value in row]
+        else:
+            output = [None if value != value else value for value in row]
+        if key in latest_keys:
+            output = output[0] if output else None
+        ratios[key] = output
+    per_share = {name: [None if value != value else value for value in row]
+                 for (name, _, _), row in zip(PER_SHARE[market], rows[len(rounded):])}
+    log.debug(f"calc_base_ratios {market}: {periods} 期")
+    return ratios, per_share
+
+
+def _copy_lists(values: Dict[str, Any]) -> Dict[str, Any]:
+    # 值只有列表和标量，列表中是数字、字符串或 None，复制一层即可
+    return {key: list(value) if isinstance(value, list) else value for key, value in values.items()}
+
+
+def reprice(market: str, ratios: Dict[str, Any], per_share: Dict[str, List[Optional[float]]],
+            stock_price: Optional[float], annual: bool = True, ttm: bool = False) -> Dict[str, Any]:
+    """
+    在与股价无关的比率上套用当前股价，得到市盈率、市净率等
+
+    只做每期一次除法，不读取报表。返回新的字典，与股价无关的列表也是副本，不与 ratios 共享。
+
+    Args:
+        market: cn, hk 或 us
+        ratios: calc_base_ratios 返回的比率
+        per_share: calc_base_ratios 返回的每股指标，或 ttm_per_share 给出的 TTM 每股指标
+        stock_price: 当前股价
+        annual: 是否为年报，ANNUAL_ONLY_KEYS 中的键只对年报计算
+        ttm: per_share 是否为 TTM 每股指标，是时季报也计算 ANNUAL_ONLY_KEYS 中的键
+    Returns:
+        dict: 完整的财务比率，保留2位小数
+    """
+    result = _copy_lists(ratios)
+    latest_keys = LATEST_KEYS.get(market, set())
+    annual_only = set() if ttm else ANNUAL_ONLY_KEYS.get(market, set())
+    for key, name in PRICE_RATIOS[market]:
+        basis = per_share.get(name) or []
+        if stock_price is None or (key in annual_only and not annual):
+            output: Any = [None] * len(basis)
+        else:
+            output = [round(stock_price / value, 2) if value else None for value in basis]
+        if key in latest_keys:
+            output = output[0] if output else None
+        result[key] = output
+    return result
+
+
+def calc_ratios(market: str, balance_sheet: Statement, income_statement: Statement,
+                cash_flow_statement: Statement, stock_price: float, annual: bool = True,
+                limit: Optional[int] = None) -> Dict[str, Any]:
+    """
+    计算财务比率，等同于 calc_base_ratios 之后 reprice
+
+    Args:
+        market: cn, hk 或 us
+        balance_sheet: 资产负债表，DataFrame、记录列表或其 JSON 字符串
+        income_statement: 利润表
+        cash_flow_statement: 现金流量表
+        stock_price: 当前股价，用于计算市盈率、市净率
+        annual: 是否为年报，ANNUAL_ONLY_KEYS 中的键只对年报计算
+        limit: 最多保留的期数，None 表示全部
+    Returns:
+        dict: {比率: 按期倒序的列表}，CROSS_PERIOD_KEYS 中的比率比期数少一项
+    """
+    ratios, per_share = calc_base_ratios(market, balance_sheet, income_statement, cash_flow_statement, limit)
+    return reprice(market, ratios, per_share, stock_price, annual)
+
+
+def _month_ordinals(dates: List[str]) -> np.ndarray:
+    """
+    报告期转换为 年*12+月，便于按月数查找上一年同期、上一财年末和相邻季度
+    """
+    parsed = pd.to_datetime(pd.Series(dates, dtype=object))
+    return (parsed.dt.year * 12 + parsed.dt.month).to_numpy()
+
+
+def _ttm_terms(ordinals: np.ndarray, cumulative: bool, fiscal_year_end: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    每期 TTM 的加项、减项所在的列，TTM = sum(加项) - sum(减项)
+
+    累计值: 年报即 TTM；其余期 TTM = 本期累计 + 上一财年年报 - 上一年同期累计。
+    单季值: 连续4个季度相加，缺少任一季度时为缺失。
+    列号 n 表示0，n+1 表示缺失(n 为期数)，缺失会传播到结果。
+    """
+    n = len(ordinals)
+    zero, missing = n, n + 1
+    column_of = {int(ordinal): i for i, ordinal in reversed(list(enumerate(ordinals)))}
+    plus = np.empty((n, 4), dtype=int)
+    minus = np.empty((n, 1), dtype=int)
+    for i, ordinal in enumerate(ordinals):
+        if cumulative:
+            # 本财年已经过的月数，年报为12
+            elapsed = (ordinal % 12 - fiscal_year_end - 1) % 12 + 1
+            if elapsed == 12:
+                plus[i] = (i, zero, zero, zero)
+                minus[i] = zero
+            else:
+                plus[i] = (i, column_of.get(ordinal - elapsed, missing), zero, zero)
+                minus[i] = column_of.get(ordinal - 12, missing)
+        else:
+            plus[i] = [i] + [column_of.get(ordinal - 3 * k, missing) for k in (1, 2, 3)]
+            minus[i] = zero
+    return plus, minus
+
+
+def calc_ttm(market: str, balance_sheet: Statement, income_statement: Statement,
+             cash_flow_statement: Statement, fiscal_year_end: int = 12,
+             limit: Optional[int] = TTM_PERIODS) -> Dict[str, Any]:
+    """
+    由季度报表计算滚动12个月(TTM)的营收、净利润、自由现金流、每股收益，以及每股净资产
+
+    所有流量字段组成一个矩阵，按 _ttm_terms 给出的列一次取数相加，不逐期循环计算。
+    结果只取决于报表，与比率一样按报表版本缓存，用 reprice_ttm 套用股价。
+
+    Args:
+        market: cn, hk 或 us
+        balance_sheet: 资产负债表，应包含全部季度及年报，TTM 需要上一年同期和上一财年年报
+        income_statement: 利润表
+        cash_flow_statement: 现金流量表
+        fiscal_year_end: 财年结束的月份，仅对累计值的市场有效
+        limit: 输出的期数，None 表示全部
+    Returns:
+        dict: {"report_date": 按倒序排列的报告期(YYYY-MM-DD), "revenue_ttm", "net_income_ttm",
+            "free_cash_flow_ttm", "eps_ttm", "book_value_per_share": 按期倒序的列表}
+    """
+    dates, fields = load_fields(market, balance_sheet, income_statement, cash_flow_statement)
+    fields["free_cash_flow"] = fields["operating_cash_flow"] - np.nan_to_num(fields["capex"])
+    ordinals = _month_ordinals(dates)
+    flows = TTM_FLOWS[market]
+    periods = len(dates)
+    matrix = np.hstack([np.vstack([fields[name] for name in flows]).reshape(len(flows), periods),
+                        np.zeros((len(flows), 1)), np.full((len(flows), 1), np.nan)])
+    plus, minus = _ttm_terms(ordinals, market in CUMULATIVE_MARKETS, fiscal_year_end)
+    ttm = matrix[:, plus].sum(axis=2) - matrix[:, minus].sum(axis=2)
+    values = dict(zip(flows, ttm))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        shares = np.where(fields["shares"] > 0, fields["shares"], np.nan) if "shares" in fields else np.full(periods, np.nan)
+        if "eps" not in values:
+            values["eps"] = values["net_income"] / shares
+        book_value_per_share = fields["equity"] / shares
+
+    def output(row: np.ndarray, digits: Optional[int] = None) -> List[Optional[float]]:
+        row = row[:limit] if limit is not None else row
+        return [None if value != value else (round(value, digits) if digits is not None else value)
+                for value in row.tolist()]
+
+    report_dates = pd.to_datetime(pd.Series(dates, dtype=object)).dt.strftime("%Y-%m-%d").tolist()
+    return {
+        "report_date": report_dates[:limit] if limit is not None else report_dates,
+        "revenue_ttm": output(values["total_revenue"]),
+        "net_income_ttm": output(values["net_income"]),
+        "free_cash_flow_ttm": output(values["free_cash_flow"]),
+        "eps_ttm": output(values["eps"], 4),
+        "book_value_per_share": output(book_value_per_share, 4),
+    }
+
+
+def reprice_ttm(ttm: Dict[str, Any], stock_price: Optional[float]) -> Dict[str, Any]:
+    """
+    在 TTM 数据上套用当前股价，得到 pe_ttm、pb_ttm，返回新的字典，不与 ttm 共享列表
+    """
+    result = _copy_lists(ttm)
+    for key, name in (("pe_ttm", "eps_ttm"), ("pb_ttm", "book_value_per_share")):
+        basis = ttm.get(name) or []
+        result[key] = [round(stock_price / value, 2) if stock_price is not None and value else None for value in basis]
+    return result
+
+
+def ttm_per_share(ttm: Dict[str, Any], dates: List[str]) -> Dict[str, List[Optional[float]]]:
+    """
+    按报告期取出 TTM 每股收益和每股净资产，用于替换季报的每股指标，使季报的市盈率、市净率按 TTM 计算
+
+    Args:
+        ttm: calc_ttm 的结果(输出的期数应覆盖 dates)
+        dates: 季报比率的报告期
+    Returns:
+        {"eps": [...], "book_value_per_share": [...]}，与 dates 一一对应
+    """
+    index = {date: i for i, date in enumerate(ttm["report_date"])}
+    positions = [index.get(str(pd.Timestamp(date).date())) for date in dates]
+    return {name: [ttm[key][i] if i is not None else None for i in positions]
+            for name, key in (("eps", "eps_ttm"), ("book_value_per_share", "book_value_per_share"))}
+
+
+def defined(values: Optional[Sequence[Optional[float]]]) -> List[float]:
+    """
+    去掉比率列表中的 None，用于求均值、中位数等统计量
+    """
+    return [value for value in (values or []) if value is not None]
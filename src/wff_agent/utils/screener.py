@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+"""
+全市场选股
+
+对市场求值筛选表达式，如 "RSI < 30 and close > MA200 and PE < 15"，返回排名靠前的股票。
+
+行情快照条件覆盖全市场；技术指标条件需要逐只读取日线，默认只对通过快照条件、
+成交额最大的 MAX_BAR_SYMBOLS(300) 只股票求值，其余股票视为不满足，并在返回信息中标明截断。
+
+表达式只允许比较、and/or/not、四则运算、数字和字段名，用 ast 解析后求值，不执行任意代码。
+字段分三层，按代价从低到高依次求值，每一层只用已经可以计算的 and 子条件剪枝:
+
+    spot        全市场行情快照中的列(一次请求)，如 close, PE, PB
+    indicator   技术指标(需要日线)，只为通过 spot 条件的股票读取日线，
+                并且只计算表达式引用的指标及其依赖
+    fundamental 本地已缓存财报中的比率(不回源)，未缓存的股票该字段为空，条件不成立
+"""
+import ast
+import logging
+import operator
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+import pandas as pd
+
+from wff_agent.datasource import akshare_request as ak_request
+from wff_agent.utils import indicator_engine, stock_utils
+
+log = logging.getLogger(__name__)
+
+LAYER_SPOT = "spot"
+LAYER_INDICATOR = "indicator"
+LAYER_FUNDAMENTAL = "fundamental"
+LAYERS = [LAYER_SPOT, LAYER_INDICATOR, LAYER_FUNDAMENTAL]
+
+# 行情快照字段，值为各市场快照中的候选列名，取第一个存在的
+SPOT_FIELDS: Dict[str, List[str]] = {
+    "CLOSE": ["最新价"],
+    "CHANGE_PCT": ["涨跌幅"],
+    "VOLUME": ["成交量"],
+    "AMOUNT": ["成交额"],
+    "AMPLITUDE": ["振幅"],
+    "TURNOVER": ["换手率"],
+    "VOLUME_RATIO": ["量比"],
+    "PE": ["市盈率-动态", "市盈率"],
+    "PB": ["市净率"],
+    "MARKET_CAP": ["总市值"],
+    "FLOAT_MARKET_CAP": ["流通市值"],
+    "CHANGE_60D": ["60日涨跌幅"],
+    "CHANGE_YTD": ["年初至今涨跌幅"],
+}
+# 财报字段，目前只有A股的本地财报缓存可以直接读取
+FUNDAMENTAL_FIELDS = ["ROE", "GROSS_MARGIN", "DEBT_RATIO", "REVENUE_GROWTH"]
+FUNDAMENTAL_MARKETS = ["cn"]
+
+DEFAULT_TOP_N = 20
+# 需要日线的条件默认最多对这么多只股票求值，超过时按成交额保留流动性最好的。
+# 不默认覆盖全部A股: 面板计算本身很快，但日线未缓存时每只股票都要回源，冷启动下全市场要数千次请求
+MAX_BAR_SYMBOLS = 300
+# 并行读取日线的线程数，上游并发仍由数据源调度器限制
+BAR_WORKERS = 8
+
+_COMPARE_OPS: Dict[type, Callable] = {
+    ast.Lt: operator.lt, ast.LtE: operator.le, ast.Gt: operator.gt,
+    ast.GtE: operator.ge, ast.Eq: operator.eq, ast.NotEq: operator.ne,
+}
+_BIN_OPS: Dict[type, Callable] = {
+    ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul, ast.Div: operator.truediv,
+}
+
+
+def field_layer(name: str) -> str:
+    """
+    字段所在的数据层，字段名不区分大小写
+
+    Args:
+        name: 字段名
+    Returns:
+        spot, indicator 或 fundamental
+    """
+    name = name.upper()
+    if name in SPOT_FIELDS:
+        return LAYER_SPOT
+    if name in indicator_engine.INDICATOR_COLUMNS:
+        return LAYER_INDICATOR
+    if name in FUNDAMENTAL_FIELDS:
+        return LAYER_FUNDAMENTAL
+    available = list(SPOT_FIELDS) + indicator_engine.INDICATOR_COLUMNS + FUNDAMENTAL_FIELDS
+    raise ValueError(f"未知的选股字段: {name}，可选: {', '.join(available)}")
+
+
+def parse_expression(expression: str) -> ast.AST:
+    """
+    解析并校验筛选表达式
+
+    Args:
+        expression: 如 "RSI < 30 and close > MA200 and PE < 15"
+    Returns:
+        表达式的语法树
+    """
+    try:
+        tree = ast.parse(expression.strip(), mode="eval").body
+    except SyntaxError as e:
+        raise ValueError(f"选股表达式语法错误: {expression}, {e.msg}")
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name):
+            field_layer(node.id)
+        elif isinstance(node, ast.Constant):
+            if isinstance(node.value, bool) or not isinstance(node.value, (int, float)):
+                raise ValueError(f"选股表达式只支持数字常量: {node.value!r}")
+        elif isinstance(node, ast.BinOp):
+            if type(node.op) not in _BIN_OPS:
+                raise ValueError(f"选股表达式不支持的运算: {type(node.op).__name__}")
+        elif isinstance(node, ast.UnaryOp):
+            if not isinstance(node.op, (ast.Not, ast.USub, ast.UAdd)):
+                raise ValueError(f"选股表达式不支持的运算: {type(node.op).__name__}")
+        elif isinstance(node, ast.Compare):
+            if any(type(op) not in _COMPARE_OPS for op in node.ops):
+                raise ValueError("选股表达式只支持 <, <=, >, >=, ==, != 比较")
+        elif not isinstance(node, (ast.BoolOp, ast.And, ast.Or, ast.Load, ast.cmpop, ast.operator, ast.unaryop)):
+            raise ValueError(f"选股表达式不支持: {type(node).__name__}")
+    return tree
+
+
+def referenced_fields(node: ast.AST) -> Set[str]:
+    """表达式引用的字段，统一为大写"""
+    return {child.id.upper() for child in ast.walk(node) if isinstance(child, ast.Name)}
+
+
+def _conjuncts(tree: ast.AST) -> List[ast.AST]:
+    # 顶层 and 拆成可以分别剪枝的子条件
+    if isinstance(tree, ast.BoolOp) and isinstance(tree.op, ast.And):
+        return [part for value in tree.values for part in _conjuncts(value)]
+    return [tree]
+
+
+def evaluate(node: ast.AST, frame: pd.DataFrame) -> Any:
+    """
+    在 frame 上向量化地求值，比较中的缺失值视为不成立
+
+    Args:
+        node: parse_expression 返回的语法树
+        frame: 以字段名(大写)为列的数据
+    Returns:
+        数值或布尔数组
+    """
+    if isinstance(node, ast.Name):
+        return frame[node.id.upper()].to_numpy(dtype=float)
+    if isinstance(node, ast.Constant):
+        return float(node.value)
+    if isinstance(node, ast.BinOp):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return _BIN_OPS[type(node.op)](evaluate(node.left, frame), evaluate(node.right, frame))
+    if isinstance(node, ast.UnaryOp):
+        operand = evaluate(node.operand, frame)
+        if isinstance(node.op, ast.Not):
+            return ~_as_mask(operand, len(frame))
+        return -operand if isinstance(node.op, ast.USub) else operand
+    if isinstance(node, ast.BoolOp):
+        masks = [_as_mask(evaluate(value, frame), len(frame)) for value in node.values]
+        reduce = np.logical_and.reduce if isinstance(node.op, ast.And) else np.logical_or.reduce
+        return reduce(masks)
+    if isinstance(node, ast.Compare):
+        result = np.ones(len(frame), dtype=bool)
+        left = evaluate(node.left, frame)
+        for op, comparator in zip(node.ops, node.comparators):
+            right = evaluate(comparator, frame)
+            with np.errstate(invalid="ignore"):
+                result &= np.broadcast_to(_COMPARE_OPS[type(op)](left, right), len(frame))
+            left = right
+        return result
+    raise ValueError(f"选股表达式不支持: {type(node).__name__}")
+
+
+def _as_mask(value: Any, length: int) -> np.ndarray:
+    if isinstance(value, np.ndarray) and value.dtype == bool:
+        return value
+    # 数值作为条件时非0且非缺失为真
+    value = np.broadcast_to(np.asarray(value, dtype=float), length)
+    return np.nan_to_num(value, nan=0.0) != 0
+
+
+def _spot_frame(spot: pd.DataFrame, market: str, fields: Set[str]) -> pd.DataFrame:
+    frame = pd.DataFrame({"代码": spot["代码"].astype(str), "名称": spot.get("名称")})
+    for field in fields:
+        column = next((col for col in SPOT_FIELDS[field] if col in spot.columns), None)
+        if column is None:
+            raise ValueError(f"{market} 市场的行情快照没有字段: {field}")
+        frame[field] = pd.to_numeric(spot[column], errors="coerce")
+    return frame.reset_index(drop=True)
+
+
+def _load_bars(symbols: List[str], market: str, bars: int) -> Dict[str, pd.DataFrame]:
+    start_date = stock_utils.history_start_date(bars)
+
+    def load(symbol: str) -> Optional[pd.DataFrame]:
+        try:
+            return ak_request.get_stock_history(symbol, market, start_date=start_date).sort_index()
+        except Exception as e:
+            log.warning(f"选股读取日线失败: {symbol}, {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=BAR_WORKERS) as executor:
+        histories = dict(zip(symbols, executor.map(load, symbols)))
+    return {symbol: df for symbol, df in histories.items() if df is not None and not df.empty}
+
+
+def _indicator_frame(symbols: List[str], market: str, fields: Set[str]) -> pd.DataFrame:
+    """
+    读取日线并用面板计算最新一根K线上的所需指标
+    """
+    columns = indicator_engine.resolve(fields)
+    histories = _load_bars(symbols, market, indicator_engine.required_bars(columns))
+    dates, names, panel = indicator_engine.pivot_histories(histories)
+    if not names:
+        return pd.DataFrame(columns=columns, index=pd.Index([], name="代码"))
+    values = indicator_engine.compute_panel_indicators(panel["收盘"], panel["最高"], panel["最低"], panel["成交量"],
+                                                       indicators=columns)
+    snapshot = indicator_engine.latest_snapshot(dates, names, dict(values, 收盘=panel["收盘"]))
+    return snapshot[columns]
+
+
+def _report_fundamentals(reports: dict) -> Dict[str, float]:
+    # assign 返回新的报表，不修改缓存中的报表
+    income, balance = (reports[name].assign(报告日=pd.to_datetime(reports[name]["报告日"].astype(str)))
+                       for name in ("income_statement", "balance_sheet"))
+    income = income[income["报告日"].dt.month == 12].sort_values("报告日", ascending=False)
+    balance = balance[balance["报告日"].dt.month == 12].sort_values("报告日", ascending=False)
+    if income.empty or balance.empty:
+        return {}
+    latest_income, latest_balance = income.iloc[0], balance.iloc[0]
+
+    def ratio(part: Any, whole: Any) -> float:
+        part, whole = pd.to_numeric(part, errors="coerce"), pd.to_numeric(whole, errors="coerce")
+        return float(part / whole) if whole and not pd.isna(whole) else np.nan
+
+    result = {
+        "ROE": ratio(latest_income.get("净利润"), latest_balance.get("所有者权益(或股东权益)合计")),
+        "GROSS_MARGIN": 1 - ratio(latest_income.get("营业成本"), latest_income.get("营业收入")),
+        "DEBT_RATIO": ratio(latest_balance.get("负债合计"), latest_balance.get("资产总计")),
+        "REVENUE_GROWTH": np.nan,
+    }
+    if len(income) > 1:
+        result["REVENUE_GROWTH"] = ratio(latest_income.get("营业总收入"), income.iloc[1].get("营业总收入")) - 1
+    return result
+
+
+def _fundamental_frame(symbols: List[str], market: str) -> pd.DataFrame:
+    """
+    读取本地已缓存财报计算的比率，未缓存的股票为空
+    """
+    rows = {}
+    if market in FUNDAMENTAL_MARKETS:
+        for symbol in symbols:
+            reports = ak_request.get_cached_financial_report_cn(symbol)
+            if reports is None:
+                continue
+            try:
+                rows[symbol] = _report_fundamentals(reports)
+            except Exception as e:
+                log.warning(f"选股计算财报比率失败: {symbol}, {e}")
+    frame = pd.DataFrame.from_dict(rows, orient="index", columns=FUNDAMENTAL_FIELDS)
+    frame.index.name = "代码"
+    return frame
+
+
+def screen(expression: str, market: str, top_n: int = DEFAULT_TOP_N, sort_by: Optional[str] = None,
+           ascending: bool = False, max_bar_symbols: int = MAX_BAR_SYMBOLS) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """
+    全市场选股，技术指标条件默认只对成交额最大的 max_bar_symbols 只候选股票求值
+
+    Args:
+        expression: 筛选表达式，如 "RSI < 30 and close > MA200 and PE < 15"
+        market: 市场, us, cn, hk
+        top_n: 返回的股票数
+        sort_by: 排序字段，默认按成交额(AMOUNT)，快照中没有成交额时按代码
+        ascending: 是否升序
+        max_bar_symbols: 技术指标条件最多对这么多只股票求值，超过时按成交额保留流动性最好的
+    Returns:
+        (代码、名称和表达式引用的字段，最多 top_n 行,
+         {"indicator_candidates": 需要计算技术指标的候选数, "indicator_evaluated": 实际计算的股票数})，
+        不需要技术指标时两者都为 None
+    """
+    if max_bar_symbols < 1:
+        raise ValueError(f"max_bar_symbols 必须大于0: {max_bar_symbols}")
+    market = market.lower()
+    tree = parse_expression(expression)
+    fields = referenced_fields(tree)
+    if sort_by:
+        sort_by = sort_by.upper()
+        fields.add(sort_by)
+        field_layer(sort_by)
+    by_layer = {layer: {field for field in fields if field_layer(field) == layer} for layer in LAYERS}
+    spot = ak_request.get_market_spot(market)
+    if "AMOUNT" not in by_layer[LAYER_SPOT] and any(col in spot.columns for col in SPOT_FIELDS["AMOUNT"]):
+        by_layer[LAYER_SPOT].add("AMOUNT")
+    frame = _spot_frame(spot, market, by_layer[LAYER_SPOT])
+
+    pending = _conjuncts(tree)
+    available: Set[str] = set()
+    info: Dict[str, Any] = {"indicator_candidates": None, "indicator_evaluated": None}
+    for layer in LAYERS:
+        available |= by_layer[layer]
+        if layer == LAYER_INDICATOR and by_layer[layer]:
+            info["indicator_candidates"] = len(frame)
+            if len(frame) > max_bar_symbols:
+                log.warning(f"选股候选 {len(frame)} 只，只对成交额最大的 {max_bar_symbols} 只计算技术指标")
+                order = frame["AMOUNT"] if "AMOUNT" in frame.columns else pd.Series(0, index=frame.index)
+                frame = frame.loc[order.sort_values(ascending=False).index[:max_bar_symbols]]
+            info["indicator_evaluated"] = len(frame)
+            indicators = _indicator_frame(frame["代码"].tolist(), market, by_layer[layer])
+            frame = frame.join(indicators, on="代码", how="inner")
+        elif layer == LAYER_FUNDAMENTAL and by_layer[layer]:
+            fundamentals = _fundamental_frame(frame["代码"].tolist(), market)
+            frame = frame.join(fundamentals[sorted(by_layer[layer])], on="代码", how="left")
+        ready = [part for part in pending if referenced_fields(part) <= available]
+        pending = [part for part in pending if part not in ready]
+        for part in ready:
+            frame = frame[evaluate(part, frame)]
+        log.info(f"选股 {layer} 层筛选后剩余 {len(frame)} 只")
+
+    sort_column = sort_by or ("AMOUNT" if "AMOUNT" in frame.columns else "代码")
+    frame = frame.sort_values(sort_column, ascending=ascending if sort_by else sort_column == "代码")
+    columns = ["代码", "名称"] + sorted(fields) + (["AMOUNT"] if "AMOUNT" not in fields and "AMOUNT" in frame.columns else [])
+    return frame[columns].head(top_n).reset_index(drop=True), info
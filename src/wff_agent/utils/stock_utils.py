@@ -1,79 +1,89 @@
 # -*- coding: utf-8 -*-
+import datetime
 import logging
+import math
 import pandas as pd
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
 from wff_agent.datasource import akshare_request as ak_request, news_request
 from wff_agent.datasource import alpha_v_request as av_request
 from wff_agent.datasource import file_lru_cache as lru_cache
+from wff_agent.datasource import price_store
+from wff_agent.datasource import replay
+from wff_agent.utils import indicator_engine, indicator_memo, indicator_stream, payload_codec
 log = logging.getLogger(__name__)
 
-def get_market_indicators(symbol: str, market: str, windows_size:int=50) -> Dict[str, Any]:
+# 换算K线数与自然日时按每年约240个交易日，另留出长假的余量
+TRADING_DAYS_PER_YEAR = 240
+HOLIDAY_BUFFER_DAYS = 15
+
+def history_start_date(bars: int, period: str = "daily") -> str:
     """
-    获取市场指标
+    把所需的K线数换算为历史行情的开始日期
     """
-    log.info(f"开始获取市场指标: {symbol}, {market}")
-    df = ak_request.get_stock_history(symbol, market)
-    if df is None:
-        log.error(f"获取历史数据失败: {symbol}")
-        return {"error": f"""param history is None"""}
-    # 计算市场指标
-    df.sort_values(by="日期", inplace=True, ascending=True)
+    trading_days = bars * price_store.trading_days_per_bar(period)
+    days = math.ceil(trading_days * 365 / TRADING_DAYS_PER_YEAR) + HOLIDAY_BUFFER_DAYS
+    return (replay.now() - datetime.timedelta(days=days)).strftime("%Y%m%d")
+
+def _encode_indicators(df: pd.DataFrame, encoding: str, max_points: Optional[int]) -> str:
+    if max_points is not None and len(df) > max_points:
+        df = payload_codec.downsample_lttb(df, max_points)
+    return payload_codec.encode_frame(df, encoding)
+
+def get_market_indicators(symbol: str, market: str, windows_size:int=50,
+                          indicators: Optional[List[str]] = None, period: str = "daily",
+                          encoding: Optional[str] = None, max_points: Optional[int] = None) -> Dict[str, Any]:
+    """
+    获取市场指标
+
+    Args:
+        symbol: 股票代码
+        market: 市场, us, cn, hk
+        windows_size: 返回最近的K线数
+        indicators: 指标或指标组名称，如 ["MACD", "RSI"]，None 表示全部
+        period: K线周期，daily, weekly, monthly, quarterly 或 N日线(如 5d)，由本地日线聚合
+        encoding: 载荷编码 records, columnar 或 compact，None 时按 WFF_TOOL_ENCODINGS 配置，默认 records
+        max_points: 窗口超过该行数时按收盘价形状(LTTB)降采样，None 表示不降采样
+    Returns:
+        指标数据的JSON，records 编码时每根K线一条记录
+    """
+    log.info(f"开始获取市场指标: {symbol}, {market}, {indicators}, {period}")
+    symbol, market, period = symbol.upper(), market.lower(), period.lower()
+    if windows_size < 1:
+        raise ValueError(f"windows_size 必须大于0: {windows_size}")
+    columns = indicator_engine.resolve(indicators)
+    encoding = payload_codec.tool_encoding("GetMarketIndicators", encoding)
+    # 最新K线未变化时直接返回之前的计算结果
+    last_bar = price_store.peek_last_bar(symbol, market)
+    if last_bar is not None:
+        cached = indicator_memo.get(indicator_memo.make_key(symbol, market, last_bar, columns, windows_size, period))
+        if cached is not None:
+            log.info(f"命中市场指标缓存: {symbol}, {market}, {last_bar[0]}")
+            return _encode_indicators(cached, encoding, max_points)
+    # 只拉取所请求指标及返回窗口需要的K线
+    bars = indicator_engine.required_bars(columns) + windows_size - 1
+    df = ak_request.get_stock_history(symbol, market, period=period, start_date=history_start_date(bars, period))
     if df is None:
         log.error(f"获取历史数据失败: {symbol}")
         return {"error": f"""param history is None"""}
-    # 计算市场指标
-    df["MA5"] = df["收盘"].rolling(window=5).mean()
-    df["MA20"] = df["收盘"].rolling(window=20).mean()
-    df["MA60"] = df["收盘"].rolling(window=60).mean()
-    df["MA50"] = df["收盘"].rolling(window=120).mean() #50日均线，牛熊指标 
-    df["MA200"] = df["收盘"].rolling(window=240).mean()#200日均线, 牛熊指标
-    #计算EMA
-    df["EMA9"] = df["收盘"].ewm(span=9, adjust=False).mean()
-    df["EMA12"] = df["收盘"].ewm(span=12, adjust=False).mean()
-    df["EMA21"] = df["收盘"].ewm(span=21, adjust=False).mean()
-    df["EMA26"] = df["收盘"].ewm(span=26, adjust=False).mean()
-    df["EMA50"] = df["收盘"].ewm(span=50, adjust=False).mean()
-
-    
-    #计算MACD
-    df["DIF"] = df["EMA12"] - df["EMA26"] #快线
-    df["DEA"] = df["DIF"].ewm(span=9, adjust=False).mean() #慢线
-    df["MACD"] = 2 * (df["DIF"] - df["DEA"]) #柱状图
-    #计算KDJ
-    df["RSV"] = (df["收盘"] - df["最低"].rolling(window=9).min()) / (df["最高"].rolling(window=9).max() - df["最低"].rolling(window=9).min()) * 100
-    df["K"] = df["RSV"].ewm(span=3, adjust=False).mean()
-    df["D"] = df["K"].ewm(span=3, adjust=False).mean()
-    df["J"] = 3 * df["K"] - 2 * df["D"]
-    #计算RSI
-    # 计算价格变化
-    delta = df["收盘"].diff()
-    # 分别获取上涨和下跌
-    gain = (delta.where(delta > 0, 0)).rolling(window=14).mean()
-    loss = (-delta.where(delta < 0, 0)).rolling(window=14).mean()
-    # 计算相对强度
-    rs = gain / loss
-    # 计算RSI
-    df["RSI"] = 100 - (100 / (1 + rs))
-    #计算BOLL
-    df["BOLL"] = df["收盘"].rolling(window=20).mean()
-    df["BOLL_UP"] = df["BOLL"] + 2 * df["收盘"].rolling(window=20).std()
-    df["BOLL_DOWN"] = df["BOLL"] - 2 * df["收盘"].rolling(window=20).std()
-    #计算OBV
-    df["OBV"] = (df["成交量"].where(df["收盘"].diff() > 0, 0).rolling(window=20).sum() - df["成交量"].where(df["收盘"].diff() < 0, 0).rolling(window=20).sum()) / df["成交量"].rolling(window=20).sum()
-    # 只保留需要的列, 把日期作为索引
-    df = df[['开盘', '收盘', '最高', '最低', '成交量', 
-             'MA5', 'MA20', 'MA60', "MA50", 'MA200', 
-             'EMA9', 'EMA12', 'EMA50', 'K','D','J', 
-             'RSI',  'DIF', 'DEA', 'MACD', 'BOLL', 'BOLL_UP', 'BOLL_DOWN', 'OBV']].tail(windows_size)
+    df = df.sort_values(by="日期", ascending=True)
+    # 计算市场指标，只保留需要的列
+    if columns == indicator_engine.INDICATOR_COLUMNS and period == "daily":
+        # 日线的全部指标用检查点增量推进新的K线
+        df = indicator_stream.get_indicator_frame(symbol, market, df).tail(windows_size)
+    else:
+        df = indicator_engine.calc_market_indicators(df, columns).tail(windows_size)
     
     # 重置索引，将日期作为列
     df = df.reset_index()
     # 将日期转换成字符串
     df["日期"] = df["日期"].astype(str)
     # 转换为JSON，每个对象包含日期属性
-    json_data = df.to_json(force_ascii=False, orient="records")
+    json_data = _encode_indicators(df, encoding, max_points)
     log.info(f"获取市场指标: {symbol}, {market}, {windows_size}, {json_data}")
+    last_bar = price_store.peek_last_bar(symbol, market)
+    if last_bar is not None:
+        indicator_memo.put(indicator_memo.make_key(symbol, market, last_bar, columns, windows_size, period), df)
     return json_data
 
 def get_global_market_indicators() -> Dict[str, Any]:
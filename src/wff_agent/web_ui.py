@@ -16,6 +16,7 @@ import json
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from wff_agent.agent_client import main as run_agent_analysis
+from wff_agent.utils import fin_reports_utils
 from wff_agent.utils.stock_utils import is_valid_symbol
 
 # 配置日志
@@ -249,6 +250,14 @@ class StockAnalysisWebUI:
                             label="全球市场分析报告"
                         )
                     
+                    with gr.TabItem("📐 DCF敏感性"):
+                        gr.Markdown("以当前折现率、增长率为中心计算内在价值敏感性表，直接使用缓存的财报数据，无需运行分析")
+                        dcf_sensitivity_btn = gr.Button("📐 计算DCF敏感性", variant="secondary")
+                        dcf_sensitivity_result = gr.Markdown(
+                            value="点击按钮计算...",
+                            label="DCF敏感性表"
+                        )
+                    
                     with gr.TabItem("⚙️ 当前设置"):
                         settings_display = gr.JSON(
                             value={},
@@ -365,6 +374,22 @@ class StockAnalysisWebUI:
                     log.error(f"单项分析失败: {e}", exc_info=True)
                     return error_msg
             
+            def run_dcf_sensitivity(symbol, market, discount_rate, growth_rate, total_shares):
+                """计算DCF敏感性表"""
+                if not symbol or not is_valid_symbol(symbol, market):
+                    return "❌ 股票代码无效，请先验证"
+                try:
+                    result = fin_reports_utils.get_dcf_sensitivity(
+                        symbol, market,
+                        shares_num=total_shares or None,
+                        discount_rate=discount_rate,
+                        growth_rate=growth_rate
+                    )
+                    return fin_reports_utils.dcf_sensitivity_markdown(result)
+                except Exception as e:
+                    log.error(f"DCF敏感性计算失败: {e}", exc_info=True)
+                    return f"❌ DCF敏感性计算失败: {str(e)}"
+            
             def update_results():
                 """更新结果显示"""
                 if not self.analysis_results:
@@ -435,6 +460,13 @@ class StockAnalysisWebUI:
                 outputs=[comprehensive_result, technical_result, fundamental_result, news_result, global_result]
             )
             
+            # DCF敏感性
+            dcf_sensitivity_btn.click(
+                fn=run_dcf_sensitivity,
+                inputs=[symbol_input, market_dropdown, discount_rate_input, growth_rate_input, total_shares_input],
+                outputs=[dcf_sensitivity_result]
+            )
+            
             # 单项分析
             single_analysis_btn.click(
                 fn=lambda: gr.Dropdown(visible=True),
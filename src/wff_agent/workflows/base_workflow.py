@@ -1,28 +1,44 @@
+import asyncio
 import logging
 import os
 from typing import Dict, Any, List, Callable, Optional
 from abc import ABC, abstractmethod
 
+from wff_agent.agents import llm_cache, mcp_session
 from wff_agent.agents.base_agent import AnalysisAgent
 
 log = logging.getLogger(__name__)
 
+CONCURRENCY_ENV = "WFF_WORKFLOW_CONCURRENCY"
+# 同时执行的步骤数上限
+DEFAULT_CONCURRENCY = 4
+
 class WorkflowStep:
     """工作流步骤"""
-    def __init__(self, name: str, agent: AnalysisAgent, system_prompt: str):
+    def __init__(self, name: str, agent: AnalysisAgent, system_prompt: str,
+                 depends_on: Optional[List[str]] = None):
+        """
+        Args:
+            name (str): 步骤名称，同时是 context 中保存输出的键
+            agent (AnalysisAgent): 执行步骤的 Agent
+            system_prompt (str): 系统提示
+            depends_on (List[str]): 依赖的步骤名称，这些步骤结束(无论成功失败)后才开始执行
+        """
         self.name = name
         self.agent = agent
         self.system_prompt = system_prompt
+        self.depends_on = list(depends_on or [])
         self.result = None
 
 class Workflow(ABC):
     """工作流基类"""
     
-    def __init__(self, progress_callback: Optional[Callable] = None):
+    def __init__(self, progress_callback: Optional[Callable] = None, max_concurrency: Optional[int] = None):
         self.steps: List[WorkflowStep] = []
         self.results: Dict[str, Any] = {}
         self.context: Dict[str, Any] = {}
         self.progress_callback = progress_callback
+        self.max_concurrency = max_concurrency or int(os.getenv(CONCURRENCY_ENV, DEFAULT_CONCURRENCY))
         
     @abstractmethod
     def setup_steps(self):
@@ -34,6 +50,23 @@ class Workflow(ABC):
         """合并所有步骤的结果"""
         pass
     
+    def validate_steps(self):
+        """检查步骤名称不重复、依赖的步骤存在且没有循环依赖"""
+        names = [step.name for step in self.steps]
+        if len(set(names)) != len(names):
+            raise ValueError(f"工作流步骤名称重复: {names}")
+        for step in self.steps:
+            unknown = [name for name in step.depends_on if name not in names]
+            if unknown:
+                raise ValueError(f"步骤 {step.name} 依赖的步骤不存在: {unknown}")
+        pending = {step.name: set(step.depends_on) for step in self.steps}
+        while pending:
+            ready = [name for name, deps in pending.items() if not deps & pending.keys()]
+            if not ready:
+                raise ValueError(f"工作流步骤存在循环依赖: {sorted(pending)}")
+            for name in ready:
+                del pending[name]
+    
     def update_progress(self, step_name: str, message: str, result: str = "", status: str = "completed"):
         """更新进度回调"""
         if self.progress_callback:
@@ -44,6 +77,10 @@ class Workflow(ABC):
     
     async def execute(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
         """执行工作流
+
+        步骤按 depends_on 组成有向无环图，依赖的步骤全部结束后即可开始，
+        同时执行的步骤不超过 max_concurrency(环境变量 WFF_WORKFLOW_CONCURRENCY，默认4)。
+        每个步骤使用输入数据的副本，步骤之间只通过 context 传递输出。
         
         Args:
             input_data (Dict[str, Any]): 输入数据
@@ -54,50 +91,79 @@ class Workflow(ABC):
         
         # 设置步骤
         self.setup_steps()
-        
-        # 执行每个步骤
-        for step in self.steps:
-            log.info(f"\n ##########开始执行步骤: {step.name}...")
+        self.validate_steps()
+        semaphore = asyncio.Semaphore(max(1, self.max_concurrency))
+        finished = {step.name: asyncio.Event() for step in self.steps}
+
+        async def run(step: WorkflowStep):
             try:
-                # 通知开始执行步骤
-                self.update_progress(step.name, f"开始执行 {step.name}...", None, "started")
-                
-                input_data = step.agent.prepare_input(input_data, self.context)
-                user_prompt = step.agent.get_user_prompt(input_data, self.context)
-                log.info(f"\n ##########执行步骤: {step.name} 的输入数据: {input_data}")
+                for name in step.depends_on:
+                    await finished[name].wait()
+                async with semaphore:
+                    await self.execute_step(step, dict(input_data))
+            finally:
+                finished[step.name].set()
+        
+        # 所有步骤共用同一组 MCP 服务器会话，服务器数与同时执行的步骤数相同，工作流结束时关闭
+        async with mcp_session.session_scope(self.max_concurrency):
+            await asyncio.gather(*(run(step) for step in self.steps))
+        
+        # 合并结果
+        final_result = self.combine_results()
+        log.info("工作流执行完成")
+        
+        return final_result
+
+    async def execute_step(self, step: WorkflowStep, input_data: Dict[str, Any]):
+        """执行单个步骤，失败时输出记为 ERROR，不影响其他步骤
+
+        Args:
+            step (WorkflowStep): 工作流步骤
+            input_data (Dict[str, Any]): 本步骤专用的输入数据副本
+        """
+        log.info(f"\n ##########开始执行步骤: {step.name}...")
+        error = None
+        try:
+            # 通知开始执行步骤
+            self.update_progress(step.name, f"开始执行 {step.name}...", None, "started")
+            
+            # 准备输入会读取行情和报表，在线程中执行，不阻塞其他步骤
+            input_data = await asyncio.to_thread(step.agent.prepare_input, input_data, self.context)
+            user_prompt = step.agent.get_user_prompt(input_data, self.context)
+            log.info(f"\n ##########执行步骤: {step.name} 的输入数据: {input_data}")
+            with llm_cache.track() as cache_usage:
                 result = await step.agent.execute_with_session(
                     system_prompt=step.system_prompt,
                     user_message_prompt=user_prompt,
                     input=input_data
                 )
-                
+            if result is None:
+                raise ValueError(f"步骤 {step.name} 没有返回结果")
+            
+            self.context[step.name] = {
+                "output": result
+            }
+            step.result = result
+            self.results[step.name] = result
+            log.info(f"\n ##########步骤 {step.name} 执行完成, 输出: {result}")
+            step.agent.after_ai_execute(result, input_data)
+            
+            # 通知步骤完成，注明 LLM 响应缓存的命中次数
+            message = f"{step.name} 执行完成"
+            if cache_usage["hits"]:
+                message += f"(LLM缓存命中 {cache_usage['hits']}/{cache_usage['lookups']} 次)"
+            self.update_progress(step.name, message, result, "completed")
+            
+        except Exception as e:
+            log.error(f"##########步骤 {step.name} 执行失败: {str(e)}", exc_info=True)
+            error = f"执行失败: {str(e)}"
+        finally:
+            if step.result is None:
+                log.error(f"##########步骤 {step.name} 执行失败, 结果设置为 ERROR")
                 self.context[step.name] = {
-                    "output": result
+                    "output": "ERROR"
                 }
-                step.result = result
-                self.results[step.name] = result
-                log.info(f"\n ##########步骤 {step.name} 执行完成, 输出: {result}")
-                step.agent.after_ai_execute(result, input_data)
-                
-                # 通知步骤完成
-                self.update_progress(step.name, f"{step.name} 执行完成", result, "completed")
-                
-            except Exception as e:
-                log.error(f"##########步骤 {step.name} 执行失败: {str(e)}", exc_info=True)
-                # 通知步骤失败
-                self.update_progress(step.name, f"执行失败: {str(e)}", "", "failed")
-            finally:
-                if step.result is None:
-                    log.error(f"##########步骤 {step.name} 执行失败, 结果设置为 ERROR")
-                    self.context[step.name] = {
-                        "output": "ERROR"
-                    }
-                    self.results[step.name] = "ERROR"
-                    # 通知步骤失败
-                    self.update_progress(step.name, "ERROR", "", "failed")
-        
-        # 合并结果
-        final_result = self.combine_results()
-        log.info("工作流执行完成")
-        
-        return final_result 
\ No newline at end of file
+                self.results[step.name] = "ERROR"
+            if step.result is None or error:
+                # 通知步骤失败，只通知一次
+                self.update_progress(step.name, error or "ERROR", "", "failed")
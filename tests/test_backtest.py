@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+from wff_agent.utils import backtest
+
+
+def test_no_crossover_on_first_bar():
+    fast = np.array([2.0, 3.0, 1.0, 3.0])
+    slow = np.array([1.0, 2.0, 2.0, 2.0])
+    buy, sell = backtest.ma_cross({"MA5": fast, "MA20": slow})
+    assert buy.tolist() == [False, False, False, True]
+    assert sell.tolist() == [False, False, True, False]
+
+
+def test_no_crossover_on_first_bar_below():
+    j = np.array([-5.0, -1.0, 2.0, -3.0])
+    buy, _ = backtest.kdj_extreme({"J": j})
+    assert buy.tolist() == [False, False, False, True]
+
+
+def test_positions_ignore_same_bar_signals():
+    buy = np.array([False, True, False, True, True, False])
+    sell = np.array([True, False, False, True, False, True])
+    assert backtest.positions(buy, sell).tolist() == [False, True, True, True, True, False]
+
+
+def test_evaluate_hand_computed():
+    close = np.array([10.0, 11.0, 12.0, 11.0, 13.0, 14.0, 12.0, 15.0])
+    buy = np.zeros(8, dtype=bool)
+    sell = np.zeros(8, dtype=bool)
+    buy[[1, 5]] = True
+    sell[3] = True
+    assert backtest.positions(buy, sell).tolist() == [False, True, True, False, False, True, True, True]
+    result = backtest.evaluate(close, buy, sell, horizon=2, fee=0.01)
+    # 第一笔 11 -> 11，第二笔 14 -> 15 期末未平仓按最后收盘价计
+    trades = np.array([0.0, 15 / 14 - 1]) - 0.01
+    assert result["signals"] == 2
+    assert result["signal_hit_rate"] == 0.5
+    assert result["signal_return"] == pytest.approx((15 / 14 - 1) / 2)
+    assert result["trades"] == 2
+    assert result["win_rate"] == 0.5
+    assert result["avg_trade_return"] == pytest.approx(trades.mean())
+    assert result["total_return"] == pytest.approx(np.prod(1 + trades) - 1)
+    assert result["exposure"] == 5 / 8
+
+
+def test_evaluate_without_signals():
+    result = backtest.evaluate(np.arange(1.0, 6.0), np.zeros(5, dtype=bool), np.zeros(5, dtype=bool))
+    assert result["signals"] == 0 and result["trades"] == 0
+    assert result["total_return"] == 0.0 and result["exposure"] == 0.0
+    assert np.isnan(result["win_rate"])
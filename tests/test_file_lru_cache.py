@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+import pytest
+
+from wff_agent.datasource import file_lru_cache as filecache
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.delenv("WFF_DATASOURCE_MODE", raising=False)
+    monkeypatch.setattr(filecache, "get_cache_dir", lambda: tmp_path)
+    filecache._memory.clear()
+    yield tmp_path
+    filecache._memory.clear()
+
+
+def make_report(state, lag_retry_seconds):
+    """probe 返回 state["probe"]，报表接口返回 state["upstream"] 期的数据"""
+    calls = []
+
+    @filecache.versioned("test_report", probe=lambda symbol: state["probe"],
+                         version_of=lambda data: data["period"], lag_retry_seconds=lag_retry_seconds)
+    def get_report(symbol):
+        calls.append(symbol)
+        return {"period": state["upstream"]}
+
+    return get_report, calls
+
+
+def test_versioned_reuses_current_data():
+    state = {"probe": "2024-09-30", "upstream": "2024-09-30"}
+    get_report, calls = make_report(state, lag_retry_seconds=0)
+    assert get_report("000001")["period"] == "2024-09-30"
+    assert get_report("000001")["period"] == "2024-09-30"
+    assert len(calls) == 1
+
+
+def test_versioned_refetches_while_statements_lag_probe():
+    state = {"probe": "2024-12-31", "upstream": "2024-09-30"}
+    get_report, calls = make_report(state, lag_retry_seconds=0)
+    assert get_report("000001")["period"] == "2024-09-30"
+    # 报表接口仍滞后，不能把旧数据当成最新版本
+    assert get_report("000001")["period"] == "2024-09-30"
+    assert len(calls) == 2
+    state["upstream"] = "2024-12-31"
+    assert get_report("000001")["period"] == "2024-12-31"
+    assert get_report("000001")["period"] == "2024-12-31"
+    assert len(calls) == 3
+
+
+def test_versioned_backs_off_between_lagging_refetches():
+    state = {"probe": "2024-12-31", "upstream": "2024-09-30"}
+    get_report, calls = make_report(state, lag_retry_seconds=3600)
+    get_report("000001")
+    get_report("000001")
+    assert len(calls) == 1
+
+
+def test_cached_data_is_isolated_from_caller_mutation():
+    filecache.cache_data({"rows": [1, 2]}, "test_isolation", 60)
+    first = filecache.get_cached_data("test_isolation")
+    first["rows"].append(3)
+    assert filecache.get_cached_data("test_isolation") == {"rows": [1, 2]}
+
+
+class Holder:
+    def __init__(self):
+        self.values = [1, 2]
+
+
+def test_arrays_and_objects_are_copied_on_read():
+    filecache.cache_data({"array": np.arange(3.0), "holder": Holder()}, "test_objects", 60)
+    first = filecache.get_cached_data("test_objects")
+    first["array"][0] = 100
+    first["holder"].values.append(3)
+    second = filecache.get_cached_data("test_objects")
+    assert second["array"].tolist() == [0.0, 1.0, 2.0]
+    assert second["holder"].values == [1, 2]
+
+
+def test_frames_are_isolated_without_global_copy_on_write():
+    filecache.cache_data(pd.DataFrame({"a": [1.0, 2.0]}), "test_frame", 60)
+    first = filecache.get_cached_data("test_frame")
+    first.iloc[0, 0] = 100.0
+    first["b"] = 1
+    assert filecache.get_cached_data("test_frame").to_dict("list") == {"a": [1.0, 2.0]}
+    if int(pd.__version__.split(".")[0]) < 3:
+        assert pd.get_option("mode.copy_on_write") is False
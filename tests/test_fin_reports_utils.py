@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from wff_agent import stock_agents
+from wff_agent.utils import fin_reports_utils, stock_utils
+
+
+def use_base(monkeypatch, fcf_growth=0.1, latest_fcf=1000.0, quote=None, shares_num=None):
+    base = {"market": "us", "latest_fcf": latest_fcf, "fcf_growth": fcf_growth, "shares_num": shares_num,
+            "annual_ratios": {"free_cash_flow_change_rate": [fcf_growth, fcf_growth / 2]}}
+    monkeypatch.setattr(fin_reports_utils, "get_report_fundamentals", lambda symbol, market: base)
+    monkeypatch.setattr(stock_utils, "get_latest_stock_price", lambda symbol, market: quote or {"price": 20.0})
+
+
+def test_sensitivity_without_shares_reports_firm_value(monkeypatch):
+    use_base(monkeypatch)
+    result = fin_reports_utils.get_dcf_sensitivity("AAPL", "us", discount_rates=[0.09], growth_rates=[0.01],
+                                                   fcf_growths=[0.1])
+    assert result["shares_num"] is None and result["per_share"] is False
+    assert "upside" not in result
+    # 企业总价值，不按1股折算成上千倍的"每股价值"与股价比较
+    assert result["intrinsic_value"][0][0][0] > 1000
+    text = fin_reports_utils.dcf_sensitivity_markdown(result)
+    assert "企业总价值" in text and "每股内在价值" not in text
+    assert "%)" not in text.split("\n", 1)[1]
+
+
+def test_sensitivity_with_shares_reports_upside(monkeypatch):
+    use_base(monkeypatch)
+    result = fin_reports_utils.get_dcf_sensitivity("AAPL", "us", shares_num=100, discount_rates=[0.09],
+                                                   growth_rates=[0.01], fcf_growths=[0.1])
+    value = result["intrinsic_value"][0][0][0]
+    assert result["per_share"] is True
+    assert result["upside"][0][0][0] == pytest.approx(value / 20.0 - 1, abs=1e-4)
+    assert "每股内在价值" in fin_reports_utils.dcf_sensitivity_markdown(result)
+
+
+def test_default_fcf_growth_axis_centres_on_discount_rate_when_growth_not_positive(monkeypatch):
+    use_base(monkeypatch, fcf_growth=-0.2)
+    result = fin_reports_utils.get_dcf_sensitivity("AAPL", "us", shares_num=100, discount_rate=0.08)
+    assert result["fcf_growth_used"] == 0.08
+    assert result["fcf_growths"] == [0.04, 0.06, 0.08, 0.1, 0.12]
+    tables = result["intrinsic_value"]
+    assert all(tables[i] != tables[i + 1] for i in range(len(tables) - 1))
+    assert "估值使用 8.00%" in fin_reports_utils.dcf_sensitivity_markdown(result)
+
+
+def test_default_fcf_growth_axis_uses_report_growth(monkeypatch):
+    use_base(monkeypatch, fcf_growth=0.1)
+    result = fin_reports_utils.get_dcf_sensitivity("AAPL", "us", shares_num=100)
+    assert result["fcf_growth_used"] == 0.1
+    assert result["fcf_growths"] == [0.05, 0.075, 0.1, 0.125, 0.15]
+
+
+def test_us_shares_default_to_reported_shares(monkeypatch):
+    use_base(monkeypatch, shares_num=100)
+    result = fin_reports_utils.get_dcf_sensitivity("AAPL", "us", discount_rates=[0.09], growth_rates=[0.01],
+                                                   fcf_growths=[0.1])
+    assert result["shares_num"] == 100 and result["per_share"] is True
+    assert "upside" in result
+    mc = fin_reports_utils.get_monte_carlo_valuation("AAPL", "us", paths=2000)
+    assert mc["intrinsic_value"]["p50"] < 1000
+
+
+def test_monte_carlo_without_shares_is_not_calculated(monkeypatch):
+    use_base(monkeypatch, quote={"收盘": 20.0})
+    with pytest.raises(ValueError, match="总股本未知"):
+        fin_reports_utils.get_monte_carlo_valuation("00700", "hk", paths=2000)
+    # UI 的默认总股本为0
+    agent = object.__new__(stock_agents.ComprehensiveAnalysisAgent)
+    text = agent.get_monte_carlo_valuation({"symbol": "00700", "market": "hk", "total_shares": 0,
+                                            "stock_price": 20.0, "discount_rate": 0.09, "growth_rate": 0.01})
+    assert text.startswith("未计算")
+    assert "P50" not in text and "概率" not in text
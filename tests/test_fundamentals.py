@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+import time
+
+import pytest
+
+from wff_agent.datasource import file_lru_cache as filecache
+from wff_agent.utils import ak_fin_utils, av_fin_utils, fin_reports_utils, fundamentals
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache(tmp_path, monkeypatch):
+    monkeypatch.delenv("WFF_DATASOURCE_MODE", raising=False)
+    monkeypatch.setattr(filecache, "get_cache_dir", lambda: tmp_path)
+    monkeypatch.setattr(fundamentals, "_stats", {"hits": 0, "version_hits": 0, "builds": 0})
+    filecache._memory.clear()
+    yield
+    filecache._memory.clear()
+
+
+def make_base(latest_fcf=100.0, fcf_growth=0.05, ttm=None):
+    annual = ({"fiscalDateEnding": ["2024-09-30", "2023-09-30"], "gross_margin": [0.4, 0.38],
+               "current_ratio": 1.5, "pe_ttm": None, "pb_ttm": None},
+              {"eps": [2.0, 1.6], "book_value_per_share": [10.0, 8.0]})
+    quarter = ({"fiscalDateEnding": ["2024-09-30", "2024-06-30"], "gross_margin": [0.41, 0.39],
+                "current_ratio": 1.4, "pe_ttm": None, "pb_ttm": None},
+               {"eps": [0.5, 0.4], "book_value_per_share": [10.0, 9.5]})
+    return fundamentals.make_base("us", annual, quarter, latest_fcf, fcf_growth, ttm)
+
+
+class FakeMarket:
+    """替换 fin_reports_utils._MARKETS 中的一个市场，记录报表读取和计算的次数"""
+    def __init__(self):
+        self.version = "2024-09-30"
+        self.fetches = 0
+        self.builds = 0
+
+    def fetch(self, symbol):
+        self.fetches += 1
+        return {"version": self.version}
+
+    def build(self, reports):
+        self.builds += 1
+        return make_base()
+
+    def install(self, monkeypatch):
+        markets = dict(fin_reports_utils._MARKETS)
+        markets["us"] = (self.fetch, lambda reports: reports["version"], self.build)
+        monkeypatch.setattr(fin_reports_utils, "_MARKETS", markets)
+
+
+def expire_check(symbol):
+    """把缓存条目的核对时间改到 RECHECK_SECONDS 之前，下次调用需要核对报表版本"""
+    entry = fundamentals.lookup("us", symbol)
+    entry["checked_at"] = time.time() - fundamentals.RECHECK_SECONDS - 1
+    filecache.cache_data(entry, fundamentals._key("us", symbol), fundamentals.MEMO_EXPIRE_SECONDS)
+
+
+def test_reuses_fundamentals_while_report_version_is_unchanged(monkeypatch):
+    market = FakeMarket()
+    market.install(monkeypatch)
+    first = fin_reports_utils.get_report_fundamentals("AAPL", "us")
+    assert (market.fetches, market.builds) == (1, 1)
+
+    # 刚核对过版本，不读取报表
+    assert fin_reports_utils.get_report_fundamentals("AAPL", "us") == first
+    assert (market.fetches, market.builds) == (1, 1)
+
+    # 超过核对间隔: 读取报表，版本未变时不重新计算，并刷新核对时间
+    expire_check("AAPL")
+    assert fin_reports_utils.get_report_fundamentals("AAPL", "us") == first
+    assert (market.fetches, market.builds) == (2, 1)
+    assert fundamentals.is_fresh(fundamentals.lookup("us", "AAPL"))
+
+    # 出现新报告期时重新计算
+    expire_check("AAPL")
+    market.version = "2024-12-31"
+    fin_reports_utils.get_report_fundamentals("AAPL", "us")
+    assert (market.fetches, market.builds) == (3, 2)
+    assert fundamentals.lookup("us", "AAPL")["version"] == "2024-12-31"
+    assert fundamentals.stats() == {"hits": 1, "version_hits": 1, "builds": 2}
+
+
+def test_cached_fundamentals_are_not_shared(monkeypatch):
+    FakeMarket().install(monkeypatch)
+    data = fin_reports_utils.get_report_fundamentals("AAPL", "us")
+    data["annual_ratios"]["gross_margin"][0] = -1.0
+    data["annual_per_share"]["eps"].append(0.0)
+    again = fin_reports_utils.get_report_fundamentals("AAPL", "us")
+    assert again["annual_ratios"]["gross_margin"] == [0.4, 0.38]
+    assert again["annual_per_share"]["eps"] == [2.0, 1.6]
+
+
+def test_is_fresh(monkeypatch):
+    now = time.time()
+    assert fundamentals.is_fresh({"checked_at": now})
+    assert not fundamentals.is_fresh({"checked_at": now - fundamentals.RECHECK_SECONDS - 1})
+    assert not fundamentals.is_fresh({"checked_at": now - 10}, max_age=5)
+    # 回放模式下总是核对版本，报表请求经过录制层
+    monkeypatch.setenv("WFF_DATASOURCE_MODE", "replay")
+    assert not fundamentals.is_fresh({"checked_at": now})
+
+
+def test_reprice_applies_price_to_annual_and_quarter_reports():
+    base = make_base()
+    result = fundamentals.reprice(base, 20.0, shares_num=10)
+    annual = result["annual_financial_report_indicators"]
+    quarter = result["quarter_financial_report_indicators"]
+    assert annual["pe_ttm"] == 10.0 and annual["pb_ttm"] == 2.0
+    # 季报的每股指标不是 TTM 时不计算 pe_ttm、pb_ttm
+    assert quarter["pe_ttm"] is None and quarter["pb_ttm"] is None
+    assert annual["gross_margin"] == [0.4, 0.38]
+    dcf = result["dcf_valuation"]
+    assert dcf["intrinsic_value"] == pytest.approx(dcf["present_value"] / 10)
+    assert dcf["upside"] == round(dcf["intrinsic_value"] / 20.0 - 1, 4)
+    assert "ttm_indicators" not in result
+
+
+def test_reprice_with_ttm_prices_quarterly_reports():
+    ttm = {"report_date": ["2024-09-30", "2024-06-30"], "eps_ttm": [2.5, 2.0], "book_value_per_share": [10.0, 9.5]}
+    result = fundamentals.reprice(make_base(ttm=ttm), 25.0)
+    assert result["quarter_financial_report_indicators"]["pe_ttm"] == 10.0
+    assert result["quarter_financial_report_indicators"]["pb_ttm"] == 2.5
+    assert result["ttm_indicators"]["pe_ttm"] == [10.0, 12.5]
+
+
+def test_reprice_without_fcf_skips_dcf():
+    result = fundamentals.reprice(make_base(latest_fcf=None), 20.0)
+    assert "dcf_valuation" not in result
+    assert result["annual_financial_report_indicators"]["pe_ttm"] == 10.0
+
+
+def test_reprice_does_not_share_lists_with_base():
+    ttm = {"report_date": ["2024-09-30"], "eps_ttm": [2.5], "book_value_per_share": [10.0]}
+    base = make_base(ttm=ttm)
+    result = fundamentals.reprice(base, 20.0)
+    result["annual_financial_report_indicators"]["gross_margin"][0] = -1.0
+    result["ttm_indicators"]["eps_ttm"][0] = -1.0
+    assert base["annual_ratios"]["gross_margin"] == [0.4, 0.38]
+    assert base["ttm"]["eps_ttm"] == [2.5]
+
+
+def test_hk_quarterly_pe_uses_ttm_with_march_year_end():
+    def records(rows):
+        return [{"report_time": date, "营业额": revenue, "每股基本盈利": eps} for date, revenue, eps in rows]
+    annual = records([("2024-03-31", 100, 1.0), ("2023-03-31", 80, 0.8)])
+    interim = records([("2024-09-30", 60, 0.6), ("2023-09-30", 40, 0.4)])
+    dates = lambda rows: [{"report_time": row["report_time"]} for row in rows]
+    data = {"balance_sheet": dates(annual), "income_statement": annual, "cashflow": dates(annual),
+            "quarter_balance_sheet": dates(interim), "quarter_income_statement": interim,
+            "quarter_cashflow": dates(interim)}
+    assert ak_fin_utils._hk_fiscal_year_end(annual) == 3
+    base = ak_fin_utils.calc_hk_fundamentals(data)
+    assert base["quarter_ttm"] is True
+    # 2024-09-30 中报 TTM = 0.6 + 1.0 - 0.4，2023-09-30 缺上一年中报
+    assert base["quarter_per_share"]["eps"] == [1.2, None]
+    result = fundamentals.reprice(base, 24.0)
+    assert result["quarter_financial_report_indicators"]["pe"] == [20.0, None]
+    assert result["annual_financial_report_indicators"]["pe"] == [24.0, 30.0]
+
+
+def test_us_quarterly_pe_pb_use_ttm():
+    quarters = ["2024-09-30", "2024-06-30", "2024-03-31", "2023-12-31"]
+    data = {
+        "balance_sheet": {
+            "annualReports": [{"fiscalDateEnding": d, "commonStockSharesOutstanding": "10",
+                               "totalShareholderEquity": "400"} for d in ("2023-12-31", "2022-12-31")],
+            "quarterlyReports": [{"fiscalDateEnding": d, "commonStockSharesOutstanding": "10",
+                                  "totalShareholderEquity": "400"} for d in quarters],
+        },
+        "income_statement": {
+            "annualReports": [{"fiscalDateEnding": d, "netIncome": "80"} for d in ("2023-12-31", "2022-12-31")],
+            "quarterlyReports": [{"fiscalDateEnding": d, "netIncome": str(v)} for d, v in zip(quarters, (30, 20, 25, 15))],
+        },
+        "cashflow": {
+            "annualReports": [{"fiscalDateEnding": d} for d in ("2023-12-31", "2022-12-31")],
+            "quarterlyReports": [{"fiscalDateEnding": d} for d in quarters],
+        },
+    }
+    base = av_fin_utils.calc_us_fundamentals(data)
+    assert base["shares_num"] == 10.0
+    quarter = fundamentals.reprice(base, 45.0)["quarter_financial_report_indicators"]
+    # TTM 每股收益 (30+20+25+15)/10 = 9，每股净资产 40
+    assert quarter["pe_ttm"] == 5.0 and quarter["pb_ttm"] == 1.12
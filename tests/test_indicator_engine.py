@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+import pytest
+
+from wff_agent.benchmarks import indicator_bench
+from wff_agent.utils import indicator_engine
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_matches_pandas_on_board_prices(seed):
+    # 两位小数价格、一字横盘、连续涨跌停
+    indicator_bench.check_equal(indicator_bench.make_board_history(300, seed))
+
+
+def test_flat_prices_give_nan_rsi_and_zero_width_boll():
+    df = indicator_bench.make_history(60)
+    df[["开盘", "收盘", "最高", "最低"]] = 12.34
+    expected = indicator_bench.legacy_indicators(df)
+    actual = indicator_engine.calc_market_indicators(df)
+    assert actual["RSI"].isna().all()
+    assert (actual["BOLL_UP"].dropna() == actual["BOLL"].dropna()).all()
+    pd.testing.assert_frame_equal(actual, expected, check_exact=False, rtol=1e-9, atol=1e-9)
+
+
+def test_window_sum_of_zeros_is_exact():
+    values = np.concatenate([np.random.default_rng(0).normal(1e6, 1e3, 100), np.zeros(30)])
+    sums = indicator_engine.RollingWindow(values).sum(14)
+    assert (sums[-17:] == 0).all()
+
+
+def test_panel_matches_single_series():
+    histories = {f"{i:06d}": indicator_bench.make_board_history(250, i) for i in range(3)}
+    dates, names, panel = indicator_engine.pivot_histories(histories)
+    result = indicator_engine.compute_panel_indicators(panel["收盘"], panel["最高"], panel["最低"], panel["成交量"])
+    for j, name in enumerate(names):
+        single = indicator_engine.calc_market_indicators(histories[name])
+        for column in ("MA20", "RSI", "K", "BOLL_UP", "OBV"):
+            np.testing.assert_allclose(result[column][:, j], single[column].to_numpy(), rtol=1e-9, atol=1e-9)
+
+
+def test_panel_skips_suspended_and_unlisted_bars():
+    full = indicator_bench.make_board_history(300, 7)
+    histories = {
+        "full": full,
+        # 停牌20个交易日
+        "suspended": full.drop(full.index[100:120]),
+        # 上市晚、最后一天停牌
+        "late": indicator_bench.make_board_history(300, 8).iloc[150:-1],
+    }
+    dates, names, panel = indicator_engine.pivot_histories(histories)
+    assert len(dates) == 300 and np.isnan(panel["收盘"][100:120, 1]).all()
+    result = indicator_engine.compute_panel_indicators(panel["收盘"], panel["最高"], panel["最低"], panel["成交量"],
+                                                       indicators=["MA20", "KDJ", "RSI", "OBV"])
+    assert set(result) == {"MA20", "K", "D", "J", "RSI", "OBV"}
+    for j, name in enumerate(names):
+        single = indicator_engine.calc_market_indicators(histories[name], ["MA20", "KDJ", "RSI", "OBV"])
+        rows = dates.get_indexer(single.index)
+        missing = np.setdiff1d(np.arange(len(dates)), rows)
+        for column in result:
+            np.testing.assert_allclose(result[column][rows, j], single[column].to_numpy(),
+                                       rtol=1e-9, atol=1e-9, err_msg=f"{name} {column}")
+            assert np.isnan(result[column][missing, j]).all()
+
+    snapshot = indicator_engine.latest_snapshot(dates, names, {"收盘": panel["收盘"], "MA20": result["MA20"]})
+    assert snapshot.loc["late", "日期"] == dates[-2]
+    assert snapshot.loc["suspended", "收盘"] == full["收盘"].iloc[-1]
+    assert snapshot.loc["late", "MA20"] == pytest.approx(result["MA20"][-2, 2])
+
+
+def test_resolve_expands_groups_in_output_order():
+    assert indicator_engine.resolve(["rsi", "macd"]) == ["RSI", "DIF", "DEA", "MACD"]
+    assert indicator_engine.resolve("KDJ,MA5") == ["MA5", "K", "D", "J"]
+    assert indicator_engine.resolve(None) == indicator_engine.INDICATOR_COLUMNS
+    with pytest.raises(ValueError):
+        indicator_engine.resolve(["_rsv"])
+
+
+def test_dependency_closure_and_required_bars():
+    assert indicator_engine.dependency_closure(["MA5"]) == ["_close_window", "MA5"]
+    assert indicator_engine.dependency_closure(["J"]) == ["_rsv", "K", "D", "J"]
+    assert indicator_engine.required_bars(["MA5"]) == 5
+    assert indicator_engine.required_bars(["MA200"]) == 240
+    assert indicator_engine.required_bars(["RSI"]) == 15
+    assert indicator_engine.required_bars(["OBV"]) == 22
+    # DEA 的EMA预热叠加在 DIF 所需的慢线预热之上
+    assert indicator_engine.required_bars(["DEA"]) == 1 + 4 * 26 + 4 * 9
+    assert indicator_engine.required_bars(["MA5", "MA200"]) == 240
+
+
+def test_subset_uses_only_required_bars():
+    # 只给出 required_bars 根K线时，最后一个值与长历史上的结果一致
+    df = indicator_bench.make_history(600)
+    for name in ["MA200", "RSI", "BOLL_UP", "OBV"]:
+        bars = indicator_engine.required_bars([name])
+        short = indicator_engine.calc_market_indicators(df.tail(bars), [name])
+        full = indicator_engine.calc_market_indicators(df, [name])
+        assert list(short.columns) == indicator_engine.PRICE_COLUMNS + [name]
+        assert short[name].iloc[-1] == pytest.approx(full[name].iloc[-1], rel=1e-9)
+    # 均线类指标少一根K线时没有数值
+    for name in ["MA200", "BOLL_UP"]:
+        short = indicator_engine.calc_market_indicators(df.tail(indicator_engine.required_bars([name]) - 1), [name])
+        assert np.isnan(short[name].iloc[-1])
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+import pytest
+
+from wff_agent.benchmarks import indicator_bench
+from wff_agent.datasource import file_lru_cache as filecache
+from wff_agent.utils import indicator_engine, indicator_stream
+
+
+@pytest.fixture(autouse=True)
+def checkpoints(tmp_path, monkeypatch):
+    monkeypatch.delenv("WFF_DATASOURCE_MODE", raising=False)
+    monkeypatch.setattr(filecache, "get_cache_dir", lambda: tmp_path)
+    filecache._memory.clear()
+    indicator_stream._checkpoints.clear()
+    rebuilds = []
+    rebuild = indicator_stream._rebuild
+    monkeypatch.setattr(indicator_stream, "_rebuild", lambda df, keep_rows: rebuilds.append(len(df)) or rebuild(df, keep_rows))
+    yield rebuilds
+    filecache._memory.clear()
+    indicator_stream._checkpoints.clear()
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_state_matches_engine_on_board_prices(seed):
+    df = indicator_bench.make_board_history(300, seed)
+    rows = pd.DataFrame(indicator_stream.IndicatorState().extend(df), index=df.index)
+    expected = indicator_engine.calc_market_indicators(df)
+    for column in indicator_engine.INDICATOR_COLUMNS:
+        np.testing.assert_allclose(rows[column], expected[column], rtol=1e-9, atol=1e-9, err_msg=column)
+
+
+def test_longer_window_rebuilds_short_checkpoint(checkpoints):
+    history = indicator_bench.make_history(700)
+    indicator_stream.get_indicator_frame("000001", "cn", history.tail(290))
+    frame = indicator_stream.get_indicator_frame("000001", "cn", history.tail(640)).tail(400)
+    assert len(frame) == 400
+    assert frame["MA200"].notna().all()
+    assert checkpoints == [290, 640]
+
+
+def test_window_longer_than_default_keep(checkpoints):
+    history = indicator_bench.make_history(901)
+    frame = indicator_stream.get_indicator_frame("000001", "cn", history.iloc[:-1])
+    assert len(frame) == 900
+    # 之后较短的请求和新K线都复用检查点，不会截短已保留的行
+    assert len(indicator_stream.get_indicator_frame("000001", "cn", history.iloc[:-1].tail(290))) == 900
+    assert len(indicator_stream.get_indicator_frame("000001", "cn", history.tail(290))) == 900
+    assert checkpoints == [900]
+
+
+def test_new_bar_advances_checkpoint(checkpoints):
+    history = indicator_bench.make_history(400)
+    indicator_stream.get_indicator_frame("000001", "cn", history.iloc[:-1].tail(290))
+    frame = indicator_stream.get_indicator_frame("000001", "cn", history.tail(290))
+    expected = indicator_engine.calc_market_indicators(history.iloc[-291:-1]).iloc[-1]
+    assert frame.index[-1] == history.index[-1]
+    assert checkpoints == [290]
+    assert np.isclose(frame["MA20"].iloc[-2], expected["MA20"])
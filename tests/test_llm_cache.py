@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from wff_agent.agents import llm_cache
+from wff_agent.datasource import file_lru_cache as filecache
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.delenv("WFF_DATASOURCE_MODE", raising=False)
+    monkeypatch.delenv(llm_cache.CACHE_ENV, raising=False)
+    monkeypatch.setattr(filecache, "get_cache_dir", lambda: tmp_path)
+    monkeypatch.setattr(llm_cache, "_cache", None)
+    filecache._memory.clear()
+    yield tmp_path
+    filecache._memory.clear()
+
+
+def test_prunes_on_interval(monkeypatch):
+    calls = []
+    monkeypatch.setattr(filecache, "prune_cache", lambda prefix, max_entries: calls.append(prefix) or 0)
+    cache = llm_cache.LLMResponseCache(max_entries=10)
+    for i in range(llm_cache.PRUNE_INTERVAL * 2 + 1):
+        cache.update(f"prompt {i}", "model", [])
+    assert len(calls) == 3
+
+
+def test_keeps_max_entries(cache_dir, monkeypatch):
+    monkeypatch.setattr(llm_cache, "PRUNE_INTERVAL", 1)
+    cache = llm_cache.LLMResponseCache(max_entries=3)
+    for i in range(5):
+        cache.update(f"prompt {i}", "model", [])
+    assert len(list(cache_dir.glob(f"{llm_cache.CACHE_PREFIX}_*.pkl"))) == 3
+
+
+@pytest.mark.parametrize("mode", ["record", "replay"])
+def test_disabled_outside_live_mode(mode, monkeypatch):
+    assert llm_cache.get_cache() is not None
+    monkeypatch.setenv("WFF_DATASOURCE_MODE", mode)
+    assert llm_cache.get_cache() is None
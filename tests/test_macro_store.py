@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+import datetime
+
+import pandas as pd
+import pytest
+
+from wff_agent.datasource import file_lru_cache as filecache
+from wff_agent.datasource import macro_store
+from wff_agent.utils import macro_utils
+
+FETCHED_AT = datetime.datetime(2024, 3, 10, 9, 0)
+
+
+def make_series(dates, values):
+    return pd.DataFrame({"商品": "美国CPI月率", "日期": dates, "今值": values, "预测值": None, "前值": None})
+
+
+def test_next_refresh_uses_upcoming_release():
+    df = make_series(["2024-02-13", "2024-03-12", "2024-04-10"], [0.3, None, None])
+    assert macro_store._next_refresh_time(df, 31, FETCHED_AT) == datetime.datetime(2024, 3, 12)
+
+
+def test_next_refresh_falls_back_to_cadence():
+    # 日历中没有未来的发布日期，按最近一次发布日期加发布周期
+    df = make_series(["2024-01-11", "2024-02-13"], [0.3, 0.4])
+    assert macro_store._next_refresh_time(df, 31, FETCHED_AT) == datetime.datetime(2024, 3, 15)
+    # 没有已公布的数据，从获取时间起算
+    df = make_series(["2024-01-11"], [None])
+    assert macro_store._next_refresh_time(df, 31, FETCHED_AT) == FETCHED_AT + datetime.timedelta(days=31)
+
+
+def test_next_refresh_waits_at_least_min_recheck():
+    # 推算的发布日已过而上游未更新
+    df = make_series(["2023-12-12"], [0.1])
+    expected = FETCHED_AT + datetime.timedelta(seconds=macro_store.MIN_RECHECK_SECONDS)
+    assert macro_store._next_refresh_time(df, 31, FETCHED_AT) == expected
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.delenv("WFF_DATASOURCE_MODE", raising=False)
+    monkeypatch.setattr(filecache, "get_cache_dir", lambda: tmp_path)
+    filecache._memory.clear()
+    macro_store._entries.clear()
+    calls = []
+    df = make_series(["2024-01-11", "2024-02-13", "2099-01-01"], [0.3, 0.4, None])
+    for series in macro_store.SERIES.values():
+        monkeypatch.setattr(series, "fetch", lambda name=series.name: calls.append(name) or df.copy())
+    yield calls
+    filecache._memory.clear()
+    macro_store._entries.clear()
+
+
+def test_macro_data_keeps_legacy_keys(store):
+    result = macro_utils.get_macro_data(["us", "cn"], last_n=1)
+    assert set(result) == {"美国劳动力指数", "美国CPI", "美国利率", "中国PPI", "中国CPI", "中国利率"}
+    assert result["美国CPI"]["data"] == [{"商品": "美国CPI月率", "日期": "2024-02-13", "今值": 0.4,
+                                          "预测值": None, "前值": None}]
+    assert set(macro_utils.get_macro_data(["us"])) == {"美国劳动力指数", "美国CPI", "美国利率"}
+    # 未到下一次发布日期，不再回源
+    assert sorted(store) == sorted(macro_store.SERIES)
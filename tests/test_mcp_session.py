@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+
+from wff_agent.agents import base_agent, mcp_session
+
+
+class FakeServer:
+    """替换 stdio_client 和 ClientSession，记录启动和关闭的会话，ping 结果可控制"""
+
+    def __init__(self):
+        self.started = 0
+        self.closed = []
+        self.ping_ok = True
+        server = self
+
+        @asynccontextmanager
+        async def stdio_client(params):
+            server.started += 1
+            yield server.started, None
+
+        class ClientSession:
+            def __init__(self, read, write):
+                self.id = read
+
+            async def __aenter__(self):
+                return self
+
+            async def __aexit__(self, *exc):
+                server.closed.append(self.id)
+
+            async def initialize(self):
+                pass
+
+            async def send_ping(self):
+                if not server.ping_ok:
+                    raise ConnectionError("server gone")
+
+        self.stdio_client = stdio_client
+        self.ClientSession = ClientSession
+
+    def install(self, monkeypatch, module):
+        monkeypatch.setattr(module, "stdio_client", self.stdio_client)
+        monkeypatch.setattr(module, "ClientSession", self.ClientSession)
+
+
+class FakeToolkit:
+    def __init__(self, session):
+        self.session = session
+        self.initialized = 0
+
+    async def initialize(self):
+        self.initialized += 1
+
+
+class FakeAgent(base_agent.AnalysisAgent):
+    """不创建 LLM 的 Agent，执行结果为所用会话的编号"""
+
+    def __init__(self):
+        self.toolkits = []
+
+    def get_registered_tools(self):
+        return ["get_stock_price"]
+
+    def create_toolkit(self, session=None):
+        toolkit = FakeToolkit(session)
+        self.toolkits.append(toolkit)
+        return toolkit
+
+    async def _invoke(self, toolkit, system_prompt, user_message_prompt, input):
+        return toolkit.session.id
+
+    def prepare_input(self, input, context):
+        return input
+
+    def after_ai_execute(self, result, input):
+        pass
+
+    def get_user_prompt(self, input, context):
+        return "prompt"
+
+    def get_output_file_name(self, input):
+        return "out.md"
+
+    def get_system_prompt(self):
+        return "system"
+
+
+@pytest.fixture(autouse=True)
+def env(monkeypatch):
+    monkeypatch.delenv(mcp_session.PERSISTENT_ENV, raising=False)
+    monkeypatch.delenv(mcp_session.POOL_SIZE_ENV, raising=False)
+
+
+def test_reuses_healthy_server_and_restarts_failed_one(monkeypatch):
+    fake = FakeServer()
+    fake.install(monkeypatch, mcp_session)
+    agent = FakeAgent()
+
+    async def steps():
+        async with mcp_session.session_scope(1) as pool:
+            sessions = [await agent.execute_with_session("system", "prompt", {}) for _ in range(2)]
+            # ping 失败: 关闭原服务器，启动新服务器，工具包在新会话上重新初始化
+            fake.ping_ok = False
+            sessions.append(await agent.execute_with_session("system", "prompt", {}))
+            fake.ping_ok = True
+            sessions.append(await agent.execute_with_session("system", "prompt", {}))
+            return sessions, dict(pool.stats), fake.closed[:]
+
+    sessions, stats, closed = asyncio.run(steps())
+    assert sessions == [1, 1, 2, 2]
+    assert stats == {"starts": 2, "restarts": 1, "reuses": 2}
+    assert closed == [1]
+    assert [toolkit.session.id for toolkit in agent.toolkits] == [1, 2]
+    # 最外层作用域退出时关闭全部服务器
+    assert fake.closed == [1, 2] and fake.started == 2
+    assert not mcp_session._pools
+
+
+def test_crashed_server_is_restarted(monkeypatch):
+    fake = FakeServer()
+    fake.install(monkeypatch, mcp_session)
+
+    async def steps():
+        async with mcp_session.session_scope(1) as pool:
+            async with pool.acquire() as server:
+                first = server
+            # 子进程退出后会话任务结束，不再 ping
+            first._stop.set()
+            await first._task
+            assert not first.alive
+            async with pool.acquire() as server:
+                return server.index, dict(pool.stats)
+
+    assert asyncio.run(steps()) == (1, {"starts": 2, "restarts": 1, "reuses": 0})
+
+
+def test_non_persistent_mode_starts_server_per_execution(monkeypatch):
+    monkeypatch.setenv(mcp_session.PERSISTENT_ENV, "0")
+    fake = FakeServer()
+    fake.install(monkeypatch, base_agent)
+    # 不经过会话池
+    fake_pool = FakeServer()
+    fake_pool.install(monkeypatch, mcp_session)
+    agent = FakeAgent()
+
+    async def steps():
+        async with mcp_session.session_scope(2) as pool:
+            sessions = [await agent.execute_with_session("system", "prompt", {}) for _ in range(2)]
+            return sessions, dict(pool.stats)
+
+    sessions, stats = asyncio.run(steps())
+    assert sessions == [1, 2]
+    assert fake.closed == [1, 2]
+    assert [toolkit.initialized for toolkit in agent.toolkits] == [1, 1]
+    assert stats == {"starts": 0, "restarts": 0, "reuses": 0}
+    assert fake_pool.started == 0
+
+
+@pytest.mark.parametrize("value, expected", [(None, True), ("1", True), ("0", False), ("false", False),
+                                             ("No", False)])
+def test_persistent_enabled(monkeypatch, value, expected):
+    if value is not None:
+        monkeypatch.setenv(mcp_session.PERSISTENT_ENV, value)
+    assert mcp_session.persistent_enabled() is expected
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from wff_agent.utils import payload_codec
+
+
+def make_frame(rows=30):
+    return pd.DataFrame({
+        "日期": [f"2024-01-{i + 1:02d}" for i in range(rows)],
+        "收盘": np.linspace(10.0, 12.9, rows) + 1 / 3,
+        "成交量": np.arange(rows, dtype=float) * 1000,
+        "RSI": [np.nan] + [55.123456] * (rows - 1),
+    })
+
+
+def test_records_matches_to_json():
+    df = make_frame()
+    assert payload_codec.encode_frame(df, "records") == df.to_json(force_ascii=False, orient="records")
+
+
+def test_columnar_lists_each_column_once():
+    df = make_frame(3)
+    payload = json.loads(payload_codec.encode_frame(df, "columnar"))
+    assert list(payload) == ["columns"]
+    assert payload["columns"]["日期"] == ["2024-01-01", "2024-01-02", "2024-01-03"]
+    assert payload["columns"]["成交量"] == [0, 1000, 2000]
+    assert payload["columns"]["RSI"] == [None, 55.123456, 55.123456]
+
+
+def test_compact_rounds_samples_and_summarizes():
+    df = make_frame(30)
+    payload = json.loads(payload_codec.encode_frame(df, "compact"))
+    # 最近20行完整保留，更早的10行从分界处向前每5行取1行
+    assert payload["columns"]["日期"] == ["2024-01-01", "2024-01-06"] + [f"2024-01-{i:02d}" for i in range(11, 31)]
+    assert payload["rows"].startswith("共30行")
+    assert payload["columns"]["RSI"][-1] == 55.12
+    assert payload["columns"]["收盘"][-1] == 13.23
+    summary = payload["summary"]["收盘"]
+    assert summary["min"] == 10.33 and summary["last"] == 13.23
+    assert summary["change_pct"] == 28.06
+    assert "日期" not in payload["summary"]
+
+
+def test_round_significant():
+    values = np.array([123456.0, 0.000123456, -9.99949, 0.0, np.nan, np.inf])
+    rounded = payload_codec.round_significant(values, 4)
+    np.testing.assert_array_equal(rounded[:4], [123500.0, 0.0001235, -9.999, 0.0])
+    assert np.isnan(rounded[4]) and np.isinf(rounded[5])
+
+
+def test_lttb_keeps_ends_and_extremes():
+    y = np.sin(np.linspace(0, 4 * np.pi, 500))
+    y[137] = 5.0
+    y[321] = -5.0
+    indices = payload_codec.lttb_indices(y, 40)
+    assert len(indices) == 40
+    assert indices[0] == 0 and indices[-1] == 499
+    assert (np.diff(indices) > 0).all()
+    assert 137 in indices and 321 in indices
+    np.testing.assert_array_equal(payload_codec.lttb_indices(y[:10], 40), np.arange(10))
+    with pytest.raises(ValueError):
+        payload_codec.lttb_indices(y, 2)
+
+
+def test_tool_encoding(monkeypatch):
+    monkeypatch.setenv("WFF_TOOL_ENCODINGS", "GetMarketIndicators=compact,Other=bogus")
+    assert payload_codec.tool_encoding("GetMarketIndicators") == "compact"
+    assert payload_codec.tool_encoding("Other") == "records"
+    assert payload_codec.tool_encoding("GetMarketIndicators", "Columnar") == "columnar"
+    with pytest.raises(ValueError):
+        payload_codec.tool_encoding("GetMarketIndicators", "xml")
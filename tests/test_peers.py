@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+from wff_agent.utils import peers
+
+
+def base(dates, roe):
+    return {"market": "cn", "annual_ratios": {"fiscal_end_date": dates, "roe": roe, "gross_margin": roe}}
+
+
+def test_periods_are_aligned_by_fiscal_year():
+    bases = {
+        "000001": base(["2024-12-31", "2023-12-31", "2022-12-31"], ["10%", "20%", "30%"]),
+        # 尚未发布2024年报
+        "000002": base(["2023-12-31", "2022-12-31", "2021-12-31"], ["40%", "50%", "60%"]),
+    }
+    symbols, keys, cube = peers.ratio_cube(bases, periods=3, anchor="000001")
+    roe = cube[:, :, keys.index("roe")]
+    np.testing.assert_allclose(roe[0], [0.1, 0.2, 0.3])
+    np.testing.assert_allclose(roe[1], [np.nan, 0.4, 0.5])
+
+
+def test_anchor_without_new_report_does_not_shift_axis():
+    bases = {
+        "000001": base(["2023-12-31", "2022-12-31"], ["10%", "20%"]),
+        "000002": base(["2024-12-31", "2023-12-31"], ["40%", "50%"]),
+    }
+    _, keys, cube = peers.ratio_cube(bases, periods=2, anchor="000001")
+    roe = cube[:, :, keys.index("roe")]
+    np.testing.assert_allclose(roe[:, 0], [0.1, 0.5])
+    np.testing.assert_allclose(roe[:, 1], [0.2, np.nan])
+
+
+def test_latest_scalar_uses_its_fiscal_year():
+    bases = {
+        "AAPL": {"market": "us", "annual_ratios": {"fiscalDateEnding": ["2024-09-30", "2023-09-30"],
+                                                    "current_ratio": 1.5, "debt_ratio": [0.3, 0.4]}},
+        "MSFT": {"market": "us", "annual_ratios": {"fiscalDateEnding": ["2023-06-30", "2022-06-30"],
+                                                    "current_ratio": 2.0, "debt_ratio": [0.5, 0.6]}},
+    }
+    _, keys, cube = peers.ratio_cube(bases, periods=2)
+    np.testing.assert_allclose(cube[:, 0, keys.index("current_ratio")], [1.5, np.nan])
+    np.testing.assert_allclose(cube[:, 1, keys.index("debt_ratio")], [0.4, 0.5])
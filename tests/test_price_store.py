@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+import pandas as pd
+import pytest
+
+from wff_agent.datasource import file_lru_cache as filecache
+from wff_agent.datasource import price_store
+
+
+def make_upstream(listed: str, last: str):
+    """工作日都有K线的模拟上游，记录每次拉取的日期范围"""
+    dates = pd.bdate_range(listed, last)
+    bars = pd.DataFrame({"收盘": range(1, len(dates) + 1), "成交量": 100.0}, index=dates, dtype=float)
+    bars[price_store.FACTOR_COLUMN] = 1.0
+    calls = []
+
+    def fetch_segment(symbol, market, start_date, end_date):
+        calls.append((start_date, end_date))
+        return bars.loc[pd.to_datetime(start_date):pd.to_datetime(end_date)].copy()
+
+    return fetch_segment, calls
+
+
+@pytest.fixture(autouse=True)
+def store(tmp_path, monkeypatch):
+    monkeypatch.delenv("WFF_DATASOURCE_MODE", raising=False)
+    monkeypatch.setattr(filecache, "get_cache_dir", lambda: tmp_path)
+    filecache._memory.clear()
+    price_store._entries.clear()
+    yield
+    filecache._memory.clear()
+    price_store._entries.clear()
+
+
+def test_weekend_start_is_not_a_listing_date(monkeypatch):
+    fetch_segment, calls = make_upstream("2020-01-01", "2024-06-28")
+    monkeypatch.setattr(price_store, "_fetch_segment", fetch_segment)
+    # 2024-01-06 是周六，第一根K线在 2024-01-08
+    df = price_store.get_daily_bars("000001", "cn", "20240106", "20240301")
+    assert df.index[0] == pd.Timestamp("2024-01-08")
+    assert price_store.refresh("000001", "cn", "20240106", "20240301")["listing_date"] is None
+
+    df = price_store.get_daily_bars("000001", "cn", "20230101", "20240301")
+    assert df.index[0] == pd.Timestamp("2023-01-02")
+    assert len(calls) == 2
+
+
+def test_weekend_start_does_not_refetch_head(monkeypatch):
+    fetch_segment, calls = make_upstream("2020-01-01", "2024-06-28")
+    monkeypatch.setattr(price_store, "_fetch_segment", fetch_segment)
+    price_store.get_daily_bars("000001", "cn", "20240106", "20240301")
+    price_store.get_daily_bars("000001", "cn", "20240106", "20240301")
+    price_store.get_daily_bars("000001", "cn", "20240107", "20240201")
+    assert len(calls) == 1
+
+
+def test_listing_date_stops_backfill(monkeypatch):
+    fetch_segment, calls = make_upstream("2023-06-01", "2024-06-28")
+    monkeypatch.setattr(price_store, "_fetch_segment", fetch_segment)
+    df = price_store.get_daily_bars("000001", "cn", "20200101", "20240301")
+    assert df.index[0] == pd.Timestamp("2023-06-01")
+    assert price_store.refresh("000001", "cn", "20200101", "20240301")["listing_date"] == pd.Timestamp("2023-06-01")
+
+    df = price_store.get_daily_bars("000001", "cn", "20150101", "20240301")
+    assert df.index[0] == pd.Timestamp("2023-06-01")
+    assert len(calls) == 1
+
+
+def make_daily():
+    """2024-01-25(周四) 到 2024-02-06(周二) 的9根日线，收盘价 10..18"""
+    dates = pd.bdate_range("2024-01-25", "2024-02-06", name="日期")
+    close = pd.Series(range(10, 19), index=dates, dtype=float)
+    return pd.DataFrame({"开盘": close - 0.5, "收盘": close, "最高": close + 1, "最低": close - 1,
+                         "成交量": 100.0, "涨跌额": 1.0, "涨跌幅": 0.0, "振幅": 0.0})
+
+
+def test_resample_weekly_uses_calendar_weeks():
+    weekly = price_store.resample_bars(make_daily(), "weekly")
+    assert list(weekly.index) == list(pd.to_datetime(["2024-01-26", "2024-02-02", "2024-02-06"]))
+    assert weekly["开盘"].tolist() == [9.5, 11.5, 16.5]
+    assert weekly["最高"].tolist() == [12, 17, 19]
+    assert weekly["最低"].tolist() == [9, 11, 16]
+    assert weekly["收盘"].tolist() == [11, 16, 18]
+    assert weekly["成交量"].tolist() == [200, 500, 200]
+    # 第一根的前收盘价由第一根日线的涨跌额倒推为 9
+    assert weekly["涨跌额"].tolist() == [2, 5, 2]
+    assert weekly["涨跌幅"].iloc[1] == pytest.approx(5 / 11 * 100)
+
+
+def test_resample_monthly():
+    monthly = price_store.resample_bars(make_daily(), "monthly")
+    assert list(monthly.index) == list(pd.to_datetime(["2024-01-31", "2024-02-06"]))
+    assert monthly["开盘"].tolist() == [9.5, 14.5]
+    assert monthly["收盘"].tolist() == [14, 18]
+    assert monthly["成交量"].tolist() == [500, 400]
+    assert monthly["振幅"].iloc[1] == pytest.approx((19 - 14) / 14 * 100)
+
+
+def test_resample_n_days_groups_from_latest_bar():
+    three = price_store.resample_bars(make_daily(), "3d")
+    assert list(three.index) == list(pd.to_datetime(["2024-01-29", "2024-02-01", "2024-02-06"]))
+    assert three["收盘"].tolist() == [12, 15, 18]
+    # 9根日线按4根一组，最早不足4根的1根丢弃
+    four = price_store.resample_bars(make_daily(), "4d")
+    assert list(four.index) == list(pd.to_datetime(["2024-01-31", "2024-02-06"]))
+    assert four["开盘"].tolist() == [10.5, 14.5]
+    assert four["成交量"].tolist() == [400, 400]
+    pd.testing.assert_frame_equal(price_store.resample_bars(make_daily(), "daily"), make_daily())
+
+
+def test_period_alignment_and_validation():
+    assert price_store.period_start_date("20240131", "weekly") == "20240129"
+    assert price_store.period_start_date("20240131", "monthly") == "20240101"
+    assert price_store.period_start_date("20240131", "5d") == "20240131"
+    assert price_store.trading_days_per_bar("5d") == 5
+    with pytest.raises(ValueError):
+        price_store.resample_bars(make_daily(), "0d")
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+import pandas as pd
+import pytest
+
+from wff_agent.utils import ratio_engine
+
+
+def hk_statements(income, balance=None, cashflow=None):
+    """港股三张报表，只给出用到的列，报告期取利润表的"""
+    dates = [record["report_time"] for record in income]
+    balance = balance or [{} for _ in dates]
+    cashflow = cashflow or [{} for _ in dates]
+    return ([{"report_time": date, **record} for date, record in zip(dates, balance)], income,
+            [{"report_time": date, **record} for date, record in zip(dates, cashflow)])
+
+
+def us_statements(periods):
+    dates = [f"{2024 - i}-09-30" for i in range(periods)]
+    balance = [{"fiscalDateEnding": date, "totalAssets": "1000", "totalShareholderEquity": "400",
+                "totalLiabilities": "600", "totalCurrentAssets": "300", "totalCurrentLiabilities": "150",
+                "inventory": "60", "commonStockSharesOutstanding": "10"} for date in dates]
+    income = [{"fiscalDateEnding": date, "totalRevenue": str(500 - 50 * i), "netIncome": "50"}
+              for i, date in enumerate(dates)]
+    cashflow = [{"fiscalDateEnding": date, "operatingCashflow": "80", "capitalExpenditures": "20"} for date in dates]
+    return balance, income, cashflow
+
+
+def test_zero_denominator_and_missing_values_are_none():
+    income = [
+        {"report_time": "2024-12-31", "营业额": 0, "营运收入": 0, "毛利": 10},
+        {"report_time": "2023-12-31", "营业额": 100, "营运收入": 100, "毛利": None},
+    ]
+    balance = [{"总资产": 200, "存货": 0, "总权益": 0}, {"总资产": 200, "存货": 50, "总权益": 100}]
+    ratios = ratio_engine.calc_ratios("hk", *hk_statements(income, balance), stock_price=10.0)
+    assert ratios["gross_margin"] == [None, None]
+    assert ratios["inventory_turnover_ratio"] == [None, 2.0]
+    assert ratios["equity_multiplier"] == [None, 2.0]
+    assert ratios["asset_turnover_ratio"] == [0.0, 0.5]
+    # 每股收益缺失时市盈率为 None
+    assert ratios["pe"] == [None, None]
+
+
+def test_alpha_vantage_none_strings_are_missing():
+    balance, income, cashflow = us_statements(2)
+    income[0]["totalRevenue"] = "None"
+    balance[0]["inventory"] = "None"
+    ratios = ratio_engine.calc_ratios("us", balance, income, cashflow, stock_price=20.0)
+    assert ratios["gross_margin"] == [None, None]
+    assert ratios["net_income_margin"] == [None, 0.1111]
+    # 速动资产中缺失的存货按0计
+    assert ratios["quick_ratio"] == 2.0
+
+
+def test_multi_column_fields_treat_missing_columns_as_zero():
+    income = [
+        {"report_time": "2024-12-31", "营运收入": 100, "融资成本": 5, "销售及分销费用": None, "行政开支": 15},
+        {"report_time": "2023-12-31", "营运收入": 100},
+        {"report_time": "2022-12-31", "营运收入": 100, "融资成本": 1, "销售及分销费用": 2, "行政开支": 3},
+    ]
+    balance = [{"总资产": 100, "物业厂房及设备": 30}, {"总资产": 100}, {"总资产": 100, "物业厂房及设备": 30, "土地使用权": 10}]
+    ratios = ratio_engine.calc_ratios("hk", *hk_statements(income, balance), stock_price=None)
+    assert ratios["total_expense_ratio"] == [0.2, None, 0.06]
+    assert ratios["fixed_assets_ratio"] == [0.3, None, 0.4]
+
+
+def test_cross_period_keys_are_one_period_shorter():
+    balance, income, cashflow = us_statements(4)
+    ratios = ratio_engine.calc_ratios("us", balance, income, cashflow, stock_price=20.0)
+    assert ratios["fiscalDateEnding"] == ["2024-09-30", "2023-09-30", "2022-09-30", "2021-09-30"]
+    for key, _, _ in ratio_engine.RATIOS["us"]:
+        if key in ratio_engine.LATEST_KEYS["us"]:
+            assert not isinstance(ratios[key], list)
+        elif key in ratio_engine.CROSS_PERIOD_KEYS["us"]:
+            assert len(ratios[key]) == 3, key
+        else:
+            assert len(ratios[key]) == 4, key
+    assert ratios["revenue_growth"] == [pytest.approx(500 / 450 - 1, abs=1e-4), 0.125, pytest.approx(400 / 350 - 1, abs=1e-4)]
+    assert ratios["roe"] == ["12.5%", "12.5%", "12.5%"]
+    assert ratios["pe_ttm"] == 4.0 and ratios["pb_ttm"] == 0.5
+
+
+def test_growth_over_zero_base_is_none():
+    income = [
+        {"report_time": "2024-12-31", "营业额": 100, "营运收入": 100},
+        {"report_time": "2023-12-31", "营业额": 0, "营运收入": 100},
+        {"report_time": "2022-12-31", "营业额": 50, "营运收入": 100},
+    ]
+    cashflow = [{"经营业务现金净额": 30, "购建固定资产": 10}, {"经营业务现金净额": 20}, {"经营业务现金净额": 10}]
+    ratios = ratio_engine.calc_ratios("hk", *hk_statements(income, cashflow=cashflow), stock_price=None)
+    assert ratios["revenue_growth"] == [None, -1.0]
+    # 资本开支缺失时按0计
+    assert ratios["free_cash_flow"] == [20.0, 20.0, 10.0]
+    assert ratios["free_cash_flow_growth"] == [0.0, 1.0]
+
+
+def test_cn_hk_liquidity_ratios():
+    income = [{"report_time": "2024-12-31", "营运收入": 100, "毛利": 40}]
+    balance = [{"流动资产合计": 300, "流动负债合计": 150, "总负债": 600, "存货": 60}]
+    ratios = ratio_engine.calc_ratios("hk", *hk_statements(income, balance), stock_price=None)
+    assert ratios["current_ratio"] == [2.0]
+    assert ratios["quick_ratio"] == [1.6]
+    assert ratios["gross_margin"] == [0.4]
+
+
+def test_latest_value_skips_missing_periods():
+    balance, income, cashflow = us_statements(3)
+    balance[0]["commonStockSharesOutstanding"] = "None"
+    balance[1]["commonStockSharesOutstanding"] = "12"
+    assert ratio_engine.latest_value("us", "shares", balance, income, cashflow) == 12.0
+    assert ratio_engine.latest_value("hk", "shares", *hk_statements([{"report_time": "2024-12-31"}])) is None
+
+
+def cn_statements(rows):
+    """A股三张报表(新浪宽表)，rows 为 (报告日, 营业总收入, 净利润, 经营现金流, 资本开支, 每股收益) 的累计值"""
+    dates = [row[0] for row in rows]
+    income = pd.DataFrame({"报告日": dates, "营业总收入": [row[1] for row in rows], "净利润": [row[2] for row in rows],
+                           "基本每股收益": [row[5] for row in rows]})
+    balance = pd.DataFrame({"报告日": dates, "实收资本(或股本)": 100.0, "所有者权益(或股东权益)合计": 1000.0})
+    cashflow = pd.DataFrame({"报告日": dates, "经营活动产生的现金流量净额": [row[3] for row in rows],
+                             "购建固定资产、无形资产和其他长期资产所支付的现金": [row[4] for row in rows]})
+    return balance, income, cashflow
+
+
+def test_ttm_cn_cumulative_quarter():
+    statements = cn_statements([
+        ("20240930", 300.0, 30.0, 60.0, 15.0, 0.3),
+        ("20231231", 380.0, 40.0, 80.0, 20.0, 0.4),
+        ("20230930", 270.0, 25.0, 50.0, 10.0, 0.25),
+    ])
+    ttm = ratio_engine.calc_ttm("cn", *statements)
+    assert ttm["report_date"] == ["2024-09-30", "2023-12-31", "2023-09-30"]
+    # 三季报 TTM = 本期累计 + 上年年报 - 上年三季报累计，年报即 TTM，缺上一年年报时缺失
+    assert ttm["revenue_ttm"] == [410.0, 380.0, None]
+    assert ttm["net_income_ttm"] == [45.0, 40.0, None]
+    assert ttm["free_cash_flow_ttm"] == [65.0, 60.0, None]
+    assert ttm["eps_ttm"] == [0.45, 0.4, None]
+    assert ttm["book_value_per_share"] == [10.0, 10.0, 10.0]
+
+
+def hk_interims():
+    """3月财年结束: 2024-09-30 为2025财年中报，2024-03-31 为2024财年年报"""
+    income = [
+        {"report_time": "2024-09-30", "营业额": 60, "持续经营业务税后利润": 6, "每股基本盈利": 0.6},
+        {"report_time": "2024-03-31", "营业额": 100, "持续经营业务税后利润": 10, "每股基本盈利": 1.0},
+        {"report_time": "2023-09-30", "营业额": 40, "持续经营业务税后利润": 4, "每股基本盈利": 0.4},
+    ]
+    return hk_statements(income)
+
+
+def test_ttm_hk_half_year_with_march_year_end():
+    ttm = ratio_engine.calc_ttm("hk", *hk_interims(), fiscal_year_end=3)
+    assert ttm["revenue_ttm"] == [120.0, 100.0, None]
+    assert ttm["net_income_ttm"] == [12.0, 10.0, None]
+    assert ttm["eps_ttm"] == [1.2, 1.0, None]
+    # 港股报表没有股本
+    assert ttm["book_value_per_share"] == [None, None, None]
+    # 按12月财年时找不到上一年的"年报"，中报和年报都无法汇总
+    assert ratio_engine.calc_ttm("hk", *hk_interims())["revenue_ttm"] == [None, None, None]
+
+
+def test_ttm_us_single_quarters_with_missing_quarter():
+    dates = ["2024-09-30", "2024-06-30", "2024-03-31", "2023-12-31", "2023-09-30", "2023-03-31"]
+    net_income = [30, 20, 25, 15, 10, 5]
+    income = [{"fiscalDateEnding": date, "totalRevenue": str(value * 10), "netIncome": str(value)}
+              for date, value in zip(dates, net_income)]
+    balance = [{"fiscalDateEnding": date, "commonStockSharesOutstanding": "10", "totalShareholderEquity": "400"}
+               for date in dates]
+    cashflow = [{"fiscalDateEnding": date, "operatingCashflow": "None"} for date in dates]
+    ttm = ratio_engine.calc_ttm("us", balance, income, cashflow)
+    assert ttm["report_date"] == dates
+    # 2023-06-30 缺失，用到它的 TTM 都缺失
+    assert ttm["net_income_ttm"] == [90.0, 70.0, None, None, None, None]
+    assert ttm["revenue_ttm"] == [900.0, 700.0, None, None, None, None]
+    assert ttm["free_cash_flow_ttm"] == [None] * 6
+    assert ttm["eps_ttm"] == [9.0, 7.0, None, None, None, None]
+    assert ttm["book_value_per_share"] == [40.0] * 6
+    assert ratio_engine.calc_ttm("us", balance, income, cashflow, limit=2)["report_date"] == dates[:2]
+
+
+def test_ttm_per_share_aligns_report_dates():
+    ttm = {"report_date": ["2024-09-30", "2024-06-30"], "eps_ttm": [1.2, 1.0], "book_value_per_share": [10.0, None]}
+    per_share = ratio_engine.ttm_per_share(ttm, ["20240930", "2024-03-31", "2024-06-30"])
+    assert per_share == {"eps": [1.2, None, 1.0], "book_value_per_share": [10.0, None, None]}
+    repriced = ratio_engine.reprice_ttm(ttm, 24.0)
+    assert repriced["pe_ttm"] == [20.0, 24.0] and repriced["pb_ttm"] == [2.4, None]
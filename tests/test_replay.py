@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+import datetime
+import sys
+import types
+
+import pandas as pd
+import pytest
+
+from wff_agent.datasource import replay
+
+
+@pytest.fixture
+def upstream(tmp_path, monkeypatch):
+    """假的上游模块，记录真实调用次数"""
+    calls = []
+    module = types.ModuleType("fake_upstream")
+
+    def history(symbol, start_date="20240101"):
+        calls.append(symbol)
+        if symbol == "bad":
+            raise KeyError(symbol)
+        return pd.DataFrame({"日期": ["2024-01-02", "2024-01-03"], "收盘": [10.0, 10.5]}).assign(代码=symbol)
+
+    module.history = history
+    monkeypatch.setitem(sys.modules, "fake_upstream", module)
+    monkeypatch.setenv("WFF_FIXTURE_DIR", str(tmp_path / "fixtures"))
+    monkeypatch.delenv("WFF_REPLAY_LATENCY", raising=False)
+    monkeypatch.setattr(replay, "_manifests", {})
+    yield replay.upstream("fake_upstream", "fake"), calls
+
+
+def test_record_then_replay(upstream, monkeypatch, tmp_path):
+    proxy, calls = upstream
+    monkeypatch.setenv("WFF_DATASOURCE_MODE", "replay")
+    # 回放模式下不创建夹具目录
+    assert replay.now() <= datetime.datetime.now()
+    assert not (tmp_path / "fixtures").exists()
+
+    monkeypatch.setenv("WFF_DATASOURCE_MODE", "record")
+    recorded = proxy.history("000001", start_date="20240101")
+    with pytest.raises(KeyError):
+        proxy.history("bad")
+    recorded_at = replay.now()
+    assert calls == ["000001", "bad"]
+
+    monkeypatch.setenv("WFF_DATASOURCE_MODE", "replay")
+    pd.testing.assert_frame_equal(proxy.history("000001", start_date="20240101"), recorded)
+    with pytest.raises(KeyError):
+        proxy.history("bad")
+    with pytest.raises(replay.ReplayMissError):
+        proxy.history("000002")
+    assert calls == ["000001", "bad"]
+    assert abs((replay.now() - recorded_at).total_seconds()) < 1
+
+
+def test_manifest_read_once(upstream, monkeypatch):
+    proxy, _ = upstream
+    monkeypatch.setenv("WFF_DATASOURCE_MODE", "record")
+    proxy.history("000001")
+    monkeypatch.setattr(replay, "_manifests", {})
+    monkeypatch.setenv("WFF_DATASOURCE_MODE", "replay")
+    reads = []
+    read_manifest = replay.json.load
+    monkeypatch.setattr(replay.json, "load", lambda f: reads.append(f.name) or read_manifest(f))
+    for _ in range(5):
+        replay.now()
+    assert len(reads) == 1
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+import threading
+
+import pytest
+
+from wff_agent.datasource import scheduler
+
+
+@pytest.fixture
+def pool():
+    pool = scheduler.DatasourceScheduler(max_workers=1, provider_limits={"slow": 1})
+    yield pool
+    pool.shutdown()
+
+
+def blocker(pool):
+    """占住唯一的工作线程，直到 release.set()"""
+    started, release = threading.Event(), threading.Event()
+    future = pool.submit("other", lambda: started.set() or release.wait(5))
+    assert started.wait(5)
+    return future, release
+
+
+def test_interactive_runs_before_prefetch(pool):
+    future, release = blocker(pool)
+    order = []
+    with scheduler.prefetch():
+        prefetched = [pool.submit("akshare", order.append, (f"prefetch{i}",)) for i in range(2)]
+    interactive = pool.submit("akshare", order.append, ("interactive",))
+    assert pool.metrics()["queue_depth_by_priority"] == {scheduler.PRIORITY_INTERACTIVE: 1,
+                                                         scheduler.PRIORITY_PREFETCH: 2}
+    release.set()
+    for f in [future, interactive, *prefetched]:
+        f.result(5)
+    assert order == ["interactive", "prefetch0", "prefetch1"]
+
+
+def test_provider_limit():
+    pool = scheduler.DatasourceScheduler(max_workers=4, provider_limits={"slow": 2})
+    lock, running, peak = threading.Lock(), [0], [0]
+
+    def work():
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        threading.Event().wait(0.05)
+        with lock:
+            running[0] -= 1
+
+    futures = [pool.submit("slow", work) for _ in range(6)]
+    for future in futures:
+        future.result(5)
+    pool.shutdown()
+    assert peak[0] == 2
+
+
+def test_cancel_pending(pool):
+    future, release = blocker(pool)
+    slow = [pool.submit("slow", lambda: 1) for _ in range(3)]
+    fast = pool.submit("fast", lambda: 2)
+    assert pool.cancel_pending(provider="slow") == 3
+    assert all(f.cancelled() for f in slow)
+    release.set()
+    assert fast.result(5) == 2
+    assert pool.metrics()["queue_depth"] == 0
+
+
+def test_call_kwargs_are_separate_from_options(pool):
+    def fetch(symbol, priority="high"):
+        return symbol, priority
+
+    assert pool.run("akshare", fetch, ("000001",), {"priority": "low"}) == ("000001", "low")
+
+
+def test_nested_submission_is_queued_and_inherits_priority(pool):
+    # 只有一个工作线程且 slow 的上限为1，外层任务等待内层任务时需让出名额
+    def outer():
+        inner = pool.submit("slow", lambda: scheduler._current_priority.get())
+        return inner.result(5)
+
+    with scheduler.prefetch():
+        future = pool.submit("slow", outer)
+    assert future.result(5) == scheduler.PRIORITY_PREFETCH
+    assert pool.metrics()["submitted"] == 2
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+import pandas as pd
+import pytest
+
+from wff_agent.datasource import akshare_request as ak_request
+from wff_agent.utils import screener
+
+
+@pytest.fixture(autouse=True)
+def market(monkeypatch):
+    spot = pd.DataFrame({
+        "代码": [f"{i:06d}" for i in range(10)],
+        "名称": [f"股票{i}" for i in range(10)],
+        "最新价": [10.0 + i for i in range(10)],
+        "成交额": [1000.0 * i for i in range(10)],
+    })
+    evaluated = []
+
+    def indicator_frame(symbols, market, fields):
+        evaluated.extend(symbols)
+        return pd.DataFrame({"RSI": 20.0}, index=pd.Index(symbols, name="代码"))
+
+    monkeypatch.setattr(ak_request, "get_market_spot", lambda market: spot)
+    monkeypatch.setattr(screener, "_indicator_frame", indicator_frame)
+    return evaluated
+
+
+def test_indicator_cap_is_reported(market):
+    frame, info = screener.screen("RSI < 30", "cn", max_bar_symbols=4)
+    assert info == {"indicator_candidates": 10, "indicator_evaluated": 4}
+    # 按成交额保留流动性最好的
+    assert sorted(market) == ["000006", "000007", "000008", "000009"]
+    assert len(frame) == 4
+
+
+def test_spot_only_screen_has_no_indicator_info():
+    frame, info = screener.screen("close > 15", "cn")
+    assert info == {"indicator_candidates": None, "indicator_evaluated": None}
+    assert len(frame) == 4
+
+
+def test_invalid_cap():
+    with pytest.raises(ValueError):
+        screener.screen("RSI < 30", "cn", max_bar_symbols=0)
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+import json
+
+import pandas as pd
+import pytest
+
+from wff_agent.benchmarks import indicator_bench
+from wff_agent.datasource import file_lru_cache as filecache
+from wff_agent.datasource import price_store, replay
+from wff_agent.utils import indicator_memo, indicator_stream, stock_utils
+
+
+@pytest.fixture(autouse=True)
+def upstream(tmp_path, monkeypatch):
+    monkeypatch.delenv("WFF_DATASOURCE_MODE", raising=False)
+    monkeypatch.delenv("WFF_TOOL_ENCODINGS", raising=False)
+    monkeypatch.setattr(filecache, "get_cache_dir", lambda: tmp_path)
+    # 指标结果缓存保存在文件缓存中，随 filecache._memory 和临时目录一起重置
+    monkeypatch.setattr(indicator_memo, "_stats", {"hits": 0, "misses": 0})
+    for cache in (filecache._memory, price_store._entries, indicator_stream._checkpoints):
+        cache.clear()
+    bars = indicator_bench.make_history(3000)
+    bars.index = pd.bdate_range(end=replay.now().date(), periods=len(bars), name="日期")
+    bars[price_store.FACTOR_COLUMN] = 1.0
+    monkeypatch.setattr(price_store, "_fetch_segment",
+                        lambda symbol, market, start_date, end_date:
+                        bars.loc[pd.to_datetime(start_date):pd.to_datetime(end_date)].copy())
+    yield
+    for cache in (filecache._memory, price_store._entries, indicator_stream._checkpoints):
+        cache.clear()
+
+
+def test_daily_all_indicators_return_requested_windows():
+    # 先用短窗口建立检查点，更长的窗口(包括超过检查点默认行数的)仍返回完整的K线数
+    for windows in (50, 500, 300, 1000):
+        result = json.loads(stock_utils.get_market_indicators("000001", "cn", windows, encoding="records"))
+        assert len(result) == windows
+        assert all(bar["MA200"] is not None for bar in result)
+
+
+def test_memoized_indicators_are_not_shared():
+    first = stock_utils.get_market_indicators("000001", "cn", 30)
+    assert stock_utils.get_market_indicators("000001", "cn", 30) == first
+    assert indicator_memo.stats()["hits"] == 1
+    last_bar = price_store.peek_last_bar("000001", "cn")
+    key = indicator_memo.make_key("000001", "cn", last_bar, stock_utils.indicator_engine.INDICATOR_COLUMNS, 30, "daily")
+    cached = indicator_memo.get(key)
+    cached.loc[:, "收盘"] = 0.0
+    assert stock_utils.get_market_indicators("000001", "cn", 30) == first
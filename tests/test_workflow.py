@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+import pytest
+
+from wff_agent.agents import mcp_session
+from wff_agent.workflows.base_workflow import Workflow, WorkflowStep
+
+
+class FakeAgent:
+    """不启动 MCP 服务器的 Agent，execute 决定步骤的结果"""
+
+    def __init__(self, execute=None, after=None):
+        self.execute = execute or (lambda: "ok")
+        self.after = after
+
+    def prepare_input(self, input_data, context):
+        return input_data
+
+    def get_user_prompt(self, input_data, context):
+        return "prompt"
+
+    async def execute_with_session(self, system_prompt, user_message_prompt, input):
+        result = self.execute()
+        return await result if asyncio.iscoroutine(result) else result
+
+    def after_ai_execute(self, result, input_data):
+        if self.after:
+            self.after()
+
+
+class FakeWorkflow(Workflow):
+    def __init__(self, agents, depends_on=None, **kwargs):
+        super().__init__(**kwargs)
+        self.agents = agents
+        self.depends_on = depends_on or {}
+
+    def setup_steps(self):
+        self.steps = [WorkflowStep(name, agent, "system", self.depends_on.get(name))
+                      for name, agent in self.agents.items()]
+
+    def combine_results(self):
+        return dict(self.results)
+
+
+def run(agents, **kwargs):
+    events = []
+    workflow = FakeWorkflow(agents, progress_callback=lambda step, message, result, status:
+                            events.append((step, status)), **kwargs)
+    return asyncio.run(workflow.execute({})), events
+
+
+@pytest.fixture(autouse=True)
+def env(monkeypatch):
+    monkeypatch.delenv(mcp_session.POOL_SIZE_ENV, raising=False)
+
+
+def fail():
+    raise RuntimeError("boom")
+
+
+@pytest.mark.parametrize("agent", [FakeAgent(execute=fail), FakeAgent(execute=lambda: None),
+                                   FakeAgent(after=fail)])
+def test_failed_step_reports_failure_once(agent):
+    results, events = run({"ok": FakeAgent(), "bad": agent})
+    assert [status for step, status in events if step == "bad"] == ["started", "failed"]
+    assert [status for step, status in events if step == "ok"] == ["started", "completed"]
+    assert results["ok"] == "ok"
+
+
+def test_pool_matches_concurrency(monkeypatch):
+    async def pool_size():
+        async with mcp_session.session_scope() as pool:
+            return pool.size
+
+    results, _ = run({"a": FakeAgent(execute=pool_size)}, max_concurrency=6)
+    assert results["a"] == 6
+
+    monkeypatch.setenv(mcp_session.POOL_SIZE_ENV, "3")
+    results, _ = run({"a": FakeAgent(execute=pool_size)}, max_concurrency=6)
+    assert results["a"] == 3
+
+
+def test_nested_scope_grows_pool():
+    async def sizes():
+        async with mcp_session.session_scope() as pool:
+            before = pool.size
+            async with mcp_session.session_scope(5):
+                return before, pool.size, pool._available._value
+
+    assert asyncio.run(sizes()) == (mcp_session.DEFAULT_POOL_SIZE, 5, 5)
+
+
+class Tracker:
+    """记录步骤的开始、结束顺序和同时执行的步骤数"""
+
+    def __init__(self):
+        self.events = []
+        self.running = 0
+        self.peak = 0
+
+    def agent(self, name, delay=0.05, error=False):
+        async def execute():
+            self.events.append(("start", name))
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+            await asyncio.sleep(delay)
+            self.running -= 1
+            self.events.append(("end", name))
+            if error:
+                raise RuntimeError(f"{name} failed")
+            return name
+        return FakeAgent(execute=execute)
+
+    def index(self, event, name):
+        return self.events.index((event, name))
+
+
+def test_independent_steps_overlap():
+    tracker = Tracker()
+    results, _ = run({name: tracker.agent(name) for name in "abc"}, max_concurrency=4)
+    assert tracker.peak == 3
+    assert all(tracker.index("start", name) < tracker.index("end", "a") for name in "abc")
+    assert results == {"a": "a", "b": "b", "c": "c"}
+
+
+@pytest.mark.parametrize("limit", [1, 2])
+def test_max_concurrency_is_respected(limit):
+    tracker = Tracker()
+    run({name: tracker.agent(name, delay=0.02) for name in "abcde"}, max_concurrency=limit)
+    assert tracker.peak == limit
+    assert len(tracker.events) == 10
+
+
+def test_dependent_step_waits_for_dependencies():
+    tracker = Tracker()
+    agents = {"fast": tracker.agent("fast", delay=0.01), "slow": tracker.agent("slow", delay=0.05),
+              "summary": tracker.agent("summary", delay=0), "other": tracker.agent("other", delay=0)}
+    results, _ = run(agents, depends_on={"summary": ["fast", "slow"]}, max_concurrency=4)
+    assert tracker.index("start", "summary") > tracker.index("end", "slow")
+    # 不依赖其他步骤的步骤不等待
+    assert tracker.index("start", "other") < tracker.index("end", "fast")
+    assert results["summary"] == "summary"
+
+
+def test_dependent_step_runs_after_failed_dependency():
+    tracker = Tracker()
+    agents = {"bad": tracker.agent("bad", error=True), "summary": tracker.agent("summary", delay=0)}
+    results, events = run(agents, depends_on={"summary": ["bad"]})
+    assert tracker.index("start", "summary") > tracker.index("end", "bad")
+    assert ("bad", "failed") in events and ("summary", "completed") in events
+    assert results["summary"] == "summary"
+
+
+@pytest.mark.parametrize("depends_on, message", [
+    ({"a": ["b"], "b": ["a"]}, "循环依赖"),
+    ({"a": ["a"]}, "循环依赖"),
+    ({"a": ["missing"]}, "不存在"),
+])
+def test_invalid_dependencies_raise(depends_on, message):
+    tracker = Tracker()
+    with pytest.raises(ValueError, match=message):
+        run({"a": tracker.agent("a"), "b": tracker.agent("b")}, depends_on=depends_on)
+    assert tracker.events == []